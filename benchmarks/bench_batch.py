@@ -0,0 +1,53 @@
+"""Compares single calls against Commands.batch on a local stand-in
+server with injected latency.
+
+Usage:
+    python -m benchmarks.bench_batch [keys] [latency_ms]
+"""
+import sys
+import time
+from redis import Redis
+from driver.utils.commands import Commands
+from benchmarks.standin import StandinServer
+
+
+def run(keys:int=200,latency:float=0.0005,max_commands:int=100)->dict:
+    with StandinServer(latency=latency) as server:
+        commands=Commands(Redis(port=server.port))
+        names=[f"bench:batch:{index}" for index in range(keys)]
+
+        server.reset_counters()
+        start=time.perf_counter()
+        for name in names:
+            commands.set(name,"value")
+        for name in names:
+            commands.get(name)
+        single_time=time.perf_counter()-start
+        single_trips=server.round_trips
+
+        server.reset_counters()
+        start=time.perf_counter()
+        with commands.batch(max_commands=max_commands) as batch:
+            for name in names:
+                batch.set(name,"value")
+            for name in names:
+                batch.get(name)
+        batch_time=time.perf_counter()-start
+        batch_trips=server.round_trips
+
+    return {
+        "keys":keys,
+        "latency_ms":latency*1000,
+        "single_round_trips":single_trips,
+        "single_seconds":round(single_time,4),
+        "batch_round_trips":batch_trips,
+        "batch_seconds":round(batch_time,4),
+        "round_trips_saved":single_trips-batch_trips,
+    }
+
+
+if __name__=="__main__":
+    keys=int(sys.argv[1]) if len(sys.argv)>1 else 200
+    latency=float(sys.argv[2])/1000 if len(sys.argv)>2 else 0.0005
+    for name,value in run(keys,latency).items():
+        print(f"{name:>20} : {value}")
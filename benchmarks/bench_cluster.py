@@ -0,0 +1,39 @@
+"""Measures mset and mget throughput of ClusterClient against stand-in
+clusters of 1, 2 and 4 nodes, each node in its own process.
+
+Usage:
+    python -m benchmarks.bench_cluster [keys] [rounds]
+"""
+import sys
+import time
+from driver.utils.cluster import ClusterClient
+from benchmarks.standin import StandinCluster
+
+
+def run(nodes:int,keys:int=20000,rounds:int=5,chunk:int=1000)->dict:
+    with StandinCluster(nodes=nodes,processes=True) as cluster:
+        client=ClusterClient(host=cluster.host,port=cluster.port)
+        names=[f"bench:cluster:{index}" for index in range(keys)]
+        start=time.perf_counter()
+        for _ in range(rounds):
+            for offset in range(0,keys,chunk):
+                client.mset({name:"value" for name in names[offset:offset+chunk]})
+        mset_time=time.perf_counter()-start
+        start=time.perf_counter()
+        for _ in range(rounds):
+            for offset in range(0,keys,chunk):
+                client.mget(names[offset:offset+chunk])
+        mget_time=time.perf_counter()-start
+        client.close()
+    return {
+        "nodes":nodes,
+        "mset_keys_per_second":round(keys*rounds/mset_time),
+        "mget_keys_per_second":round(keys*rounds/mget_time),
+    }
+
+
+if __name__=="__main__":
+    keys=int(sys.argv[1]) if len(sys.argv)>1 else 20000
+    rounds=int(sys.argv[2]) if len(sys.argv)>2 else 5
+    for nodes in (1,2,4):
+        print(" ".join(f"{name}={value}" for name,value in run(nodes,keys,rounds).items()))
@@ -0,0 +1,57 @@
+"""Compares encode/decode time and stored bytes of every codec and
+compression on representative payloads. Codecs whose optional package
+is not installed are skipped.
+
+Usage:
+    python -m benchmarks.bench_codecs [rounds]
+"""
+import sys
+import time
+from driver.utils.codecs import Serializer
+
+
+def payloads()->dict:
+    user={"id":1234,"name":"Jhon Doe","email":"jhon@example.com","active":True,"tags":["a","b","c"],"score":98.5}
+    return {
+        "small_dict":user,
+        "list_of_dicts":[dict(user,id=index) for index in range(500)],
+        "text":"lorem ipsum dolor sit amet "*400,
+        "numbers":list(range(5000)),
+    }
+
+
+def measure(serializer:Serializer,value,rounds:int)->dict:
+    start=time.perf_counter()
+    for _ in range(rounds):
+        data=serializer.dumps(value)
+    encode=(time.perf_counter()-start)/rounds
+    start=time.perf_counter()
+    for _ in range(rounds):
+        serializer.loads(data)
+    decode=(time.perf_counter()-start)/rounds
+    return {"encode_us":round(encode*1e6,1),"decode_us":round(decode*1e6,1),"bytes":len(data)}
+
+
+def run(rounds:int=200)->list:
+    results=[]
+    for codec in ("json","pickle","msgpack"):
+        for compression in ("none","zlib","lz4"):
+            try:
+                serializer=Serializer(codec,compression=compression,threshold=256)
+            except ImportError:
+                continue
+            if serializer.compression.name!=compression:
+                continue
+            for name,value in payloads().items():
+                result={"codec":codec,"compression":compression,"payload":name}
+                result.update(measure(serializer,value,rounds))
+                results.append(result)
+    return results
+
+
+if __name__=="__main__":
+    rounds=int(sys.argv[1]) if len(sys.argv)>1 else 200
+    print(f"{'codec':>8} {'compression':>11} {'payload':>14} {'encode_us':>10} {'decode_us':>10} {'bytes':>8}")
+    for result in run(rounds):
+        print(f"{result['codec']:>8} {result['compression']:>11} {result['payload']:>14} "
+            f"{result['encode_us']:>10} {result['decode_us']:>10} {result['bytes']:>8}")
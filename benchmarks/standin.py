@@ -0,0 +1,1816 @@
+import asyncio
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import Future
+from redis.crc import key_slot,REDIS_CLUSTER_HASH_SLOTS
+
+
+class StandinServer:
+    """Minimal in-process RESP server used by the benchmarks and the tests
+    as a local stand-in for Redis. It runs an asyncio loop in a background
+    thread and implements the subset of commands the driver relies on.
+
+    Every batch of commands read from a socket is answered with a single
+    write, which is counted as one round trip in `round_trips`. An optional
+    `latency` (seconds) is injected before each reply to emulate the
+    network distance to a real server.
+
+    Example:
+        with StandinServer(latency=0.001) as server:
+            driver.connect(port=server.port)
+    """
+
+    def __init__(self,host:str="127.0.0.1",port:int=0,latency:float=0.0) -> None:
+        self.host=host
+        self.port=port
+        self.latency=latency
+        self.round_trips=0
+        self.commands_processed=0
+        self.databases={}
+        self.connections=set()
+        self.clients={}
+        self.tracked={}
+        self.scripts={}
+        self.script_functions={}
+        self.slot_map=None
+        self.cluster_nodes=[]
+        self.migrating={}
+        self.importing=set()
+        self.replication={"role":"master","master_repl_offset":0}
+        self.acl_users={b"default":AclUser.default()}
+        self.__loop=None
+        self.__server=None
+        self.__thread=None
+        self.__ready=threading.Event()
+        self.__next_client_id=0
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self,*exc)->None:
+        self.stop()
+
+
+    def start(self)->int:
+        """Starts the server in a background thread.
+
+        Returns:
+            int: port the server is listening on
+        """
+        self.__thread=threading.Thread(target=self.__run,daemon=True)
+        self.__thread.start()
+        self.__ready.wait()
+        return self.port
+
+
+    def stop(self)->None:
+        """Stops the server and waits for its thread to finish
+        """
+        if self.__loop is None:
+            return
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop=None
+
+
+    def reset_counters(self)->None:
+        """Sets the round trip and command counters back to 0
+        """
+        self.round_trips=0
+        self.commands_processed=0
+
+
+    def __run(self)->None:
+        self.__loop=asyncio.new_event_loop()
+        asyncio.set_event_loop(self.__loop)
+        self.__server=self.__loop.run_until_complete(
+            self.__loop.create_server(lambda:_RespProtocol(self),self.host,self.port)
+        )
+        self.port=self.__server.sockets[0].getsockname()[1]
+        self.__ready.set()
+        try:
+            self.__loop.run_forever()
+        finally:
+            self.__server.close()
+            for connection in list(self.connections):
+                connection.transport.close()
+            tasks=asyncio.all_tasks(self.__loop)
+            for task in tasks:
+                task.cancel()
+            self.__loop.run_until_complete(asyncio.gather(*tasks,return_exceptions=True))
+            self.__loop.run_until_complete(self.__server.wait_closed())
+            self.__loop.close()
+
+
+    @property
+    def address(self)->str:
+        return f"{self.host}:{self.port}"
+
+
+    def invoke(self,method:str,*args):
+        """Runs a method of the server in its event loop thread and
+        returns its result. Used to change the server while it runs.
+        """
+        future=Future()
+        def call():
+            try:
+                future.set_result(getattr(self,method)(*args))
+            except Exception as err:
+                future.set_exception(err)
+        self.__loop.call_soon_threadsafe(call)
+        return future.result()
+
+
+    def counters(self)->tuple:
+        return self.round_trips,self.commands_processed
+
+
+    def set_cluster(self,owners:list,nodes:list)->None:
+        """Enables cluster mode : (owners) holds the "host:port" address
+        of the node serving each of the 16384 slots and (nodes) the
+        (host,port,node_id) of every node. Commands on keys of slots
+        served by other nodes are answered with MOVED.
+        """
+        self.slot_map=list(owners)
+        self.cluster_nodes=list(nodes)
+
+
+    def export_slot(self,slot:int)->dict:
+        """Removes the keys of a slot from database 0 and returns them
+        """
+        keyspace=self.keyspace(0)
+        exported={}
+        for key in [key for key in keyspace.data if key_slot(key)==slot]:
+            exported[key]=(keyspace.data.pop(key),keyspace.expires.pop(key,None))
+        return exported
+
+
+    def import_slot(self,data:dict)->None:
+        keyspace=self.keyspace(0)
+        for key,(value,expire_at) in data.items():
+            keyspace.data[key]=value
+            if expire_at is not None:
+                keyspace.expires[key]=expire_at
+
+
+    def set_slot_state(self,slot:int,migrating:str=None,importing:bool=False)->None:
+        """Marks a slot as migrating to the node at address (migrating),
+        answered with ASK for missing keys, or as importing, served to
+        clients that sent ASKING.
+        """
+        if migrating is None:
+            self.migrating.pop(slot,None)
+        else:
+            self.migrating[slot]=migrating
+        if importing:
+            self.importing.add(slot)
+        else:
+            self.importing.discard(slot)
+
+
+    def cluster_slots(self)->list:
+        """Returns the reply of CLUSTER SLOTS
+        """
+        ids={f"{host}:{port}":(host,port,node_id) for host,port,node_id in self.cluster_nodes}
+        reply=[]
+        start=0
+        for slot in range(1,REDIS_CLUSTER_HASH_SLOTS+1):
+            if slot==REDIS_CLUSTER_HASH_SLOTS or self.slot_map[slot]!=self.slot_map[start]:
+                host,port,node_id=ids[self.slot_map[start]]
+                reply.append([start,slot-1,[host.encode(),port,node_id.encode()]])
+                start=slot
+        return reply
+
+
+    def new_client_id(self)->int:
+        self.__next_client_id+=1
+        return self.__next_client_id
+
+
+    def register_script(self,source:str,function)->str:
+        """The stand-in server has no Lua interpreter. Scripts are run by
+        a python function(connection,keys,args) registered for their source.
+
+        Returns:
+            str: SHA1 of the source
+        """
+        sha=hashlib.sha1(source.encode()).hexdigest()
+        self.script_functions[sha]=function
+        return sha
+
+
+    def notify_write(self,keys)->None:
+        """Sends CLIENT TRACKING invalidation messages for keys that
+        were written. None invalidates every key (flush).
+        """
+        targets={}
+        for connection in self.connections:
+            if connection.tracking_prefixes is None:
+                continue
+            for key in ([None] if keys is None else keys):
+                if key is None or any(key.startswith(prefix) for prefix in connection.tracking_prefixes):
+                    targets.setdefault(connection.tracking_redirect,[]).append(key)
+        for key in ([None] if keys is None else keys):
+            redirects=self.tracked.pop(key,()) if key is not None else set().union(*self.tracked.values())
+            for redirect in redirects:
+                targets.setdefault(redirect,[]).append(key)
+        if keys is None:
+            self.tracked.clear()
+        for redirect,invalidated in targets.items():
+            client=self.clients.get(redirect)
+            if client is None:
+                continue
+            payload=None if None in invalidated else sorted(set(invalidated))
+            client.push_message(b"__redis__:invalidate",payload)
+
+
+    def publish(self,channel:bytes,message)->int:
+        """Delivers a message to the connections subscribed to channel
+        """
+        receivers=0
+        for connection in list(self.connections):
+            if channel in connection.channels:
+                connection.push_message(channel,message)
+                receivers+=1
+            for pattern in sorted(connection.patterns):
+                if fnmatch.fnmatchcase(channel.decode("utf-8","replace"),pattern.decode("utf-8","replace")):
+                    connection.push_message(channel,message,pattern)
+                    receivers+=1
+        return receivers
+
+
+    def feed_monitors(self,source,command:list)->None:
+        """Sends a command to the connections in MONITOR mode, in the 
+        format of Redis : +<time> [<db> <addr>] "<command>" "<arg>"...
+        """
+        monitors=[connection for connection in self.connections if connection.monitoring and connection is not source]
+        if not monitors:
+            return
+        line=f"{time.time():.6f} [{source.db} {source.addr}] "+" ".join(_quote(arg) for arg in command)
+        for connection in monitors:
+            connection.pending.put_nowait(b"+"+line.encode()+b"\r\n")
+
+
+    def keyspace(self,db:int=0):
+        """Returns the keyspace of a logical database, creating it on first use
+        """
+        if db not in self.databases:
+            self.databases[db]=Keyspace()
+        return self.databases[db]
+
+
+class Keyspace:
+    """Data and expiry tables of one logical database
+    """
+
+    def __init__(self) -> None:
+        self.data={}
+        self.expires={}
+
+
+    def lookup(self,key:bytes):
+        expire_at=self.expires.get(key)
+        if expire_at is not None and expire_at<=time.time():
+            self.data.pop(key,None)
+            self.expires.pop(key,None)
+        return self.data.get(key)
+
+
+    def store(self,key:bytes,value,keep_ttl:bool=False)->None:
+        self.data[key]=value
+        if not keep_ttl:
+            self.expires.pop(key,None)
+
+
+    def delete(self,key:bytes)->bool:
+        self.expires.pop(key,None)
+        return self.data.pop(key,None) is not None
+
+
+class _Error(Exception):
+    pass
+
+
+_WRITES={"SET","APPEND","GETDEL","DEL","SETRANGE","INCR","INCRBY","DECR","DECRBY","EXPIRE","PEXPIRE","PERSIST",
+    "HSET","HDEL","HINCRBY","HINCRBYFLOAT","SADD","SREM","ZADD","ZREM","ZINCRBY","XADD","RESTORE","SETBIT","BITFIELD",
+    "PFADD","PFMERGE"}
+_READS={"GET","MGET","STRLEN","GETRANGE"}
+# the stand-in DUMP payload is a pickle of the value, readable only by the stand-in
+_DUMP_PREFIX=b"STANDIN1"
+
+
+class _RespProtocol(asyncio.Protocol):
+
+    def __init__(self,server:StandinServer) -> None:
+        self.server=server
+        self.buffer=bytearray()
+        self.transport=None
+        self.client_id=server.new_client_id()
+        self.name=None
+        self.db=0
+        self.keyspace=server.keyspace(0)
+        self.pending=None
+        self.closing=False
+        self.channels=set()
+        self.patterns=set()
+        self.tracking_redirect=None
+        self.tracking_prefixes=None
+        self.created=time.monotonic()
+        self.last_command=self.created
+        self.last_name="NULL"
+        self.monitoring=False
+        self.asking=False
+
+
+    def connection_made(self,transport)->None:
+        self.transport=transport
+        self.addr=self.__address(transport.get_extra_info("peername"))
+        self.laddr=self.__address(transport.get_extra_info("sockname"))
+        socket=transport.get_extra_info("socket")
+        self.fd=socket.fileno() if socket is not None else -1
+        self.server.connections.add(self)
+        self.server.clients[self.client_id]=self
+        self.pending=asyncio.Queue()
+        asyncio.ensure_future(self.__writer())
+
+
+    def connection_lost(self,exc)->None:
+        self.server.connections.discard(self)
+        self.server.clients.pop(self.client_id,None)
+        self.pending.put_nowait(None)
+
+
+    def data_received(self,data:bytes)->None:
+        self.buffer+=data
+        replies=[]
+        while True:
+            command=self.__parse()
+            if command is None:
+                break
+            self.server.commands_processed+=1
+            replies.append(self.__execute(command))
+            if self.closing:
+                break
+        if replies:
+            self.server.round_trips+=1
+            self.pending.put_nowait(b"".join(replies))
+
+
+    def push_message(self,channel:bytes,message,pattern:bytes=None)->None:
+        """Queues a pub/sub message for this connection
+        """
+        if pattern is None:
+            self.pending.put_nowait(encode([b"message",channel,message]))
+        else:
+            self.pending.put_nowait(encode([b"pmessage",pattern,channel,message]))
+
+
+    async def __writer(self)->None:
+        while True:
+            payload=await self.pending.get()
+            if payload is None:
+                return
+            if self.server.latency:
+                await asyncio.sleep(self.server.latency)
+            if self.transport.is_closing():
+                return
+            self.transport.write(payload)
+            if self.closing and self.pending.empty():
+                self.transport.close()
+                return
+
+
+    def __parse(self):
+        buffer=self.buffer
+        if not buffer:
+            return None
+        if buffer[0:1]!=b"*":
+            end=buffer.find(b"\r\n")
+            if end<0:
+                return None
+            line=bytes(buffer[:end])
+            del buffer[:end+2]
+            return line.split()
+        end=buffer.find(b"\r\n")
+        if end<0:
+            return None
+        count=int(buffer[1:end])
+        position=end+2
+        args=[]
+        for _ in range(count):
+            end=buffer.find(b"\r\n",position)
+            if end<0:
+                return None
+            size=int(buffer[position+1:end])
+            start=end+2
+            if len(buffer)<start+size+2:
+                return None
+            args.append(bytes(buffer[start:start+size]))
+            position=start+size+2
+        del buffer[:position]
+        return args
+
+
+    def __execute(self,command:list)->bytes:
+        if not command:
+            return b""
+        name=command[0].decode().upper()
+        self.last_command=time.monotonic()
+        self.last_name=name.lower()
+        self.server.feed_monitors(self,command)
+        handler=getattr(self,"cmd_"+name.replace(" ","_"),None)
+        if handler is None:
+            return encode(_Error(f"ERR unknown command '{name}'"))
+        if self.server.slot_map is not None and name!="ASKING":
+            redirect=self.__route(name,command[1:])
+            self.asking=False
+            if redirect is not None:
+                return encode(redirect)
+        try:
+            reply=handler(*command[1:])
+            if name in _WRITES:
+                self.server.notify_write(command[1:2])
+            elif name=="MSET":
+                self.server.notify_write(command[1::2])
+            elif name in ("FLUSHDB","FLUSHALL"):
+                self.server.notify_write(None)
+            if name in _READS and self.tracking_redirect is not None and self.tracking_prefixes is None:
+                for key in (command[1:] if name=="MGET" else command[1:2]):
+                    self.server.tracked.setdefault(key,set()).add(self.tracking_redirect)
+            return encode(reply)
+        except _Error as err:
+            return encode(err)
+        except (TypeError,ValueError,IndexError):
+            return encode(_Error(f"ERR wrong number of arguments for '{name.lower()}' command"))
+
+
+    def __route(self,name:str,args:list):
+        """Returns the MOVED, ASK or CROSSSLOT error of a command sent
+        to the wrong node in cluster mode, None if it can run here.
+        """
+        try:
+            keys=_command_keys(name,args)
+        except (ValueError,IndexError):
+            return None
+        if not keys:
+            return None
+        slots={key_slot(key) for key in keys}
+        if len(slots)>1:
+            return _Error("CROSSSLOT Keys in request don't hash to the same slot")
+        slot=slots.pop()
+        owner=self.server.slot_map[slot]
+        if owner==self.server.address:
+            target=self.server.migrating.get(slot)
+            if target is not None and any(self.keyspace.lookup(key) is None for key in keys):
+                return _Error(f"ASK {slot} {target}")
+            return None
+        if self.asking and slot in self.server.importing:
+            return None
+        return _Error(f"MOVED {slot} {owner}")
+
+
+    # ---- connection -------------------------------------------------------
+
+    def cmd_PING(self,message:bytes=None):
+        return SimpleString("PONG") if message is None else message
+
+
+    def cmd_ECHO(self,message:bytes):
+        return message
+
+
+    def cmd_QUIT(self):
+        self.closing=True
+        return SimpleString("OK")
+
+
+    def cmd_SELECT(self,db:bytes):
+        self.db=int(db)
+        self.keyspace=self.server.keyspace(self.db)
+        return SimpleString("OK")
+
+
+    def cmd_AUTH(self,*args):
+        return SimpleString("OK")
+
+
+    def cmd_ACL(self,subcommand:bytes,*args):
+        subcommand=subcommand.upper()
+        users=self.server.acl_users
+        if subcommand==b"SETUSER":
+            user=users.get(args[0]) or AclUser(args[0])
+            user.apply(args[1:])
+            users[args[0]]=user
+            return SimpleString("OK")
+        if subcommand==b"DELUSER":
+            if b"default" in args:
+                raise _Error("ERR The 'default' user cannot be removed")
+            return sum(1 for name in args if users.pop(name,None) is not None)
+        if subcommand==b"LIST":
+            return [user.describe() for _,user in sorted(users.items())]
+        if subcommand==b"USERS":
+            return sorted(users)
+        if subcommand==b"CAT":
+            if not args:
+                return sorted(_ACL_CATEGORIES)
+            if args[0].decode().lower() not in _ACL_CATEGORIES:
+                raise _Error(f"ERR Unknown category '{args[0].decode()}'")
+            return sorted(_ACL_CATEGORIES[args[0].decode().lower()])
+        if subcommand==b"GENPASS":
+            return hashlib.sha256(os.urandom(32)).hexdigest().encode()
+        raise _Error("ERR unsupported ACL subcommand")
+
+
+    def cmd_CLIENT(self,subcommand:bytes,*args):
+        subcommand=subcommand.upper()
+        if subcommand==b"SETNAME":
+            self.name=args[0]
+            return SimpleString("OK")
+        if subcommand==b"GETNAME":
+            return self.name
+        if subcommand==b"ID":
+            return self.client_id
+        if subcommand==b"INFO":
+            return self.describe()+b"\n"
+        if subcommand==b"LIST":
+            return b"".join(client.describe()+b"\n" for client in list(self.server.clients.values()))
+        if subcommand==b"KILL":
+            if len(args)==1:
+                # old form : CLIENT KILL addr
+                for client in list(self.server.clients.values()):
+                    if client.addr==args[0].decode():
+                        client.transport.close()
+                        return SimpleString("OK")
+                raise _Error("ERR No such client")
+            options=[arg.upper() for arg in args]
+            skip_me=b"SKIPME" not in options or args[options.index(b"SKIPME")+1].upper()==b"YES"
+            killed=0
+            for client in list(self.server.clients.values()):
+                if (b"ID" in options and client.client_id!=int(args[options.index(b"ID")+1])) \
+                    or (b"ADDR" in options and client.addr!=args[options.index(b"ADDR")+1].decode()) \
+                    or (skip_me and client is self):
+                    continue
+                client.transport.close()
+                killed+=1
+            return killed
+        if subcommand==b"TRACKING":
+            options=[arg.upper() for arg in args]
+            if options[0]==b"OFF":
+                self.tracking_redirect=None
+                self.tracking_prefixes=None
+                return SimpleString("OK")
+            self.tracking_redirect=int(args[options.index(b"REDIRECT")+1]) if b"REDIRECT" in options else self.client_id
+            if b"BCAST" in options:
+                self.tracking_prefixes=[args[index+1] for index,option in enumerate(options) if option==b"PREFIX"] or [b""]
+            return SimpleString("OK")
+        raise _Error("ERR unsupported CLIENT subcommand")
+
+
+    def describe(self)->bytes:
+        """Returns the CLIENT LIST line of this connection
+        """
+        now=time.monotonic()
+        fields=(
+            ("id",self.client_id),("addr",self.addr),("laddr",self.laddr),("fd",self.fd),
+            ("name",(self.name or b"").decode()),("age",int(now-self.created)),
+            ("idle",int(now-self.last_command)),("flags","N"),("db",self.db),
+            ("sub",len(self.channels)),("psub",len(self.patterns)),("multi",-1),("qbuf",len(self.buffer)),
+            ("qbuf-free",0),("argv-mem",0),("obl",0),("oll",self.pending.qsize()),("omem",0),
+            ("tot-mem",len(self.buffer)),("events","r"),("cmd",self.last_name),("user","default"),
+        )
+        return " ".join(f"{name}={value}" for name,value in fields).encode()
+
+
+    @staticmethod
+    def __address(address)->str:
+        return f"{address[0]}:{address[1]}" if address else ""
+
+
+    def cmd_INFO(self,*sections):
+        enabled=int(self.server.slot_map is not None)
+        replication="".join(f"{name}:{value}\r\n" for name,value in self.server.replication.items())
+        return f"# Server\r\nredis_version:7.0.0\r\n# Replication\r\n{replication}# Cluster\r\ncluster_enabled:{enabled}\r\n".encode()
+
+
+    def cmd_CLUSTER(self,subcommand:bytes,*args):
+        subcommand=subcommand.upper()
+        if subcommand==b"KEYSLOT":
+            return key_slot(args[0])
+        if self.server.slot_map is None:
+            raise _Error("ERR This instance has cluster support disabled")
+        if subcommand==b"SLOTS":
+            return self.server.cluster_slots()
+        if subcommand==b"INFO":
+            return b"cluster_state:ok\r\ncluster_slots_assigned:16384\r\n"
+        raise _Error("ERR unsupported CLUSTER subcommand")
+
+
+    def cmd_ASKING(self):
+        self.asking=True
+        return SimpleString("OK")
+
+
+    def cmd_READONLY(self):
+        return SimpleString("OK")
+
+
+    def cmd_READWRITE(self):
+        return SimpleString("OK")
+
+
+    def cmd_COMMAND(self,*args):
+        if args and args[0].upper()==b"GETKEYS":
+            keys=_command_keys(args[1].decode().upper(),list(args[2:]))
+            if not keys:
+                raise _Error("ERR The command has no key arguments")
+            return keys
+        if args:
+            raise _Error("ERR unsupported COMMAND subcommand")
+        table=[]
+        for attribute in dir(self):
+            if not attribute.startswith("cmd_"):
+                continue
+            name=attribute[4:]
+            first,last,step=_KEY_SPECS.get(name,(0,0,0) if name in _KEYLESS else (1,1,1))
+            flags=[SimpleString("movablekeys")] if name in _MOVABLE_KEYS else []
+            table.append([name.lower().encode(),-1,flags,first,last,step])
+        return table
+
+
+    def cmd_MONITOR(self):
+        self.monitoring=True
+        return SimpleString("OK")
+
+
+    def cmd_SUBSCRIBE(self,*channels):
+        if not channels:
+            raise ValueError
+        replies=Replies()
+        for channel in channels:
+            self.channels.add(channel)
+            replies.append([b"subscribe",channel,len(self.channels)+len(self.patterns)])
+        return replies
+
+
+    def cmd_UNSUBSCRIBE(self,*channels):
+        replies=Replies()
+        for channel in (channels or sorted(self.channels)):
+            self.channels.discard(channel)
+            replies.append([b"unsubscribe",channel,len(self.channels)+len(self.patterns)])
+        return replies
+
+
+    def cmd_PSUBSCRIBE(self,*patterns):
+        if not patterns:
+            raise ValueError
+        replies=Replies()
+        for pattern in patterns:
+            self.patterns.add(pattern)
+            replies.append([b"psubscribe",pattern,len(self.channels)+len(self.patterns)])
+        return replies
+
+
+    def cmd_PUNSUBSCRIBE(self,*patterns):
+        replies=Replies()
+        for pattern in (patterns or sorted(self.patterns)):
+            self.patterns.discard(pattern)
+            replies.append([b"punsubscribe",pattern,len(self.channels)+len(self.patterns)])
+        return replies
+
+
+    def cmd_PUBLISH(self,channel:bytes,message:bytes):
+        return self.server.publish(channel,message)
+
+
+    # ---- streams ----------------------------------------------------------
+
+    def cmd_XADD(self,key:bytes,*args):
+        args=list(args)
+        options=[arg.upper() for arg in args]
+        maxlen=None
+        nomkstream=False
+        index=0
+        while True:
+            if options[index]==b"NOMKSTREAM":
+                nomkstream=True
+                index+=1
+            elif options[index] in (b"MAXLEN",b"MINID"):
+                if options[index]==b"MINID":
+                    raise _Error("ERR stand-in server does not support MINID")
+                index+=1
+                if args[index] in (b"~",b"="):
+                    index+=1
+                maxlen=int(args[index])
+                index+=1
+                if options[index]==b"LIMIT":
+                    index+=2
+            else:
+                break
+        requested=args[index]
+        fields=args[index+1:]
+        if not fields or len(fields)%2:
+            raise ValueError
+        stream=self.keyspace.lookup(key)
+        if stream is None:
+            if nomkstream:
+                return None
+            stream=self.__collection(key,Stream,create=True)
+        elif type(stream) is not Stream:
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        if requested==b"*":
+            milliseconds=int(time.time()*1000)
+            entry_id=(milliseconds,0) if milliseconds>stream.last[0] else (stream.last[0],stream.last[1]+1)
+        else:
+            entry_id=_stream_id(requested)
+            if entry_id<=stream.last:
+                raise _Error("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        stream.entries[entry_id]=list(fields)
+        stream.last=entry_id
+        if maxlen is not None:
+            for old in list(stream.entries)[:max(len(stream.entries)-maxlen,0)]:
+                del stream.entries[old]
+        return _format_id(entry_id)
+
+
+    def cmd_XLEN(self,key:bytes):
+        stream=self.keyspace.lookup(key)
+        return 0 if stream is None else len(self.__collection(key,Stream).entries)
+
+
+    def cmd_XRANGE(self,key:bytes,start:bytes,end:bytes,*options):
+        stream=self.__collection(key,Stream)
+        low,high=_stream_id(start),_stream_id(end)
+        count=int(options[1]) if options else None
+        entries=[[_format_id(entry_id),fields] for entry_id,fields in stream.entries.items() if low<=entry_id<=high]
+        return entries[:count] if count is not None else entries
+
+
+    def cmd_XGROUP(self,subcommand:bytes,key:bytes,group:bytes,*args):
+        subcommand=subcommand.upper()
+        if subcommand!=b"CREATE":
+            raise _Error("ERR unsupported XGROUP subcommand")
+        mkstream=b"MKSTREAM" in [arg.upper() for arg in args[1:]]
+        if self.keyspace.lookup(key) is None and not mkstream:
+            raise _Error("ERR The XGROUP subcommand requires the key to exist.")
+        stream=self.__collection(key,Stream,create=True)
+        if group in stream.groups:
+            raise _Error("BUSYGROUP Consumer Group name already exists")
+        stream.groups[group]=StreamGroup(_stream_id(args[0],stream))
+        return SimpleString("OK")
+
+
+    def __group(self,key:bytes,group:bytes):
+        stream=self.keyspace.lookup(key)
+        if type(stream) is not Stream or group not in stream.groups:
+            raise _Error("NOGROUP No such key or consumer group")
+        return stream,stream.groups[group]
+
+
+    def cmd_XREADGROUP(self,*args):
+        options=[arg.upper() for arg in args]
+        group,consumer=args[1],args[2]
+        count=None
+        noack=False
+        index=3
+        while options[index]!=b"STREAMS":
+            if options[index]==b"COUNT":
+                count=int(args[index+1])
+                index+=2
+            elif options[index]==b"BLOCK":
+                index+=2
+            elif options[index]==b"NOACK":
+                noack=True
+                index+=1
+            else:
+                raise _Error("ERR syntax error")
+        rest=args[index+1:]
+        half=len(rest)//2
+        replies=[]
+        for key,requested in zip(rest[:half],rest[half:]):
+            stream,state=self.__group(key,group)
+            if requested==b">":
+                entries=[(entry_id,fields) for entry_id,fields in stream.entries.items() if entry_id>state.last]
+                entries=entries[:count] if count is not None else entries
+                if entries:
+                    state.last=entries[-1][0]
+                if not noack:
+                    for entry_id,_ in entries:
+                        state.pending[entry_id]=[consumer,time.time(),1]
+            else:
+                start=_stream_id(requested)
+                entries=[(entry_id,stream.entries.get(entry_id)) for entry_id,owner in state.pending.items()
+                    if owner[0]==consumer and entry_id>start]
+                entries=entries[:count] if count is not None else entries
+            if entries or requested!=b">":
+                replies.append([key,[[_format_id(entry_id),fields] for entry_id,fields in entries]])
+        return replies or None
+
+
+    def cmd_XACK(self,key:bytes,group:bytes,*ids):
+        _,state=self.__group(key,group)
+        return sum(1 for entry_id in ids if state.pending.pop(_stream_id(entry_id),None) is not None)
+
+
+    def cmd_XPENDING(self,key:bytes,group:bytes):
+        _,state=self.__group(key,group)
+        if not state.pending:
+            return [0,None,None,None]
+        consumers={}
+        for owner in state.pending.values():
+            consumers[owner[0]]=consumers.get(owner[0],0)+1
+        ids=sorted(state.pending)
+        return [len(ids),_format_id(ids[0]),_format_id(ids[-1]),[[name,str(total).encode()] for name,total in consumers.items()]]
+
+
+    def cmd_XAUTOCLAIM(self,key:bytes,group:bytes,consumer:bytes,min_idle:bytes,start:bytes,*options):
+        stream,state=self.__group(key,group)
+        options=[option.upper() if isinstance(option,bytes) else option for option in options]
+        count=int(options[options.index(b"COUNT")+1]) if b"COUNT" in options else 100
+        justid=b"JUSTID" in options
+        deadline=time.time()-int(min_idle)/1000
+        start=_stream_id(start)
+        claimed=[]
+        deleted=[]
+        cursor=(0,0)
+        for entry_id in sorted(state.pending):
+            if entry_id<start:
+                continue
+            if len(claimed)+len(deleted)>=count:
+                cursor=entry_id
+                break
+            owner=state.pending[entry_id]
+            if owner[1]>deadline:
+                continue
+            if entry_id not in stream.entries:
+                del state.pending[entry_id]
+                deleted.append(_format_id(entry_id))
+                continue
+            state.pending[entry_id]=[consumer,time.time(),owner[2]+1]
+            claimed.append(entry_id)
+        if justid:
+            entries=[_format_id(entry_id) for entry_id in claimed]
+        else:
+            entries=[[_format_id(entry_id),stream.entries[entry_id]] for entry_id in claimed]
+        return [_format_id(cursor),entries,deleted]
+
+
+    # ---- scripting --------------------------------------------------------
+
+    def cmd_SCRIPT(self,subcommand:bytes,*args):
+        subcommand=subcommand.upper()
+        if subcommand==b"LOAD":
+            sha=hashlib.sha1(args[0]).hexdigest()
+            self.server.scripts[sha]=args[0]
+            return sha
+        if subcommand==b"EXISTS":
+            return [int(sha.decode() in self.server.scripts) for sha in args]
+        if subcommand==b"FLUSH":
+            self.server.scripts.clear()
+            return SimpleString("OK")
+        raise _Error("ERR unsupported SCRIPT subcommand")
+
+
+    def cmd_EVALSHA(self,sha:bytes,numkeys:bytes,*args):
+        sha=sha.decode().lower()
+        if sha not in self.server.scripts:
+            raise _Error("NOSCRIPT No matching script. Please use EVAL.")
+        function=self.server.script_functions.get(sha)
+        if function is None:
+            raise _Error("ERR the stand-in server cannot run this script")
+        numkeys=int(numkeys)
+        keys=list(args[:numkeys])
+        reply=function(self,keys,list(args[numkeys:]))
+        self.server.notify_write(keys)
+        return reply
+
+
+    def cmd_EVAL(self,source:bytes,numkeys:bytes,*args):
+        sha=self.cmd_SCRIPT(b"LOAD",source)
+        return self.cmd_EVALSHA(sha.encode(),numkeys,*args)
+
+
+    # ---- keyspace ---------------------------------------------------------
+
+    def cmd_DBSIZE(self):
+        return len(self.keyspace.data)
+
+
+    def cmd_FLUSHDB(self,*args):
+        self.keyspace.data.clear()
+        self.keyspace.expires.clear()
+        return SimpleString("OK")
+
+
+    def cmd_FLUSHALL(self,*args):
+        self.server.databases.clear()
+        self.keyspace=self.server.keyspace(self.db)
+        return SimpleString("OK")
+
+
+    def cmd_DEL(self,*keys):
+        return sum(1 for key in keys if self.keyspace.delete(key))
+
+
+    def cmd_EXISTS(self,*keys):
+        return sum(1 for key in keys if self.keyspace.lookup(key) is not None)
+
+
+    def cmd_PTTL(self,key:bytes):
+        if self.keyspace.lookup(key) is None:
+            return -2
+        expire_at=self.keyspace.expires.get(key)
+        if expire_at is None:
+            return -1
+        return max(int((expire_at-time.time())*1000),0)
+
+
+    def cmd_TTL(self,key:bytes):
+        ttl=self.cmd_PTTL(key)
+        return ttl if ttl<0 else ttl//1000
+
+
+    # ---- strings ----------------------------------------------------------
+
+    def __string(self,key:bytes):
+        value=self.keyspace.lookup(key)
+        if value is not None and not isinstance(value,bytes):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+
+    def cmd_GET(self,key:bytes):
+        return self.__string(key)
+
+
+    def cmd_SET(self,key:bytes,value:bytes,*options):
+        options=[option.upper() if isinstance(option,bytes) else option for option in options]
+        expire_at=None
+        nx=xx=get=keep_ttl=False
+        index=0
+        while index<len(options):
+            option=options[index]
+            if option in (b"EX",b"PX",b"EXAT",b"PXAT"):
+                amount=int(options[index+1])
+                index+=1
+                if option==b"EX":
+                    expire_at=time.time()+amount
+                elif option==b"PX":
+                    expire_at=time.time()+amount/1000
+                elif option==b"EXAT":
+                    expire_at=amount
+                else:
+                    expire_at=amount/1000
+            elif option==b"NX":
+                nx=True
+            elif option==b"XX":
+                xx=True
+            elif option==b"GET":
+                get=True
+            elif option==b"KEEPTTL":
+                keep_ttl=True
+            else:
+                raise _Error("ERR syntax error")
+            index+=1
+        old=self.__string(key)
+        if (nx and old is not None) or (xx and old is None):
+            return old if get else None
+        self.keyspace.store(key,value,keep_ttl=keep_ttl)
+        if expire_at is not None:
+            self.keyspace.expires[key]=expire_at
+        return old if get else SimpleString("OK")
+
+
+    def cmd_APPEND(self,key:bytes,value:bytes):
+        old=self.__string(key) or b""
+        self.keyspace.store(key,old+value,keep_ttl=True)
+        return len(old)+len(value)
+
+
+    def cmd_GETDEL(self,key:bytes):
+        value=self.__string(key)
+        if value is not None:
+            self.keyspace.delete(key)
+        return value
+
+
+    def cmd_MSET(self,*pairs):
+        if not pairs or len(pairs)%2:
+            raise ValueError
+        for index in range(0,len(pairs),2):
+            self.keyspace.store(pairs[index],pairs[index+1])
+        return SimpleString("OK")
+
+
+    def cmd_MGET(self,*keys):
+        if not keys:
+            raise ValueError
+        values=[self.keyspace.lookup(key) for key in keys]
+        return [value if isinstance(value,bytes) else None for value in values]
+
+
+    def cmd_STRLEN(self,key:bytes):
+        return len(self.__string(key) or b"")
+
+
+    def cmd_GETRANGE(self,key:bytes,start:bytes,end:bytes):
+        value=self.__string(key) or b""
+        start,end=int(start),int(end)
+        if start<0:
+            start=max(len(value)+start,0)
+        if end<0:
+            end=len(value)+end
+        return value[start:end+1] if start<=end else b""
+
+
+    def cmd_SETRANGE(self,key:bytes,offset:bytes,value:bytes):
+        offset=int(offset)
+        if offset<0:
+            raise _Error("ERR offset is out of range")
+        old=self.__string(key) or b""
+        if not value:
+            return len(old)
+        new=old[:offset].ljust(offset,b"\0")+value+old[offset+len(value):]
+        self.keyspace.store(key,new,keep_ttl=True)
+        return len(new)
+
+
+    def cmd_SETBIT(self,key:bytes,offset:bytes,value:bytes):
+        return self.cmd_BITFIELD(key,b"SET",b"u1",offset,value)[0]
+
+
+    def cmd_GETBIT(self,key:bytes,offset:bytes):
+        return _get_bits(self.__string(key) or b"",int(offset),1,False)
+
+
+    def cmd_BITCOUNT(self,key:bytes,*bounds):
+        value=self.__string(key) or b""
+        if bounds:
+            start,end=int(bounds[0]),int(bounds[1])
+            start=max(len(value)+start,0) if start<0 else start
+            end=len(value)+end if end<0 else end
+            value=value[start:end+1]
+        return sum(bin(byte).count("1") for byte in value)
+
+
+    def cmd_BITFIELD(self,key:bytes,*operations):
+        data=bytearray(self.__string(key) or b"")
+        replies=[]
+        written=False
+        index=0
+        while index<len(operations):
+            operation=operations[index].upper()
+            if operation==b"OVERFLOW":
+                index+=2
+                continue
+            if operation not in (b"GET",b"SET"):
+                raise _Error("ERR unsupported BITFIELD operation")
+            signed,width=operations[index+1][:1].lower()==b"i",int(operations[index+1][1:])
+            offset=operations[index+2]
+            offset=int(offset[1:])*width if offset.startswith(b"#") else int(offset)
+            replies.append(_get_bits(data,offset,width,signed))
+            if operation==b"SET":
+                _set_bits(data,offset,width,int(operations[index+3]))
+                written=True
+                index+=1
+            index+=3
+        if written:
+            self.keyspace.store(key,bytes(data),keep_ttl=True)
+        return replies
+
+
+    def cmd_BITFIELD_RO(self,key:bytes,*operations):
+        if any(operation.upper()==b"SET" for operation in operations[::3]):
+            raise _Error("ERR BITFIELD_RO only supports the GET subcommand")
+        return self.cmd_BITFIELD(key,*operations)
+
+
+    def cmd_PFADD(self,key:bytes,*elements):
+        value=self.keyspace.lookup(key)
+        if value is not None and not isinstance(value,HyperLogLog):
+            raise _Error("WRONGTYPE Key is not a valid HyperLogLog string value.")
+        if value is None:
+            value=HyperLogLog()
+            self.keyspace.store(key,value)
+            if not elements:
+                return 1
+        before=len(value)
+        value.update(elements)
+        return int(len(value)>before)
+
+
+    def cmd_PFCOUNT(self,*keys):
+        union=set()
+        for key in keys:
+            value=self.keyspace.lookup(key)
+            if value is not None and not isinstance(value,HyperLogLog):
+                raise _Error("WRONGTYPE Key is not a valid HyperLogLog string value.")
+            union.update(value or ())
+        return len(union)
+
+
+    def cmd_PFMERGE(self,target:bytes,*sources):
+        merged=HyperLogLog(self.keyspace.lookup(target) or ())
+        for source in sources:
+            merged.update(self.keyspace.lookup(source) or ())
+        self.keyspace.store(target,merged,keep_ttl=True)
+        return SimpleString("OK")
+
+
+    # ---- scanning ---------------------------------------------------------
+
+    def cmd_DUMP(self,key:bytes):
+        value=self.keyspace.lookup(key)
+        if value is None:
+            return None
+        return _DUMP_PREFIX+pickle.dumps(value)
+
+
+    def cmd_RESTORE(self,key:bytes,ttl:bytes,payload:bytes,*options):
+        options={option.upper() for option in options}
+        if not payload.startswith(_DUMP_PREFIX):
+            raise _Error("ERR DUMP payload version or checksum are wrong")
+        if b"REPLACE" not in options and self.keyspace.lookup(key) is not None:
+            raise _Error("BUSYKEY Target key name already exists.")
+        self.keyspace.store(key,pickle.loads(payload[len(_DUMP_PREFIX):]))
+        ttl=int(ttl)
+        if ttl:
+            self.keyspace.expires[key]=ttl/1000 if b"ABSTTL" in options else time.time()+ttl/1000
+        return SimpleString("OK")
+
+
+    def cmd_TYPE(self,key:bytes):
+        value=self.keyspace.lookup(key)
+        if value is None:
+            return SimpleString("none")
+        return SimpleString(_type_name(value))
+
+
+    def cmd_MEMORY(self,subcommand:bytes,*args):
+        if subcommand.upper()!=b"USAGE":
+            raise _Error("ERR unsupported MEMORY subcommand")
+        value=self.keyspace.lookup(args[0])
+        if value is None:
+            return None
+        return 48+len(args[0])+_value_size(value)
+
+
+    def cmd_SCAN(self,cursor:bytes,*options):
+        match,count,type_name=_scan_options(options)
+        keys=sorted(self.keyspace.data)
+        cursor=int(cursor)
+        page=keys[cursor:cursor+count]
+        cursor=cursor+count if cursor+count<len(keys) else 0
+        result=[]
+        for key in page:
+            value=self.keyspace.lookup(key)
+            if value is None or (match and not fnmatch.fnmatchcase(key,match)):
+                continue
+            if type_name and _type_name(value).encode()!=type_name:
+                continue
+            result.append(key)
+        return [str(cursor).encode(),result]
+
+
+    def __scan_collection(self,key:bytes,kind:type,cursor:bytes,options:tuple,pairs:bool):
+        match,count,_=_scan_options(options)
+        collection=self.__collection(key,kind)
+        members=sorted(collection)
+        cursor=int(cursor)
+        page=[member for member in members[cursor:cursor+count] if not match or fnmatch.fnmatchcase(member,match)]
+        cursor=cursor+count if cursor+count<len(members) else 0
+        if not pairs:
+            return [str(cursor).encode(),page]
+        flat=[]
+        for member in page:
+            flat.append(member)
+            value=collection[member]
+            flat.append(value if isinstance(value,bytes) else repr(value).encode())
+        return [str(cursor).encode(),flat]
+
+
+    def __collection(self,key:bytes,kind:type,create:bool=False):
+        value=self.keyspace.lookup(key)
+        if value is None:
+            value=kind()
+            if create:
+                self.keyspace.store(key,value)
+        if type(value) is not kind:
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+
+    def __drop_empty(self,key:bytes,collection)->None:
+        if not collection:
+            self.keyspace.delete(key)
+
+
+    def cmd_HSCAN(self,key:bytes,cursor:bytes,*options):
+        return self.__scan_collection(key,Hash,cursor,options,pairs=True)
+
+
+    def cmd_SSCAN(self,key:bytes,cursor:bytes,*options):
+        return self.__scan_collection(key,set,cursor,options,pairs=False)
+
+
+    def cmd_ZSCAN(self,key:bytes,cursor:bytes,*options):
+        return self.__scan_collection(key,ZSet,cursor,options,pairs=True)
+
+
+    # ---- hashes, sets and sorted sets -------------------------------------
+
+    def cmd_HSET(self,key:bytes,*pairs):
+        if not pairs or len(pairs)%2:
+            raise ValueError
+        collection=self.__collection(key,Hash,create=True)
+        added=0
+        for index in range(0,len(pairs),2):
+            added+=pairs[index] not in collection
+            collection[pairs[index]]=pairs[index+1]
+        return added
+
+
+    def cmd_HGET(self,key:bytes,field:bytes):
+        return self.__collection(key,Hash).get(field)
+
+
+    def cmd_HDEL(self,key:bytes,*fields):
+        collection=self.__collection(key,Hash)
+        removed=sum(1 for field in fields if collection.pop(field,None) is not None)
+        self.__drop_empty(key,collection)
+        return removed
+
+
+    def cmd_HMGET(self,key:bytes,*fields):
+        if not fields:
+            raise ValueError
+        collection=self.__collection(key,Hash)
+        return [collection.get(field) for field in fields]
+
+
+    def cmd_HEXISTS(self,key:bytes,field:bytes):
+        return int(field in self.__collection(key,Hash))
+
+
+    def cmd_HINCRBY(self,key:bytes,field:bytes,amount:bytes):
+        collection=self.__collection(key,Hash,create=True)
+        value=int(collection.get(field,b"0"))+int(amount)
+        collection[field]=str(value).encode()
+        return value
+
+
+    def cmd_HINCRBYFLOAT(self,key:bytes,field:bytes,amount:bytes):
+        collection=self.__collection(key,Hash,create=True)
+        value=float(collection.get(field,b"0"))+float(amount)
+        collection[field]=repr(value).encode()
+        return collection[field]
+
+
+    def cmd_HGETALL(self,key:bytes):
+        return [item for pair in self.__collection(key,Hash).items() for item in pair]
+
+
+    def cmd_HLEN(self,key:bytes):
+        return len(self.__collection(key,Hash))
+
+
+    def cmd_SADD(self,key:bytes,*members):
+        if not members:
+            raise ValueError
+        collection=self.__collection(key,set,create=True)
+        before=len(collection)
+        collection.update(members)
+        return len(collection)-before
+
+
+    def cmd_SREM(self,key:bytes,*members):
+        collection=self.__collection(key,set)
+        before=len(collection)
+        collection.difference_update(members)
+        self.__drop_empty(key,collection)
+        return before-len(collection)
+
+
+    def cmd_SMEMBERS(self,key:bytes):
+        return sorted(self.__collection(key,set))
+
+
+    def cmd_SISMEMBER(self,key:bytes,member:bytes):
+        return int(member in self.__collection(key,set))
+
+
+    def cmd_SMISMEMBER(self,key:bytes,*members):
+        if not members:
+            raise ValueError
+        collection=self.__collection(key,set)
+        return [int(member in collection) for member in members]
+
+
+    def cmd_SCARD(self,key:bytes):
+        return len(self.__collection(key,set))
+
+
+    def cmd_ZADD(self,key:bytes,*pairs):
+        if not pairs or len(pairs)%2:
+            raise ValueError
+        collection=self.__collection(key,ZSet,create=True)
+        added=0
+        for index in range(0,len(pairs),2):
+            member=pairs[index+1]
+            added+=member not in collection
+            collection[member]=float(pairs[index])
+        return added
+
+
+    def cmd_ZREM(self,key:bytes,*members):
+        collection=self.__collection(key,ZSet)
+        removed=sum(1 for member in members if collection.pop(member,None) is not None)
+        self.__drop_empty(key,collection)
+        return removed
+
+
+    def cmd_ZCARD(self,key:bytes):
+        return len(self.__collection(key,ZSet))
+
+
+    def cmd_ZSCORE(self,key:bytes,member:bytes):
+        score=self.__collection(key,ZSet).get(member)
+        return None if score is None else repr(score).encode()
+
+
+    def cmd_ZMSCORE(self,key:bytes,*members):
+        if not members:
+            raise ValueError
+        collection=self.__collection(key,ZSet)
+        return [None if member not in collection else repr(collection[member]).encode() for member in members]
+
+
+    def cmd_ZINCRBY(self,key:bytes,amount:bytes,member:bytes):
+        collection=self.__collection(key,ZSet,create=True)
+        collection[member]=collection.get(member,0.0)+float(amount)
+        return repr(collection[member]).encode()
+
+
+    def cmd_ZRANGE(self,key:bytes,start:bytes,stop:bytes,*options):
+        options=[option.upper() for option in options]
+        by_score,rev,with_scores=b"BYSCORE" in options,b"REV" in options,b"WITHSCORES" in options
+        items=sorted(self.__collection(key,ZSet).items(),key=lambda item:(item[1],item[0]),reverse=rev)
+        if by_score:
+            low,high=(_score_bound(stop),_score_bound(start)) if rev else (_score_bound(start),_score_bound(stop))
+            items=[item for item in items
+                if (item[1]>low[0] or (item[1]==low[0] and not low[1])) and (item[1]<high[0] or (item[1]==high[0] and not high[1]))]
+            if b"LIMIT" in options:
+                position=options.index(b"LIMIT")
+                offset,count=int(options[position+1]),int(options[position+2])
+                items=items[offset:] if count<0 else items[offset:offset+count]
+        else:
+            start,stop=int(start),int(stop)
+            start=max(len(items)+start,0) if start<0 else start
+            stop=len(items)+stop if stop<0 else stop
+            items=items[start:stop+1]
+        if not with_scores:
+            return [member for member,_ in items]
+        return [value for member,score in items for value in (member,repr(score).encode())]
+
+
+class SimpleString(str):
+    pass
+
+
+class Hash(dict):
+    pass
+
+
+class ZSet(dict):
+    pass
+
+
+class AclUser:
+    """ACL rules of one user, applied in order like ACL SETUSER
+    """
+
+    def __init__(self,name:bytes) -> None:
+        self.name=name
+        self.reset()
+
+
+    @classmethod
+    def default(cls):
+        user=cls(b"default")
+        user.apply([b"on",b"nopass",b"allkeys",b"allchannels",b"allcommands"])
+        return user
+
+
+    def reset(self)->None:
+        self.enabled=False
+        self.nopass=False
+        self.passwords=[]
+        self.keys=[]
+        self.channels=[]
+        self.commands=[b"-@all"]
+
+
+    def apply(self,rules)->None:
+        for rule in rules:
+            lower=rule.lower()
+            if lower==b"reset":
+                self.reset()
+            elif lower in (b"on",b"off"):
+                self.enabled=lower==b"on"
+            elif lower==b"nopass":
+                self.nopass,self.passwords=True,[]
+            elif lower==b"resetpass":
+                self.nopass,self.passwords=False,[]
+            elif rule[:1] in (b">",b"#"):
+                digest=hashlib.sha256(rule[1:]).hexdigest().encode() if rule[:1]==b">" else rule[1:].lower()
+                if rule[:1]==b"#" and len(digest)!=64:
+                    raise _Error("ERR Error in ACL SETUSER modifier '#...': The password hash must be exactly 64 characters")
+                self.nopass=False
+                if digest not in self.passwords:
+                    self.passwords.append(digest)
+            elif lower==b"allkeys":
+                self.keys=[b"~*"]
+            elif lower==b"resetkeys":
+                self.keys=[]
+            elif rule[:1]==b"~" or rule[:1]==b"%":
+                self.keys.append(rule)
+            elif lower==b"allchannels":
+                self.channels=[b"&*"]
+            elif lower==b"resetchannels":
+                self.channels=[]
+            elif rule[:1]==b"&":
+                self.channels.append(rule)
+            elif lower in (b"allcommands",b"+@all"):
+                self.commands=[b"+@all"]
+            elif lower in (b"nocommands",b"-@all"):
+                self.commands=[b"-@all"]
+            elif rule[:1] in (b"+",b"-"):
+                if rule[1:2]==b"@" and rule[2:].decode().lower() not in _ACL_CATEGORIES:
+                    raise _Error(f"ERR Error in ACL SETUSER modifier '{rule.decode()}': Unknown command or category name in ACL")
+                self.commands.append(lower)
+            else:
+                raise _Error(f"ERR Error in ACL SETUSER modifier '{rule.decode()}': Syntax error")
+
+
+    def describe(self)->bytes:
+        """Line of the user in ACL LIST
+        """
+        parts=[b"user",self.name,b"on" if self.enabled else b"off"]
+        if self.nopass:
+            parts.append(b"nopass")
+        parts+=[b"#"+digest for digest in self.passwords]
+        parts+=self.keys
+        parts+=self.channels or [b"resetchannels"]
+        parts+=self.commands
+        return b" ".join(parts)
+
+
+_ACL_CATEGORIES={
+    "keyspace":{"del","exists","expire","pexpire","persist","pttl","ttl","type","scan","rename","dump","restore","dbsize","flushdb","flushall"},
+    "read":{"get","mget","strlen","getrange","exists","ttl","pttl","type","scan","hget","hmget","hgetall","hlen","hscan","smembers","sismember",
+        "scard","sscan","zscore","zrange","zcard","zscan","xrange","xlen","getbit","bitcount","pfcount","dump"},
+    "write":{"set","mset","append","getdel","setrange","del","expire","pexpire","persist","rename","restore","hset","hdel","hincrby","sadd",
+        "srem","zadd","zrem","zincrby","xadd","setbit","bitfield","pfadd","pfmerge","flushdb","flushall"},
+    "string":{"get","set","mget","mset","append","getdel","strlen","getrange","setrange"},
+    "hash":{"hset","hget","hmget","hdel","hgetall","hlen","hscan","hincrby"},
+    "set":{"sadd","srem","smembers","sismember","scard","sscan"},
+    "sortedset":{"zadd","zrem","zscore","zrange","zcard","zscan","zincrby"},
+    "bitmap":{"setbit","getbit","bitcount","bitfield"},
+    "hyperloglog":{"pfadd","pfcount","pfmerge"},
+    "stream":{"xadd","xrange","xlen","xreadgroup","xack","xgroup"},
+    "pubsub":{"publish","subscribe","psubscribe","unsubscribe","punsubscribe"},
+    "admin":{"acl","client","config","monitor","flushall","flushdb","debug"},
+    "dangerous":{"acl","client","config","monitor","flushall","flushdb","keys","debug"},
+    "connection":{"ping","echo","auth","select","client","hello","quit"},
+    "scripting":{"eval","evalsha","script"},
+    "fast":{"get","set","append","strlen","hget","hset","sadd","sismember","zadd","zscore","ping","echo"},
+    "slow":{"mget","mset","hgetall","smembers","zrange","scan","keys","flushall","flushdb","eval","evalsha"},
+}
+
+
+class HyperLogLog(set):
+    """Exact stand-in of a HyperLogLog : the set of the added elements
+    """
+
+
+class Stream:
+
+    def __init__(self) -> None:
+        self.entries={}
+        self.last=(0,0)
+        self.groups={}
+
+
+class StreamGroup:
+
+    def __init__(self,last:tuple) -> None:
+        self.last=last
+        self.pending={}
+
+
+def _stream_id(value:bytes,stream:Stream=None)->tuple:
+    if value==b"$":
+        return stream.last
+    if value in (b"-",b"0"):
+        return (0,0)
+    if value==b"+":
+        return (2**64,0)
+    milliseconds,_,sequence=value.partition(b"-")
+    return (int(milliseconds),int(sequence or 0))
+
+
+def _format_id(entry_id:tuple)->bytes:
+    return f"{entry_id[0]}-{entry_id[1]}".encode()
+
+
+class Replies(list):
+    """Several replies sent back for a single command, like SUBSCRIBE
+    """
+
+
+def _type_name(value)->str:
+    return {bytes:"string",Hash:"hash",set:"set",ZSet:"zset",Stream:"stream",HyperLogLog:"string"}.get(type(value),"none")
+
+
+def _score_bound(bound:bytes)->tuple:
+    """Parses a score bound of ZRANGE BYSCORE : (value, exclusive)
+    """
+    exclusive=bound.startswith(b"(")
+    return float(bound[1:] if exclusive else bound),exclusive
+
+
+def _get_bits(data,offset:int,width:int,signed:bool)->int:
+    """Reads (width) bits from bit (offset), most significant bit first
+    like BITFIELD
+    """
+    value=0
+    for bit in range(offset,offset+width):
+        byte=bit>>3
+        value=(value<<1)|((data[byte]>>(7-(bit&7)))&1 if byte<len(data) else 0)
+    if signed and value>>(width-1):
+        value-=1<<width
+    return value
+
+
+def _set_bits(data:bytearray,offset:int,width:int,value:int)->None:
+    end=(offset+width+7)>>3
+    if len(data)<end:
+        data.extend(bytes(end-len(data)))
+    for position in range(width):
+        bit=offset+position
+        mask=1<<(7-(bit&7))
+        if (value>>(width-1-position))&1:
+            data[bit>>3]|=mask
+        else:
+            data[bit>>3]&=~mask&0xff
+
+
+_KEYLESS={"PING","ECHO","QUIT","SELECT","AUTH","ACL","CLIENT","MONITOR","SUBSCRIBE","UNSUBSCRIBE","PSUBSCRIBE","PUNSUBSCRIBE","PUBLISH","SCRIPT",
+    "DBSIZE","FLUSHDB","FLUSHALL","SCAN","INFO","CLUSTER","COMMAND","ASKING","READONLY","READWRITE"}
+_MOVABLE_KEYS={"EVAL","EVALSHA","XREADGROUP"}
+_KEY_SPECS={"MGET":(1,-1,1),"DEL":(1,-1,1),"EXISTS":(1,-1,1),"MSET":(1,-1,2),"MEMORY":(2,2,1),"XGROUP":(2,2,1),
+    "EVAL":(0,0,0),"EVALSHA":(0,0,0),"XREADGROUP":(0,0,0)}
+
+
+def _command_keys(name:str,args:list)->list:
+    """Returns the keys of a command, used for cluster routing
+    """
+    if name in _KEYLESS or not args:
+        return []
+    if name in ("MGET","DEL","EXISTS"):
+        return list(args)
+    if name=="MSET":
+        return list(args[::2])
+    if name in ("EVAL","EVALSHA"):
+        return list(args[2:2+int(args[1])])
+    if name=="XREADGROUP":
+        options=[arg.upper() for arg in args]
+        streams=list(args[options.index(b"STREAMS")+1:])
+        return streams[:len(streams)//2]
+    if name in ("MEMORY","XGROUP"):
+        return list(args[1:2])
+    return list(args[:1])
+
+
+def _quote(arg:bytes)->str:
+    """Quotes an argument the way MONITOR does (sdscatrepr)
+    """
+    escapes={0x5c:"\\\\",0x22:'\\"',0x0a:"\\n",0x0d:"\\r",0x09:"\\t",0x07:"\\a",0x08:"\\b"}
+    out=[]
+    for byte in arg:
+        if byte in escapes:
+            out.append(escapes[byte])
+        elif 32<=byte<127:
+            out.append(chr(byte))
+        else:
+            out.append(f"\\x{byte:02x}")
+    return '"'+"".join(out)+'"'
+
+
+def _value_size(value)->int:
+    """Rough in-memory size of a value, in the spirit of MEMORY USAGE
+    """
+    if isinstance(value,bytes):
+        return len(value)
+    if isinstance(value,dict):
+        return sum(16+len(field)+(len(item) if isinstance(item,bytes) else 8) for field,item in value.items())
+    if isinstance(value,set):
+        return sum(16+len(member) for member in value)
+    if isinstance(value,Stream):
+        return sum(32+sum(len(item) for item in fields) for fields in value.entries.values())
+    return 0
+
+
+def _scan_options(options:tuple)->tuple:
+    match=None
+    count=10
+    type_name=None
+    options=list(options)
+    for index in range(0,len(options),2):
+        option=options[index].upper()
+        if option==b"MATCH":
+            match=options[index+1]
+        elif option==b"COUNT":
+            count=int(options[index+1])
+        elif option==b"TYPE":
+            type_name=options[index+1].lower()
+        else:
+            raise _Error("ERR syntax error")
+    return match,count,type_name
+
+
+def encode(value)->bytes:
+    """Serializes a python value as a RESP2 reply
+    """
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value,_Error):
+        return b"-"+str(value).encode()+b"\r\n"
+    if isinstance(value,Replies):
+        return b"".join(encode(item) for item in value)
+    if isinstance(value,SimpleString):
+        return b"+"+value.encode()+b"\r\n"
+    if isinstance(value,bool):
+        return b":"+(b"1" if value else b"0")+b"\r\n"
+    if isinstance(value,int):
+        return b":"+str(value).encode()+b"\r\n"
+    if isinstance(value,str):
+        value=value.encode()
+    if isinstance(value,(bytes,bytearray)):
+        return b"$"+str(len(value)).encode()+b"\r\n"+bytes(value)+b"\r\n"
+    if isinstance(value,(list,tuple)):
+        return b"*"+str(len(value)).encode()+b"\r\n"+b"".join(encode(item) for item in value)
+    raise TypeError(f"cannot encode {type(value)}")
+
+
+class StandinCluster:
+    """Several stand-in servers sharing the 16384 hash slots like a
+    Redis Cluster, with evenly split slot ranges. With processes=True
+    each node runs in its own process, so the nodes do not share the
+    GIL and the throughput of the cluster grows with the number of nodes.
+
+    Example:
+        with StandinCluster(nodes=3) as cluster:
+            driver.connect(port=cluster.port,cluster=True)
+    """
+
+    def __init__(self,nodes:int=3,processes:bool=False,host:str="127.0.0.1",latency:float=0.0) -> None:
+        self.size=nodes
+        self.processes=processes
+        self.host=host
+        self.latency=latency
+        self.ports=[]
+        self.owners=None
+        self.__nodes=[]
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self,*exc)->None:
+        self.stop()
+
+
+    @property
+    def port(self)->int:
+        return self.ports[0]
+
+
+    def start(self)->list:
+        """Starts the nodes and assigns the slots
+
+        Returns:
+            list: ports of the nodes
+        """
+        for _ in range(self.size):
+            node=_ProcessNode(self.host,self.latency) if self.processes else _ThreadNode(self.host,self.latency)
+            self.__nodes.append(node)
+            self.ports.append(node.port)
+        addresses=[f"{self.host}:{port}" for port in self.ports]
+        self.owners=[addresses[slot*self.size//REDIS_CLUSTER_HASH_SLOTS] for slot in range(REDIS_CLUSTER_HASH_SLOTS)]
+        self.__publish()
+        return self.ports
+
+
+    def stop(self)->None:
+        for node in self.__nodes:
+            node.stop()
+        self.__nodes=[]
+        self.ports=[]
+
+
+    def call(self,index:int,method:str,*args):
+        """Runs a StandinServer method on node (index)
+        """
+        return self.__nodes[index].call(method,*args)
+
+
+    def move_slot(self,slot:int,index:int)->None:
+        """Moves a slot and its keys to node (index), as a resharding would
+        """
+        source=self.ports.index(int(self.owners[slot].rsplit(":",1)[1]))
+        if source==index:
+            return
+        self.call(index,"import_slot",self.call(source,"export_slot",slot))
+        self.owners[slot]=f"{self.host}:{self.ports[index]}"
+        self.__publish()
+
+
+    def counters(self)->tuple:
+        """Returns the round trips and commands processed by every node
+        """
+        counters=[self.call(index,"counters") for index in range(len(self.__nodes))]
+        return sum(trips for trips,_ in counters),sum(commands for _,commands in counters)
+
+
+    def reset_counters(self)->None:
+        for index in range(len(self.__nodes)):
+            self.call(index,"reset_counters")
+
+
+    def __publish(self)->None:
+        nodes=[(self.host,port,hashlib.sha1(str(port).encode()).hexdigest()) for port in self.ports]
+        for index in range(len(self.__nodes)):
+            self.call(index,"set_cluster",self.owners,nodes)
+
+
+class _ThreadNode:
+
+    def __init__(self,host:str,latency:float) -> None:
+        self.server=StandinServer(host,0,latency)
+        self.port=self.server.start()
+
+
+    def call(self,method:str,*args):
+        return self.server.invoke(method,*args)
+
+
+    def stop(self)->None:
+        self.server.stop()
+
+
+class _ProcessNode:
+
+    def __init__(self,host:str,latency:float) -> None:
+        context=multiprocessing.get_context("spawn")
+        self.connection,child=context.Pipe()
+        self.process=context.Process(target=_serve_node,args=(host,latency,child),daemon=True)
+        self.process.start()
+        self.port=self.connection.recv()
+
+
+    def call(self,method:str,*args):
+        self.connection.send((method,args))
+        ok,result=self.connection.recv()
+        if not ok:
+            raise result
+        return result
+
+
+    def stop(self)->None:
+        self.connection.send(None)
+        self.process.join(5)
+
+
+def _serve_node(host:str,latency:float,connection)->None:
+    server=StandinServer(host,0,latency)
+    connection.send(server.start())
+    while True:
+        message=connection.recv()
+        if message is None:
+            break
+        method,args=message
+        try:
+            connection.send((True,server.invoke(method,*args)))
+        except Exception as err:
+            connection.send((False,err))
+    server.stop()
@@ -0,0 +1,363 @@
+"""Reproducible benchmark suite of the driver. Runs against a stand-in
+server started in process (with --latency ms injected before each reply)
+or against a real server with --host and --port, and writes one JSON
+document with, for each benchmark : operations per second, p50 and p99
+latency in microseconds and the memory allocated per operation
+(measured with tracemalloc in a separate pass).
+
+With --baseline the results are compared with a previous JSON output :
+the run fails (exit code 1) when a benchmark is slower than the
+baseline by more than --threshold (ops/s lower or p99 higher). With
+--startup-budget the run also fails when the median import plus first
+connection of a fresh interpreter (startup.import + startup.connect)
+takes longer than the budget in milliseconds.
+
+Usage:
+    python -m benchmarks.suite [--quick] [--latency MS] [--host HOST --port PORT]
+        [--output FILE] [--baseline FILE] [--threshold FRACTION] [--startup-budget MS] [--only PREFIX ...]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import redis
+from redis import Redis
+from driver import Driver
+from driver.utils.client import Client
+from driver.utils.commands import Commands
+from benchmarks.standin import StandinServer
+
+
+PREFIX="bench:suite:"
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP="""
+import json,sys,time
+start=time.perf_counter()
+from driver import Driver
+imported=time.perf_counter()
+driver=Driver()
+driver.connect(host=sys.argv[1],port=int(sys.argv[2]))
+driver.commands.get("bench:suite:startup")
+connected=time.perf_counter()
+driver.close()
+print(json.dumps({"import_us":(imported-start)*1e6,"connect_us":(connected-imported)*1e6}))
+"""
+
+
+def percentile(samples:list,percent:float)->float:
+    if not samples:
+        return 0.0
+    samples=sorted(samples)
+    return samples[min(int(percent/100*len(samples)),len(samples)-1)]
+
+
+def measure(operation,ops:int,units:int=1,alloc_ops:int=200)->dict:
+    """Runs operation(index) ops times, timing every call, then again
+    under tracemalloc for min(ops,alloc_ops) calls
+
+    Args:
+        operation (callable): operation(index)
+        ops (int): number of calls
+        units (int, optional): items handled by one call (keys of an mset). Defaults to 1.
+
+    Returns:
+        dict: ops, seconds, ops_per_second (units per second), p50_us, p99_us,
+        alloc_bytes_per_op and alloc_peak_kb
+    """
+    latencies=[]
+    clock=time.perf_counter_ns
+    start=clock()
+    for index in range(ops):
+        begin=clock()
+        operation(index)
+        latencies.append((clock()-begin)/1000)
+    elapsed=(clock()-start)/1e9
+    result=summarize(latencies,elapsed,units)
+    result.update(allocations(operation,min(ops,alloc_ops)))
+    return result
+
+
+def summarize(latencies:list,elapsed:float,units:int=1)->dict:
+    return {
+        "ops":len(latencies),
+        "seconds":round(elapsed,6),
+        "ops_per_second":round(len(latencies)*units/elapsed,1) if elapsed else 0.0,
+        "p50_us":round(percentile(latencies,50),1),
+        "p99_us":round(percentile(latencies,99),1),
+    }
+
+
+def allocations(operation,ops:int)->dict:
+    """Memory allocated by operation : bytes still held per call, and
+    the peak of the pass above the memory held before it
+    """
+    if not ops:
+        return {"alloc_bytes_per_op":0,"alloc_peak_kb":0.0}
+    tracing=tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before,_=tracemalloc.get_traced_memory()
+    for index in range(ops):
+        operation(index)
+    current,peak=tracemalloc.get_traced_memory()
+    if not tracing:
+        tracemalloc.stop()
+    return {"alloc_bytes_per_op":round((current-before)/ops),"alloc_peak_kb":round((peak-before)/1024,1)}
+
+
+# ---- benchmarks --------------------------------------------------------
+
+def bench_single(r:Redis,ops:int)->dict:
+    commands=Commands(r)
+    names=[f"{PREFIX}single:{index}" for index in range(ops)]
+    return {
+        "commands.set":measure(lambda index:commands.set(names[index],"value"),ops),
+        "commands.get":measure(lambda index:commands.get(names[index]),ops),
+        "commands.append":measure(lambda index:commands.append(names[index],"!"),ops),
+        "commands.getdel":measure(lambda index:commands.getdel(names[index]),ops),
+        "client.get_client_info":measure(lambda index:Client(r).get_client_info(),max(ops//4,1)),
+    }
+
+
+def bench_multi(r:Redis,ops:int,sizes:tuple)->dict:
+    commands=Commands(r)
+    results={}
+    for size in sizes:
+        calls=max(ops//size,5)
+        names=[f"{PREFIX}multi:{index}" for index in range(size)]
+        items={name:"value" for name in names}
+        results[f"commands.mset[{size}]"]=measure(lambda index:commands.mset(items),calls,size)
+        results[f"commands.mget[{size}]"]=measure(lambda index:commands.mget(names),calls,size)
+    return results
+
+
+def bench_connect(host:str,port:int,ops:int)->dict:
+    driver=Driver.get_instance()
+    def cycle(index):
+        driver.connect(host=host,port=port)
+        driver.close()
+    return {"driver.connect_close":measure(cycle,max(ops//20,5),alloc_ops=20)}
+
+
+def bench_startup(host:str,port:int,runs:int)->dict:
+    """Startup of a fresh interpreter, as paid by every short lived or
+    pre-fork worker : startup.import is the import of the driver,
+    startup.connect is connect() plus the first command
+    """
+    samples={"startup.import":[],"startup.connect":[]}
+    for _ in range(runs):
+        output=subprocess.run([sys.executable,"-c",STARTUP,host,str(port)],cwd=ROOT,capture_output=True,
+            text=True,check=True).stdout
+        timings=json.loads(output.strip().splitlines()[-1])
+        samples["startup.import"].append(timings["import_us"])
+        samples["startup.connect"].append(timings["connect_us"])
+    return {name:summarize(latencies,sum(latencies)/1e6) for name,latencies in samples.items()}
+
+
+def bench_threads(r:Redis,ops:int,counts:tuple)->dict:
+    results={}
+    for count in counts:
+        commands=Commands(redis.Redis(connection_pool=redis.BlockingConnectionPool(
+            max_connections=count,**r.connection_pool.connection_kwargs)))
+        per_thread=max(ops//count,1)
+        latencies=[[] for _ in range(count)]
+        barrier=threading.Barrier(count+1)
+        def worker(samples:list):
+            clock=time.perf_counter_ns
+            barrier.wait()
+            for index in range(per_thread):
+                begin=clock()
+                commands.get(f"{PREFIX}thread:{index}")
+                samples.append((clock()-begin)/1000)
+        threads=[threading.Thread(target=worker,args=(samples,)) for samples in latencies]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start=time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed=time.perf_counter()-start
+        results[f"concurrency.threads[{count}]"]=summarize([sample for samples in latencies for sample in samples],elapsed)
+        commands.close()
+    return results
+
+
+def _process_worker(kwargs:dict,ops:int,ready,start,results)->None:
+    commands=Commands(redis.Redis(**kwargs))
+    commands.get(f"{PREFIX}process")
+    ready.release()
+    start.wait()
+    samples=[]
+    clock=time.perf_counter_ns
+    for index in range(ops):
+        begin=clock()
+        commands.get(f"{PREFIX}process:{index}")
+        samples.append((clock()-begin)/1000)
+    results.put(samples)
+
+
+def bench_processes(r:Redis,ops:int,counts:tuple)->dict:
+    context=multiprocessing.get_context("spawn")
+    kwargs={key:value for key,value in r.connection_pool.connection_kwargs.items() if key in ("host","port","db","password")}
+    results={}
+    for count in counts:
+        per_process=max(ops//count,1)
+        ready=context.Semaphore(0)
+        start=context.Event()
+        queue=context.Queue()
+        processes=[context.Process(target=_process_worker,args=(kwargs,per_process,ready,start,queue),daemon=True)
+            for _ in range(count)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+        begin=time.perf_counter()
+        start.set()
+        samples=[sample for _ in processes for sample in queue.get()]
+        elapsed=time.perf_counter()-begin
+        for process in processes:
+            process.join()
+        results[f"concurrency.processes[{count}]"]=summarize(samples,elapsed)
+    return results
+
+
+def cleanup(r:Redis)->None:
+    keys=list(r.scan_iter(match=f"{PREFIX}*",count=1000))
+    for offset in range(0,len(keys),1000):
+        r.delete(*keys[offset:offset+1000])
+
+
+def run(host:str=None,port:int=None,latency:float=0.0,quick:bool=False,only:list=None)->dict:
+    """Runs the suite against the server at (host,port), or a stand-in
+    server with (latency) seconds injected before each reply
+
+    Returns:
+        dict: {"environment":{...},"results":{name:{metrics}}}
+    """
+    ops=200 if quick else 5000
+    sizes=(10,100) if quick else (10,100,1000)
+    counts=(1,2) if quick else (1,2,4,8)
+    server=None
+    if host is None:
+        server=StandinServer(latency=latency)
+        server.start()
+        host,port=server.host,server.port
+    r=redis.Redis(host=host,port=port)
+    groups={
+        "commands":lambda:{**bench_single(r,ops),**bench_multi(r,ops,sizes)},
+        "driver":lambda:bench_connect(host,port,ops),
+        "startup":lambda:bench_startup(host,port,5 if quick else 20),
+        "concurrency.threads":lambda:bench_threads(r,ops,counts),
+        "concurrency.processes":lambda:bench_processes(r,ops,counts),
+    }
+    results={}
+    try:
+        for name,group in groups.items():
+            if only and not any(name.startswith(prefix) or prefix.startswith(name) for prefix in only):
+                continue
+            results.update(group())
+        cleanup(r)
+    finally:
+        r.connection_pool.disconnect()
+        if server is not None:
+            server.stop()
+    if only:
+        results={name:value for name,value in results.items() if any(name.startswith(prefix) for prefix in only)}
+    return {"environment":environment(host,port,server is not None,latency,quick),"results":results}
+
+
+def environment(host:str,port:int,standin:bool,latency:float,quick:bool)->dict:
+    return {
+        "target":"standin" if standin else f"{host}:{port}",
+        "latency_ms":latency*1000 if standin else None,
+        "quick":quick,
+        "python":platform.python_version(),
+        "redis_py":redis.__version__,
+        "platform":platform.platform(),
+        "cpus":os.cpu_count(),
+        "time":time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results:dict,baseline:dict,threshold:float=0.25)->list:
+    """Compares two outputs of run. A benchmark regresses when its ops/s
+    is lower than (1 - threshold) times the baseline or its p99 higher
+    than (1 + threshold) times the baseline. Benchmarks missing from
+    either side are ignored.
+
+    Returns:
+        list: description of every regression, empty if none
+    """
+    regressions=[]
+    current=results.get("results",results)
+    for name,base in baseline.get("results",baseline).items():
+        result=current.get(name)
+        if result is None:
+            continue
+        if base["ops_per_second"] and result["ops_per_second"]<base["ops_per_second"]*(1-threshold):
+            regressions.append(f"{name} : {result['ops_per_second']} ops/s, baseline {base['ops_per_second']} ops/s "
+                f"({result['ops_per_second']/base['ops_per_second']-1:+.0%})")
+        if base["p99_us"] and result["p99_us"]>base["p99_us"]*(1+threshold):
+            regressions.append(f"{name} : p99 {result['p99_us']} us, baseline {base['p99_us']} us "
+                f"({result['p99_us']/base['p99_us']-1:+.0%})")
+    return regressions
+
+
+def over_budget(results:dict,budget_ms:float)->list:
+    """Checks the median startup (startup.import + startup.connect)
+    against a budget in milliseconds
+
+    Returns:
+        list: description of the overrun, empty if within the budget or not measured
+    """
+    current=results.get("results",results)
+    if "startup.import" not in current or "startup.connect" not in current:
+        return []
+    startup=(current["startup.import"]["p50_us"]+current["startup.connect"]["p50_us"])/1000
+    if startup<=budget_ms:
+        return []
+    return [f"startup : import + connect {startup:.1f} ms, budget {budget_ms} ms"]
+
+
+def main(argv:list=None)->int:
+    parser=argparse.ArgumentParser(prog="python -m benchmarks.suite",description="Benchmark suite of the driver")
+    parser.add_argument("--host",help="real server to use instead of the stand-in")
+    parser.add_argument("--port",type=int,default=6379)
+    parser.add_argument("--latency",type=float,default=0.0,help="milliseconds injected by the stand-in before each reply")
+    parser.add_argument("--quick",action="store_true",help="small sizes, for smoke runs")
+    parser.add_argument("--only",nargs="*",help="benchmark name prefixes to run")
+    parser.add_argument("--output",help="JSON file of the results, printed when missing")
+    parser.add_argument("--baseline",help="JSON output of a previous run to compare with")
+    parser.add_argument("--threshold",type=float,default=0.25,help="allowed regression as a fraction. Defaults to 0.25")
+    parser.add_argument("--startup-budget",type=float,help="milliseconds allowed for the median import + connect")
+    args=parser.parse_args(argv)
+    output=run(args.host,args.port if args.host else None,args.latency/1000,args.quick,args.only)
+    document=json.dumps(output,indent=2)
+    if args.output:
+        with open(args.output,"w",encoding="utf-8") as target:
+            target.write(document+"\n")
+    else:
+        print(document)
+    for name,result in output["results"].items():
+        print(f"{name:>32} : {result['ops_per_second']:>12} ops/s  p50 {result['p50_us']:>9} us  p99 {result['p99_us']:>9} us",
+            file=sys.stderr)
+    regressions=[]
+    if args.baseline:
+        with open(args.baseline,"r",encoding="utf-8") as source:
+            regressions=compare(output,json.load(source),args.threshold)
+    if args.startup_budget is not None:
+        regressions+=over_budget(output,args.startup_budget)
+    for regression in regressions:
+        print(f"REGRESSION {regression}",file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -1,27 +1,199 @@
-from http import server
+import os
+import threading
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
 import redis
-from driver.utils.commands import Commands
-from driver.utils.client import Client
-from driver.utils.users import Users
-from driver.utils.test import Test
+from driver.utils.pool import Pool
+from driver.utils.handle import HELPERS,Handle,Helpers
+if TYPE_CHECKING:
+    from driver.utils.metrics import Metrics
+    from driver.utils.resilience import Resilience
+
+
+INSTRUMENTED=("commands","client","users","test")
+"""helpers whose calls are recorded by enable_metrics"""
+
+
 class Driver:
+    """Process wide entry point : connection pool, helpers (commands,
+    client, users, test, scripts, streams, coordination, pubsub, bulk,
+    structures) and named handles.
+
+    The helper modules are imported and the helpers built the first time
+    they are used. The driver remembers the process that connected : in a
+    child created with fork() (pre-fork workers of gunicorn, multiprocessing)
+    the first use reconnects with the same settings, so the sockets of the
+    parent are never shared.
+    """
 
     __instance=None
 
     def __init__(self) -> None:
         self.__r=None
+        self.__pool=None
+        self.__handles={}
+        self.__metrics=None
+        self.__router=None
+        self.__resilience=None
+        self.__helpers=None
+        self.__settings=None
+        self.__cluster=False
+        self.__pid=None
+        self.__lock=threading.RLock()
         if self.__instance is not None:
             raise Exception("Driver can only be instanciated once")
         Driver.__instance=self
 
+
+    def __getattr__(self,name:str):
+        if name.startswith("_") or name not in HELPERS:
+            raise AttributeError(f"'Driver' object has no attribute '{name}'")
+        with self.__lock:
+            self.__check_pid()
+            if self.__helpers is None:
+                raise AttributeError(f"Redis driver : No connection has been stablished with redis, no {name} helper")
+            helper=self.__helpers.get(name)
+            self.__dict__[name]=helper
+        return helper
+
+
+    def __uncache(self)->None:
+        for name in HELPERS:
+            self.__dict__.pop(name,None)
+
+
+    def __check_pid(self)->None:
+        if self.__pid is not None and self.__pid!=os.getpid():
+            self.__after_fork()
+
+
+    def __after_fork(self)->None:
+        """Drops everything created by the parent process, without QUIT
+        nor socket shutdown, and connects again with the same settings
+        """
+        handles=self.__handles
+        self.__forget()
+        if self.connect(**self.__settings) and not self.__cluster:
+            for name,handle in handles.items():
+                self.handle(name,db=handle.db)
+
+
+    @staticmethod
+    def _forked()->None:
+        """Runs in the child after fork() : the cached helpers of the parent
+        are dropped so the next use goes through the PID check
+        """
+        instance=Driver.__instance
+        if instance is not None:
+            instance.__lock=threading.RLock()
+            instance.__uncache()
+
     
-    def connect(self,host:str="localhost",port:int=6379,password:str=None,db:int=0)->bool:
+    def connect(self,host:str="localhost",port:int=6379,password:str=None,db:int=0,
+    max_connections:int=50,timeout:float=20,health_check_interval:int=0,idle_timeout:float=None,
+    cluster:bool=False,replicas:list=None,read_strategy:str="round_robin",max_replica_lag:int=None,
+    sticky_writes:float=0.0,sentinels:list=None,service_name:str="mymaster")->bool:
+        """Connects to the Redis server through a shared connection pool.
+        With cluster=True (host,port) is any node of a Redis Cluster : the
+        topology is discovered from it and every node gets its own pool.
+
+        With replicas, or sentinels, read-only commands are sent to the 
+        replicas and everything else to the primary (host,port). See 
+        ReplicaRouter. With sentinels the primary and the replicas of 
+        (service_name) are discovered from the Sentinels, and the replica 
+        set is refreshed at every lag check.
+
+        Args:
+            host (str, optional): Defaults to "localhost".
+            port (int, optional): Defaults to 6379.
+            password (str, optional): Defaults to None.
+            db (int, optional): database used by the default helpers. Defaults to 0.
+            max_connections (int, optional): size limit of the pool. Defaults to 50.
+            timeout (float, optional): seconds to wait for a free connection. Defaults to 20.
+            health_check_interval (int, optional): seconds before an idle connection 
+            is checked with a PING. 0 disables it. Defaults to 0.
+            idle_timeout (float, optional): seconds before the socket of an idle 
+            connection is closed. None disables it. Defaults to None.
+            cluster (bool, optional): connect to a Redis Cluster. Defaults to False.
+            replicas (list, optional): (host,port) of the replicas of the primary. Defaults to None.
+            read_strategy (str, optional): "round_robin" or "least_latency". Defaults to "round_robin".
+            max_replica_lag (int, optional): replication lag in bytes above which 
+            a replica gets no reads. None disables the guard. Defaults to None.
+            sticky_writes (float, optional): seconds the reads of a thread stay on 
+            the primary after it writes. Defaults to 0.
+            sentinels (list, optional): (host,port) of the Sentinels. Defaults to None.
+            service_name (str, optional): name of the primary in the Sentinels. Defaults to "mymaster".
+
+        Returns:
+            bool: True if the server answered the PING
+        """
+        settings={name:value for name,value in locals().items() if name!="self"}
+        with self.__lock:
+            return self.__connect(settings)
+
+
+    def __connect(self,settings:dict)->bool:
+        if self.__pid==os.getpid():
+            self.__release()
+        else:
+            self.__forget()
+        self.__settings=settings
+        self.__pid=os.getpid()
+        host,port,password,db=settings["host"],settings["port"],settings["password"],settings["db"]
         try:
-            self.__r=redis.Redis(host=host,port=port,password=password,db=db)
-            self.commands=Commands(self.__r)
-            self.client=Client(self.__r)
-            self.users=Users(self.__r)
-            self.test=Test(self.__r)
+            self.__cluster=settings["cluster"]
+            if self.__cluster:
+                from driver.utils.cluster import ClusterClient
+                if db:
+                    raise ValueError("Redis Cluster only has the database 0")
+                self.__r=ClusterClient(
+                    host=host,
+                    port=port,
+                    password=password,
+                    max_connections=settings["max_connections"],
+                    health_check_interval=settings["health_check_interval"]
+                )
+            else:
+                replicas=settings["replicas"]
+                discover=None
+                if settings["sentinels"]:
+                    from redis.sentinel import Sentinel
+                    service_name=settings["service_name"]
+                    sentinel=Sentinel(settings["sentinels"])
+                    host,port=sentinel.discover_master(service_name)
+                    replicas=sentinel.discover_slaves(service_name)
+                    discover=lambda:sentinel.discover_slaves(service_name)
+                def pool(host,port):
+                    return Pool(
+                        host=host,
+                        port=port,
+                        password=password,
+                        db=db,
+                        max_connections=settings["max_connections"],
+                        timeout=settings["timeout"],
+                        health_check_interval=settings["health_check_interval"],
+                        idle_timeout=settings["idle_timeout"]
+                    )
+                self.__pool=pool(host,port)
+                if replicas or discover is not None:
+                    from driver.utils.replicas import ReplicaRedis,ReplicaRouter
+                    self.__router=ReplicaRouter(
+                        redis.Redis(connection_pool=self.__pool.database(db)),
+                        replicas or [],
+                        lambda host,port:redis.Redis(connection_pool=pool(host,port).database(db)),
+                        strategy=settings["read_strategy"],
+                        max_lag=settings["max_replica_lag"],
+                        sticky_writes=settings["sticky_writes"],
+                        discover=discover
+                    )
+                    self.__r=ReplicaRedis(router=self.__router,connection_pool=self.__pool.database(db))
+                else:
+                    self.__r=redis.Redis(connection_pool=self.__pool.database(db))
+            self.__helpers=Helpers(self.__r,tuple(HELPERS),self.__built(""))
+            if self.__metrics is not None:
+                self.__instrument(self.__metrics)
+            if self.__resilience is not None:
+                self.__protect(self.__resilience)
             if not self.__r.ping():
                 print("Redis online but connection cannot be stablished")
                 return False
@@ -30,22 +202,268 @@ class Driver:
             print("Connection to Redis server failed")
             print(err)
             return False
+
+
+    def __built(self,prefix:str):
+        """Callback of Helpers : instruments and protects a helper the
+        first time it is built
+        """
+        def on_build(name:str,helper)->None:
+            if self.__metrics is not None and name in INSTRUMENTED:
+                self.__metrics.instrument(helper,prefix+name)
+            if name=="commands" and self.__resilience is not None:
+                helper.enable_resilience(self.__resilience)
+        return on_build
+
+
+    def __forget(self)->None:
+        """Drops the connection state without closing anything : used in
+        a forked child, whose sockets belong to the parent, and by
+        __release once the state is detached
+        """
+        self.__uncache()
+        if self.__metrics is not None and self.__pool is not None:
+            self.__metrics.detach_pool(self.__pool)
+        self.__helpers=None
+        self.__handles={}
+        self.__router=None
+        self.__pool=None
+        self.__r=None
+        self.__pid=None
       
 
+    def handle(self,name:str,db:int=None)->Handle:
+        """Returns the handle registered as (name), creating it for the 
+        logical database (db) on first use. Every handle shares the
+        connection pool of the driver.
+
+        Example:
+            sessions=driver.handle("sessions",db=3)
+            sessions.commands.set("user:1","Jhon")
+
+        Args:
+            name (str): name of the handle
+            db (int, optional): database of a new handle. Required the first time.
+
+        Returns:
+            Handle: handle with its own commands, client, users and test helpers
+        """
+        with self.__lock:
+            self.__check_pid()
+            if self.__cluster:
+                raise Exception("Redis driver : handles are not available in cluster mode")
+            if self.__pool is None:
+                raise Exception("Redis driver : No connection has been stablished with redis")
+            handle=self.__handles.get(name)
+            if handle is not None:
+                if db is not None and db!=handle.db:
+                    raise ValueError(f"Redis driver : handle {name} is bound to db {handle.db}")
+                return handle
+            if db is None:
+                raise ValueError(f"Redis driver : handle {name} does not exist, db is required")
+            handle=Handle(name,db,redis.Redis(connection_pool=self.__pool.database(db)),self.__built(f"{name}."))
+            if self.__metrics is not None:
+                self.__instrument_handle(handle)
+            self.__handles[name]=handle
+            return handle
+
+
+    def read_your_writes(self):
+        """Context manager that keeps the reads of the current thread on 
+        the primary, so they see the writes made before.
+
+        Example:
+            with driver.read_your_writes():
+                driver.commands.set("user:1","Jhon")
+                driver.commands.get("user:1")
+        """
+        self.__check_pid()
+        if self.__router is None:
+            return nullcontext()
+        return self.__router.pinned()
+
+
+    def replica_stats(self)->dict:
+        """Returns the reads, failures, latency and lag of every replica.
+        See ReplicaRouter.stats.
+        """
+        self.__check_pid()
+        if self.__router is None:
+            return {}
+        return self.__router.stats()
+
+
+    def enable_resilience(self,resilience:"Resilience"=None,**options)->"Resilience":
+        """Installs a Resilience layer (retries, circuit breaker, hedged 
+        reads, typed errors) on the commands helper of the driver and of 
+        every handle. Can be called before or after connect. With replicas
+        the reads are hedged to the replica picked by the router unless 
+        another hedge is given.
+
+        Example:
+            resilience=driver.enable_resilience(retries=3,raise_errors=True)
+
+        Args:
+            resilience (Resilience, optional): layer to install. Defaults to Resilience(**options).
+
+        Returns:
+            Resilience: the installed layer
+        """
+        if resilience is None:
+            from driver.utils.resilience import Resilience
+            resilience=self.__resilience or Resilience(**options)
+        self.__resilience=resilience
+        if self.__r is not None:
+            self.__protect(resilience)
+        return resilience
+
+
+    def __protect(self,resilience:"Resilience")->None:
+        from driver.utils.replicas import ReplicaRouter
+        if resilience.hedge is None or isinstance(resilience.hedge,ReplicaRouter):
+            resilience.hedge=self.__router
+        for helpers in self.__commands():
+            helpers.enable_resilience(resilience)
+
+
+    def __commands(self)->list:
+        """Commands helpers of the driver and of the handles built so far
+        """
+        helpers=[self.__helpers.built.get("commands")] if self.__helpers is not None else []
+        helpers+=[handle.built.get("commands") for handle in self.__handles.values()]
+        return [helper for helper in helpers if helper is not None]
+
+
+    def disable_resilience(self)->None:
+        """Removes the resilience layer from the commands helpers
+        """
+        if self.__resilience is None:
+            return
+        for helper in self.__commands():
+            helper.disable_resilience()
+        self.__resilience.close()
+        self.__resilience=None
+
+
+    def resilience_stats(self)->dict:
+        """Returns the retries, circuit breakers, hedges and errors of the
+        resilience layer. See Resilience.stats.
+        """
+        if self.__resilience is None:
+            return {}
+        return self.__resilience.stats()
+
+
+    def pool_stats(self)->dict:
+        """Returns the usage counters of the connection pool.
+        See Pool.stats for the list of counters.
+        """
+        self.__check_pid()
+        if self.__pool is None:
+            return {}
+        return self.__pool.stats()
+
+
+    def enable_metrics(self,metrics:"Metrics"=None)->"Metrics":
+        """Records the latency, payload size and errors of every call of the
+        helpers and of every command sent to the server, plus the wait time 
+        of the pool. Can be called before or after connect.
+
+        Example:
+            metrics=driver.enable_metrics()
+            metrics.add_hook(post=lambda name,seconds,result,error,context:...)
+            print(metrics.prometheus())
+
+        Args:
+            metrics (Metrics, optional): registry to record into. Defaults to a new one.
+
+        Returns:
+            Metrics: the registry with snapshot() and prometheus() exports
+        """
+        if metrics is None:
+            from driver.utils.metrics import Metrics
+            metrics=self.__metrics or Metrics()
+        self.__metrics=metrics
+        if self.__r is not None:
+            self.__instrument(metrics)
+        return metrics
+
+
+    def __instrument(self,metrics:"Metrics")->None:
+        metrics.instrument_client(self.__r)
+        if self.__pool is not None:
+            metrics.attach_pool(self.__pool)
+        for name,helper in self.__helpers.built.items():
+            if name in INSTRUMENTED:
+                metrics.instrument(helper,name)
+        for handle in self.__handles.values():
+            self.__instrument_handle(handle)
+
+
+    def __instrument_handle(self,handle:Handle)->None:
+        metrics=self.__metrics
+        for name,helper in handle.built.items():
+            if name in INSTRUMENTED:
+                metrics.instrument(helper,f"{handle.name}.{name}")
+        metrics.instrument_client(handle.redis)
+
 
     def close(self)->bool:
-        if self.__r == None:
-            print("Redis driver : No connection has been stablished with redis")
-            return True
-        result=self.__r.quit()
-        if result:
-            self.commands.close()
-            self.client.close()
-            self.users.close()
-            self.test.close()
-            self.__r=None
-            return True
-        return False
+        """Closes the connection : one QUIT, then the helpers and handles
+        are released and the sockets of the pool closed. Calling it again
+        does nothing. In a forked child that did not reconnect yet, the 
+        state inherited from the parent is dropped without touching the
+        sockets, which still belong to the parent.
+
+        Returns:
+            bool: True unless the server refused the QUIT
+        """
+        with self.__lock:
+            if self.__r is None:
+                print("Redis driver : No connection has been stablished with redis")
+                return True
+            if self.__pid!=os.getpid():
+                self.__forget()
+                return True
+            result=True
+            try:
+                result=bool(self.__r.quit())
+            except redis.ConnectionError:
+                pass
+            except redis.RedisError as err:
+                print("Redis driver : QUIT failed")
+                print(err)
+                result=False
+            self.__release()
+            return result
+
+
+    def __release(self)->None:
+        """Closes the helpers, handles, router and pool of the current
+        connection without sending QUIT
+        """
+        helpers=self.__helpers
+        handles=list(self.__handles.values())
+        router=self.__router
+        pool=self.__pool
+        r=self.__r
+        self.__forget()
+        if helpers is not None:
+            helpers.close()
+        for handle in handles:
+            handle.close()
+        if router is not None:
+            router.close()
+        if pool is not None:
+            pool.disconnect()
+        elif r is not None:
+            r.close()
+
+
+    def batch(self,max_commands:int=100,max_bytes:int=1048576):
+        """Shortcut for Commands.batch on the current connection
+        """
+        return self.commands.batch(max_commands=max_commands,max_bytes=max_bytes)
 
 
     @staticmethod
@@ -53,3 +471,6 @@ class Driver:
         if Driver.__instance is None:
             Driver()
         return Driver.__instance
+
+
+os.register_at_fork(after_in_child=Driver._forked)
@@ -0,0 +1,72 @@
+import redis.asyncio as redis
+from driver.aio.commands import Commands
+from driver.aio.client import Client
+from driver.aio.users import Users
+from driver.aio.test import Test
+class AsyncDriver:
+    """Asyncio version of the Driver facade built on redis.asyncio.
+    Every helper shares one blocking connection pool, so many commands
+    can be in flight at the same time from a single event loop. When all
+    (max_connections) connections are busy, new commands wait up to
+    (timeout) seconds for a free one instead of failing.
+
+    Example:
+        driver=AsyncDriver.get_instance()
+        await driver.connect(password="test")
+        values=await asyncio.gather(*[driver.commands.get(key) for key in keys])
+        await driver.close()
+    """
+
+    __instance=None
+
+    def __init__(self) -> None:
+        self.__r=None
+        if self.__instance is not None:
+            raise Exception("AsyncDriver can only be instanciated once")
+        AsyncDriver.__instance=self
+
+
+    async def connect(self,host:str="localhost",port:int=6379,password:str=None,db:int=0,
+    max_connections:int=50,timeout:int=20)->bool:
+        try:
+            pool=redis.BlockingConnectionPool(
+                host=host,
+                port=port,
+                password=password,
+                db=db,
+                max_connections=max_connections,
+                timeout=timeout
+            )
+            self.__r=redis.Redis(connection_pool=pool)
+            self.commands=Commands(self.__r)
+            self.client=Client(self.__r)
+            self.users=Users(self.__r)
+            self.test=Test(self.__r)
+            if not await self.__r.ping():
+                print("Redis online but connection cannot be stablished")
+                return False
+            return True
+        except Exception as err:
+            print("Connection to Redis server failed")
+            print(err)
+            return False
+
+
+    async def close(self)->bool:
+        if self.__r == None:
+            print("Redis driver : No connection has been stablished with redis")
+            return True
+        await self.__r.close(close_connection_pool=True)
+        self.commands.close()
+        self.client.close()
+        self.users.close()
+        self.test.close()
+        self.__r=None
+        return True
+
+
+    @staticmethod
+    def get_instance():
+        if AsyncDriver.__instance is None:
+            AsyncDriver()
+        return AsyncDriver.__instance
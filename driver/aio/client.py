@@ -0,0 +1,98 @@
+from redis.asyncio import Redis
+
+
+class Client:
+    """Asyncio version of driver.utils.client.Client :
+        - get_client_id : Returns the current client id.
+        - get_client_info : Returns partial or all the information about the current client.
+        - get_client_list : Returns a list of the current clients connected to Redis.
+        - kill : Closes the connection of the specified client.
+        - set_client_name : Sets a name or alias for the connection of the current client.
+        - echo : Sends a echo command string to the Redis server.
+    """
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        """Destroys the current local(class) client instance
+        """
+        self.__r=None
+
+
+    async def get_client_id(self)->str:
+        """Returns the id of the client connection used by the command
+
+        Returns:
+            str: id
+        """
+        return await self.__r.client_id()
+
+
+    async def get_client_info(self,all:bool=False)->dict:
+        """Returns total or partial info about the current client.
+
+        Args:
+            all (bool, optional): If false only relevant information is returned. Defaults to False.
+
+        Returns:
+            dict: Client information
+        """
+        info=await self.__r.client_info()
+        if all:
+            return info
+        return {field:info[field] for field in ("id","addr","laddr","fd","name","db")}
+
+
+    async def get_client_list(self)->list:
+        """Returns a list with all the clients currently connected to the 
+        Redis server.
+
+        Returns:
+            list: list of clients
+        """
+        return await self.__r.client_list()
+
+
+    async def kill(self,address:str)->bool:
+        """Closes de connection of the specified client
+
+        Args:
+            address (str): Addres of the client to be shut down, as "ip_address:port".
+
+        Returns:
+            bool: True if the client was closed
+        """
+        if not isinstance(address,str):
+            print("Redis kill operation : wrong data type. Args must be both strings")
+            return False
+        try:
+            return await self.__r.client_kill(address=address)
+        except Exception as err:
+            print(err)
+            return False
+
+
+    async def set_client_name(self,name:str)->bool:
+        """Set a name or alias for the current client connection
+
+        Args:
+            name (str): Alias or label/name.
+
+        Returns:
+            bool: True if operation was successful. False if not.
+        """
+        if not isinstance(name,str):
+            print("Redis set_client_name operation : name must be a string")
+        return await self.__r.client_setname(name=name)
+
+
+    async def echo(self,message:str):
+        """Send an echo message/command to the redis server
+
+        Args:
+            message (str): message/command 
+        """
+        if not isinstance(message,str):
+            print("Redis echo operation : message must be a string (str)")
+        await self.__r.echo(message)
@@ -0,0 +1,171 @@
+from redis.asyncio import Redis
+
+class Commands:
+
+    """Asyncio version of driver.utils.commands.Commands.
+    Every method is a coroutine with the same arguments, validation
+    and return values as its blocking counterpart :
+        - set : set key - value with optional expiration settings
+        - get : search and get value by key
+        - append : append/add elements on existing value
+        - mset : set a collection of key - value items
+        - mget : get a list of values from a list of keys
+        - getdel : find, get and delete item (in that specific order)
+    """
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        self.__r=None
+
+
+    def __validate_key_value(self,key:str,value:str)->bool:
+        """Checks the arguments of the command
+
+        Args:
+            key (str): key
+            value (str): value
+
+        Returns:
+            bool: False if key and value are not (str)
+        """
+        if not isinstance(key,str) or not isinstance(value,str):
+            print("Redis set operation : key and value must be strings")
+            return False 
+        return True
+
+
+    async def get(self,key:str)->str:
+        """Returns the value of the key if exists.
+        If the key does not exists returns None.
+
+        Args:
+            key (str): key
+
+        Returns:
+            str: value of (key)
+            None: If the key does no exists or error
+        """
+        if not self.__validate_key_value(key,"value"):
+            return None
+        try:
+            return (await self.__r.get(key)).decode("utf-8")
+        except Exception as err:
+            print(f"Redis get operation : {err}")
+            return None
+
+
+    async def set(self,key:str,value:str,**kargs)->bool:
+        """Set the a key value pair. If the key already exists,
+        the old value is replaced for the new value.
+        Accepts the same additional parameters as Commands.set :
+        ex, exat, nx and xx.
+
+        Args:
+            key (str): key 
+            value (str): value 
+
+        Returns:
+            bool: True if the operation soceeded
+            bool: False if the operation failed
+        """
+        if not self.__validate_key_value(key,value):
+            return False
+        try:
+            result=await self.__r.set(
+                name=key,
+                value=value,
+                ex=kargs.get("ex"),
+                exat=kargs.get("exat"),
+                nx=kargs.get("nx"),
+                xx=kargs.get("xx")
+            )
+            if result:
+                return True
+            return False
+        except Exception as err:
+            print(f"Redis set operation failed : {err}")
+            return False
+
+
+    async def append(self,key:str,value:str)->int:
+        """Appends the value at the end of the string stored at key.
+
+        Args:
+            key (str): key
+            value (str): key value
+
+        Returns:
+            int: return the numer of characters or elements added (return can be 0)
+            bool: return false if the operation failed
+        """
+        if not self.__validate_key_value(key,value):
+            return False
+        try:
+            return await self.__r.append(key,value)
+        except Exception as err:
+            print(f"Redis append operation failed : {err}")
+            return False
+
+
+    async def mset(self,items:dict)->bool:
+        """Sets the keys and their respective values.
+
+        Args:
+            items (dict): Map of keys and values. Keys and values must be strings
+
+        Returns:
+            bool: True if the operation suceeded.
+            bool: False if the operation failed.
+        """
+        if not isinstance(items,dict):
+            print("Redis mset operation : arg items must be type (dict)")
+            return False
+        try:
+            return await self.__r.mset(items)
+        except Exception as err:
+            print(f"Redis mset operation failed : {err}")
+            return False
+
+
+    async def mget(self,items:list)->list:
+        """Returns a list of values corresponding to each key.
+
+        Args:
+            items (list): list of keys
+
+        Returns:
+            list: list of values for each key
+            None: returns None if the operation failed
+        """
+        if not isinstance(items,list):
+            print("Redis mget operation : arg items must be type (list)")
+        try:
+            return await self.__r.mget(items)
+        except Exception as err:
+            print(f"Redis mget operation failed : {err}")
+            return None
+
+
+    async def getdel(self,key:str)->bool:
+        """Finds a key, returns its value and deletes the key.
+
+        Args:
+            key (str): key
+
+        Returns:
+            str: Returns the value of the key before deleting it.
+            bool: False if the key wasnt found
+        """
+        if not self.__validate_key_value(key,"value"):
+            return False
+        try:
+            result=await self.__r.getdel(key)
+            if result is not None:
+                return result
+            return False
+        except Exception as err:
+            print(f"Redis getdel operation failed : {err}")
+            return False
@@ -0,0 +1,59 @@
+from redis.asyncio import Redis
+
+class Test:
+    """Asyncio version of driver.utils.test.Test
+    """
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        """Kills the client object
+        """
+        self.__r=None
+
+
+    async def check_memory(self):
+        """Returns the report of the MEMORY DOCTOR command
+        """
+        return await self.__r.memory_doctor()
+
+
+    async def check_memory_stats(self)->list:
+        """Returns the metrics of the MEMORY STATS command. See
+        driver.utils.test.Test.check_memory_stats for the list of metrics.
+        """
+        return await self.__r.memory_stats()
+
+
+    async def memory_usage(self,key:str)->int:
+        """Returns the number of bytes that a 
+        key and its value require to be stored in RAM.
+
+        Args:
+            key (str): key name
+
+        Returns:
+            int: number of bytes the content of a key occupies in RAM
+        """
+        if not isinstance(key,str):
+            print("Redis memory_usage : Argument passed must be a string")
+            return 0
+        return await self.__r.memory_usage(key)
+
+
+    async def database_size(self)->int:
+        """Return the number of keys in the currently-selected database.
+
+        Returns:
+            int: number of keys
+        """
+        return await self.__r.dbsize()
+
+
+    def get_actions_registry(self):
+        """Returns a Monitor that streams back every command processed
+        by the Redis server. Use it as an async context manager.
+        """
+        return self.__r.monitor()
@@ -0,0 +1,98 @@
+from redis.asyncio import Redis
+from typing import List,NewType
+
+class Users:
+    """Asyncio version of driver.utils.users.Users :
+        - users_list : Returns a list with the current users
+        - add_user : Adds a new user to the database and grants permissions
+        - categories_list : Diplay commands categories.
+    """
+    stringlist=NewType("list[str]",List[str])
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        """Kills the client object
+        """
+        self.__r=None
+
+
+    async def generate_password(self)->str:
+        """Generates a random password
+
+        Returns:
+            string: random password string
+        """
+        return await self.__r.acl_genpass()
+
+
+    async def users(self)->list:
+        """Returns a list of all the registered users on
+        the Redis server
+
+        Returns:
+            list: list of users
+        """
+        return await self.__r.acl_users()
+
+
+    async def users_list(self)->list:
+        """Returns a list of all the acls on the redis server instance.
+
+        Returns:
+            list: list of acls
+        """
+        return await self.__r.acl_list()
+
+
+    async def add_user(self,username:str,
+    enabled:bool,
+    password:str,
+    nopass:bool=False,
+    categories:stringlist=None,
+    commands:stringlist=None,
+    keys:stringlist=None
+    ):
+        """Adds a new user to the database and grants permissions.
+        See driver.utils.users.Users.add_user for the format of
+        categories, commands and keys.
+        """
+        await self.__r.acl_setuser(
+            username=username,
+            enabled=enabled,
+            nopass=nopass,
+            passwords=password,
+            categories=categories,
+            commands=commands,
+            keys=keys
+            )
+
+
+    async def categories_list(self,category:str=None)->stringlist:
+        """Returns the list of command categories available, or the
+        commands belonging to (category).
+
+        Args:
+            category (str, optional): category. Defaults to None.
+        """
+        return await self.__r.acl_cat(category=category)
+
+
+    async def delete_users(self,users:list)->int:
+        if not isinstance(users,list):
+            print("Redis users delete_users : Argument users must be a list ")
+            return 0
+        return await self.__r.acl_deluser(*users)
+
+
+    def get_basic_commands(self)->stringlist:
+        """Returns a list with the most basic commands that a user 
+        needs to perform actions inside the database in this 
+        exact order : \n 
+            "+set","+get","+mset","+mget","+getdel"
+
+        Returns:
+            list[str]: list of commands
+        """
+        return ["+set","+get","+mset","+mget","+getdel"]
@@ -0,0 +1,416 @@
+import hashlib
+import threading
+import time
+from redis.utils import str_if_bytes
+
+
+def _category(rule:str)->str:
+    """Normalizes a category rule : "read", "+read" or "+@read" -> "+@read"
+    """
+    rule=rule.strip().lower()
+    sign="-" if rule.startswith("-") else "+"
+    return f"{sign}@{rule.lstrip('+-').lstrip('@')}"
+
+
+def _command(rule:str)->str:
+    """Normalizes a command rule : "get" or "+get" -> "+get"
+    """
+    rule=rule.strip().lower()
+    return rule if rule[:1] in ("+","-") else f"+{rule}"
+
+
+def _keys(rule:str)->str:
+    """Normalizes a key pattern rule : "cache:*" -> "~cache:*", "%R~log:*" is kept
+    """
+    return rule if rule[:1] in ("~","%") else f"~{rule}"
+
+
+def _glob(pattern:str,string:str)->bool:
+    """Redis glob matching, as stringmatchlen of the server : *, ?,
+    [abc], [^abc], [a-z] (bounds in any order) and backslash escapes.
+    Unlike fnmatch, [!abc] is not a negation and a backslash escapes the next character.
+    """
+    p=s=0
+    plen,slen=len(pattern),len(string)
+    while p<plen and s<slen:
+        char=pattern[p]
+        if char=="*":
+            while p+1<plen and pattern[p+1]=="*":
+                p+=1
+            if p+1==plen:
+                return True
+            return any(_glob(pattern[p+1:],string[start:]) for start in range(s,slen))
+        elif char=="?":
+            pass
+        elif char=="[":
+            p+=1
+            negate=p<plen and pattern[p]=="^"
+            if negate:
+                p+=1
+            matched=False
+            while True:
+                if p>=plen:
+                    # unterminated class : the pattern ends here
+                    p-=1
+                    break
+                if pattern[p]=="\\" and p+1<plen:
+                    p+=1
+                    matched=matched or pattern[p]==string[s]
+                elif pattern[p]=="]":
+                    break
+                elif plen-p>=3 and pattern[p+1]=="-":
+                    start,end=sorted((pattern[p],pattern[p+2]))
+                    p+=2
+                    matched=matched or start<=string[s]<=end
+                else:
+                    matched=matched or pattern[p]==string[s]
+                p+=1
+            if matched==negate:
+                return False
+        else:
+            if char=="\\" and p+1<plen:
+                p+=1
+            if pattern[p]!=string[s]:
+                return False
+        p+=1
+        s+=1
+    while p<plen and pattern[p]=="*":
+        p+=1
+    return p==plen and s==slen
+
+
+def _base_rules(rules:list)->list:
+    """Command rules without the leading -@all, implied by reset"""
+    while rules and rules[0]=="-@all":
+        rules=rules[1:]
+    return rules
+
+
+class UserSpec:
+    """Desired state of a user for Users.provision. Permissions use the
+    formats of Users.add_user : categories like "+read" or "read",
+    commands like "+set", keys like "cache:*".
+
+    Passwords are sent and compared as SHA256 hashes, so plain
+    passwords never reach the server logs. Channels are only changed
+    when the spec sets them (channels=None keeps those of the user).
+    """
+
+    def __init__(self,username:str,enabled:bool=True,password:str=None,passwords:list=None,password_hashes:list=None,
+    nopass:bool=False,categories:list=None,commands:list=None,keys:list=None,channels:list=None) -> None:
+        if not isinstance(username,str) or not username or " " in username:
+            raise ValueError("Redis users : username must be a string without spaces")
+        self.username=username
+        self.enabled=enabled
+        self.nopass=nopass
+        plain=([password] if password is not None else [])+list(passwords or [])
+        self.password_hashes=frozenset([hashlib.sha256(value.encode("utf-8")).hexdigest() for value in plain]
+            +[value.lower() for value in password_hashes or []])
+        self.command_rules=[_category(rule) for rule in categories or []]+[_command(rule) for rule in commands or []]
+        self.keys=[_keys(rule) for rule in keys or []]
+        self.channels=None if channels is None else [rule if rule.startswith("&") else f"&{rule}" for rule in channels]
+
+
+    def __repr__(self)->str:
+        return f"UserSpec({self.username!r})"
+
+
+    def rules(self)->list:
+        """Rules of ACL SETUSER, starting with reset so the user ends up
+        exactly as described. Without channels, the reset rules of the
+        other fields are sent instead, since reset also clears the channels.
+        """
+        if self.channels is None:
+            rules=["resetpass","resetkeys","nocommands","on" if self.enabled else "off"]
+        else:
+            rules=["reset","on" if self.enabled else "off"]
+        rules+=["nopass"] if self.nopass else [f"#{digest}" for digest in sorted(self.password_hashes)]
+        rules+=self.keys
+        rules+=self.channels or []
+        rules+=self.command_rules
+        return rules
+
+
+    def matches(self,user)->bool:
+        """Returns True if the AclUser already has this state. Channels
+        are only compared when the spec sets them.
+        """
+        return (user.enabled==self.enabled and user.nopass==self.nopass
+            and user.password_hashes==(frozenset() if self.nopass else self.password_hashes)
+            and user.key_rules==self.keys
+            and (self.channels is None or user.channels==self.channels)
+            and _base_rules(user.command_rules)==_base_rules(self.command_rules))
+
+
+class AclUser:
+    """One user of ACL LIST, parsed : state, password hashes, key and
+    channel patterns and the command rules in the order the server
+    applies them. Selectors of Redis 7 ("(...)") are kept in
+    selectors and ignored by the evaluator.
+    """
+
+    def __init__(self,line:str) -> None:
+        tokens=_tokens(line)
+        if len(tokens)<2 or tokens[0]!="user":
+            raise ValueError(f"Redis users : not an ACL LIST line : {line}")
+        self.line=line
+        self.name=tokens[1]
+        self.enabled=False
+        self.nopass=False
+        hashes=[]
+        self.key_rules=[]
+        self.keys=[]
+        self.channels=[]
+        self.command_rules=[]
+        self.selectors=[]
+        self.decisions={}
+        for token in tokens[2:]:
+            lower=token.lower()
+            if lower in ("on","off"):
+                self.enabled=lower=="on"
+            elif lower=="nopass":
+                self.nopass=True
+            elif token.startswith("#"):
+                hashes.append(token[1:].lower())
+            elif token.startswith("~") or token.startswith("%"):
+                self.key_rules.append(token)
+                mode,_,pattern=token.partition("~")
+                self.keys.append((pattern,mode[1:].upper() or "RW"))
+            elif lower=="allkeys":
+                self.key_rules.append("~*")
+                self.keys.append(("*","RW"))
+            elif token.startswith("&"):
+                self.channels.append(token)
+            elif lower=="allchannels":
+                self.channels.append("&*")
+            elif token.startswith("("):
+                self.selectors.append(token)
+            elif lower in ("allcommands","nocommands"):
+                self.command_rules.append("+@all" if lower=="allcommands" else "-@all")
+            elif token[:1] in ("+","-"):
+                self.command_rules.append(lower)
+        self.password_hashes=frozenset(hashes)
+
+
+    def __repr__(self)->str:
+        return f"AclUser({self.name!r})"
+
+
+    @property
+    def categories(self)->set:
+        """Categories granted with +@category"""
+        return {rule[2:] for rule in self.command_rules if rule.startswith("+@")}
+
+
+    @property
+    def commands(self)->set:
+        """Commands granted one by one with +command"""
+        return {rule[1:] for rule in self.command_rules if rule.startswith("+") and not rule.startswith("+@")}
+
+
+def _tokens(line:str)->list:
+    """Splits an ACL LIST line, keeping each selector "(...)" in one token
+    """
+    tokens=[]
+    depth=0
+    for part in line.split():
+        if depth:
+            tokens[-1]+=" "+part
+        else:
+            tokens.append(part)
+        depth+=part.count("(")-part.count(")")
+    return tokens
+
+
+class AclSnapshot:
+    """Parsed and indexed copy of the ACL of the server, refreshed with
+    one ACL LIST : only the users whose line changed are parsed again,
+    and ACL CAT is only sent for categories not seen before. can()
+    answers "may this user run this command on this key" without a
+    round trip, with the same rule order as the server.
+
+    Indexes :
+        - users : name -> AclUser
+        - by_category : category -> names of the users granted +@category
+        - by_command : command -> names of the users granted +command
+        - categories : category -> commands of the category
+    """
+
+    def __init__(self) -> None:
+        self.users={}
+        self.by_category={}
+        self.by_command={}
+        self.categories={}
+        self.loaded_at=0.0
+        self.refreshes=0
+        self.parsed=0
+
+
+    def load(self,lines:list,categories:dict)->bool:
+        """Replaces the users with the parsed (lines) of ACL LIST and adds
+        (categories) to the known ones
+
+        Returns:
+            bool: True if a user changed
+        """
+        self.categories.update(categories)
+        users={}
+        changed=False
+        for line in lines:
+            line=str_if_bytes(line)
+            name=_tokens(line)[1]
+            current=self.users.get(name)
+            if current is None or current.line!=line:
+                current=AclUser(line)
+                self.parsed+=1
+                changed=True
+            users[name]=current
+        changed=changed or len(users)!=len(self.users)
+        self.users=users
+        if changed or categories:
+            self.__index()
+        self.loaded_at=time.monotonic()
+        self.refreshes+=1
+        return changed
+
+
+    def missing_categories(self,lines:list)->set:
+        """Categories used by (lines) whose commands are not known yet
+        """
+        used=set()
+        for line in lines:
+            used.update(token[2:].lower() for token in str_if_bytes(line).split() if token[:2] in ("+@","-@"))
+        used.discard("all")
+        return used-set(self.categories)
+
+
+    def __index(self)->None:
+        by_category={}
+        by_command={}
+        for name,user in self.users.items():
+            user.decisions={}
+            for category in user.categories:
+                by_category.setdefault(category,set()).add(name)
+            for command in user.commands:
+                by_command.setdefault(command,set()).add(name)
+        self.by_category=by_category
+        self.by_command=by_command
+
+
+    def can(self,username:str,command:str,key:str=None,channel:str=None,access:str=None)->bool:
+        """Evaluates the ACL of the snapshot
+
+        Args:
+            username (str): user
+            command (str): command, "config|get" or "config get" for a subcommand
+            key (str, optional): key the command accesses. Defaults to None.
+            channel (str, optional): pub/sub channel the command accesses. Defaults to None.
+            access (str, optional): "read" or "write" access to the key, needed to
+            use %R~ and %W~ patterns; None requires a full (~ or %RW~) pattern. Defaults to None.
+
+        Returns:
+            bool: True if the server would accept the command
+        """
+        user=self.users.get(username)
+        if user is None or not user.enabled:
+            return False
+        command=command.lower().replace(" ","|")
+        allowed=user.decisions.get(command)
+        if allowed is None:
+            allowed=user.decisions[command]=self.__command_allowed(user,command)
+        if not allowed:
+            return False
+        if key is not None:
+            needed={"read":"R","write":"W"}.get(access)
+            if not any(_glob(pattern,key) and (mode=="RW" or mode==needed) for pattern,mode in user.keys):
+                return False
+        if channel is not None:
+            if not any(_glob(rule[1:],channel) for rule in user.channels):
+                return False
+        return True
+
+
+    def __command_allowed(self,user:AclUser,command:str)->bool:
+        """Applies the command rules in order : the last one that covers
+        the command decides
+        """
+        base=command.split("|")[0]
+        allowed=False
+        for rule in user.command_rules:
+            name=rule[1:]
+            if name=="@all":
+                covers=True
+            elif name.startswith("@"):
+                covers=base in self.categories.get(name[1:],())
+            elif "|" in name:
+                covers=command==name
+            else:
+                covers=base==name
+            if covers:
+                allowed=rule[0]=="+"
+        return allowed
+
+
+    def who_can(self,command:str,key:str=None,access:str=None)->list:
+        """Names of the users allowed to run command (on key)
+        """
+        return sorted(name for name in self.users if self.can(name,command,key,access=access))
+
+
+class ProvisionReport:
+    """Outcome of Users.provision : names of the users created, updated,
+    left unchanged and deleted, and the errors of the failed ones
+    """
+
+    def __init__(self) -> None:
+        self.created=[]
+        self.updated=[]
+        self.unchanged=[]
+        self.deleted=[]
+        self.errors={}
+        self.round_trips=0
+
+
+    def summary(self)->dict:
+        return {
+            "created":len(self.created),
+            "updated":len(self.updated),
+            "unchanged":len(self.unchanged),
+            "deleted":len(self.deleted),
+            "failed":len(self.errors),
+            "round_trips":self.round_trips,
+        }
+
+
+class AclCache:
+    """Holds the AclSnapshot of a connection and refreshes it when it is
+    older than max_age seconds
+    """
+
+    def __init__(self) -> None:
+        self.snapshot=AclSnapshot()
+        self.__lock=threading.Lock()
+
+
+    def get(self,r,max_age:float)->AclSnapshot:
+        with self.__lock:
+            snapshot=self.snapshot
+            if snapshot.refreshes and time.monotonic()-snapshot.loaded_at<max_age:
+                return snapshot
+            lines=r.acl_list()
+            missing=sorted(snapshot.missing_categories(lines))
+            categories={}
+            if missing:
+                pipe=r.pipeline(transaction=False)
+                for category in missing:
+                    pipe.acl_cat(category)
+                for category,commands in zip(missing,pipe.execute(raise_on_error=False)):
+                    categories[category]=frozenset() if isinstance(commands,Exception) else frozenset(
+                        str_if_bytes(command).lower() for command in commands)
+            snapshot.load(lines,categories)
+            return snapshot
+
+
+    def invalidate(self)->None:
+        with self.__lock:
+            self.snapshot.loaded_at=float("-inf")
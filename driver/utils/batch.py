@@ -0,0 +1,254 @@
+from redis import Redis
+
+
+class Batch:
+    """Queues set, get, append and getdel calls into a single
+    pipeline so that many keys can be handled with a few round trips.
+    The queue is flushed automatically when it reaches (max_commands)
+    commands or (max_bytes) bytes of keys and values, and when the
+    batch is used as a context manager it is also flushed on exit.
+
+    Results are collected in call order in `results` and follow the
+    same return conventions as the single call methods in Commands :
+        - get : decoded value (str) or None
+        - set : True or False
+        - append : length of the value after the append (int) or False
+        - getdel : value of the key or False
+
+    Example:
+        with driver.batch(max_commands=50) as batch:
+            batch.set("name","Jhon")
+            batch.get("name")
+        batch.results -> [True,"Jhon"]
+    """
+
+    def __init__(self,r:Redis,max_commands:int=100,max_bytes:int=1048576,scripts=None) -> None:
+        if not isinstance(max_commands,int) or max_commands<1:
+            raise ValueError("Redis batch : max_commands must be a positive int")
+        if not isinstance(max_bytes,int) or max_bytes<1:
+            raise ValueError("Redis batch : max_bytes must be a positive int")
+        self.__r=r
+        self.__scripts=scripts
+        self.max_commands=max_commands
+        self.max_bytes=max_bytes
+        self.results=[]
+        self.round_trips=0
+        self.__pipe=None
+        self.__pending=[]
+        self.__queued=0
+        self.__bytes=0
+        self.__sent=set()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self,exc_type,exc,traceback)->None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+
+    def __len__(self)->int:
+        return len(self.__pending)
+
+
+    def __validate_key_value(self,key:str,value:str)->bool:
+        if not isinstance(key,str) or not isinstance(value,str):
+            print("Redis batch operation : key and value must be strings")
+            return False
+        return True
+
+
+    def __queue(self,converter,size:int,method:str,*args,**kargs)->int:
+        """Adds a command to the pipeline and flushes it if any
+        of the limits was reached.
+
+        Returns:
+            int: position of the result of the command in `results`
+        """
+        if self.__pipe is None:
+            self.__pipe=self.__r.pipeline(transaction=False)
+        getattr(self.__pipe,method)(*args,**kargs)
+        self.__pending.append((True,converter))
+        return self.__queued_one(size)
+
+
+    def __queued_one(self,size:int)->int:
+        self.__queued+=1
+        self.__bytes+=size
+        position=len(self.results)+len(self.__pending)-1
+        if self.__queued>=self.max_commands or self.__bytes>=self.max_bytes:
+            self.flush()
+        return position
+
+
+    def __skip(self,value)->int:
+        """Records the result of a call that failed validation and
+        was never sent to the server.
+        """
+        self.__pending.append((False,value))
+        return len(self.results)+len(self.__pending)-1
+
+
+    def get(self,key:str)->int:
+        """Queues a get command.
+
+        Args:
+            key (str): key
+
+        Returns:
+            int: position of the result in `results`
+        """
+        if not self.__validate_key_value(key,"value"):
+            return self.__skip(None)
+        return self.__queue(_decode,len(key),"get",key)
+
+
+    def set(self,key:str,value:str,**kargs)->int:
+        """Queues a set command. Accepts the same optional parameters
+        as Commands.set : ex, exat, nx and xx.
+
+        Args:
+            key (str): key
+            value (str): value
+
+        Returns:
+            int: position of the result in `results`
+        """
+        if not self.__validate_key_value(key,value):
+            return self.__skip(False)
+        return self.__queue(
+            _to_bool,
+            len(key)+len(value),
+            "set",
+            name=key,
+            value=value,
+            ex=kargs.get("ex"),
+            exat=kargs.get("exat"),
+            nx=kargs.get("nx"),
+            xx=kargs.get("xx")
+        )
+
+
+    def append(self,key:str,value:str)->int:
+        """Queues an append command.
+
+        Args:
+            key (str): key
+            value (str): value to append
+
+        Returns:
+            int: position of the result in `results`
+        """
+        if not self.__validate_key_value(key,value):
+            return self.__skip(False)
+        return self.__queue(_or_false,len(key)+len(value),"append",key,value)
+
+
+    def getdel(self,key:str)->int:
+        """Queues a getdel command.
+
+        Args:
+            key (str): key
+
+        Returns:
+            int: position of the result in `results`
+        """
+        if not self.__validate_key_value(key,"value"):
+            return self.__skip(False)
+        return self.__queue(_or_false,len(key),"getdel",key)
+
+
+    def script(self,name:str,keys:list=(),args:list=())->int:
+        """Queues a call to a Lua script registered in Scripts, like
+        the library scripts "compare_and_delete" or "incr_capped".
+        The raw reply of the script is stored in `results`. The first
+        call of each script in a flush is sent with EVAL, so a script
+        missing from the server cache still runs in call order.
+
+        Args:
+            name (str): name of the script
+            keys (list, optional): KEYS of the script. Defaults to ().
+            args (list, optional): ARGV of the script. Defaults to ().
+
+        Returns:
+            int: position of the result in `results`
+        """
+        if self.__scripts is None:
+            raise ValueError("Redis batch : this batch was created without scripts")
+        if self.__pipe is None:
+            self.__pipe=self.__r.pipeline(transaction=False)
+        self.__scripts.queue(self.__pipe,name,keys,args,sent=self.__sent)
+        self.__pending.append((True,_raw))
+        return self.__queued_one(sum(len(str(item)) for item in (*keys,*args)))
+
+
+    def flush(self)->list:
+        """Sends every queued command to the server in one round trip.
+
+        Returns:
+            list: results of the flushed commands in call order
+        """
+        if not self.__pending:
+            return []
+        replies=[]
+        if self.__queued:
+            try:
+                replies=self.__pipe.execute(raise_on_error=False)
+                self.round_trips+=1
+            except Exception as err:
+                print(f"Redis batch flush failed : {err}")
+                replies=[err]*self.__queued
+        replies=iter(replies)
+        flushed=[]
+        for queued,converter in self.__pending:
+            if not queued:
+                flushed.append(converter)
+                continue
+            reply=next(replies)
+            if isinstance(reply,Exception):
+                print(f"Redis batch operation failed : {reply}")
+                flushed.append(converter(None))
+                continue
+            flushed.append(converter(reply))
+        self.results.extend(flushed)
+        self.__reset()
+        return flushed
+
+
+    def discard(self)->None:
+        """Drops every queued command without sending it
+        """
+        self.__reset()
+
+
+    def __reset(self)->None:
+        if self.__pipe is not None:
+            self.__pipe.reset()
+        self.__pending=[]
+        self.__queued=0
+        self.__bytes=0
+        self.__sent=set()
+
+
+def _decode(reply):
+    if reply is None:
+        return None
+    return reply.decode("utf-8")
+
+
+def _raw(reply):
+    return reply
+
+
+def _to_bool(reply)->bool:
+    return bool(reply)
+
+
+def _or_false(reply):
+    if reply is None:
+        return False
+    return reply
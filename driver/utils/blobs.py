@@ -0,0 +1,413 @@
+import codecs
+import uuid
+from redis import Redis
+from redis.exceptions import RedisError
+from redis.utils import str_if_bytes
+from driver.utils.resilience import DriverError
+from driver.utils.scripts import Scripts
+
+
+BLOB_COMMIT="""
+local old=false
+if redis.call("TYPE",KEYS[1]).ok=="hash" then
+    old=redis.call("HMGET",KEYS[1],"version","chunks")
+end
+local last=#KEYS
+if ARGV[2]=="string" then
+    redis.call("RENAME",KEYS[2],KEYS[1])
+    last=1
+else
+    redis.call("DEL",KEYS[1])
+    redis.call("HSET",KEYS[1],"size",ARGV[3],"chunk_size",ARGV[4],"chunks",#KEYS-1,"version",ARGV[5])
+end
+for index=1,last do
+    if tonumber(ARGV[1])>0 then
+        redis.call("PEXPIRE",KEYS[index],ARGV[1])
+    else
+        redis.call("PERSIST",KEYS[index])
+    end
+end
+return old
+"""
+
+
+class BlobError(DriverError):
+    """A large value was replaced or lost a chunk while it was read
+    """
+
+
+def tagged(key:str,suffix:str)->str:
+    """Name of a key stored next to (key) : in the same cluster slot,
+    so scripts and RENAME can use both.
+    """
+    start=key.find("{")
+    if start>=0 and key.find("}",start+2)>0:
+        return f"{key}:{suffix}"
+    return f"{{{key}}}:{suffix}"
+
+
+class Blobs:
+    """Large values written and read in chunks of (chunk_size) bytes, so
+    neither side holds more than about one chunk at a time and a value
+    can be read in part.
+
+    Layouts :
+        - "string" : one string key, built with SET and APPEND on a
+          temporary key renamed over (key) once complete. Readable with
+          a plain GET, limited to 512 MB by the server.
+        - "chunked" : a manifest hash at (key) (size, chunk_size, chunks,
+          version) and one key per chunk. A new version is written next
+          to the current one and swapped in by the manifest, so readers
+          never see a mix of two versions.
+
+    Sources can be bytes, bytearray, memoryview or any buffer (sent as
+    slices, without a copy), str, a binary file (read with readinto in
+    one reused buffer), a text file, or an iterable of chunks. Reads
+    return bytes unless an encoding is given.
+
+    Example:
+        with open("dump.bin","rb") as source:
+            driver.commands.blobs().write("backup",source)
+        with open("copy.bin","wb") as target:
+            driver.commands.blobs().read_to("backup",target)
+        header=driver.commands.blobs().read("backup",0,512)
+
+    Args:
+        r (Redis): redis client
+        scripts (Scripts): registry of the commit script
+        chunk_size (int, optional): bytes per command. Defaults to 1048576.
+        layout (str, optional): "string" or "chunked". Defaults to "string".
+        pending_ttl (float, optional): seconds an unfinished write is kept. Defaults to 3600.
+    """
+
+    layouts=("string","chunked")
+
+    def __init__(self,r:Redis,scripts:Scripts,chunk_size:int=1048576,layout:str="string",pending_ttl:float=3600) -> None:
+        if not isinstance(chunk_size,int) or chunk_size<1:
+            raise ValueError("Redis blobs : chunk_size must be a positive int")
+        if layout not in self.layouts:
+            raise ValueError(f"Redis blobs : layout must be one of {self.layouts}")
+        self.__r=r
+        self.__scripts=scripts
+        self.chunk_size=chunk_size
+        self.layout=layout
+        self.pending_ttl=pending_ttl
+        scripts.register("blob_commit",BLOB_COMMIT)
+
+
+    def write(self,key:str,source,ttl:float=None,layout:str=None)->int:
+        """Stores (source) under key, replacing the current value once
+        the whole source is written
+
+        Args:
+            key (str): key
+            source (any): buffer, str, file or iterable of chunks
+            ttl (float, optional): seconds to live. Defaults to None (no expiry).
+            layout (str, optional): Defaults to the layout of the helper.
+
+        Returns:
+            int: bytes stored
+            None: if the operation failed
+        """
+        layout=layout or self.layout
+        if not isinstance(key,str) or layout not in self.layouts:
+            print(f"Redis blob write operation : key must be a string and layout one of {self.layouts}")
+            return None
+        pending_ms=max(int(self.pending_ttl*1000),1)
+        ttl_ms=max(int(ttl*1000),1) if ttl else 0
+        written=[]
+        size=0
+        try:
+            if layout=="string":
+                temporary=tagged(key,f"blob:pending:{uuid.uuid4().hex}")
+                written.append(temporary)
+                self.__r.set(temporary,b"",px=pending_ms)
+                for piece in self.__pieces(source):
+                    size=self.__r.append(temporary,piece)
+                old=self.__scripts.call("blob_commit",[key,temporary],[ttl_ms,"string"])
+            else:
+                version=uuid.uuid4().hex[:16]
+                for index,piece in enumerate(self.__sized(self.__pieces(source))):
+                    written.append(self.chunk_key(key,version,index))
+                    self.__r.set(written[-1],piece,px=pending_ms)
+                    size+=len(piece)
+                old=self.__scripts.call("blob_commit",[key,*written],[ttl_ms,"chunked",size,self.chunk_size,version])
+        except (RedisError,OSError,TypeError,ValueError) as err:
+            self.__discard(written)
+            print(f"Redis blob write operation failed : {err}")
+            return None
+        if old and old[0] is not None:
+            self.__discard([self.chunk_key(key,str_if_bytes(old[0]),index) for index in range(int(old[1]))])
+        return size
+
+
+    def size(self,key:str)->int:
+        """Returns the size of the value in bytes, None if the key does not exist
+        """
+        try:
+            description=self.__describe(key)
+        except (RedisError,ValueError) as err:
+            print(f"Redis blob size operation failed : {err}")
+            return None
+        return description[1] if description is not None else None
+
+
+    def stream(self,key:str,start:int=0,length:int=None,encoding:str=None,chunk_size:int=None):
+        """Returns an iterator over the value of key, one chunk per round
+        trip. Chunks are bytes, or str decoded incrementally when an
+        encoding is given (a character is never split between two chunks).
+        The iterator raises BlobError if the value is replaced while it
+        is read, and RedisError if the connection fails.
+
+        Args:
+            key (str): key
+            start (int, optional): first byte. Defaults to 0.
+            length (int, optional): bytes to read. Defaults to the rest of the value.
+            encoding (str, optional): Defaults to None (bytes).
+            chunk_size (int, optional): Defaults to the chunk size of the helper.
+
+        Returns:
+            iterator: chunks of the value
+            None: if the key does not exist or the operation failed
+        """
+        try:
+            description=self.__describe(key)
+        except (RedisError,ValueError) as err:
+            print(f"Redis blob stream operation failed : {err}")
+            return None
+        if description is None:
+            return None
+        chunks=self.__ranges(key,description,start,length,chunk_size or self.chunk_size)
+        return chunks if encoding is None else self.__decode(chunks,encoding)
+
+
+    def read(self,key:str,start:int=0,length:int=None)->bytearray:
+        """Reads the value, or (length) bytes from (start), in one buffer
+        allocated once and filled chunk by chunk
+
+        Returns:
+            bytearray: bytes of the value
+            None: if the key does not exist or the operation failed
+        """
+        try:
+            description=self.__describe(key)
+            if description is None:
+                return None
+            start,end=self.__bounds(description[1],start,length)
+            buffer=bytearray(end-start)
+            self.__fill(key,description,memoryview(buffer),start)
+            return buffer
+        except (RedisError,ValueError) as err:
+            print(f"Redis blob read operation failed : {err}")
+            return None
+
+
+    def read_into(self,key:str,buffer,start:int=0)->int:
+        """Copies the value, from byte (start), into a writable buffer
+        (bytearray, memoryview, mmap, array...) until the buffer or the
+        value ends
+
+        Returns:
+            int: bytes copied
+            None: if the key does not exist or the operation failed
+        """
+        try:
+            view=memoryview(buffer).cast("B")
+            if view.readonly:
+                raise ValueError("buffer is read-only")
+            description=self.__describe(key)
+            if description is None:
+                return None
+            start,end=self.__bounds(description[1],start,len(view))
+            return self.__fill(key,description,view[:end-start],start)
+        except (RedisError,ValueError,TypeError) as err:
+            print(f"Redis blob read_into operation failed : {err}")
+            return None
+
+
+    def read_to(self,key:str,target,start:int=0,length:int=None)->int:
+        """Writes the value into a binary file-like object chunk by chunk
+
+        Returns:
+            int: bytes written
+            None: if the key does not exist or the operation failed
+        """
+        chunks=self.stream(key,start,length)
+        if chunks is None:
+            return None
+        written=0
+        try:
+            for chunk in chunks:
+                target.write(chunk)
+                written+=len(chunk)
+        except (RedisError,OSError) as err:
+            print(f"Redis blob read_to operation failed after {written} bytes : {err}")
+            return None
+        return written
+
+
+    def delete(self,key:str)->bool:
+        """Deletes the value and its chunks
+
+        Returns:
+            bool: True if the key existed
+        """
+        try:
+            description=self.__describe(key)
+            if description is None:
+                return False
+            self.__r.delete(key)
+        except (RedisError,ValueError) as err:
+            print(f"Redis blob delete operation failed : {err}")
+            return False
+        if description[0]=="chunked":
+            self.__discard([self.chunk_key(key,description[4],index) for index in range(description[3])])
+        return True
+
+
+    @staticmethod
+    def chunk_key(key:str,version:str,index:int)->str:
+        return tagged(key,f"blob:{version}:{index}")
+
+
+    def __pieces(self,source):
+        """Splits a source in pieces of at most chunk_size bytes. Buffers
+        are sliced through a memoryview and files read into one buffer
+        that is reused, so each piece must be sent before the next one
+        is taken.
+        """
+        size=self.chunk_size
+        if isinstance(source,str):
+            for offset in range(0,len(source),size):
+                yield source[offset:offset+size].encode("utf-8")
+            return
+        if hasattr(source,"readinto"):
+            buffer=bytearray(size)
+            view=memoryview(buffer)
+            while True:
+                count=source.readinto(buffer)
+                if not count:
+                    return
+                yield view[:count]
+        if hasattr(source,"read"):
+            while True:
+                data=source.read(size)
+                if not data:
+                    return
+                yield data.encode("utf-8") if isinstance(data,str) else data
+        try:
+            view=memoryview(source).cast("B")
+        except TypeError:
+            for chunk in source:
+                yield from self.__pieces(chunk)
+            return
+        for offset in range(0,len(view),size):
+            yield view[offset:offset+size]
+
+
+    def __sized(self,pieces):
+        """Regroups pieces in chunks of exactly chunk_size bytes but the
+        last one, since the chunked layout finds a byte by its offset.
+        Pieces that already have the size are passed through.
+        """
+        size=self.chunk_size
+        pending=bytearray()
+        for piece in pieces:
+            if not pending and len(piece)==size:
+                yield piece
+                continue
+            pending+=piece
+            while len(pending)>=size:
+                yield bytes(pending[:size])
+                del pending[:size]
+        if pending:
+            yield bytes(pending)
+
+
+    def __describe(self,key:str)->tuple:
+        """Returns (layout, size, chunk_size, chunks, version) of the value,
+        None if the key does not exist
+        """
+        kind=str_if_bytes(self.__r.type(key))
+        if kind=="none":
+            return None
+        if kind=="string":
+            return ("string",self.__r.strlen(key),self.chunk_size,None,None)
+        if kind!="hash":
+            raise ValueError(f"{key} holds a {kind}, not a large value")
+        manifest={str_if_bytes(field):value for field,value in self.__r.hgetall(key).items()}
+        if not manifest:
+            return None
+        try:
+            return ("chunked",int(manifest["size"]),int(manifest["chunk_size"]),int(manifest["chunks"]),
+                str_if_bytes(manifest["version"]))
+        except KeyError:
+            raise ValueError(f"{key} is a hash, not a large value manifest")
+
+
+    @staticmethod
+    def __bounds(size:int,start:int,length:int)->tuple:
+        if start<0:
+            raise ValueError("start must not be negative")
+        start=min(start,size)
+        end=size if length is None else min(start+max(length,0),size)
+        return start,end
+
+
+    def __ranges(self,key:str,description:tuple,start:int,length:int,chunk_size:int):
+        """Yields the bytes of [start, start + length) of the value, one
+        command per chunk : GETRANGE of the string, or GET of the chunk
+        keys (GETRANGE for the partial first and last ones)
+        """
+        layout,size,stored,chunks,version=description
+        start,end=self.__bounds(size,start,length)
+        if layout=="string":
+            for offset in range(start,end,chunk_size):
+                stop=min(offset+chunk_size,end)
+                data=self.__r.getrange(key,offset,stop-1)
+                if len(data)!=stop-offset:
+                    raise BlobError(f"Redis blob : {key} changed while it was read",command="GETRANGE")
+                yield data
+            return
+        offset=start
+        while offset<end:
+            index,first=divmod(offset,stored)
+            last=min(stored,end-index*stored)
+            name=self.chunk_key(key,version,index)
+            if first==0 and last==stored:
+                data=self.__r.get(name)
+            else:
+                data=self.__r.getrange(name,first,last-1)
+            if not data or len(data)!=last-first:
+                raise BlobError(f"Redis blob : {key} was replaced while it was read",command="GET")
+            yield data
+            offset+=len(data)
+
+
+    def __fill(self,key:str,description:tuple,view:memoryview,start:int)->int:
+        position=0
+        for chunk in self.__ranges(key,description,start,len(view),self.chunk_size):
+            view[position:position+len(chunk)]=chunk
+            position+=len(chunk)
+        return position
+
+
+    @staticmethod
+    def __decode(chunks,encoding:str):
+        decoder=codecs.getincrementaldecoder(encoding)()
+        for chunk in chunks:
+            text=decoder.decode(chunk)
+            if text:
+                yield text
+        text=decoder.decode(b"",final=True)
+        if text:
+            yield text
+
+
+    def __discard(self,keys:list)->None:
+        for offset in range(0,len(keys),1000):
+            try:
+                self.__r.delete(*keys[offset:offset+1000])
+            except RedisError as err:
+                print(f"Redis blob cleanup failed, keys expire after pending_ttl : {err}")
+                return
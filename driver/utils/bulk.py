@@ -0,0 +1,548 @@
+import csv
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED,ThreadPoolExecutor,wait
+from itertools import islice
+from redis import Redis
+from redis.exceptions import RedisError,ResponseError
+from driver.utils.chunks import chunked
+from driver.utils.scan import Scanner
+
+
+FILE_MAGIC=b"RDRVDUMP\x00\x01"
+CHUNK_MAGIC=b"CHNK"
+# chunk header : magic, number of records, size of the records in bytes
+CHUNK=struct.Struct("!4sIQ")
+# record header : key size, value size, expiry in unix milliseconds (-1 : none)
+RECORD=struct.Struct("!IIq")
+FORMATS=("jsonl","csv","resp")
+
+
+def encode_command(*args)->bytes:
+    """Encodes a command in the RESP protocol
+
+    Returns:
+        bytes: *<argc> then $<size> <arg> for every argument
+    """
+    parts=[b"*%d\r\n"%len(args)]
+    for arg in args:
+        if isinstance(arg,str):
+            arg=arg.encode("utf-8")
+        elif isinstance(arg,(int,float)):
+            arg=repr(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n"%(len(arg),arg))
+    return b"".join(parts)
+
+
+def jsonl_commands(path:str):
+    """Reads a JSON lines file. A line is either {"command":[...]} or
+    {"key":..,"value":..,"ttl":seconds} which is stored with SET (values
+    that are not strings are stored as JSON).
+
+    Yields:
+        tuple: arguments of each command
+    """
+    with open(path,"r",encoding="utf-8") as source:
+        for line in source:
+            line=line.strip()
+            if not line:
+                continue
+            record=json.loads(line)
+            if "command" in record:
+                yield tuple(record["command"])
+                continue
+            yield _set(record["key"],record["value"],record.get("ttl"))
+
+
+def csv_commands(path:str,key:str="key",value:str="value",ttl:str=None):
+    """Reads a CSV file with a header line, one SET per row
+
+    Args:
+        key (str, optional): column of the keys. Defaults to "key".
+        value (str, optional): column of the values. Defaults to "value".
+        ttl (str, optional): column of the ttls in seconds, empty for none. Defaults to None.
+
+    Yields:
+        tuple: arguments of each command
+    """
+    with open(path,"r",encoding="utf-8",newline="") as source:
+        for row in csv.DictReader(source):
+            yield _set(row[key],row[value],row.get(ttl) if ttl else None)
+
+
+def resp_commands(path:str):
+    """Reads a file of commands already encoded in the RESP protocol
+    (the input of redis-cli --pipe) one command at a time
+
+    Yields:
+        bytes: encoded command
+    """
+    with open(path,"rb") as source:
+        while True:
+            header=source.readline()
+            if not header:
+                return
+            if not header.startswith(b"*"):
+                raise ValueError(f"Redis bulk : invalid RESP command header {header[:20]!r}")
+            parts=[header]
+            for _ in range(int(header[1:])):
+                size=source.readline()
+                parts.append(size)
+                parts.append(source.read(int(size[1:])+2))
+            yield b"".join(parts)
+
+
+def _set(key:str,value,ttl)->tuple:
+    if not isinstance(value,(str,bytes)):
+        value=json.dumps(value,separators=(",",":"))
+    if ttl in (None,""):
+        return ("SET",key,value)
+    return ("SET",key,value,"PX",int(float(ttl)*1000))
+
+
+class TransferReport:
+    """Progress of an import, export or restore. skipped counts the
+    expired keys that were not restored, resumed the records (chunks
+    for a restore) done by a previous run.
+    """
+
+    def __init__(self,operation:str) -> None:
+        self.operation=operation
+        self.records=0
+        self.bytes=0
+        self.chunks=0
+        self.errors=0
+        self.error_samples=[]
+        self.skipped=0
+        self.resumed=0
+        self.started=time.monotonic()
+        self.elapsed=0.0
+        self.__lock=threading.Lock()
+
+
+    def add(self,records:int,size:int,chunks:int=0)->None:
+        with self.__lock:
+            self.records+=records
+            self.bytes+=size
+            self.chunks+=chunks
+            self.elapsed=time.monotonic()-self.started
+
+
+    def skip(self)->None:
+        with self.__lock:
+            self.skipped+=1
+
+
+    def error(self,err)->None:
+        with self.__lock:
+            self.errors+=1
+            if len(self.error_samples)<10:
+                self.error_samples.append(str(err))
+
+
+    def summary(self)->dict:
+        """Returns the records, bytes, chunks and errors transferred, the
+        elapsed seconds and the records and bytes per second
+        """
+        elapsed=self.elapsed or time.monotonic()-self.started
+        return {
+            "operation":self.operation,
+            "records":self.records,
+            "bytes":self.bytes,
+            "chunks":self.chunks,
+            "errors":self.errors,
+            "error_samples":list(self.error_samples),
+            "skipped":self.skipped,
+            "resumed":self.resumed,
+            "elapsed":elapsed,
+            "records_per_second":self.records/elapsed if elapsed else 0.0,
+            "bytes_per_second":self.bytes/elapsed if elapsed else 0.0,
+        }
+
+
+def _load_checkpoint(path:str)->dict:
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path,"r",encoding="utf-8") as source:
+        return json.load(source)
+
+
+def _save_checkpoint(path:str,state:dict)->None:
+    if path is None:
+        return
+    temporary=f"{path}.tmp"
+    with open(temporary,"w",encoding="utf-8") as target:
+        json.dump(state,target)
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(temporary,path)
+
+
+def _clear_checkpoint(path:str)->None:
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+class BulkImporter:
+    """Sends a stream of commands on one connection as raw RESP, in
+    batches of (batch_size) commands, without waiting for the replies
+    of the last (window) commands before sending the next batch : the
+    network stays busy in both directions like with redis-cli --pipe.
+    Only one batch and the sizes of the batches in flight are held in
+    memory, whatever the size of the input.
+
+    With (checkpoint) the number of acknowledged commands is saved
+    every (checkpoint_every) commands; a run with the same checkpoint
+    skips them, so an import can resume after a crash. The checkpoint
+    is removed once the import is complete.
+
+    The commands are written on one connection of the pool of (r) : a
+    Redis Cluster client, which has no single pool, is rejected.
+    """
+
+    def __init__(self,r:Redis,batch_size:int=500,window:int=5000,checkpoint:str=None,checkpoint_every:int=10000) -> None:
+        if getattr(r,"connection_pool",None) is None:
+            raise ValueError("Redis bulk : imports need a single node client, they are not available in cluster mode")
+        if not isinstance(batch_size,int) or batch_size<1:
+            raise ValueError("Redis bulk : batch_size must be a positive int")
+        if window<batch_size:
+            raise ValueError("Redis bulk : window must hold at least one batch")
+        self.__r=r
+        self.batch_size=batch_size
+        self.window=window
+        self.checkpoint=checkpoint
+        self.checkpoint_every=checkpoint_every
+
+
+    def run(self,commands,source:str=None,progress=None)->TransferReport:
+        """Imports the commands
+
+        Args:
+            commands (iterable): tuples of arguments or RESP encoded bytes
+            source (str, optional): name of the input, stored in the checkpoint. Defaults to None.
+            progress (callable, optional): progress(report) after each acknowledged batch. Defaults to None.
+
+        Returns:
+            TransferReport: report of the import
+        """
+        report=TransferReport("import")
+        state=_load_checkpoint(self.checkpoint)
+        done=0
+        if state is not None:
+            if state.get("source")!=source:
+                raise ValueError(f"Redis bulk : checkpoint {self.checkpoint} belongs to {state.get('source')}")
+            done=state["records"]
+            report.resumed=done
+            commands=islice(commands,done,None)
+        pool=self.__r.connection_pool
+        connection=pool.get_connection("_")
+        pending=deque()
+        in_flight=0
+        saved=done
+        try:
+            for batch in chunked(commands,self.batch_size):
+                payload=b"".join(command if isinstance(command,bytes) else encode_command(*command) for command in batch)
+                connection.send_packed_command([payload],check_health=False)
+                pending.append((len(batch),len(payload)))
+                in_flight+=len(batch)
+                while in_flight>self.window:
+                    in_flight-=self.__acknowledge(connection,pending.popleft(),report)
+                    done=report.resumed+report.records
+                    if done-saved>=self.checkpoint_every:
+                        _save_checkpoint(self.checkpoint,{"source":source,"records":done})
+                        saved=done
+                    if progress is not None:
+                        progress(report)
+            while pending:
+                self.__acknowledge(connection,pending.popleft(),report)
+                if progress is not None:
+                    progress(report)
+        except BaseException as err:
+            if not isinstance(err,(RedisError,OSError)):
+                # the input failed : the commands sent are still acknowledged
+                try:
+                    while pending:
+                        self.__acknowledge(connection,pending.popleft(),report)
+                except (RedisError,OSError):
+                    pass
+            connection.disconnect()
+            _save_checkpoint(self.checkpoint,{"source":source,"records":report.resumed+report.records})
+            raise
+        finally:
+            pool.release(connection)
+        _clear_checkpoint(self.checkpoint)
+        return report
+
+
+    def __acknowledge(self,connection,batch:tuple,report:TransferReport)->int:
+        count,size=batch
+        for _ in range(count):
+            try:
+                connection.read_response()
+            except ResponseError as err:
+                report.error(err)
+        report.add(count,size,1)
+        return count
+
+
+class BulkExporter:
+    """Exports the keys matching (match) with SCAN and DUMP into a dump
+    file, a sequence of chunks of up to about (chunk_size) records :
+
+        file   : FILE_MAGIC chunk*
+        chunk  : CHUNK(b"CHNK",records,size) record*
+        record : RECORD(key size,value size,expiry) key value
+
+    The value is the DUMP payload of the key and the expiry the unix time
+    in milliseconds at which it expires (-1 : never), so the time between
+    export and restore is not added to the ttls.
+
+    Only the current scan page and chunk are held in memory. With
+    (checkpoint) the scan cursor and the size of the file are saved after
+    each chunk; a run with the same checkpoint truncates the file to the
+    last complete chunk and continues the scan from there.
+    """
+
+    def __init__(self,r:Redis,match:str=None,count:int=1000,chunk_size:int=1000,checkpoint:str=None) -> None:
+        self.__r=r
+        self.match=match
+        self.count=count
+        self.chunk_size=chunk_size
+        self.checkpoint=checkpoint
+
+
+    def run(self,path:str,progress=None)->TransferReport:
+        """Writes the dump file
+
+        Args:
+            path (str): dump file
+            progress (callable, optional): progress(report) after each chunk. Defaults to None.
+
+        Returns:
+            TransferReport: report of the export
+        """
+        report=TransferReport("export")
+        state=_load_checkpoint(self.checkpoint)
+        cursor=0
+        if state is not None and os.path.exists(path):
+            cursor=state["cursor"]
+            target=open(path,"r+b")
+            target.truncate(state["size"])
+            target.seek(state["size"])
+            report.resumed=state["records"]
+        else:
+            target=open(path,"wb")
+            target.write(FILE_MAGIC)
+        with target:
+            scanner=Scanner(self.__r,match=self.match,count=self.count,cursor=cursor,decode=False)
+            records=[]
+            for page in scanner.pages():
+                records.extend(self.__dump(page))
+                if len(records)>=self.chunk_size or scanner.cursor==0:
+                    self.__write(target,records,report)
+                    records=[]
+                    _save_checkpoint(self.checkpoint,{"cursor":scanner.cursor,"size":target.tell(),
+                        "records":report.resumed+report.records})
+                    if progress is not None:
+                        progress(report)
+        _clear_checkpoint(self.checkpoint)
+        return report
+
+
+    def __dump(self,keys:list)->list:
+        if not keys:
+            return []
+        pipe=self.__r.pipeline(transaction=False)
+        for key in keys:
+            pipe.dump(key)
+            pipe.pttl(key)
+        replies=pipe.execute(raise_on_error=False)
+        now=int(time.time()*1000)
+        records=[]
+        for index,key in enumerate(keys):
+            value,pttl=replies[2*index],replies[2*index+1]
+            if value is None or isinstance(value,Exception) or isinstance(pttl,Exception) or pttl==-2:
+                continue
+            records.append((key,value,now+pttl if pttl>=0 else -1))
+        return records
+
+
+    def __write(self,target,records:list,report:TransferReport)->None:
+        if not records:
+            return
+        payload=b"".join(RECORD.pack(len(key),len(value),expiry)+key+value for key,value,expiry in records)
+        target.write(CHUNK.pack(CHUNK_MAGIC,len(records),len(payload)))
+        target.write(payload)
+        target.flush()
+        report.add(len(records),len(payload),1)
+
+
+def chunks_of(data)->list:
+    """Returns the (offset,records,size) of every chunk of a dump file
+    mapped in memory. Reads the chunk headers only.
+    """
+    if bytes(data[:len(FILE_MAGIC)])!=FILE_MAGIC:
+        raise ValueError("Redis bulk : not a dump file")
+    chunks=[]
+    offset=len(FILE_MAGIC)
+    while offset+CHUNK.size<=len(data):
+        magic,records,size=CHUNK.unpack_from(data,offset)
+        if magic!=CHUNK_MAGIC or offset+CHUNK.size+size>len(data):
+            raise ValueError(f"Redis bulk : truncated or corrupted chunk at offset {offset}")
+        chunks.append((offset+CHUNK.size,records,size))
+        offset+=CHUNK.size+size
+    return chunks
+
+
+def records_of(data,offset:int,records:int):
+    """Yields the (key,value,expiry) records of the chunk at offset
+    """
+    for _ in range(records):
+        key_size,value_size,expiry=RECORD.unpack_from(data,offset)
+        offset+=RECORD.size
+        key=bytes(data[offset:offset+key_size])
+        offset+=key_size
+        yield key,bytes(data[offset:offset+value_size]),expiry
+        offset+=value_size
+
+
+class BulkRestorer:
+    """Restores a dump file of BulkExporter with RESTORE ... ABSTTL. The
+    file is mapped in memory and its chunks are restored in parallel by
+    (workers) threads, one pipeline per chunk; at most 2 * workers chunks
+    are in progress. Keys whose expiry has passed are skipped.
+
+    With (checkpoint) the restored chunks are saved as they complete, so
+    a restore can resume after a crash.
+    """
+
+    def __init__(self,r:Redis,workers:int=4,replace:bool=True,checkpoint:str=None) -> None:
+        self.__r=r
+        self.workers=workers
+        self.replace=replace
+        self.checkpoint=checkpoint
+        self.__lock=threading.Lock()
+
+
+    def run(self,path:str,progress=None)->TransferReport:
+        """Restores the dump file
+
+        Args:
+            path (str): dump file
+            progress (callable, optional): progress(report) after each chunk. Defaults to None.
+
+        Returns:
+            TransferReport: report of the restore
+        """
+        report=TransferReport("restore")
+        state=_load_checkpoint(self.checkpoint) or {"path":os.path.abspath(path),"done":[]}
+        if state["path"]!=os.path.abspath(path):
+            raise ValueError(f"Redis bulk : checkpoint {self.checkpoint} belongs to {state['path']}")
+        done=set(state["done"])
+        with open(path,"rb") as source,mmap.mmap(source.fileno(),0,access=mmap.ACCESS_READ) as data:
+            chunks=[(index,chunk) for index,chunk in enumerate(chunks_of(data)) if index not in done]
+            report.resumed=len(done)
+            with ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix="redis-restore") as executor:
+                running=set()
+                for index,chunk in chunks:
+                    if len(running)>=2*self.workers:
+                        finished,running=wait(running,return_when=FIRST_COMPLETED)
+                        self.__finish(finished,report,progress)
+                    running.add(executor.submit(self.__restore,data,index,chunk,report,done,state))
+                self.__finish(running,report,progress)
+        _clear_checkpoint(self.checkpoint)
+        return report
+
+
+    def __finish(self,futures,report:TransferReport,progress)->None:
+        for future in futures:
+            future.result()
+            if progress is not None:
+                progress(report)
+
+
+    def __restore(self,data,index:int,chunk:tuple,report:TransferReport,done:set,state:dict)->None:
+        offset,records,size=chunk
+        now=int(time.time()*1000)
+        pipe=self.__r.pipeline(transaction=False)
+        restored=0
+        for key,value,expiry in records_of(data,offset,records):
+            if expiry!=-1 and expiry<=now:
+                report.skip()
+                continue
+            args=["RESTORE",key,0 if expiry==-1 else expiry,value]
+            if self.replace:
+                args.append("REPLACE")
+            if expiry!=-1:
+                args.append("ABSTTL")
+            pipe.execute_command(*args)
+            restored+=1
+        for reply in pipe.execute(raise_on_error=False) if restored else []:
+            if isinstance(reply,Exception):
+                report.error(reply)
+        report.add(restored,size,1)
+        with self.__lock:
+            done.add(index)
+            state["done"]=sorted(done)
+            _save_checkpoint(self.checkpoint,state)
+
+
+class Bulk:
+    """Bulk import, export and restore bound to the connection of the Driver.
+
+    Example:
+        driver.bulk.import_file("seed.jsonl").summary()
+        driver.bulk.export("snapshot.dump",match="user:*")
+        driver.bulk.restore("snapshot.dump",workers=8)
+    """
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        self.__r=None
+
+
+    def import_file(self,path:str,format:str=None,checkpoint:str=None,progress=None,
+    csv_options:dict=None,**options)->TransferReport:
+        """Imports a JSON lines, CSV or RESP file. The format is guessed
+        from the extension (.jsonl, .csv, .resp) when not given.
+        See BulkImporter for the options and jsonl_commands, csv_commands
+        and resp_commands for the file formats.
+        """
+        format=format or os.path.splitext(path)[1].lstrip(".").lower()
+        if format=="json":
+            format="jsonl"
+        if format not in FORMATS:
+            raise ValueError(f"Redis bulk : format must be one of {FORMATS}")
+        if format=="jsonl":
+            commands=jsonl_commands(path)
+        elif format=="csv":
+            commands=csv_commands(path,**(csv_options or {}))
+        else:
+            commands=resp_commands(path)
+        return BulkImporter(self.__r,checkpoint=checkpoint,**options).run(commands,os.path.abspath(path),progress)
+
+
+    def import_commands(self,commands,checkpoint:str=None,progress=None,**options)->TransferReport:
+        """Imports an iterable of commands (tuples of arguments or RESP bytes)
+        """
+        return BulkImporter(self.__r,checkpoint=checkpoint,**options).run(commands,None,progress)
+
+
+    def export(self,path:str,match:str=None,checkpoint:str=None,progress=None,**options)->TransferReport:
+        """Exports the keys matching (match) to a dump file. See BulkExporter.
+        """
+        return BulkExporter(self.__r,match=match,checkpoint=checkpoint,**options).run(path,progress)
+
+
+    def restore(self,path:str,workers:int=4,checkpoint:str=None,progress=None,**options)->TransferReport:
+        """Restores a dump file written by export. See BulkRestorer.
+        """
+        return BulkRestorer(self.__r,workers=workers,checkpoint=checkpoint,**options).run(path,progress)
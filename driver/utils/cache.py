@@ -0,0 +1,379 @@
+import threading
+import time
+from collections import OrderedDict
+from redis import Redis
+from redis.exceptions import RedisError
+from redis.utils import str_if_bytes
+
+
+INVALIDATION_CHANNEL="__redis__:invalidate"
+
+
+class NearCache:
+    """In-process cache placed in front of Commands.get and Commands.mget.
+
+    Entries are bounded by (max_entries) and (max_bytes) and evicted with
+    an LRU or LFU policy. An entry never outlives the expiry of its key on
+    the server, nor (ttl) seconds when it is given.
+
+    Coherence is kept with server assisted client side caching: every
+    connection of the pool runs CLIENT TRACKING and redirects the
+    invalidation messages to a dedicated listener connection. When
+    (prefixes) are given the BCAST mode is used and only keys starting
+    with one of the prefixes are cached. If the listener connection is
+    lost the cache is flushed and bypassed until it reconnects.
+
+    Counters : hits, misses, evictions, invalidations and expirations.
+    """
+
+    def __init__(self,max_entries:int=10000,max_bytes:int=67108864,policy:str="lru",
+    ttl:float=None,prefixes:list=None) -> None:
+        if not isinstance(max_entries,int) or max_entries<1:
+            raise ValueError("Redis near cache : max_entries must be a positive int")
+        if not isinstance(max_bytes,int) or max_bytes<1:
+            raise ValueError("Redis near cache : max_bytes must be a positive int")
+        if policy not in ("lru","lfu"):
+            raise ValueError("Redis near cache : policy must be lru or lfu")
+        self.max_entries=max_entries
+        self.max_bytes=max_bytes
+        self.policy=policy
+        self.ttl=ttl
+        self.prefixes=list(prefixes) if prefixes else None
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.invalidations=0
+        self.expirations=0
+        self.size=0
+        self.__lock=threading.Lock()
+        self.__entries={}
+        self.__lru=OrderedDict()
+        self.__frequencies={}
+        self.__min_frequency=0
+        self.__fetching={}
+        self.__online=True
+        self.__listener=None
+
+
+    def __len__(self)->int:
+        return len(self.__entries)
+
+
+    def cacheable(self,key:str)->bool:
+        """Returns True if the key can be stored in the cache
+        """
+        if not self.__online:
+            return False
+        if self.prefixes is None:
+            return True
+        return any(key.startswith(prefix) for prefix in self.prefixes)
+
+
+    def lookup(self,key:str):
+        """Returns the cached entry of key as a list [raw,text]
+        or None on a miss.
+        """
+        with self.__lock:
+            entry=self.__entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            if entry[2] is not None and entry[2]<=time.monotonic():
+                self.__remove(key)
+                self.expirations+=1
+                self.misses+=1
+                return None
+            self.hits+=1
+            self.__touch(key)
+            return entry
+
+
+    def begin(self,key:str)->None:
+        """Marks key as being fetched from the server. An invalidation
+        received before store() is called discards the fetched value.
+        """
+        with self.__lock:
+            self.__fetching[key]=self.__fetching.get(key,0)+1
+
+
+    def store(self,key:str,raw:bytes,pttl:int=-1)->None:
+        """Stores the value fetched for key after begin(key).
+
+        Args:
+            key (str): key
+            raw (bytes): value returned by the server
+            pttl (int, optional): remaining time to live of the key in milliseconds.
+            Negative values mean the key has no expiry. Defaults to -1.
+        """
+        with self.__lock:
+            pending=self.__fetching.pop(key,None)
+            if not pending or raw is None or not self.__online:
+                return
+            if pending>1:
+                self.__fetching[key]=pending-1
+            size=len(key)+len(raw)
+            if size>self.max_bytes:
+                return
+            expire_at=None
+            if pttl is not None and pttl>=0:
+                expire_at=time.monotonic()+pttl/1000
+            if self.ttl is not None:
+                local=time.monotonic()+self.ttl
+                expire_at=local if expire_at is None else min(expire_at,local)
+            if key in self.__entries:
+                self.__remove(key)
+            while self.__entries and (len(self.__entries)>=self.max_entries or self.size+size>self.max_bytes):
+                self.__remove(self.__victim())
+                self.evictions+=1
+            self.__entries[key]=[raw,None,expire_at,size]
+            self.size+=size
+            self.__insert(key)
+
+
+    def invalidate(self,keys)->None:
+        """Removes keys from the cache. None removes every key.
+
+        Args:
+            keys (list): keys (str or bytes) or None
+        """
+        with self.__lock:
+            if keys is None:
+                self.invalidations+=len(self.__entries)
+                self.__clear()
+                for key in self.__fetching:
+                    self.__fetching[key]=0
+                return
+            for key in keys:
+                key=str_if_bytes(key)
+                if key in self.__fetching:
+                    self.__fetching[key]=0
+                if key in self.__entries:
+                    self.__remove(key)
+                    self.invalidations+=1
+
+
+    def clear(self)->None:
+        """Removes every entry without counting invalidations
+        """
+        with self.__lock:
+            self.__clear()
+
+
+    def stats(self)->dict:
+        """Returns the counters of the cache
+
+        Returns:
+            dict: hits, misses, evictions, invalidations, expirations, entries and bytes
+        """
+        with self.__lock:
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "evictions":self.evictions,
+                "invalidations":self.invalidations,
+                "expirations":self.expirations,
+                "entries":len(self.__entries),
+                "bytes":self.size,
+            }
+
+
+    # ---- eviction policies ------------------------------------------------
+
+    def __insert(self,key:str)->None:
+        if self.policy=="lru":
+            self.__lru[key]=None
+            return
+        self.__entries[key].append(1)
+        self.__frequencies.setdefault(1,OrderedDict())[key]=None
+        self.__min_frequency=1
+
+
+    def __touch(self,key:str)->None:
+        if self.policy=="lru":
+            self.__lru.move_to_end(key)
+            return
+        entry=self.__entries[key]
+        frequency=entry[4]
+        bucket=self.__frequencies[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.__frequencies[frequency]
+            if self.__min_frequency==frequency:
+                self.__min_frequency=frequency+1
+        entry[4]=frequency+1
+        self.__frequencies.setdefault(frequency+1,OrderedDict())[key]=None
+
+
+    def __victim(self)->str:
+        if self.policy=="lru":
+            return next(iter(self.__lru))
+        if self.__min_frequency not in self.__frequencies:
+            self.__min_frequency=min(self.__frequencies)
+        return next(iter(self.__frequencies[self.__min_frequency]))
+
+
+    def __remove(self,key:str)->None:
+        entry=self.__entries.pop(key)
+        self.size-=entry[3]
+        if self.policy=="lru":
+            del self.__lru[key]
+            return
+        bucket=self.__frequencies[entry[4]]
+        del bucket[key]
+        if not bucket:
+            del self.__frequencies[entry[4]]
+
+
+    def __clear(self)->None:
+        self.__entries.clear()
+        self.__lru.clear()
+        self.__frequencies.clear()
+        self.size=0
+
+
+    # ---- server assisted invalidation -------------------------------------
+
+    def attach(self,r:Redis)->None:
+        """Enables CLIENT TRACKING on the connections of the pool of (r)
+        and starts the listener thread that applies the invalidations.
+        Connections already open in the pool are closed so they reconnect
+        with tracking enabled; attach the cache at startup.
+
+        Args:
+            r (Redis): client whose pool serves the cached reads
+        """
+        pool=r.connection_pool
+        if pool.connection_kwargs.get("redis_connect_func") is not None:
+            raise ValueError("Redis near cache : the connection pool already has a connect hook")
+        self.__listener=_InvalidationListener(self,pool)
+        self.__listener.start()
+        pool.connection_kwargs["redis_connect_func"]=self.__listener.enable_tracking
+        for connection in _pool_connections(pool):
+            connection.redis_connect_func=self.__listener.enable_tracking
+        pool.disconnect()
+
+
+    def detach(self)->None:
+        """Stops the listener thread and disables tracking on new connections
+        """
+        if self.__listener is None:
+            return
+        self.__listener.stop()
+        self.__listener=None
+        self.clear()
+
+
+    def set_online(self,online:bool)->None:
+        """Called by the listener when the invalidation connection goes up or down.
+        While offline the cache is empty and every read goes to the server.
+        """
+        with self.__lock:
+            self.__online=online
+            self.__clear()
+            for key in self.__fetching:
+                self.__fetching[key]=0
+
+
+def _pool_connections(pool)->list:
+    """Returns every connection created by a blocking or a regular pool
+    """
+    if hasattr(pool,"_connections"):
+        return list(pool._connections)
+    return list(pool._available_connections)+list(pool._in_use_connections)
+
+
+class _InvalidationListener:
+    """Dedicated connection subscribed to the invalidation channel
+    """
+
+    def __init__(self,cache:NearCache,pool) -> None:
+        self.cache=cache
+        self.pool=pool
+        self.client_id=None
+        self.__stop=threading.Event()
+        self.__ready=threading.Event()
+        self.__thread=None
+        self.__connection=None
+
+
+    def start(self)->None:
+        self.__thread=threading.Thread(target=self.__run,name="redis-near-cache",daemon=True)
+        self.__thread.start()
+        self.__ready.wait(5)
+        if self.client_id is None:
+            raise ConnectionError("Redis near cache : invalidation listener could not connect")
+
+
+    def stop(self)->None:
+        self.__stop.set()
+        self.__thread.join()
+        if self.pool.connection_kwargs.get("redis_connect_func")==self.enable_tracking:
+            del self.pool.connection_kwargs["redis_connect_func"]
+            for connection in _pool_connections(self.pool):
+                connection.redis_connect_func=None
+            self.pool.disconnect()
+
+
+    def enable_tracking(self,connection)->None:
+        """Connect hook of the pooled connections
+        """
+        connection.on_connect()
+        args=["CLIENT","TRACKING","ON","REDIRECT",self.client_id]
+        if self.cache.prefixes:
+            args.append("BCAST")
+            for prefix in self.cache.prefixes:
+                args.extend(["PREFIX",prefix])
+        connection.send_command(*args)
+        if str_if_bytes(connection.read_response())!="OK":
+            raise RedisError("Redis near cache : CLIENT TRACKING failed")
+
+
+    def __connect(self):
+        kwargs={key:value for key,value in self.pool.connection_kwargs.items() if key!="redis_connect_func"}
+        connection=self.pool.connection_class(**kwargs)
+        connection.connect()
+        connection.send_command("CLIENT","ID")
+        client_id=connection.read_response()
+        connection.send_command("SUBSCRIBE",INVALIDATION_CHANNEL)
+        connection.read_response()
+        return connection,client_id
+
+
+    def __run(self)->None:
+        while not self.__stop.is_set():
+            try:
+                connection,client_id=self.__connect()
+            except Exception as err:
+                print(f"Redis near cache : invalidation listener failed : {err}")
+                if not self.__ready.is_set():
+                    self.__ready.set()
+                    return
+                self.__stop.wait(1)
+                continue
+            reconnected=self.client_id is not None
+            self.client_id=client_id
+            self.__connection=connection
+            if reconnected:
+                self.pool.disconnect()
+            self.cache.set_online(True)
+            self.__ready.set()
+            try:
+                self.__listen(connection)
+            except Exception as err:
+                if not self.__stop.is_set():
+                    print(f"Redis near cache : invalidation listener lost : {err}")
+            finally:
+                self.cache.set_online(False)
+                connection.disconnect()
+
+
+    def __listen(self,connection)->None:
+        while not self.__stop.is_set():
+            if not connection.can_read(timeout=0.2):
+                continue
+            message=connection.read_response()
+            if not isinstance(message,list) or len(message)<3:
+                continue
+            if str_if_bytes(message[0])!="message":
+                continue
+            self.cache.invalidate(message[2])
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from redis import Redis
+
+
+class ChunkReport:
+    """Collects the latency of every chunk sent by Commands.mset_chunked
+    and Commands.mget_chunked.
+    """
+
+    def __init__(self) -> None:
+        self.chunks=0
+        self.keys=0
+        self.failed=0
+        self.latencies=[]
+        self.__lock=threading.Lock()
+
+
+    def record(self,keys:int,seconds:float,failed:bool=False)->None:
+        with self.__lock:
+            self.chunks+=1
+            self.keys+=keys
+            self.failed+=failed
+            self.latencies.append(seconds)
+
+
+    def summary(self)->dict:
+        """Returns the number of chunks, keys and failed chunks, and
+        the total, mean, p50, p99 and max latency of the chunks in seconds.
+        """
+        with self.__lock:
+            latencies=sorted(self.latencies)
+            summary={"chunks":self.chunks,"keys":self.keys,"failed":self.failed}
+        if not latencies:
+            return summary
+        summary.update({
+            "total":sum(latencies),
+            "mean":sum(latencies)/len(latencies),
+            "p50":latencies[int(0.50*(len(latencies)-1))],
+            "p99":latencies[int(0.99*(len(latencies)-1))],
+            "max":latencies[-1],
+        })
+        return summary
+
+
+def chunked(items,size:int):
+    """Splits any iterable in lists of (size) items without
+    materializing the whole input.
+    """
+    iterator=iter(items)
+    while True:
+        chunk=list(islice(iterator,size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def mset(r:Redis,pairs,chunk_size:int,workers:int,report:ChunkReport=None)->bool:
+    """Sends (pairs) with one MSET per chunk, running up to (workers)
+    chunks at the same time. At most 2 * workers chunks are held in memory.
+
+    Returns:
+        bool: True if every chunk was stored
+    """
+    def send(chunk:list)->bool:
+        start=time.perf_counter()
+        try:
+            r.mset(dict(chunk))
+            ok=True
+        except Exception as err:
+            print(f"Redis mset_chunked operation failed : {err}")
+            ok=False
+        if report is not None:
+            report.record(len(chunk),time.perf_counter()-start,failed=not ok)
+        return ok
+
+    ok=True
+    for result in _ordered(send,chunked(pairs,chunk_size),workers):
+        ok=ok and result
+    return ok
+
+
+def mget(r:Redis,keys,chunk_size:int,workers:int,report:ChunkReport=None):
+    """Yields the values of (keys) in input order, fetching them with
+    one MGET per chunk and up to (workers) chunks at the same time.
+    The values of a chunk that failed are yielded as None.
+    """
+    def fetch(chunk:list)->list:
+        start=time.perf_counter()
+        try:
+            values=r.mget(chunk)
+            ok=True
+        except Exception as err:
+            print(f"Redis mget_chunked operation failed : {err}")
+            values=[None]*len(chunk)
+            ok=False
+        if report is not None:
+            report.record(len(chunk),time.perf_counter()-start,failed=not ok)
+        return values
+
+    for values in _ordered(fetch,chunked(keys,chunk_size),workers):
+        yield from values
+
+
+def _ordered(function,chunks,workers:int):
+    """Runs function over chunks in a thread pool and yields the
+    results in input order, keeping at most 2 * workers chunks in flight.
+    """
+    if workers<=1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+    with ThreadPoolExecutor(max_workers=workers,thread_name_prefix="redis-chunks") as executor:
+        in_flight=deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(function,chunk))
+            if len(in_flight)>=workers*2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
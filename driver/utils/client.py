@@ -1,3 +1,4 @@
+from array import array
 from redis import Redis 
 
 
@@ -9,15 +10,19 @@ class Client:
         - kill : Closes the connection of the specified client.
         - set_client_name : Sets a name or alias for the connection of the current client.
         - echo : Sends a echo command string to the Redis server.
+        - get_client_table : Returns the client list parsed in columns, with filters.
+        - kill_clients : Closes every client matching a filter in one round trip.
     """
     def __init__(self,r:Redis) -> None:
         self.__r=r
 
     
-    def close(self):
-        """Destroys the current local(class) client instance
+    def close(self,quit:bool=True):
+        """Destroys the current local(class) client instance. With
+        quit=False the connection is left to its owner.
         """
-        self.__r.quit()
+        if quit:
+            self.__r.quit()
         self.__r=None
     
 
@@ -41,18 +46,10 @@ class Client:
         Returns:
             dict: Client information
         """
-        if not all:
-            client_info={
-                "id":self.__r.client_info()["id"],
-                "addr":self.__r.client_info()["addr"],
-                "laddr":self.__r.client_info()["laddr"],
-                "fd":self.__r.client_info()["fd"],
-                "name":self.__r.client_info()["name"],
-                "db":self.__r.client_info()["db"],
-            }
-            return client_info
-        else:
-            return self.__r.client_info()
+        info=self.__r.client_info()
+        if all:
+            return info
+        return {field:info[field] for field in ("id","addr","laddr","fd","name","db")}
 
     
     def get_client_list(self)->list:
@@ -110,6 +107,166 @@ class Client:
         if not isinstance(message,str):
             print("Redis echo operation : message must be a string (str)")
         self.__r.echo(message)
-      
-    
-  
\ No newline at end of file
+
+
+    def get_client_table(self)->"ClientTable":
+        """Returns the CLIENT LIST of the server parsed into a compact
+        column oriented ClientTable, with a single round trip. 
+        Use it instead of get_client_list to inspect or filter
+        servers with many connections.
+
+        Example:
+            table=driver.client.get_client_table()
+            idle=table.filter(min_idle=300,addr_prefix="10.0.")
+            idle.column("addr")
+
+        Returns:
+            ClientTable: clients of the server
+        """
+        return ClientTable.parse(self.__r.execute_command("CLIENT","LIST"))
+
+
+    def kill_clients(self,skip_me:bool=True,**filters)->int:
+        """Closes the connection of every client matching the filters
+        (see ClientTable.filter) with one pipelined pass of CLIENT KILL ID.
+
+        Example:
+            driver.client.kill_clients(min_idle=3600,name="worker")
+
+        Args:
+            skip_me (bool, optional): never kill the current connection. Defaults to True.
+
+        Returns:
+            int: number of clients killed
+        """
+        if not filters:
+            print("Redis kill_clients operation : at least one filter is required")
+            return 0
+        table=self.get_client_table().filter(**filters)
+        if not len(table):
+            return 0
+        pipe=self.__r.pipeline(transaction=False)
+        for client_id in table.column("id"):
+            pipe.execute_command("CLIENT","KILL","ID",client_id,"SKIPME","yes" if skip_me else "no")
+        try:
+            return sum(reply for reply in pipe.execute(raise_on_error=False) if isinstance(reply,int))
+        except Exception as err:
+            print(f"Redis kill_clients operation failed : {err}")
+            return 0
+
+
+class ClientTable:
+    """Clients of CLIENT LIST stored by column. Numeric fields are
+    kept in arrays of 64 bit ints and text fields in lists of str,
+    which keeps tables of tens of thousands of clients small and 
+    makes filtering a pass over a few columns.
+    """
+
+    numeric=("id","fd","age","idle","db","sub","psub","ssub","multi","qbuf","qbuf-free",
+        "argv-mem","multi-mem","obl","oll","omem","tot-mem","rbs","rbp","redir","resp")
+
+    def __init__(self,columns:dict) -> None:
+        self.columns=columns
+
+
+    @classmethod
+    def parse(cls,raw)->"ClientTable":
+        """Parses the raw reply of CLIENT LIST
+
+        Args:
+            raw (bytes): reply of CLIENT LIST
+
+        Returns:
+            ClientTable: parsed table
+        """
+        if isinstance(raw,bytes):
+            raw=raw.decode("utf-8",errors="replace")
+        columns={}
+        rows=0
+        for line in raw.splitlines():
+            if not line:
+                continue
+            for field in line.split(" "):
+                name,_,value=field.partition("=")
+                column=columns.get(name)
+                if column is None:
+                    column=columns[name]=array("q") if name in cls.numeric else []
+                    column.extend([0]*rows if name in cls.numeric else [""]*rows)
+                if name in cls.numeric:
+                    column.append(int(value) if value.lstrip("-").isdigit() else 0)
+                else:
+                    column.append(value)
+            rows+=1
+            for column in columns.values():
+                if len(column)<rows:
+                    column.append(0 if isinstance(column,array) else "")
+        return cls(columns)
+
+
+    def __len__(self)->int:
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+
+    def column(self,name:str)->list:
+        """Returns every value of the column (name)
+        """
+        return list(self.columns.get(name,()))
+
+
+    def rows(self):
+        """Yields each client as a dict
+        """
+        names=list(self.columns)
+        for index in range(len(self)):
+            yield {name:self.columns[name][index] for name in names}
+
+
+    def select(self,indexes:list)->"ClientTable":
+        """Returns a table holding only the rows at (indexes)
+        """
+        return ClientTable({
+            name:(array("q",(column[index] for index in indexes)) if isinstance(column,array) else [column[index] for index in indexes])
+            for name,column in self.columns.items()
+        })
+
+
+    def filter(self,min_idle:int=None,max_idle:int=None,name:str=None,addr_prefix:str=None,
+    min_output_buffer:int=None,min_query_buffer:int=None,min_memory:int=None,predicate=None)->"ClientTable":
+        """Returns the clients matching every given filter
+
+        Args:
+            min_idle (int, optional): idle for at least this many seconds. Defaults to None.
+            max_idle (int, optional): idle for at most this many seconds. Defaults to None.
+            name (str, optional): name set with set_client_name. Defaults to None.
+            addr_prefix (str, optional): address starting with it, like "10.0.". Defaults to None.
+            min_output_buffer (int, optional): output buffer memory (omem) in bytes. Defaults to None.
+            min_query_buffer (int, optional): query buffer length (qbuf) in bytes. Defaults to None.
+            min_memory (int, optional): total memory (tot-mem) in bytes. Defaults to None.
+            predicate (callable, optional): predicate(row dict) -> bool. Defaults to None.
+
+        Returns:
+            ClientTable: matching clients
+        """
+        indexes=range(len(self))
+        checks=(
+            ("idle",min_idle,lambda value,limit:value>=limit),
+            ("idle",max_idle,lambda value,limit:value<=limit),
+            ("name",name,lambda value,limit:value==limit),
+            ("addr",addr_prefix,lambda value,limit:value.startswith(limit)),
+            ("omem",min_output_buffer,lambda value,limit:value>=limit),
+            ("qbuf",min_query_buffer,lambda value,limit:value>=limit),
+            ("tot-mem",min_memory,lambda value,limit:value>=limit),
+        )
+        for column_name,limit,check in checks:
+            if limit is None:
+                continue
+            column=self.columns.get(column_name)
+            if column is None:
+                return self.select([])
+            indexes=[index for index in indexes if check(column[index],limit)]
+        if predicate is not None:
+            names=list(self.columns)
+            indexes=[index for index in indexes if predicate({name:self.columns[name][index] for name in names})]
+        return self.select(list(indexes))
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from redis.cluster import ClusterNode,RedisCluster
+from redis.exceptions import AskError,MovedError,RedisClusterException
+
+
+class ClusterClient(RedisCluster):
+    """Redis Cluster client used by Driver in cluster mode.
+
+    The topology is discovered from the startup node with CLUSTER SLOTS
+    and kept in a slot map that is refreshed when a node answers MOVED
+    or ASK; every node gets its own connection pool of (max_connections).
+    Single key commands are routed by redis-py.
+
+    Multi-key commands (mget, mset, getdel_many) are split by hash slot,
+    the commands of each node are sent in one pipeline, the nodes are
+    called in parallel and the replies are put back in input order.
+    Unlike MGET and MSET on a single server they are not atomic across slots.
+    """
+
+    max_redirects=5
+
+    def __init__(self,*args,workers:int=16,**kargs) -> None:
+        self.__executor=None
+        self.workers=workers
+        self.redirects=0
+        super().__init__(*args,**kargs)
+
+
+    def close(self)->None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor=None
+        super().close()
+
+
+    def mget(self,keys,*args)->list:
+        """MGET of keys of any slot
+
+        Returns:
+            list: value of each key in input order, None for missing keys
+        """
+        keys=list(keys) if isinstance(keys,(list,tuple)) else [keys]
+        keys.extend(args)
+        slots=self.__by_slot(keys)
+        replies=self.__fan_out("MGET",{slot:[keys[index] for index in indexes] for slot,indexes in slots.items()})
+        values=[None]*len(keys)
+        for slot,indexes in slots.items():
+            for index,value in zip(indexes,replies[slot]):
+                values[index]=value
+        return values
+
+
+    def mset(self,mapping:dict)->bool:
+        """MSET of keys of any slot
+
+        Returns:
+            bool: True when every slot was stored
+        """
+        items=list(mapping.items())
+        slots=self.__by_slot([key for key,_ in items])
+        commands={}
+        for slot,indexes in slots.items():
+            args=[]
+            for index in indexes:
+                args.extend(items[index])
+            commands[slot]=args
+        replies=self.__fan_out("MSET",commands)
+        return all(reply is True or reply==b"OK" or reply=="OK" for reply in replies.values())
+
+
+    def getdel_many(self,keys:list)->list:
+        """GETDEL of several keys of any slot, one GETDEL per key
+
+        Returns:
+            list: value of each key before it was deleted, in input order
+        """
+        keys=list(keys)
+        slots=self.__by_slot(keys)
+        commands={}
+        for slot,indexes in slots.items():
+            commands[slot]=[("GETDEL",keys[index]) for index in indexes]
+        replies=self.__fan_out(None,commands)
+        values=[None]*len(keys)
+        for slot,indexes in slots.items():
+            for index,value in zip(indexes,replies[slot]):
+                values[index]=value
+        return values
+
+
+    def __by_slot(self,keys:list)->dict:
+        slots={}
+        for index,key in enumerate(keys):
+            slots.setdefault(self.keyslot(key),[]).append(index)
+        return slots
+
+
+    def __fan_out(self,command:str,commands:dict)->dict:
+        """Runs the commands of each slot on the node serving it, every
+        node in parallel. With command=None each slot holds a list of
+        commands whose replies are returned as a list.
+
+        Returns:
+            dict: reply of each slot
+        """
+        replies={}
+        pending=dict(commands)
+        asking={}
+        for _ in range(self.max_redirects+1):
+            by_node={}
+            for slot in pending:
+                node=asking.get(slot) or self.nodes_manager.get_node_from_slot(slot)
+                by_node.setdefault(node.name,(node,[]))[1].append(slot)
+            results=self.__map(lambda item:self.__send(item[0],item[1],command,pending,asking),by_node.values())
+            asking={}
+            retry={}
+            for slots,node_replies in results:
+                for slot,reply in zip(slots,node_replies):
+                    if isinstance(reply,Exception):
+                        error=reply
+                    elif command is None:
+                        error=next((item for item in reply if isinstance(item,Exception)),None)
+                    else:
+                        error=None
+                    if isinstance(error,MovedError):
+                        self.redirects+=1
+                        self.nodes_manager.update_moved_exception(error)
+                        self.nodes_manager.get_node_from_slot(error.slot_id)
+                        retry[slot]=pending[slot]
+                    elif isinstance(error,AskError):
+                        self.redirects+=1
+                        asking[slot]=self.nodes_manager.get_node(host=error.host,port=error.port) or ClusterNode(error.host,error.port)
+                        retry[slot]=pending[slot]
+                    elif error is not None:
+                        raise error
+                    else:
+                        replies[slot]=reply
+            if not retry:
+                return replies
+            pending=retry
+        raise RedisClusterException(f"Redis cluster : too many redirections for slots {sorted(pending)}")
+
+
+    def __send(self,node,slots:list,command:str,commands:dict,asking:dict)->tuple:
+        pipe=self.get_redis_connection(node).pipeline(transaction=False)
+        positions=[]
+        for slot in slots:
+            if slot in asking:
+                pipe.execute_command("ASKING")
+            start=len(pipe.command_stack)
+            if command is None:
+                for args in commands[slot]:
+                    pipe.execute_command(*args)
+            else:
+                pipe.execute_command(command,*commands[slot])
+            positions.append((start,len(pipe.command_stack)))
+        replies=pipe.execute(raise_on_error=False)
+        if command is None:
+            return slots,[replies[start:end] for start,end in positions]
+        return slots,[replies[start] for start,_ in positions]
+
+
+    def __map(self,function,items)->list:
+        items=list(items)
+        if len(items)<=1:
+            return [function(item) for item in items]
+        if self.__executor is None:
+            self.__executor=ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix="redis-cluster")
+        return list(self.__executor.map(function,items))
@@ -0,0 +1,276 @@
+import json
+import pickle
+import zlib
+
+
+MAGIC=b"\xf5"
+"""never the first byte of UTF-8 text, so plain strings are not mistaken for headers"""
+HEADER_SIZE=3
+
+
+class Codec:
+    """Base class of the serializers used by Serializer. Each codec
+    has a unique id (1-255) that is written in the header of the stored
+    value, so values can always be decoded with the codec that wrote them.
+    """
+    id=0
+    name=""
+
+    def encode(self,value)->bytes:
+        raise NotImplementedError
+
+
+    def decode(self,data:bytes):
+        raise NotImplementedError
+
+
+class RawCodec(Codec):
+    """Stores bytes, bytearray and memoryview values as they are
+    """
+    id=1
+    name="raw"
+
+    def encode(self,value)->bytes:
+        if not isinstance(value,(bytes,bytearray,memoryview)):
+            raise TypeError("Redis raw codec : value must be bytes, bytearray or memoryview")
+        return bytes(value)
+
+
+    def decode(self,data:bytes)->bytes:
+        return bytes(data)
+
+
+class JsonCodec(Codec):
+    """Stores values as compact UTF-8 JSON
+    """
+    id=2
+    name="json"
+
+    def encode(self,value)->bytes:
+        return json.dumps(value,separators=(",",":"),ensure_ascii=False).encode("utf-8")
+
+
+    def decode(self,data:bytes):
+        return json.loads(bytes(data))
+
+
+class PickleCodec(Codec):
+    """Stores any picklable value with pickle protocol 5.
+    Only use it with servers that are not writable by untrusted clients,
+    unpickling data can execute arbitrary code.
+    """
+    id=3
+    name="pickle"
+
+    def encode(self,value)->bytes:
+        return pickle.dumps(value,protocol=5)
+
+
+    def decode(self,data:bytes):
+        return pickle.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """Stores values with msgpack. Requires the msgpack package.
+    """
+    id=4
+    name="msgpack"
+
+    def __init__(self) -> None:
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError("Redis msgpack codec : install the msgpack package to use it")
+        self.__msgpack=msgpack
+
+
+    def encode(self,value)->bytes:
+        return self.__msgpack.packb(value,use_bin_type=True)
+
+
+    def decode(self,data:bytes):
+        return self.__msgpack.unpackb(data,raw=False)
+
+
+class StrCodec(Codec):
+    """Stores str values as UTF-8
+    """
+    id=5
+    name="str"
+
+    def encode(self,value)->bytes:
+        if not isinstance(value,str):
+            raise TypeError("Redis str codec : value must be a string")
+        return value.encode("utf-8")
+
+
+    def decode(self,data:bytes)->str:
+        return bytes(data).decode("utf-8")
+
+
+class Compression:
+    """Base class of the compression algorithms used by Serializer
+    """
+    id=0
+    name="none"
+
+    def compress(self,data:bytes)->bytes:
+        return data
+
+
+    def decompress(self,data:bytes)->bytes:
+        return data
+
+
+class ZlibCompression(Compression):
+    """Standard library zlib compression
+    """
+    id=1
+    name="zlib"
+
+    def __init__(self,level:int=6) -> None:
+        self.level=level
+
+
+    def compress(self,data:bytes)->bytes:
+        return zlib.compress(data,self.level)
+
+
+    def decompress(self,data:bytes)->bytes:
+        return zlib.decompress(data)
+
+
+class Lz4Compression(Compression):
+    """lz4 frame compression. Requires the lz4 package.
+    """
+    id=2
+    name="lz4"
+
+    def __init__(self) -> None:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("Redis lz4 compression : install the lz4 package to use it")
+        self.__lz4=lz4.frame
+
+
+    def compress(self,data:bytes)->bytes:
+        return self.__lz4.compress(data)
+
+
+    def decompress(self,data:bytes)->bytes:
+        return self.__lz4.decompress(data)
+
+
+codecs={codec.name:codec for codec in (RawCodec,JsonCodec,PickleCodec,MsgpackCodec,StrCodec)}
+compressions={compression.name:compression for compression in (Compression,ZlibCompression,Lz4Compression)}
+
+
+def register_codec(codec:type)->None:
+    """Makes a custom Codec subclass available by name to Serializer
+
+    Args:
+        codec (type): Codec subclass with a unique id and name
+    """
+    for registered in codecs.values():
+        if registered.id==codec.id and registered is not codec:
+            raise ValueError(f"Redis codecs : id {codec.id} is already used by {registered.name}")
+    codecs[codec.name]=codec
+
+
+class Serializer:
+    """Turns python values into bytes stored in Redis and back.
+
+    Stored values start with a 3 bytes header : a magic byte, the id of
+    the codec and the id of the compression. Values are compressed when
+    their encoded size is at least (threshold) bytes. When the lz4 package
+    is not installed "lz4" falls back to zlib.
+    Values without header (written by Commands.set for example), or
+    whose codec or compression id is unknown, are returned as bytes.
+
+    Example:
+        serializer=Serializer("msgpack",compression="lz4",threshold=1024)
+        data=serializer.dumps({"name":"Jhon"})
+        serializer.loads(data) -> {"name":"Jhon"}
+    """
+
+    def __init__(self,codec:str="json",compression:str="zlib",threshold:int=1024) -> None:
+        if codec not in codecs:
+            raise ValueError(f"Redis serializer : unknown codec {codec}, available : {list(codecs)}")
+        if compression is None:
+            compression="none"
+        if compression not in compressions:
+            raise ValueError(f"Redis serializer : unknown compression {compression}, available : {list(compressions)}")
+        self.codec=codecs[codec]()
+        try:
+            self.compression=compressions[compression]()
+        except ImportError:
+            self.compression=ZlibCompression()
+        self.threshold=threshold
+        self.__decoders={self.codec.id:self.codec}
+        self.__decompressors={self.compression.id:self.compression}
+
+
+    def dumps(self,value)->bytes:
+        """Encodes a value with the codec of the serializer
+
+        Args:
+            value (any): value supported by the codec
+
+        Returns:
+            bytes: header and encoded value
+        """
+        data=self.codec.encode(value)
+        compression=self.compression
+        if compression.id and len(data)>=self.threshold:
+            compressed=compression.compress(data)
+            if len(compressed)<len(data):
+                return MAGIC+bytes((self.codec.id,compression.id))+compressed
+        return MAGIC+bytes((self.codec.id,0))+data
+
+
+    def loads(self,data:bytes):
+        """Decodes a value written by any Serializer
+
+        Args:
+            data (bytes): stored value
+
+        Returns:
+            any: decoded value, or data itself if it has no known header
+        """
+        if data is None:
+            return None
+        if len(data)<HEADER_SIZE or data[:1]!=MAGIC:
+            return data
+        codec=self.__decoder(data[1])
+        compression=self.__decompressor(data[2]) if data[2] else None
+        if codec is None or (data[2] and compression is None):
+            return data
+        payload=memoryview(data)[HEADER_SIZE:]
+        if compression is not None:
+            payload=compression.decompress(payload)
+        return codec.decode(payload)
+
+
+    def __decoder(self,codec_id:int)->Codec:
+        codec=self.__decoders.get(codec_id)
+        if codec is None:
+            for registered in codecs.values():
+                if registered.id==codec_id:
+                    codec=self.__decoders[codec_id]=registered()
+                    break
+            else:
+                return None
+        return codec
+
+
+    def __decompressor(self,compression_id:int)->Compression:
+        compression=self.__decompressors.get(compression_id)
+        if compression is None:
+            for registered in compressions.values():
+                if registered.id==compression_id:
+                    compression=self.__decompressors[compression_id]=registered()
+                    break
+            else:
+                return None
+        return compression
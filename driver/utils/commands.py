@@ -1,4 +1,15 @@
+from typing import TYPE_CHECKING
 from redis import Redis
+if TYPE_CHECKING:
+    from driver.utils.batch import Batch
+    from driver.utils.blobs import Blobs
+    from driver.utils.cache import NearCache
+    from driver.utils.chunks import ChunkReport
+    from driver.utils.codecs import Serializer
+    from driver.utils.memoize import Memoizer
+    from driver.utils.resilience import Resilience
+    from driver.utils.scan import Scanner
+    from driver.utils.scripts import Scripts
 
 class Commands:
 
@@ -10,17 +21,48 @@ class Commands:
         - mset : set a collection of key - value items
         - mget : get a list of values from a list of keys
         - getdel : find, get and delete item (in that specific order)
+        - getdel_many : getdel for a list of keys in one round trip
+        - batch : queue several of the commands above into one pipeline
+        - enable_near_cache : keep the values read with get and mget in memory
+        - scan_iter, hscan_iter, sscan_iter, zscan_iter : stream keys or members without blocking the server
+        - mset_chunked, mget_chunked : mset and mget for very large key sets
+        - set_object, get_object, mset_objects, mget_objects : store python values with a Serializer
+        - scripts : registry of Lua scripts and atomic compound operations
+        - enable_resilience : retries, circuit breaker, hedged reads and typed errors
+        - memoize : cache-aside decorator with stampede protection
+        - blobs : large values written and read in chunks, as bytes or into buffers
     """
 
     def __init__(self,r:Redis) -> None:
         self.__r=r
+        self.__cache=None
+        self.__serializer=None
+        self.__scripts=None
+        self.__resilience=None
 
 
-    def close(self):
-        self.__r.quit()
+    def close(self,quit:bool=True):
+        """Releases the helper. With quit=False the connection is left
+        to its owner (the Driver closes its pool once for every helper).
+        """
+        self.disable_near_cache()
+        if self.__resilience is not None:
+            self.__resilience.close()
+        if quit:
+            self.__r.quit()
         self.__r=None
         
 
+    def __failed(self,operation:str,err:Exception)->None:
+        """Reports a failed operation : printed, or recorded (and raised
+        if configured) by the Resilience layer when it is enabled
+        """
+        if self.__resilience is None:
+            print(f"Redis {operation} operation failed : {err}")
+            return
+        self.__resilience.failed(operation,err)
+
+
     def __validate_key_value(self,key:str,value:str)->bool:
         """_summary_
 
@@ -50,10 +92,30 @@ class Commands:
         """
         if not self.__validate_key_value(key,"value"):
             return None
+        if self.__cache is not None and self.__cache.cacheable(key):
+            return self.__cached_get(key)
+        try:
+            value=self.__r.get(key)
+            return value.decode("utf-8") if value is not None else None
+        except Exception as err:
+            self.__failed("get",err)
+            return None
+
+
+    def __cached_get(self,key:str)->str:
+        entry=self.__cache.lookup(key)
+        if entry is not None:
+            if entry[1] is None:
+                entry[1]=entry[0].decode("utf-8")
+            return entry[1]
+        self.__cache.begin(key)
         try:
-            return self.__r.get(key).decode("utf-8")
+            value,pttl=self.__r.pipeline(transaction=False).get(key).pttl(key).execute()
+            self.__cache.store(key,value,pttl)
+            return value.decode("utf-8") if value is not None else None
         except Exception as err:
-            print(f"Redis get operation : {err}")
+            self.__cache.invalidate([key])
+            self.__failed("get",err)
             return None
 
     
@@ -88,11 +150,12 @@ class Commands:
                 nx=kargs.get("nx"),
                 xx=kargs.get("xx")
             )
-            if result=="OK":
+            self.__invalidate(key)
+            if result:
                 return  True 
             return False
         except  Exception as err:
-            print(f"Redis set operation failed : {err}")
+            self.__failed("set",err)
             return False
 
 
@@ -117,9 +180,11 @@ class Commands:
         if not self.__validate_key_value(key,value):
             return False
         try:
-            return self.__r.append(key,value)
+            result=self.__r.append(key,value)
+            self.__invalidate(key)
+            return result
         except Exception as err:
-            print(f"Redis append operation failed : {err}")
+            self.__failed("append",err)
             return False
 
 
@@ -140,9 +205,11 @@ class Commands:
             print("Redis mset operation : arg items must be type (dict)")
             return False
         try:
-            return self.__r.mset(items)
+            result=self.__r.mset(items)
+            self.__invalidate(*items)
+            return result
         except Exception as err:
-            print(f"Redis mset operation failed : {err}")
+            self.__failed("mset",err)
             return False
         
     
@@ -161,13 +228,105 @@ class Commands:
         """
         if not isinstance(items,list):
             print("Redis mget operation : arg items must be type (list)")
+        if self.__cache is not None and isinstance(items,list):
+            return self.__cached_mget(items)
         try:
             return self.__r.mget(items)
         except Exception as err:
-            print(f"Redis mget operation failed : {err}")
+            self.__failed("mget",err)
+            return None
+
+
+    def __cached_mget(self,items:list)->list:
+        values=[None]*len(items)
+        missing=[]
+        for index,key in enumerate(items):
+            entry=self.__cache.lookup(key) if self.__cache.cacheable(key) else None
+            if entry is None:
+                missing.append(index)
+            else:
+                values[index]=entry[0]
+        if not missing:
+            return values
+        keys=[items[index] for index in missing]
+        cacheable=[self.__cache.cacheable(key) for key in keys]
+        for key,tracked in zip(keys,cacheable):
+            if tracked:
+                self.__cache.begin(key)
+        try:
+            pipe=self.__r.pipeline(transaction=False)
+            pipe.mget(keys)
+            for key in keys:
+                pipe.pttl(key)
+            replies=pipe.execute()
+        except Exception as err:
+            self.__cache.invalidate(keys)
+            self.__failed("mget",err)
             return None
+        for position,index in enumerate(missing):
+            values[index]=replies[0][position]
+            if cacheable[position]:
+                self.__cache.store(items[index],values[index],replies[position+1])
+        return values
 
     
+    def mset_chunked(self,items,chunk_size:int=1000,workers:int=4,report:"ChunkReport"=None)->bool:
+        """Same as mset, for very large inputs. The items are split in 
+        chunks of (chunk_size) keys sent concurrently by (workers) threads,
+        so no single command holds a huge buffer or stalls the server.
+        Each chunk is atomic but the whole operation is not.
+
+        Args:
+            items (dict): Map of keys and values, or any iterable of (key,value) pairs.
+            chunk_size (int, optional): keys per MSET. Defaults to 1000.
+            workers (int, optional): chunks sent at the same time. Defaults to 4.
+            report (ChunkReport, optional): collects the latency of each chunk. Defaults to None.
+
+        Returns:
+            bool: True if every chunk was stored.
+            bool: False if any chunk failed.
+        """
+        if not isinstance(chunk_size,int) or chunk_size<1 or not isinstance(workers,int) or workers<1:
+            print("Redis mset_chunked operation : chunk_size and workers must be positive ints")
+            return False
+        pairs=items.items() if isinstance(items,dict) else items
+        if self.__cache is not None:
+            pairs=self.__invalidating(pairs)
+        from driver.utils import chunks
+        return chunks.mset(self.__r,pairs,chunk_size,workers,report)
+
+
+    def mget_chunked(self,items,chunk_size:int=1000,workers:int=4,report:"ChunkReport"=None):
+        """Same as mget, for very large inputs. The keys are split in
+        chunks of (chunk_size) fetched concurrently by (workers) threads,
+        and the values are streamed back in input order instead of
+        building one giant list.
+
+        Example:
+            for key,value in zip(keys,driver.commands.mget_chunked(keys)):
+                ...
+
+        Args:
+            items (list): keys, or any iterable of keys.
+            chunk_size (int, optional): keys per MGET. Defaults to 1000.
+            workers (int, optional): chunks fetched at the same time. Defaults to 4.
+            report (ChunkReport, optional): collects the latency of each chunk. Defaults to None.
+
+        Returns:
+            generator: value of each key, None if the key does not exist or its chunk failed
+        """
+        if not isinstance(chunk_size,int) or chunk_size<1 or not isinstance(workers,int) or workers<1:
+            raise ValueError("Redis mget_chunked operation : chunk_size and workers must be positive ints")
+        from driver.utils import chunks
+        return chunks.mget(self.__r,items,chunk_size,workers,report)
+
+
+    def __invalidating(self,pairs):
+        for key,value in pairs:
+            self.__cache.invalidate([key])
+            yield key,value
+
+
     def getdel(self,key:str)->bool:
         """Finds a key, returns its value and deletes the key.
 
@@ -183,9 +342,364 @@ class Commands:
             return  False
         try:
             result=self.__r.getdel(key)
+            self.__invalidate(key)
             if result is not None:
                 return result
             return False
         except Exception as err:
-            print(f"Redis getdel operation failed : {err}")
-            return False
\ No newline at end of file
+            self.__failed("getdel",err)
+            return False
+
+
+    def getdel_many(self,items:list)->list:
+        """Gets and deletes a list of keys in one round trip. 
+        In cluster mode the keys are grouped by slot and every node 
+        is called in parallel.
+
+        Args:
+            items (list): list of keys
+
+        Returns:
+            list: value of each key before it was deleted, None for missing keys
+            None: returns None if the operation failed
+        """
+        if not isinstance(items,list):
+            print("Redis getdel_many operation : arg items must be type (list)")
+            return None
+        from driver.utils.cluster import ClusterClient
+        try:
+            if isinstance(self.__r,ClusterClient):
+                result=self.__r.getdel_many(items)
+            else:
+                pipe=self.__r.pipeline(transaction=False)
+                for key in items:
+                    pipe.getdel(key)
+                result=pipe.execute()
+            self.__invalidate(*items)
+            return result
+        except Exception as err:
+            self.__failed("getdel_many",err)
+            return None
+
+
+    def batch(self,max_commands:int=100,max_bytes:int=1048576)->"Batch":
+        """Returns a Batch that queues set, get, append and getdel
+        calls into a pipeline. The batch is flushed automatically when
+        it holds (max_commands) commands or (max_bytes) bytes and when
+        it is used as a context manager, on exit.
+
+        Args:
+            max_commands (int, optional): commands per round trip. Defaults to 100.
+            max_bytes (int, optional): bytes of keys and values per round trip. Defaults to 1048576.
+
+        Returns:
+            Batch: batch bound to the current connection
+        """
+        from driver.utils.batch import Batch
+        return Batch(self.__r,max_commands=max_commands,max_bytes=max_bytes,scripts=self.scripts)
+
+
+    @property
+    def scripts(self)->"Scripts":
+        """Registry of Lua scripts called with EVALSHA. See Scripts.
+        """
+        if self.__scripts is None:
+            from driver.utils.scripts import Scripts
+            self.__scripts=Scripts(self.__r)
+        return self.__scripts
+
+
+    def memoizer(self,**options)->"Memoizer":
+        """Returns a Memoizer (cache-aside with stampede protection) using 
+        the serializer and the scripts of the helper. See Memoizer for the options.
+
+        Example:
+            cache=driver.commands.memoizer(ttl=30)
+            page=cache.get_or_compute("page:home",render_home)
+        """
+        from driver.utils.memoize import Memoizer
+        options.setdefault("serializer",self.serializer)
+        return Memoizer(self.__r,self.scripts,**options)
+
+
+    def memoize(self,function=None,ttl:float=300,key=None,**options):
+        """Decorator caching the results of a function in Redis, 
+        with a key built from its arguments. See Memoizer.
+
+        Example:
+            @driver.commands.memoize(ttl=60,prefix="views")
+            def profile(user_id):
+                return render(user_id)
+        """
+        memoizer=self.memoizer(ttl=ttl,**options)
+        if function is None:
+            return memoizer(key=key)
+        return memoizer(function,key=key)
+
+
+    def blobs(self,**options)->"Blobs":
+        """Returns a Blobs helper storing large values in chunks instead
+        of whole str copies. See Blobs for the options.
+
+        Example:
+            blobs=driver.commands.blobs(layout="chunked")
+            blobs.write("video",open("video.mp4","rb"))
+            for chunk in blobs.stream("video"):
+                response.write(chunk)
+        """
+        from driver.utils.blobs import Blobs
+        return Blobs(self.__r,self.scripts,**options)
+
+
+    def set_serializer(self,serializer:"Serializer")->None:
+        """Sets the Serializer used by set_object, get_object, mset_objects
+        and mget_objects. The default one uses JSON with zlib compression 
+        of values of 1 KB or more.
+
+        Example:
+            driver.commands.set_serializer(Serializer("pickle",compression="lz4"))
+
+        Args:
+            serializer (Serializer): serializer
+        """
+        from driver.utils.codecs import Serializer
+        if not isinstance(serializer,Serializer):
+            raise ValueError("Redis set_serializer : serializer must be a Serializer")
+        self.__serializer=serializer
+
+
+    @property
+    def serializer(self)->"Serializer":
+        if self.__serializer is None:
+            from driver.utils.codecs import Serializer
+            self.__serializer=Serializer()
+        return self.__serializer
+
+
+    def set_object(self,key:str,value,**kargs)->bool:
+        """Same as set, for any value supported by the serializer.
+        Accepts the same additional parameters : ex, exat, nx and xx.
+
+        Args:
+            key (str): key
+            value (any): value
+
+        Returns:
+            bool: True if the operation soceeded
+            bool: False if the operation failed
+        """
+        if not self.__validate_key_value(key,"value"):
+            return False
+        try:
+            result=self.__r.set(
+                name=key,
+                value=self.serializer.dumps(value),
+                ex=kargs.get("ex"),
+                exat=kargs.get("exat"),
+                nx=kargs.get("nx"),
+                xx=kargs.get("xx")
+            )
+            self.__invalidate(key)
+            return bool(result)
+        except Exception as err:
+            self.__failed("set_object",err)
+            return False
+
+
+    def get_object(self,key:str):
+        """Returns the value of the key decoded by the serializer.
+
+        Args:
+            key (str): key
+
+        Returns:
+            any: value of (key)
+            None: If the key does no exists or error
+        """
+        if not self.__validate_key_value(key,"value"):
+            return None
+        try:
+            return self.serializer.loads(self.__r.get(key))
+        except Exception as err:
+            self.__failed("get_object",err)
+            return None
+
+
+    def mset_objects(self,items:dict)->bool:
+        """Same as mset, for values supported by the serializer.
+
+        Args:
+            items (dict): Map of keys (str) and values.
+
+        Returns:
+            bool: True if the operation suceeded.
+            bool: False if the operation failed.
+        """
+        if not isinstance(items,dict):
+            print("Redis mset_objects operation : arg items must be type (dict)")
+            return False
+        try:
+            result=self.__r.mset({key:self.serializer.dumps(value) for key,value in items.items()})
+            self.__invalidate(*items)
+            return result
+        except Exception as err:
+            self.__failed("mset_objects",err)
+            return False
+
+
+    def mget_objects(self,items:list)->list:
+        """Same as mget, with the values decoded by the serializer.
+
+        Args:
+            items (list): list of keys
+
+        Returns:
+            list: list of values for each key
+            None: returns None if the operation failed
+        """
+        if not isinstance(items,list):
+            print("Redis mget_objects operation : arg items must be type (list)")
+            return None
+        try:
+            return [self.serializer.loads(value) for value in self.__r.mget(items)]
+        except Exception as err:
+            self.__failed("mget_objects",err)
+            return None
+
+
+    def scan_iter(self,match:str=None,count:int=1000,type:str=None,prefetch:bool=True,
+    values:bool=False,types:bool=False,ttls:bool=False)->"Scanner":
+        """Iterates over the keys of the database with SCAN. 
+        Use it instead of KEYS, which blocks the server.
+        The next page of keys is fetched in the background while the
+        current one is processed. When values, types or ttls are requested
+        they are fetched with one pipeline per page and each item is a 
+        ScanEntry(key,value,type,ttl).
+
+        Example:
+            for key in driver.commands.scan_iter(match="user:*",count=5000):
+                ...
+
+        Args:
+            match (str, optional): glob-style pattern of the keys. Defaults to None.
+            count (int, optional): COUNT hint, keys per page. Defaults to 1000.
+            type (str, optional): only return keys of this type, like "string". Defaults to None.
+            prefetch (bool, optional): fetch the next page in the background. Defaults to True.
+            values (bool, optional): fetch the value of each key (MGET). Defaults to False.
+            types (bool, optional): fetch the type of each key (TYPE). Defaults to False.
+            ttls (bool, optional): fetch the ttl in milliseconds of each key (PTTL). Defaults to False.
+
+        Returns:
+            Scanner: iterable of keys (str) or ScanEntry. Scanner.pages() yields whole pages.
+        """
+        from driver.utils.scan import Scanner
+        return Scanner(self.__r,"SCAN",match=match,count=count,type=type,prefetch=prefetch,
+            fetch_values=values,fetch_types=types,fetch_ttls=ttls)
+
+
+    def hscan_iter(self,key:str,match:str=None,count:int=1000,prefetch:bool=True)->"Scanner":
+        """Iterates over the fields of the hash stored at key with HSCAN.
+
+        Returns:
+            Scanner: iterable of (field,value) tuples
+        """
+        from driver.utils.scan import Scanner
+        return Scanner(self.__r,"HSCAN",key=key,match=match,count=count,prefetch=prefetch)
+
+
+    def sscan_iter(self,key:str,match:str=None,count:int=1000,prefetch:bool=True)->"Scanner":
+        """Iterates over the members of the set stored at key with SSCAN.
+
+        Returns:
+            Scanner: iterable of members (str)
+        """
+        from driver.utils.scan import Scanner
+        return Scanner(self.__r,"SSCAN",key=key,match=match,count=count,prefetch=prefetch)
+
+
+    def zscan_iter(self,key:str,match:str=None,count:int=1000,prefetch:bool=True)->"Scanner":
+        """Iterates over the members of the sorted set stored at key with ZSCAN.
+
+        Returns:
+            Scanner: iterable of (member,score) tuples
+        """
+        from driver.utils.scan import Scanner
+        return Scanner(self.__r,"ZSCAN",key=key,match=match,count=count,prefetch=prefetch)
+
+
+    def enable_near_cache(self,max_entries:int=10000,max_bytes:int=67108864,policy:str="lru",
+    ttl:float=None,prefixes:list=None)->"NearCache":
+        """Keeps the values read with get and mget in an in-process cache.
+        The cache stays coherent with the server using CLIENT TRACKING, so
+        writes from other processes evict the local copy. See NearCache.
+
+        Args:
+            max_entries (int, optional): maximum number of cached keys. Defaults to 10000.
+            max_bytes (int, optional): maximum size of keys and values. Defaults to 64 MB.
+            policy (str, optional): eviction policy, "lru" or "lfu". Defaults to "lru".
+            ttl (float, optional): maximum seconds an entry is kept. Defaults to None.
+            prefixes (list, optional): only cache keys with these prefixes (BCAST mode). Defaults to None.
+
+        Returns:
+            NearCache: the cache, with its hit/miss/eviction counters
+        """
+        if self.__cache is not None:
+            return self.__cache
+        from driver.utils.cache import NearCache
+        cache=NearCache(max_entries=max_entries,max_bytes=max_bytes,policy=policy,ttl=ttl,prefixes=prefixes)
+        cache.attach(self.__r)
+        self.__cache=cache
+        return cache
+
+
+    def enable_resilience(self,resilience:"Resilience"=None,**options)->"Resilience":
+        """Installs a Resilience layer on the connection of the helper :
+        idempotent commands are retried with jittered backoff, a circuit
+        breaker fails fast while the server is down, reads can be hedged 
+        to a replica, and failed operations are counted by type instead
+        of printed (raised as DriverError with raise_errors=True).
+
+        Example:
+            resilience=driver.commands.enable_resilience(retries=3,raise_errors=True)
+            resilience.stats()["breakers"]
+
+        Args:
+            resilience (Resilience, optional): layer to install. Defaults to Resilience(**options).
+
+        Returns:
+            Resilience: the installed layer
+        """
+        if resilience is None:
+            from driver.utils.resilience import Resilience
+            resilience=Resilience(**options)
+        resilience.install(self.__r)
+        self.__resilience=resilience
+        return resilience
+
+
+    def disable_resilience(self)->None:
+        """Removes the Resilience layer : errors are printed again
+        """
+        if self.__resilience is None:
+            return
+        self.__resilience.uninstall(self.__r)
+        self.__resilience=None
+
+
+    @property
+    def resilience(self)->"Resilience":
+        return self.__resilience
+
+
+    def disable_near_cache(self)->None:
+        """Stops and drops the near cache if it was enabled
+        """
+        if self.__cache is None:
+            return
+        self.__cache.detach()
+        self.__cache=None
+
+
+    def __invalidate(self,*keys)->None:
+        if self.__cache is not None:
+            self.__cache.invalidate(keys)
@@ -0,0 +1,424 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import namedtuple
+from redis import Redis
+from driver.utils.scripts import Scripts
+
+
+LOCK_ACQUIRE="""
+if redis.call("SET",KEYS[1],ARGV[1],"NX","PX",ARGV[2]) then
+    return redis.call("INCR",KEYS[2])
+end
+return false
+"""
+
+LOCK_EXTEND="""
+if redis.call("GET",KEYS[1])==ARGV[1] then
+    return redis.call("PEXPIRE",KEYS[1],ARGV[2])
+end
+return 0
+"""
+
+SLIDING_WINDOW="""
+local now=tonumber(ARGV[1])
+local window=tonumber(ARGV[2])
+local limit=tonumber(ARGV[3])
+local cost=tonumber(ARGV[4])
+redis.call("ZREMRANGEBYSCORE",KEYS[1],"-inf",now-window)
+local count=redis.call("ZCARD",KEYS[1])
+if count+cost>limit then
+    local oldest=redis.call("ZRANGE",KEYS[1],0,0,"WITHSCORES")
+    local retry=window
+    if oldest[2] then
+        retry=tonumber(oldest[2])+window-now
+    end
+    return {0,limit-count,retry}
+end
+for index=1,cost do
+    redis.call("ZADD",KEYS[1],now,ARGV[5]..":"..index)
+end
+redis.call("PEXPIRE",KEYS[1],window)
+return {1,limit-count-cost,0}
+"""
+
+TOKEN_BUCKET="""
+local now=tonumber(ARGV[1])
+local rate=tonumber(ARGV[2])
+local capacity=tonumber(ARGV[3])
+local cost=tonumber(ARGV[4])
+local state=redis.call("HMGET",KEYS[1],"tokens","ts")
+local tokens=tonumber(state[1]) or capacity
+local ts=tonumber(state[2]) or now
+tokens=math.min(capacity,tokens+math.max(now-ts,0)*rate/1000)
+local allowed=0
+local retry=0
+if tokens>=cost then
+    tokens=tokens-cost
+    allowed=1
+else
+    retry=math.ceil((cost-tokens)*1000/rate)
+end
+redis.call("HSET",KEYS[1],"tokens",tostring(tokens),"ts",now)
+redis.call("PEXPIRE",KEYS[1],math.ceil(capacity*1000/rate))
+return {allowed,math.floor(tokens),retry}
+"""
+
+RateResult=namedtuple("RateResult",["allowed","remaining","retry_after"])
+
+
+class Lock:
+    """Distributed lock with fencing tokens. acquire sets the lock with
+    SET NX PX and increments the fence counter of the lock in the same
+    script : the returned token grows with every acquisition, so a
+    resource can reject the writes of a holder whose lock expired
+    (token lower than the last one it saw). release and extend only
+    act if the lock still holds the random value of this holder.
+
+    Example:
+        with driver.coordination.lock("reports",ttl=30) as token:
+            storage.write(report,fence=token)
+    """
+
+    def __init__(self,r:Redis,scripts:Scripts,name:str,ttl:float=10.0,blocking:bool=True,
+    timeout:float=None,retry_interval:float=0.05,prefix:str="lock") -> None:
+        if not isinstance(name,str):
+            raise ValueError("Redis lock : name must be a string")
+        if ttl<=0:
+            raise ValueError("Redis lock : ttl must be positive")
+        self.__r=r
+        self.__scripts=scripts
+        self.name=name
+        # hash tag on the name : the acquire script uses both keys, they must share a cluster slot
+        self.key=f"{prefix}:{{{name}}}"
+        self.fence_key=f"{self.key}:fence"
+        self.ttl=ttl
+        self.blocking=blocking
+        self.timeout=timeout
+        self.retry_interval=retry_interval
+        self.token=None
+        self.__value=None
+
+
+    def __enter__(self)->int:
+        token=self.acquire()
+        if token is None:
+            raise TimeoutError(f"Redis lock : {self.name} could not be acquired")
+        return token
+
+
+    def __exit__(self,exc_type,exc,traceback)->None:
+        self.release()
+
+
+    def acquire(self,blocking:bool=None,timeout:float=None)->int:
+        """Takes the lock, waiting up to (timeout) seconds when blocking
+
+        Returns:
+            int: fencing token
+            None: if the lock is held by another owner
+        """
+        blocking=self.blocking if blocking is None else blocking
+        timeout=self.timeout if timeout is None else timeout
+        deadline=None if timeout is None else time.monotonic()+timeout
+        value=uuid.uuid4().hex
+        while True:
+            token=self.__scripts.call("lock_acquire",[self.key,self.fence_key],[value,int(self.ttl*1000)])
+            if token:
+                self.__value=value
+                self.token=int(token)
+                return self.token
+            if not blocking or (deadline is not None and time.monotonic()>=deadline):
+                return None
+            time.sleep(self.retry_interval if deadline is None else max(min(self.retry_interval,deadline-time.monotonic()),0))
+
+
+    def release(self)->bool:
+        """Releases the lock if it is still held by this owner
+
+        Returns:
+            bool: False if the lock had expired or was taken by another owner
+        """
+        if self.__value is None:
+            return False
+        value,self.__value,self.token=self.__value,None,None
+        return self.__scripts.call("compare_and_delete",[self.key],[value])==1
+
+
+    def extend(self,ttl:float=None)->bool:
+        """Sets the time to live of a held lock to (ttl) seconds
+
+        Returns:
+            bool: False if the lock is no longer held by this owner
+        """
+        if self.__value is None:
+            return False
+        return self.__scripts.call("lock_extend",[self.key],[self.__value,int((ttl or self.ttl)*1000)])==1
+
+
+    def locked(self)->bool:
+        """Returns True if any owner holds the lock
+        """
+        return bool(self.__r.exists(self.key))
+
+
+class ReentrantLock:
+    """Lock that the thread holding it can acquire again : only the
+    first acquire and the last release reach the server.
+    """
+
+    def __init__(self,lock:Lock) -> None:
+        self.lock=lock
+        self.__owner=None
+        self.__depth=0
+        self.__guard=threading.Lock()
+
+
+    def __enter__(self)->int:
+        token=self.acquire()
+        if token is None:
+            raise TimeoutError(f"Redis lock : {self.lock.name} could not be acquired")
+        return token
+
+
+    def __exit__(self,exc_type,exc,traceback)->None:
+        self.release()
+
+
+    @property
+    def token(self)->int:
+        return self.lock.token
+
+
+    def acquire(self,blocking:bool=None,timeout:float=None)->int:
+        me=threading.get_ident()
+        with self.__guard:
+            if self.__owner==me:
+                self.__depth+=1
+                return self.lock.token
+        token=self.lock.acquire(blocking,timeout)
+        if token is not None:
+            with self.__guard:
+                self.__owner=me
+                self.__depth=1
+        return token
+
+
+    def release(self)->bool:
+        with self.__guard:
+            if self.__owner!=threading.get_ident():
+                return False
+            self.__depth-=1
+            if self.__depth:
+                return True
+            self.__owner=None
+        return self.lock.release()
+
+
+    def extend(self,ttl:float=None)->bool:
+        return self.lock.extend(ttl)
+
+
+class _Limiter:
+    """Base of the rate limiters : one script call per check, batches
+    of checks in one pipeline, and a local pre-check that denies without
+    a round trip while a key is known to be over its limit. At most
+    (max_blocked) keys are remembered : past it the expired ones are
+    swept, then the oldest dropped.
+    """
+
+    script=""
+
+    def __init__(self,r:Redis,scripts:Scripts,prefix:str,local_precheck:bool=True,max_blocked:int=10000) -> None:
+        if not isinstance(max_blocked,int) or max_blocked<1:
+            raise ValueError("Redis rate limiter : max_blocked must be a positive int")
+        self.__r=r
+        self.__scripts=scripts
+        self.prefix=prefix
+        self.local_precheck=local_precheck
+        self.max_blocked=max_blocked
+        self.checks=0
+        self.local_denials=0
+        self.__blocked={}
+        self.__lock=threading.Lock()
+
+
+    def _args(self,now:int,cost:int)->list:
+        raise NotImplementedError
+
+
+    def hit(self,key:str,cost:int=1)->RateResult:
+        """Counts (cost) requests of key if the limit allows them
+
+        Returns:
+            RateResult: (allowed, remaining, retry_after in seconds)
+        """
+        denied=self.__precheck(key,cost)
+        if denied is not None:
+            return denied
+        now=int(time.time()*1000)
+        reply=self.__scripts.call(self.script,[f"{self.prefix}:{key}"],self._args(now,cost))
+        return self.__result(key,cost,reply)
+
+
+    def hit_many(self,keys:list,cost:int=1)->list:
+        """Checks several keys in one pipeline
+
+        Returns:
+            list: RateResult of each key, in input order
+        """
+        results=[self.__precheck(key,cost) for key in keys]
+        pending=[index for index,result in enumerate(results) if result is None]
+        if pending:
+            now=int(time.time()*1000)
+            pipe=self.__r.pipeline(transaction=False)
+            sent=set()
+            for index in pending:
+                self.__scripts.queue(pipe,self.script,[f"{self.prefix}:{keys[index]}"],self._args(now,cost),sent=sent)
+            for index,reply in zip(pending,pipe.execute()):
+                results[index]=self.__result(keys[index],cost,reply)
+        return results
+
+
+    def reset(self,key:str)->None:
+        with self.__lock:
+            self.__blocked.pop(key,None)
+        self.__r.delete(f"{self.prefix}:{key}")
+
+
+    def __precheck(self,key:str,cost:int)->RateResult:
+        """Denies locally a request at least as costly as one the server
+        denied, until the retry_after of that denial
+        """
+        if not self.local_precheck:
+            return None
+        with self.__lock:
+            blocked=self.__blocked.get(key)
+            if blocked is None or cost<blocked[1]:
+                return None
+            left=blocked[0]-time.monotonic()
+            if left<=0:
+                del self.__blocked[key]
+                return None
+            self.local_denials+=1
+        return RateResult(False,0,left)
+
+
+    def __result(self,key:str,cost:int,reply:list)->RateResult:
+        allowed,remaining,retry=(int(value) for value in reply)
+        result=RateResult(bool(allowed),max(remaining,0),retry/1000)
+        with self.__lock:
+            self.checks+=1
+            if not result.allowed and self.local_precheck and retry>0:
+                self.__blocked.pop(key,None)
+                self.__blocked[key]=(time.monotonic()+result.retry_after,cost)
+                if len(self.__blocked)>self.max_blocked:
+                    self.__sweep()
+        return result
+
+
+    def __sweep(self)->None:
+        """Drops the expired entries, then the oldest ones down to 3/4 of
+        max_blocked so the next sweeps are not run at every denial
+        """
+        now=time.monotonic()
+        blocked={key:entry for key,entry in self.__blocked.items() if entry[0]>now}
+        excess=len(blocked)-self.max_blocked*3//4
+        if excess>0:
+            for key in list(itertools.islice(blocked,excess)):
+                del blocked[key]
+        self.__blocked=blocked
+
+
+    def stats(self)->dict:
+        return {"checks":self.checks,"local_denials":self.local_denials,"blocked_keys":len(self.__blocked)}
+
+
+class SlidingWindowLimiter(_Limiter):
+    """At most (limit) requests per key in any (window) seconds. Each
+    request is kept in a sorted set scored by its time, old ones are
+    trimmed by the script that counts and adds the new ones.
+    """
+
+    script="sliding_window"
+
+    def __init__(self,r:Redis,scripts:Scripts,limit:int,window:float,prefix:str="rate",local_precheck:bool=True,
+    max_blocked:int=10000) -> None:
+        if not isinstance(limit,int) or limit<1:
+            raise ValueError("Redis rate limiter : limit must be a positive int")
+        super().__init__(r,scripts,prefix,local_precheck,max_blocked)
+        self.limit=limit
+        self.window=window
+
+
+    def _args(self,now:int,cost:int)->list:
+        return [now,int(self.window*1000),self.limit,cost,uuid.uuid4().hex]
+
+
+class TokenBucketLimiter(_Limiter):
+    """Bucket of (capacity) tokens per key refilled with (rate) tokens
+    per second; a request takes (cost) tokens. Allows bursts up to
+    capacity, and keeps two fields per key whatever the traffic.
+    """
+
+    script="token_bucket"
+
+    def __init__(self,r:Redis,scripts:Scripts,rate:float,capacity:int,prefix:str="bucket",local_precheck:bool=True,
+    max_blocked:int=10000) -> None:
+        if rate<=0 or capacity<1:
+            raise ValueError("Redis rate limiter : rate and capacity must be positive")
+        super().__init__(r,scripts,prefix,local_precheck,max_blocked)
+        self.rate=rate
+        self.capacity=capacity
+
+
+    def _args(self,now:int,cost:int)->list:
+        return [now,self.rate,self.capacity,cost]
+
+
+class Coordination:
+    """Factory of locks and rate limiters bound to the connection of the Driver.
+    Their scripts are registered in the Scripts registry of the commands helper.
+    """
+
+    library={
+        "lock_acquire":LOCK_ACQUIRE,
+        "lock_extend":LOCK_EXTEND,
+        "sliding_window":SLIDING_WINDOW,
+        "token_bucket":TOKEN_BUCKET,
+    }
+
+    def __init__(self,r:Redis,scripts:Scripts) -> None:
+        self.__r=r
+        self.__scripts=scripts
+        for name,source in self.library.items():
+            scripts.register(name,source)
+
+
+    def close(self):
+        self.__r=None
+
+
+    def lock(self,name:str,**kargs)->Lock:
+        """Returns a Lock named (name). See Lock for the options.
+        """
+        return Lock(self.__r,self.__scripts,name,**kargs)
+
+
+    def reentrant_lock(self,name:str,**kargs)->ReentrantLock:
+        """Returns a ReentrantLock named (name). See Lock for the options.
+        """
+        return ReentrantLock(self.lock(name,**kargs))
+
+
+    def sliding_window(self,limit:int,window:float,**kargs)->SlidingWindowLimiter:
+        """Returns a SlidingWindowLimiter of (limit) requests per (window) seconds
+        """
+        return SlidingWindowLimiter(self.__r,self.__scripts,limit,window,**kargs)
+
+
+    def token_bucket(self,rate:float,capacity:int,**kargs)->TokenBucketLimiter:
+        """Returns a TokenBucketLimiter of (rate) tokens per second and (capacity) tokens
+        """
+        return TokenBucketLimiter(self.__r,self.__scripts,rate,capacity,**kargs)
@@ -0,0 +1,125 @@
+import importlib
+import threading
+from redis import Redis
+
+
+HELPERS={
+    "commands":("driver.utils.commands","Commands"),
+    "client":("driver.utils.client","Client"),
+    "users":("driver.utils.users","Users"),
+    "test":("driver.utils.test","Test"),
+    "scripts":None,
+    "streams":("driver.utils.streams","Streams"),
+    "coordination":("driver.utils.coordination","Coordination"),
+    "pubsub":("driver.utils.pubsub","PubSub"),
+    "bulk":("driver.utils.bulk","Bulk"),
+    "structures":("driver.utils.structures","Structures"),
+}
+"""name -> (module,class) of the helpers built by Helpers. scripts is the
+Scripts registry of the commands helper"""
+
+QUITTING=("commands","client","users","test")
+"""helpers whose close() sends QUIT unless called with quit=False"""
+
+
+class Helpers:
+    """Helpers of one redis client, imported and built the first time
+    they are used, so connect() and the import of the driver only pay
+    for the helpers a process actually calls.
+
+    Args:
+        r (Redis): client shared by the helpers
+        names (tuple): names of HELPERS available
+        on_build (callable, optional): on_build(name,helper) called once
+        for every helper built. Defaults to None.
+    """
+
+    def __init__(self,r:Redis,names:tuple,on_build=None) -> None:
+        self.r=r
+        self.names=names
+        self.built={}
+        self.__on_build=on_build
+        self.__lock=threading.RLock()
+
+
+    def get(self,name:str):
+        helper=self.built.get(name)
+        if helper is not None:
+            return helper
+        if name not in self.names:
+            raise AttributeError(name)
+        with self.__lock:
+            helper=self.built.get(name)
+            if helper is None:
+                helper=self.__build(name)
+                if self.__on_build is not None:
+                    self.__on_build(name,helper)
+                self.built[name]=helper
+        return helper
+
+
+    def __build(self,name:str):
+        if name=="scripts":
+            return self.get("commands").scripts
+        module,attribute=HELPERS[name]
+        factory=getattr(importlib.import_module(module),attribute)
+        if name=="coordination":
+            return factory(self.r,self.get("scripts"))
+        return factory(self.r)
+
+
+    def close(self)->None:
+        """Closes the helpers built so far. The connection is left to the
+        owner of the client : no helper sends QUIT.
+        """
+        with self.__lock:
+            built,self.built=self.built,{}
+            self.r=None
+        for name,helper in built.items():
+            if name=="scripts":
+                continue
+            if name in QUITTING:
+                helper.close(quit=False)
+            else:
+                helper.close()
+
+
+class Handle:
+    """Named set of helpers (commands, client, users, test, scripts, streams,
+    coordination, bulk and structures) bound to one logical database. Handles are created with Driver.handle()
+    and share the connection pool of the Driver. Helpers are built on first use.
+    """
+
+    def __init__(self,name:str,db:int,r:Redis,on_build=None) -> None:
+        self.name=name
+        self.db=db
+        self.redis=r
+        self.__helpers=Helpers(r,tuple(name for name in HELPERS if name!="pubsub"),on_build)
+
+
+    def __getattr__(self,name:str):
+        if name.startswith("_") or name not in HELPERS:
+            raise AttributeError(name)
+        if self.redis is None:
+            return None
+        return self.__helpers.get(name)
+
+
+    @property
+    def built(self)->dict:
+        """Helpers built so far"""
+        return dict(self.__helpers.built)
+
+
+    def batch(self,max_commands:int=100,max_bytes:int=1048576):
+        """Shortcut for Commands.batch on this handle
+        """
+        return self.commands.batch(max_commands=max_commands,max_bytes=max_bytes)
+
+
+    def close(self)->None:
+        """Releases the helpers of the handle. The connections stay in
+        the pool of the Driver.
+        """
+        self.redis=None
+        self.__helpers=Helpers(None,())
@@ -0,0 +1,340 @@
+import functools
+import hashlib
+import inspect
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from redis import Redis
+from redis.exceptions import RedisError
+from driver.utils.codecs import Serializer
+from driver.utils.metrics import Histogram
+from driver.utils.scripts import Scripts
+
+
+# header of a cached entry : recompute time and logical expiry, in seconds
+_HEADER=struct.Struct("!dd")
+
+
+class _Flight:
+    """Computation of a key in progress in this process
+    """
+
+    def __init__(self) -> None:
+        self.done=threading.Event()
+        self.value=None
+        self.error=None
+
+
+class Memoizer:
+    """Cache-aside in front of slow functions : results are stored under
+    a key built from the function and its arguments, serialized with a
+    Serializer and expired after (ttl) seconds, randomized by +/- (jitter)
+    so keys written together do not expire together.
+
+    Stampede protection :
+        - single flight : concurrent misses of a key in the process wait
+          for one computation
+        - distributed lock : across processes only the holder of
+          SET lock NX PX computes, the others wait for its result up to
+          (lock_timeout) seconds and compute themselves after that
+        - early recomputation (XFetch) : a hit is recomputed before it
+          expires with a probability that grows as the expiry approaches
+          and with the time the last computation took (scaled by beta).
+          While it is recomputed the other callers get the current value.
+
+    Example:
+        @driver.commands.memoize(ttl=60)
+        def profile(user_id):
+            return slow_query(user_id)
+
+        profile(1)
+        profile.invalidate(1)
+        profile.memoizer.stats()
+
+    Args:
+        r (Redis): redis client
+        scripts (Scripts): registry used to release the locks
+        serializer (Serializer, optional): Defaults to Serializer().
+        prefix (str, optional): prefix of the keys. Defaults to "memo".
+        ttl (float, optional): seconds a result is kept. Defaults to 300.
+        jitter (float, optional): fraction of ttl added or removed at random. Defaults to 0.1.
+        beta (float, optional): eagerness of early recomputation, 0 disables it. Defaults to 1.0.
+        lock_timeout (float, optional): seconds a computation holds the lock. Defaults to 10.
+    """
+
+    def __init__(self,r:Redis,scripts:Scripts,serializer:Serializer=None,prefix:str="memo",ttl:float=300,
+    jitter:float=0.1,beta:float=1.0,lock_timeout:float=10.0) -> None:
+        if not isinstance(ttl,(int,float)) or ttl<=0:
+            raise ValueError("Redis memoize : ttl must be a positive number")
+        if not 0<=jitter<1:
+            raise ValueError("Redis memoize : jitter must be between 0 and 1")
+        self.__r=r
+        self.__scripts=scripts
+        self.serializer=serializer or Serializer()
+        self.prefix=prefix
+        self.ttl=ttl
+        self.jitter=jitter
+        self.beta=beta
+        self.lock_timeout=lock_timeout
+        self.recompute_time=Histogram()
+        self.counters={"hits":0,"misses":0,"early_recomputes":0,"stale_served":0,"coalesced":0,
+            "lock_waits":0,"lock_timeouts":0,"errors":0}
+        self.__flights={}
+        self.__lock=threading.Lock()
+
+
+    def __call__(self,function=None,key=None,ttl:float=None):
+        """Decorates (function). The wrapper has invalidate(*args,**kargs)
+        and key(*args,**kargs) methods and a memoizer attribute.
+
+        Args:
+            function (callable): function to memoize
+            key (callable, optional): key(*args,**kargs) -> str, replaces the built key. Defaults to None.
+            ttl (float, optional): ttl of this function. Defaults to the ttl of the memoizer.
+        """
+        if function is None:
+            return lambda function:self(function,key=key,ttl=ttl)
+        signature=inspect.signature(function)
+        name=f"{function.__module__}.{function.__qualname__}"
+
+        def build(*args,**kargs)->str:
+            if key is not None:
+                return f"{self.prefix}:{name}:{key(*args,**kargs)}"
+            return self.key(name,signature,args,kargs)
+
+        @functools.wraps(function)
+        def wrapper(*args,**kargs):
+            return self.get_or_compute(build(*args,**kargs),lambda:function(*args,**kargs),ttl)
+
+        wrapper.key=build
+        wrapper.invalidate=lambda *args,**kargs:self.invalidate(build(*args,**kargs))
+        wrapper.memoizer=self
+        return wrapper
+
+
+    def key(self,name:str,signature:inspect.Signature,args:tuple,kargs:dict)->str:
+        """Builds the key of a call : arguments are bound to the signature
+        so f(1) and f(x=1) share the key, then hashed.
+        """
+        try:
+            bound=signature.bind(*args,**kargs)
+            bound.apply_defaults()
+            arguments=bound.arguments
+        except TypeError:
+            arguments={"args":args,"kargs":kargs}
+        encoded=json.dumps(arguments,sort_keys=True,default=repr,separators=(",",":"))
+        return f"{self.prefix}:{name}:{hashlib.sha1(encoded.encode('utf-8')).hexdigest()}"
+
+
+    def get_or_compute(self,key:str,compute,ttl:float=None):
+        """Returns the cached value of key, or the result of compute()
+        stored under key for (ttl) seconds.
+
+        Args:
+            key (str): key
+            compute (callable): compute() -> value, called on a miss
+            ttl (float, optional): Defaults to the ttl of the memoizer.
+
+        Returns:
+            any: cached or computed value
+        """
+        entry=self.__read(key)
+        if entry is not None:
+            delta,expiry,value=entry
+            if not self.__expiring(delta,expiry):
+                self.__count("hits")
+                return value
+            self.__count("early_recomputes")
+            return self.__refresh(key,compute,ttl,value)
+        self.__count("misses")
+        return self.__single_flight(key,compute,ttl)
+
+
+    def invalidate(self,key:str)->bool:
+        """Deletes a cached value
+
+        Returns:
+            bool: True if the key existed
+        """
+        try:
+            return bool(self.__r.delete(key))
+        except RedisError as err:
+            self.__error("invalidate",err)
+            return False
+
+
+    def __expiring(self,delta:float,expiry:float)->bool:
+        if not self.beta:
+            return False
+        return time.time()-delta*self.beta*math.log(1.0-random.random())>=expiry
+
+
+    def __refresh(self,key:str,compute,ttl:float,stale):
+        """Early recomputation : only the caller that gets the lock recomputes,
+        the others keep the current value.
+        """
+        with self.__lock:
+            if key in self.__flights:
+                self.counters["stale_served"]+=1
+                return stale
+        token=self.__acquire(key)
+        if token is None:
+            self.__count("stale_served")
+            return stale
+        return self.__single_flight(key,compute,ttl,token)
+
+
+    def __single_flight(self,key:str,compute,ttl:float,token:str=None):
+        with self.__lock:
+            flight=self.__flights.get(key)
+            leader=flight is None
+            if leader:
+                flight=self.__flights[key]=_Flight()
+            else:
+                self.counters["coalesced"]+=1
+        if not leader:
+            if token:
+                self.__release(key,token)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value=self.__compute(key,compute,ttl,token)
+            return flight.value
+        except BaseException as err:
+            flight.error=err
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+
+    def __compute(self,key:str,compute,ttl:float,token:str):
+        if token is None:
+            token=self.__acquire(key)
+            if token is None:
+                entry=self.__wait(key)
+                if entry is not None:
+                    return entry[2]
+        try:
+            start=time.perf_counter()
+            value=compute()
+            delta=time.perf_counter()-start
+            with self.__lock:
+                self.recompute_time.record(delta*1000000)
+            self.__write(key,value,delta,ttl)
+            return value
+        finally:
+            if token:
+                self.__release(key,token)
+
+
+    def __wait(self,key:str):
+        """Waits for the holder of the lock to store the value
+
+        Returns:
+            tuple: the entry, None after lock_timeout seconds
+        """
+        self.__count("lock_waits")
+        deadline=time.monotonic()+self.lock_timeout
+        delay=0.005
+        while time.monotonic()<deadline:
+            time.sleep(delay)
+            delay=min(delay*2,0.1)
+            entry=self.__read(key)
+            if entry is not None:
+                return entry
+            try:
+                if not self.__r.exists(f"{key}:lock"):
+                    return self.__read(key)
+            except RedisError as err:
+                self.__error("wait",err)
+                return None
+        self.__count("lock_timeouts")
+        return None
+
+
+    def __read(self,key:str):
+        try:
+            raw=self.__r.get(key)
+        except RedisError as err:
+            self.__error("get",err)
+            return None
+        if raw is None or len(raw)<_HEADER.size:
+            return None
+        delta,expiry=_HEADER.unpack_from(raw)
+        try:
+            return delta,expiry,self.serializer.loads(raw[_HEADER.size:])
+        except Exception as err:
+            self.__error("decode",err)
+            return None
+
+
+    def __write(self,key:str,value,delta:float,ttl:float)->None:
+        ttl=(ttl or self.ttl)*random.uniform(1-self.jitter,1+self.jitter)
+        try:
+            data=_HEADER.pack(delta,time.time()+ttl)+self.serializer.dumps(value)
+            self.__r.set(key,data,px=max(int(ttl*1000),1))
+        except (RedisError,TypeError,ValueError) as err:
+            self.__error("set",err)
+
+
+    def __acquire(self,key:str)->str:
+        """Takes the lock of key. Without a server the caller computes unlocked.
+
+        Returns:
+            str: token of the lock, "" if the server failed, None if it is held
+        """
+        token=uuid.uuid4().hex
+        try:
+            if self.__r.set(f"{key}:lock",token,nx=True,px=max(int(self.lock_timeout*1000),1)):
+                return token
+            return None
+        except RedisError as err:
+            self.__error("lock",err)
+            return ""
+
+
+    def __release(self,key:str,token:str)->None:
+        try:
+            self.__scripts.call("compare_and_delete",[f"{key}:lock"],[token])
+        except RedisError as err:
+            self.__error("unlock",err)
+
+
+    def __count(self,name:str)->None:
+        with self.__lock:
+            self.counters[name]+=1
+
+
+    def __error(self,operation:str,err:Exception)->None:
+        self.__count("errors")
+        print(f"Redis memoize {operation} operation failed : {err}")
+
+
+    def stats(self)->dict:
+        """Returns the counters (hits, misses, early_recomputes,
+        stale_served, coalesced, lock_waits, lock_timeouts, errors), the
+        hit ratio and the recompute time percentiles in seconds
+        """
+        with self.__lock:
+            counters=dict(self.counters)
+            histogram=self.recompute_time
+            recompute={
+                "recomputes":histogram.count,
+                "recompute_seconds":histogram.total/1000000,
+                "recompute_p50":histogram.percentile(50)/1000000,
+                "recompute_p99":histogram.percentile(99)/1000000,
+            }
+        lookups=counters["hits"]+counters["misses"]+counters["early_recomputes"]
+        return {
+            **counters,
+            "hit_ratio":(counters["hits"]+counters["stale_served"])/lookups if lookups else 0.0,
+            **recompute,
+        }
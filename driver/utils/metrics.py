@@ -0,0 +1,343 @@
+import functools
+import inspect
+import threading
+import time
+from redis import Redis
+
+
+class Histogram:
+    """Log-linear histogram in the style of HdrHistogram. Values are
+    integers (microseconds for latencies) stored in sparse buckets with
+    a relative error below 1/16 (about 6 %), so recording is O(1) and the
+    memory used does not depend on the number of samples.
+    """
+
+    sub_bits=5
+    sub_count=1<<sub_bits
+    half_count=sub_count>>1
+
+    def __init__(self) -> None:
+        self.buckets={}
+        self.count=0
+        self.total=0
+        self.min=None
+        self.max=None
+
+
+    @classmethod
+    def index(cls,value:int)->int:
+        if value<cls.sub_count:
+            return value
+        shift=value.bit_length()-cls.sub_bits
+        return cls.sub_count+(shift-1)*cls.half_count+((value>>shift)-cls.half_count)
+
+
+    @classmethod
+    def lower_bound(cls,index:int)->int:
+        if index<cls.sub_count:
+            return index
+        shift=(index-cls.sub_count)//cls.half_count+1
+        return ((index-cls.sub_count)%cls.half_count+cls.half_count)<<shift
+
+
+    def record(self,value:int)->None:
+        value=max(int(value),0)
+        index=self.index(value)
+        self.buckets[index]=self.buckets.get(index,0)+1
+        self.count+=1
+        self.total+=value
+        if self.min is None or value<self.min:
+            self.min=value
+        if self.max is None or value>self.max:
+            self.max=value
+
+
+    def percentile(self,percent:float)->int:
+        """Returns the lower bound of the bucket holding the (percent) percentile
+
+        Args:
+            percent (float): percentile between 0 and 100
+
+        Returns:
+            int: value, 0 if the histogram is empty
+        """
+        if not self.count:
+            return 0
+        rank=max(1,round(percent/100*self.count))
+        seen=0
+        for index in sorted(self.buckets):
+            seen+=self.buckets[index]
+            if seen>=rank:
+                return min(max(self.lower_bound(index),self.min),self.max)
+        return self.max
+
+
+    def mean(self)->float:
+        return self.total/self.count if self.count else 0.0
+
+
+class CallStats:
+    """Latency histogram (microseconds), error count and payload sizes of one call
+    """
+
+    def __init__(self) -> None:
+        self.latency=Histogram()
+        self.errors=0
+        self.bytes_out=0
+        self.bytes_in=0
+
+
+    def snapshot(self)->dict:
+        latency=self.latency
+        return {
+            "calls":latency.count,
+            "errors":self.errors,
+            "total_us":latency.total,
+            "bytes_out":self.bytes_out,
+            "bytes_in":self.bytes_in,
+            "mean_us":round(latency.mean(),1),
+            "min_us":latency.min or 0,
+            "p50_us":latency.percentile(50),
+            "p90_us":latency.percentile(90),
+            "p99_us":latency.percentile(99),
+            "p999_us":latency.percentile(99.9),
+            "max_us":latency.max or 0,
+        }
+
+
+class Metrics:
+    """Records latency, payload size and errors of every call made
+    through the driver helpers (commands, client, users, test) and of
+    every command sent to the server, plus the wait time of the pool.
+
+    Call names are "<helper>.<method>" for helper calls, like
+    "commands.get", and "server.<COMMAND>" for server commands.
+    Connection and server errors are counted on the server commands,
+    since the helpers catch them and return None or False.
+
+    Hooks registered with add_hook are called around every call :
+        - pre(name,args,kargs) : its return value is passed to post as context
+        - post(name,seconds,result,error,context)
+
+    Example:
+        metrics=driver.enable_metrics()
+        ...
+        metrics.snapshot()["calls"]["commands.get"]["p99_us"]
+        print(metrics.prometheus())
+    """
+
+    def __init__(self) -> None:
+        self.calls={}
+        self.__lock=threading.Lock()
+        self.__hooks=[]
+        self.__pools=[]
+
+
+    def add_hook(self,pre=None,post=None)->None:
+        """Registers callbacks run before and after every call.
+
+        Args:
+            pre (callable, optional): pre(name,args,kargs) -> context. Defaults to None.
+            post (callable, optional): post(name,seconds,result,error,context). Defaults to None.
+        """
+        if pre is None and post is None:
+            raise ValueError("Redis metrics : a pre or post hook is required")
+        self.__hooks.append((pre,post))
+
+
+    def record(self,name:str,seconds:float,error:bool=False,bytes_out:int=0,bytes_in:int=0)->None:
+        """Adds one sample to the stats of (name)
+        """
+        with self.__lock:
+            stats=self.calls.get(name)
+            if stats is None:
+                stats=self.calls[name]=CallStats()
+            stats.latency.record(seconds*1000000)
+            stats.errors+=error
+            stats.bytes_out+=bytes_out
+            stats.bytes_in+=bytes_in
+
+
+    def timed(self,name:str,function):
+        """Returns function wrapped so that each call is recorded as (name)
+        """
+        @functools.wraps(function)
+        def wrapper(*args,**kargs):
+            hooks=self.__hooks
+            contexts=[pre(name,args,kargs) if pre is not None else None for pre,_ in hooks] if hooks else ()
+            start=time.perf_counter()
+            result=None
+            error=None
+            try:
+                result=function(*args,**kargs)
+                return result
+            except BaseException as err:
+                error=err
+                raise
+            finally:
+                seconds=time.perf_counter()-start
+                self.record(name,seconds,error is not None,payload_size(args)+payload_size(list(kargs.values())),payload_size(result))
+                for (_,post),context in zip(hooks,contexts):
+                    if post is not None:
+                        post(name,seconds,result,error,context)
+        wrapper.__wrapped_by_metrics__=True
+        return wrapper
+
+
+    def instrument(self,helper,prefix:str)->None:
+        """Wraps every public method of a helper instance
+
+        Args:
+            helper (object): Commands, Client, Users or Test instance
+            prefix (str): name of the helper used in the call names
+        """
+        for name in dir(type(helper)):
+            if name.startswith("_") or isinstance(getattr(type(helper),name),property):
+                continue
+            method=getattr(helper,name)
+            if not inspect.ismethod(method) or getattr(method,"__wrapped_by_metrics__",False):
+                continue
+            setattr(helper,name,self.timed(f"{prefix}.{name}",method))
+
+
+    def instrument_client(self,r:Redis)->None:
+        """Wraps execute_command and the pipelines of a redis client to
+        record every command sent to the server, including its errors.
+
+        Each pipeline round trip is recorded as "server.PIPELINE" and
+        each command it carried as "server.<COMMAND>", with the latency
+        of the round trip shared evenly between the commands.
+        """
+        if getattr(r.execute_command,"__wrapped_by_metrics__",False):
+            return
+        self.__instrument_pipelines(r)
+        execute_command=r.execute_command
+        @functools.wraps(execute_command)
+        def wrapper(*args,**options):
+            name="server."+str(args[0]).upper() if args else "server.?"
+            start=time.perf_counter()
+            error=False
+            result=None
+            try:
+                result=execute_command(*args,**options)
+                return result
+            except BaseException:
+                error=True
+                raise
+            finally:
+                self.record(name,time.perf_counter()-start,error,payload_size(args[1:]),payload_size(result))
+        wrapper.__wrapped_by_metrics__=True
+        r.execute_command=wrapper
+
+
+    def __instrument_pipelines(self,r:Redis)->None:
+        pipeline=r.pipeline
+        @functools.wraps(pipeline)
+        def wrapper(*args,**kargs):
+            pipe=pipeline(*args,**kargs)
+            pipe.execute=self.__timed_execute(pipe)
+            return pipe
+        r.pipeline=wrapper
+
+
+    def __timed_execute(self,pipe):
+        execute=pipe.execute
+        @functools.wraps(execute)
+        def wrapper(*args,**kargs):
+            stack=[command_args for command_args,_ in pipe.command_stack]
+            start=time.perf_counter()
+            error=False
+            replies=None
+            try:
+                replies=execute(*args,**kargs)
+                return replies
+            except BaseException:
+                error=True
+                raise
+            finally:
+                seconds=time.perf_counter()-start
+                self.record("server.PIPELINE",seconds,error,sum(payload_size(command[1:]) for command in stack),payload_size(replies))
+                if stack:
+                    replies=replies if isinstance(replies,list) and len(replies)==len(stack) else [None]*len(stack)
+                    for command,reply in zip(stack,replies):
+                        failed=error or isinstance(reply,Exception)
+                        self.record("server."+str(command[0]).upper(),seconds/len(stack),failed,payload_size(command[1:]),_flat_size(reply))
+        return wrapper
+
+
+    def attach_pool(self,pool)->None:
+        """Includes the stats of a Pool (driver.utils.pool) in the exports
+        """
+        if pool not in self.__pools:
+            self.__pools.append(pool)
+
+
+    def detach_pool(self,pool)->None:
+        if pool in self.__pools:
+            self.__pools.remove(pool)
+
+
+    def reset(self)->None:
+        with self.__lock:
+            self.calls={}
+
+
+    def snapshot(self)->dict:
+        """Returns every recorded stat as a dict :
+            - calls : {name:{calls,errors,total_us,bytes_out,bytes_in,mean_us,min_us,p50_us,p90_us,p99_us,p999_us,max_us}}
+            - pool : stats of the attached pool (waits, wait_time, in_use, idle...)
+        """
+        with self.__lock:
+            calls={name:stats.snapshot() for name,stats in sorted(self.calls.items())}
+        snapshot={"calls":calls}
+        for pool in self.__pools:
+            for key,value in pool.stats().items():
+                snapshot.setdefault("pool",{})
+                snapshot["pool"][key]=snapshot["pool"].get(key,0)+value
+        return snapshot
+
+
+    def prometheus(self,namespace:str="redis_driver")->str:
+        """Returns the snapshot in the Prometheus text exposition format
+        """
+        snapshot=self.snapshot()
+        lines=[
+            f"# TYPE {namespace}_call_duration_seconds summary",
+        ]
+        for name,stats in snapshot["calls"].items():
+            for quantile,field in (("0.5","p50_us"),("0.9","p90_us"),("0.99","p99_us"),("0.999","p999_us")):
+                lines.append(f'{namespace}_call_duration_seconds{{call="{name}",quantile="{quantile}"}} {stats[field]/1000000}')
+            lines.append(f'{namespace}_call_duration_seconds_sum{{call="{name}"}} {stats["total_us"]/1000000}')
+            lines.append(f'{namespace}_call_duration_seconds_count{{call="{name}"}} {stats["calls"]}')
+        for metric,field in (("call_errors_total","errors"),("call_bytes_out_total","bytes_out"),("call_bytes_in_total","bytes_in")):
+            lines.append(f"# TYPE {namespace}_{metric} counter")
+            for name,stats in snapshot["calls"].items():
+                lines.append(f'{namespace}_{metric}{{call="{name}"}} {stats[field]}')
+        for key,value in snapshot.get("pool",{}).items():
+            kind="counter" if key in ("waits","wait_time","reaped","created") else "gauge"
+            lines.append(f"# TYPE {namespace}_pool_{key} {kind}")
+            lines.append(f"{namespace}_pool_{key} {value}")
+        return "\n".join(lines)+"\n"
+
+
+def payload_size(value)->int:
+    """Returns the number of bytes of str and bytes found in value,
+    looking one level into lists, tuples and dicts.
+    """
+    if value is None:
+        return 0
+    if isinstance(value,(bytes,bytearray,memoryview)):
+        return len(value)
+    if isinstance(value,str):
+        return len(value)
+    if isinstance(value,dict):
+        return sum(payload_size(key)+_flat_size(item) for key,item in value.items())
+    if isinstance(value,(list,tuple)):
+        return sum(_flat_size(item) for item in value)
+    return 0
+
+
+def _flat_size(value)->int:
+    if isinstance(value,(bytes,bytearray,memoryview,str)):
+        return len(value)
+    return 0
@@ -0,0 +1,381 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import deque,namedtuple
+from redis.exceptions import RedisError
+from redis.utils import str_if_bytes
+from driver.utils.acl import _glob
+
+
+MonitorEvent=namedtuple("MonitorEvent",["time","db","client","command","args","keys"])
+
+_LINE=re.compile(r"^(\d+\.\d+) \[(\d+) ([^\]]*)\] (.*)$",re.S)
+_ESCAPES={"n":"\n","r":"\r","t":"\t","a":"\a","b":"\b","\\":"\\",'"':'"'}
+
+# commands whose arguments are not keys
+_KEYLESS={"PING","ECHO","SELECT","AUTH","HELLO","CLIENT","INFO","CONFIG","SCRIPT","FUNCTION","MULTI","EXEC",
+    "DISCARD","UNWATCH","PUBLISH","SUBSCRIBE","UNSUBSCRIBE","PSUBSCRIBE","PUNSUBSCRIBE","DBSIZE",
+    "FLUSHDB","FLUSHALL","SCAN","RANDOMKEY","TIME","COMMAND","SLOWLOG","MEMORY","MONITOR","QUIT","ACL",
+    "CLUSTER","READONLY","READWRITE","WAIT","LASTSAVE","SAVE","BGSAVE","BGREWRITEAOF","ROLE","LATENCY"}
+# commands whose every argument is a key
+_ALL_KEYS={"MGET","DEL","UNLINK","EXISTS","TOUCH","WATCH","SINTER","SUNION","SDIFF","PFCOUNT"}
+
+
+def parse_line(line)->MonitorEvent:
+    """Parses a line of MONITOR like
+    1339518083.107412 [0 127.0.0.1:60866] "set" "key" "value"
+
+    Returns:
+        MonitorEvent: parsed event, None if the line is not a command
+    """
+    line=str_if_bytes(line)
+    match=_LINE.match(line)
+    if match is None:
+        return None
+    timestamp,db,client,rest=match.groups()
+    words=_split(rest)
+    if not words:
+        return None
+    command=words[0].upper()
+    args=words[1:]
+    return MonitorEvent(float(timestamp),int(db),client,command,args,keys_of(command,args))
+
+
+def _split(text:str)->list:
+    """Splits the quoted arguments of a MONITOR line, undoing the
+    escaping of Redis (\\n, \\", \\xHH...)
+    """
+    words=[]
+    index=0
+    size=len(text)
+    while index<size:
+        if text[index]!='"':
+            index+=1
+            continue
+        index+=1
+        chars=[]
+        while index<size and text[index]!='"':
+            char=text[index]
+            if char=="\\" and index+1<size:
+                following=text[index+1]
+                if following=="x" and index+3<size:
+                    chars.append(chr(int(text[index+2:index+4],16)))
+                    index+=4
+                    continue
+                chars.append(_ESCAPES.get(following,following))
+                index+=2
+                continue
+            chars.append(char)
+            index+=1
+        words.append("".join(chars))
+        index+=1
+    return words
+
+
+def keys_of(command:str,args:list)->list:
+    """Returns the keys accessed by a command, as far as they can be
+    known without the COMMAND table of the server.
+    """
+    if command in _KEYLESS or not args:
+        return []
+    if command in _ALL_KEYS:
+        return list(args)
+    if command in ("MSET","MSETNX"):
+        return list(args[::2])
+    if command in ("EVAL","EVALSHA","EVAL_RO","EVALSHA_RO","FCALL","FCALL_RO"):
+        try:
+            return list(args[2:2+int(args[1])])
+        except (ValueError,IndexError):
+            return []
+    return [args[0]]
+
+
+class CountMinSketch:
+    """Count-min sketch : estimated counts of an unbounded set of
+    items in (width) * (depth) counters. Estimates are never below
+    the real count and above it by at most 2/width of the total
+    with probability 1 - 1/2^depth.
+    """
+
+    def __init__(self,width:int=2048,depth:int=4) -> None:
+        self.width=width
+        self.depth=depth
+        self.rows=[[0]*width for _ in range(depth)]
+
+
+    def __indexes(self,item:str):
+        digest=hashlib.blake2b(item.encode("utf-8","surrogateescape"),digest_size=8*self.depth).digest()
+        for row in range(self.depth):
+            yield row,int.from_bytes(digest[row*8:row*8+8],"little")%self.width
+
+
+    def add(self,item:str,count:int=1)->int:
+        """Adds (count) to item
+
+        Returns:
+            int: new estimated count of item
+        """
+        estimate=None
+        for row,index in self.__indexes(item):
+            self.rows[row][index]+=count
+            value=self.rows[row][index]
+            estimate=value if estimate is None else min(estimate,value)
+        return estimate
+
+
+    def estimate(self,item:str)->int:
+        return min(self.rows[row][index] for row,index in self.__indexes(item))
+
+
+class TopK:
+    """Heaviest (k) items of a stream, tracked with a count-min
+    sketch so memory stays bounded whatever the number of items.
+    """
+
+    def __init__(self,k:int=20,width:int=2048,depth:int=4) -> None:
+        self.k=k
+        self.sketch=CountMinSketch(width,depth)
+        self.items={}
+
+
+    def add(self,item:str)->None:
+        estimate=self.sketch.add(item)
+        if item in self.items or len(self.items)<self.k:
+            self.items[item]=estimate
+            return
+        smallest=min(self.items,key=self.items.get)
+        if estimate>self.items[smallest]:
+            del self.items[smallest]
+            self.items[item]=estimate
+
+
+    def top(self,n:int=None)->list:
+        """Returns (item,estimated count) tuples, heaviest first
+        """
+        return sorted(self.items.items(),key=lambda item:item[1],reverse=True)[:n or self.k]
+
+
+class RollingCounter:
+    """Counts of items over the last (window) seconds, kept in one
+    bucket per second.
+    """
+
+    def __init__(self,window:int=10) -> None:
+        self.window=window
+        self.buckets=deque()
+        self.totals={}
+
+
+    def add(self,item:str,now:float)->None:
+        second=int(now)
+        if not self.buckets or self.buckets[-1][0]!=second:
+            self.buckets.append((second,{}))
+        counts=self.buckets[-1][1]
+        counts[item]=counts.get(item,0)+1
+        self.totals[item]=self.totals.get(item,0)+1
+        self.__expire(second)
+
+
+    def __expire(self,second:int)->None:
+        while self.buckets and self.buckets[0][0]<=second-self.window:
+            _,counts=self.buckets.popleft()
+            for item,count in counts.items():
+                self.totals[item]-=count
+                if not self.totals[item]:
+                    del self.totals[item]
+
+
+    def rates(self)->dict:
+        """Returns the mean number of events per second of each item
+        over the window, busiest first
+        """
+        if not self.buckets:
+            return {}
+        span=min(self.window,self.buckets[-1][0]-self.buckets[0][0]+1)
+        return {item:count/span for item,count in sorted(self.totals.items(),key=lambda item:item[1],reverse=True)}
+
+
+class MonitorConsumer:
+    """Consumes the MONITOR stream of the server on a dedicated connection,
+    in a background thread (start) or an asyncio task (run_async).
+
+    Each line is parsed into a MonitorEvent(time,db,client,command,args,keys)
+    and matched against the filters. Matching events are passed to
+    (handler) and aggregated : commands per second per verb and per
+    client over the last (window) seconds, and the (top_k) hottest keys
+    estimated with a count-min sketch, so memory stays bounded.
+
+    MONITOR costs the server a copy of every command, so the consumer
+    stops after (max_seconds) or (max_events) received events, whichever
+    comes first.
+
+    Example:
+        monitor=driver.test.monitor(max_seconds=10,key_pattern="user:*")
+        monitor.start()
+        monitor.wait()
+        monitor.stats()["hot_keys"]
+    """
+
+    def __init__(self,pool,commands:list=None,key_pattern:str=None,clients:list=None,handler=None,
+    max_events:int=100000,max_seconds:float=60,top_k:int=20,sketch_width:int=2048,sketch_depth:int=4,window:int=10) -> None:
+        if max_events is None and max_seconds is None:
+            raise ValueError("Redis monitor : max_events or max_seconds is required")
+        self.pool=pool
+        self.commands={command.upper() for command in commands} if commands else None
+        self.key_pattern=key_pattern
+        self.clients=set(clients) if clients else None
+        self.handler=handler
+        self.max_events=max_events
+        self.max_seconds=max_seconds
+        self.events=0
+        self.matched=0
+        self.started=None
+        self.elapsed=0.0
+        self.stopped_by=None
+        self.hot_keys=TopK(top_k,sketch_width,sketch_depth)
+        self.verbs=RollingCounter(window)
+        self.client_rates=RollingCounter(window)
+        self.__lock=threading.Lock()
+        self.__stop=threading.Event()
+        self.__ready=threading.Event()
+        self.__done=threading.Event()
+        self.__thread=None
+
+
+    def start(self)->"MonitorConsumer":
+        """Runs the consumer in a background thread
+        """
+        self.__thread=threading.Thread(target=self.run,name="redis-monitor",daemon=True)
+        self.__thread.start()
+        self.__ready.wait(5)
+        return self
+
+
+    async def run_async(self)->dict:
+        """Runs the consumer without blocking the event loop
+
+        Returns:
+            dict: final stats
+        """
+        return await asyncio.get_running_loop().run_in_executor(None,self.run)
+
+
+    def stop(self)->dict:
+        """Stops the consumer and returns its stats
+        """
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        return self.stats()
+
+
+    def wait(self,timeout:float=None)->bool:
+        """Waits until the consumer stops on its budget
+
+        Returns:
+            bool: True if the consumer stopped
+        """
+        return self.__done.wait(timeout)
+
+
+    def run(self)->dict:
+        """Consumes the stream in the current thread until the budget
+        is spent or stop() is called.
+
+        Returns:
+            dict: final stats
+        """
+        connection=None
+        self.started=time.monotonic()
+        try:
+            connection=self.__connect()
+            self.__ready.set()
+            self.stopped_by=self.__consume(connection)
+        except (RedisError,OSError) as err:
+            print(f"Redis monitor : connection failed : {err}")
+            self.stopped_by="error"
+        finally:
+            self.__ready.set()
+            self.elapsed=time.monotonic()-self.started
+            if connection is not None:
+                connection.disconnect()
+            self.__done.set()
+        return self.stats()
+
+
+    def __connect(self):
+        kwargs={key:value for key,value in self.pool.connection_kwargs.items() if key!="redis_connect_func"}
+        connection=self.pool.connection_class(**kwargs)
+        connection.connect()
+        connection.send_command("MONITOR")
+        if str_if_bytes(connection.read_response())!="OK":
+            raise RedisError("Redis monitor : MONITOR failed")
+        return connection
+
+
+    def __consume(self,connection)->str:
+        deadline=None if self.max_seconds is None else self.started+self.max_seconds
+        while True:
+            if self.__stop.is_set():
+                return "stopped"
+            if deadline is not None and time.monotonic()>=deadline:
+                return "max_seconds"
+            if self.max_events is not None and self.events>=self.max_events:
+                return "max_events"
+            timeout=0.2 if deadline is None else max(min(0.2,deadline-time.monotonic()),0)
+            if not connection.can_read(timeout=timeout):
+                continue
+            event=parse_line(connection.read_response())
+            if event is None:
+                continue
+            self.events+=1
+            if self.__matches(event):
+                self.__record(event)
+
+
+    def __matches(self,event:MonitorEvent)->bool:
+        if self.commands is not None and event.command not in self.commands:
+            return False
+        if self.clients is not None and event.client not in self.clients:
+            return False
+        if self.key_pattern is not None and not any(_glob(self.key_pattern,key) for key in event.keys):
+            return False
+        return True
+
+
+    def __record(self,event:MonitorEvent)->None:
+        with self.__lock:
+            self.matched+=1
+            self.verbs.add(event.command,event.time)
+            self.client_rates.add(event.client,event.time)
+            for key in event.keys:
+                if self.key_pattern is None or _glob(self.key_pattern,key):
+                    self.hot_keys.add(key)
+        if self.handler is not None:
+            try:
+                self.handler(event)
+            except Exception as err:
+                print(f"Redis monitor : handler failed : {err}")
+
+
+    def stats(self)->dict:
+        """Returns the aggregates collected so far :
+            - events, matched : received and matching events
+            - elapsed : seconds spent consuming
+            - stopped_by : max_seconds, max_events, stopped, error or None while running
+            - commands_per_second : {verb:rate} over the window
+            - clients_per_second : {client:rate} over the window
+            - hot_keys : [(key,estimated count)] heaviest first
+        """
+        with self.__lock:
+            return {
+                "events":self.events,
+                "matched":self.matched,
+                "elapsed":self.elapsed if self.__done.is_set() else time.monotonic()-(self.started or time.monotonic()),
+                "stopped_by":self.stopped_by,
+                "commands_per_second":self.verbs.rates(),
+                "clients_per_second":self.client_rates.rates(),
+                "hot_keys":self.hot_keys.top(),
+            }
@@ -0,0 +1,165 @@
+import threading
+import time
+from redis import BlockingConnectionPool
+from redis.exceptions import ResponseError
+from redis.utils import str_if_bytes
+
+
+class Pool(BlockingConnectionPool):
+    """Blocking connection pool shared by every handle of the Driver.
+
+    Settings :
+        - max_connections : maximum number of open connections
+        - timeout : seconds a command waits for a free connection before failing
+        - health_check_interval : seconds after which an idle connection is
+        checked with a PING before being reused. 0 disables the check.
+        - idle_timeout : seconds after which the socket of an idle connection
+        is closed. None disables reaping.
+
+    The pool also keeps the counters returned by stats() so it can be
+    sized under load.
+    """
+
+    def __init__(self,max_connections:int=50,timeout:float=20,health_check_interval:int=0,
+    idle_timeout:float=None,**connection_kwargs) -> None:
+        if idle_timeout is not None and idle_timeout<=0:
+            raise ValueError("Redis pool : idle_timeout must be a positive number")
+        self.idle_timeout=idle_timeout
+        self.__stats_lock=threading.Lock()
+        self.__waits=0
+        self.__wait_time=0.0
+        self.__reaped=0
+        self.__released_at={}
+        self.__last_reap=time.monotonic()
+        super().__init__(
+            max_connections=max_connections,
+            timeout=timeout,
+            health_check_interval=health_check_interval,
+            **connection_kwargs
+        )
+
+
+    def get_connection(self,command_name,*keys,**options):
+        if self.idle_timeout is not None and time.monotonic()-self.__last_reap>=self.idle_timeout/2:
+            self.reap()
+        if not self.pool.empty():
+            return super().get_connection(command_name,*keys,**options)
+        start=time.perf_counter()
+        try:
+            return super().get_connection(command_name,*keys,**options)
+        finally:
+            with self.__stats_lock:
+                self.__waits+=1
+                self.__wait_time+=time.perf_counter()-start
+
+
+    def release(self,connection)->None:
+        self.__released_at[connection]=time.monotonic()
+        super().release(connection)
+
+
+    def reap(self)->int:
+        """Closes the sockets of the connections that have been idle
+        for longer than idle_timeout. The connection objects stay in
+        the pool and reconnect the next time they are used.
+
+        Returns:
+            int: number of connections closed
+        """
+        self.__last_reap=time.monotonic()
+        if self.idle_timeout is None:
+            return 0
+        deadline=self.__last_reap-self.idle_timeout
+        reaped=0
+        with self.pool.mutex:
+            for connection in self.pool.queue:
+                if connection is None or connection._sock is None:
+                    continue
+                if self.__released_at.get(connection,deadline)<=deadline:
+                    connection.disconnect()
+                    reaped+=1
+        with self.__stats_lock:
+            self.__reaped+=reaped
+        return reaped
+
+
+    def database(self,db:int):
+        """Returns a view of the pool whose connections are switched
+        to the logical database (db) when they are checked out.
+
+        Args:
+            db (int): database number
+
+        Returns:
+            DatabasePool: view sharing this pool
+        """
+        return DatabasePool(self,db)
+
+
+    def stats(self)->dict:
+        """Returns the usage counters of the pool :
+            - max_connections : size limit of the pool
+            - created : connections created so far
+            - in_use : connections currently checked out
+            - idle : created connections waiting in the pool
+            - waits : number of checkouts that found no idle connection
+            - wait_time : total seconds spent in those checkouts
+            - reaped : idle sockets closed by reap()
+
+        Returns:
+            dict: pool statistics
+        """
+        with self.pool.mutex:
+            idle=sum(1 for connection in self.pool.queue if connection is not None)
+        created=len(self._connections)
+        with self.__stats_lock:
+            return {
+                "max_connections":self.max_connections,
+                "created":created,
+                "in_use":created-idle,
+                "idle":idle,
+                "waits":self.__waits,
+                "wait_time":self.__wait_time,
+                "reaped":self.__reaped,
+            }
+
+
+class DatabasePool:
+    """View of a Pool bound to one logical database. Redis clients
+    built on different views share the connections of the same pool;
+    a SELECT is only sent when a connection last used by another
+    database is checked out.
+    """
+
+    def __init__(self,pool:Pool,db:int) -> None:
+        if not isinstance(db,int) or db<0:
+            raise ValueError("Redis pool : db must be a positive int")
+        self.pool=pool
+        self.db=db
+
+
+    def __getattr__(self,name:str):
+        return getattr(self.pool,name)
+
+
+    def __repr__(self)->str:
+        return f"{type(self).__name__}<db={self.db},{self.pool!r}>"
+
+
+    def get_connection(self,command_name,*keys,**options):
+        connection=self.pool.get_connection(command_name,*keys,**options)
+        if connection.db!=self.db:
+            try:
+                connection.send_command("SELECT",self.db)
+                if str_if_bytes(connection.read_response())!="OK":
+                    raise ResponseError("Invalid Database")
+                connection.db=self.db
+            except BaseException:
+                connection.disconnect()
+                self.pool.release(connection)
+                raise
+        return connection
+
+
+    def release(self,connection)->None:
+        self.pool.release(connection)
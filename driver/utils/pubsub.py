@@ -0,0 +1,365 @@
+import asyncio
+import itertools
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor,wait
+from redis import Redis
+from redis.exceptions import RedisError
+from redis.utils import str_if_bytes
+
+
+Message=namedtuple("Message",["channel","data","pattern"])
+
+
+class Subscription:
+    """Handler registered on a channel or a pattern of a PubSub
+    """
+
+    def __init__(self,id:int,target:str,handler,pattern:bool,batch:bool) -> None:
+        self.id=id
+        self.target=target
+        self.handler=handler
+        self.pattern=pattern
+        self.batch=batch
+
+
+class PubSub:
+    """Publish/subscribe bus of the process. Every channel and pattern
+    subscription of the process shares one dedicated reader connection,
+    read by a background thread; the subscriptions are sent again after
+    a reconnection.
+
+    Received messages go through a buffer of (max_pending) messages.
+    A dispatcher takes up to (batch_size) of them at a time and runs the
+    handlers of the batch on a pool of (workers) threads : a handler
+    registered with batch=True gets the list of its messages, the others
+    get one Message(channel,data,pattern) per call, in order. When the
+    buffer is full the reader waits (overflow="block"), leaving the
+    messages on the server, or drops them (overflow="drop").
+
+    Example:
+        driver.pubsub.subscribe("orders",lambda message:print(message.data))
+        driver.pubsub.psubscribe("user:*",notify,batch=True)
+        driver.pubsub.publish_many([("orders","1"),("orders","2")])
+    """
+
+    overflows=("block","drop")
+
+    def __init__(self,r:Redis,workers:int=4,batch_size:int=100,max_pending:int=10000,overflow:str="block",
+    reconnect_delay:float=0.5) -> None:
+        if overflow not in self.overflows:
+            raise ValueError(f"Redis pubsub : overflow must be one of {self.overflows}")
+        self.__r=r
+        self.workers=workers
+        self.batch_size=batch_size
+        self.overflow=overflow
+        self.reconnect_delay=reconnect_delay
+        self.counters={"received":0,"dispatched":0,"dropped":0,"batches":0,"reconnects":0,"handler_errors":0,"published":0}
+        self.__subscriptions={}
+        self.__confirmations={}
+        self.__ids=itertools.count(1)
+        self.__pending=queue.Queue(max_pending)
+        self.__lock=threading.Lock()
+        self.__write_lock=threading.Lock()
+        self.__start_lock=threading.Lock()
+        self.__stop=threading.Event()
+        self.__ready=threading.Event()
+        self.__connection=None
+        self.__reader=None
+        self.__dispatcher=None
+        self.__executor=None
+
+
+    def subscribe(self,channel:str,handler,batch:bool=False)->Subscription:
+        """Calls handler(message), or handler(messages) with batch=True,
+        for the messages published on channel. Returns once the server
+        confirmed the subscription.
+
+        Returns:
+            Subscription: to pass to unsubscribe
+        """
+        return self.__add(channel,handler,False,batch)
+
+
+    def psubscribe(self,pattern:str,handler,batch:bool=False)->Subscription:
+        """Same as subscribe for the channels matching a glob pattern
+        """
+        return self.__add(pattern,handler,True,batch)
+
+
+    def unsubscribe(self,subscription:Subscription)->None:
+        """Removes a handler. The channel is unsubscribed on the server
+        when its last handler is removed.
+        """
+        with self.__lock:
+            if self.__subscriptions.pop(subscription.id,None) is None:
+                return
+            last=not any(other.target==subscription.target and other.pattern==subscription.pattern
+                for other in self.__subscriptions.values())
+        if last:
+            self.__send("PUNSUBSCRIBE" if subscription.pattern else "UNSUBSCRIBE",subscription.target)
+
+
+    def queue(self,*channels,patterns:tuple=(),maxsize:int=1000)->asyncio.Queue:
+        """Returns an asyncio queue of the current event loop fed with the
+        messages of channels and patterns. Messages that do not fit in
+        a full queue are dropped and counted.
+
+        Example:
+            messages=driver.pubsub.queue("orders")
+            message=await messages.get()
+        """
+        loop=asyncio.get_running_loop()
+        messages=asyncio.Queue(maxsize)
+        def put(batch):
+            for message in batch:
+                if messages.full():
+                    self.__count("dropped")
+                else:
+                    messages.put_nowait(message)
+        handler=lambda batch:loop.call_soon_threadsafe(put,batch)
+        for channel in channels:
+            self.subscribe(channel,handler,batch=True)
+        for pattern in patterns:
+            self.psubscribe(pattern,handler,batch=True)
+        return messages
+
+
+    def publish(self,channel:str,message)->int:
+        """Returns the number of subscribers that received the message
+        """
+        receivers=self.__r.publish(channel,message)
+        self.__count("published")
+        return receivers
+
+
+    def publish_many(self,messages:list)->list:
+        """Publishes (channel,message) pairs in one pipeline
+
+        Returns:
+            list: number of receivers of each message
+        """
+        pipe=self.__r.pipeline(transaction=False)
+        for channel,message in messages:
+            pipe.publish(channel,message)
+        receivers=pipe.execute()
+        with self.__lock:
+            self.counters["published"]+=len(receivers)
+        return receivers
+
+
+    def close(self)->None:
+        """Stops the reader and the dispatcher. Handlers are kept, the
+        bus starts again on the next subscribe.
+        """
+        with self.__start_lock:
+            self.__stop.set()
+            for thread in (self.__reader,self.__dispatcher):
+                if thread is not None and thread is not threading.current_thread():
+                    thread.join()
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+            self.__reader=self.__dispatcher=self.__executor=None
+            self.__stop=threading.Event()
+            self.__ready=threading.Event()
+
+
+    def stats(self)->dict:
+        """Returns the counters (received, dispatched, dropped, batches,
+        reconnects, handler_errors, published), the buffered messages and
+        the number of channels and patterns
+        """
+        with self.__lock:
+            return {
+                **self.counters,
+                "pending":self.__pending.qsize(),
+                "channels":len({sub.target for sub in self.__subscriptions.values() if not sub.pattern}),
+                "patterns":len({sub.target for sub in self.__subscriptions.values() if sub.pattern}),
+            }
+
+
+    def __add(self,target:str,handler,pattern:bool,batch:bool)->Subscription:
+        if not isinstance(target,str) or not callable(handler):
+            raise ValueError("Redis pubsub : channel must be a string and handler a callable")
+        subscription=Subscription(next(self.__ids),target,handler,pattern,batch)
+        with self.__lock:
+            new=not any(other.target==target and other.pattern==pattern for other in self.__subscriptions.values())
+            self.__subscriptions[subscription.id]=subscription
+            confirmed=self.__confirmations.setdefault((pattern,target),threading.Event()) if new else None
+        with self.__start_lock:
+            started=self.__reader is not None
+            if not started:
+                self.__start()
+        if started and new:
+            self.__send("PSUBSCRIBE" if pattern else "SUBSCRIBE",target)
+        if confirmed is not None:
+            confirmed.wait(5)
+        return subscription
+
+
+    def __start(self)->None:
+        self.__executor=ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix="redis-pubsub")
+        self.__dispatcher=threading.Thread(target=self.__dispatch,name="redis-pubsub-dispatch",daemon=True)
+        self.__dispatcher.start()
+        self.__reader=threading.Thread(target=self.__run,name="redis-pubsub",daemon=True)
+        self.__reader.start()
+        self.__ready.wait(5)
+
+
+    def __send(self,*args)->None:
+        with self.__write_lock:
+            if self.__connection is None:
+                return
+            try:
+                self.__connection.send_command(*args)
+            except (RedisError,OSError) as err:
+                print(f"Redis pubsub : {args[0]} failed, retried after reconnection : {err}")
+
+
+    def __connect(self):
+        pool=getattr(self.__r,"connection_pool",None)
+        if pool is None:
+            pool=self.__r.get_default_node().redis_connection.connection_pool
+        kwargs={key:value for key,value in pool.connection_kwargs.items() if key!="redis_connect_func"}
+        connection=pool.connection_class(**kwargs)
+        connection.connect()
+        # snapshot and publish under the write lock : a subscribe() added after
+        # the snapshot waits for it in __send and is sent on this connection
+        with self.__write_lock:
+            with self.__lock:
+                channels=sorted({sub.target for sub in self.__subscriptions.values() if not sub.pattern})
+                patterns=sorted({sub.target for sub in self.__subscriptions.values() if sub.pattern})
+            if channels:
+                connection.send_command("SUBSCRIBE",*channels)
+            if patterns:
+                connection.send_command("PSUBSCRIBE",*patterns)
+            self.__connection=connection
+        return connection
+
+
+    def __run(self)->None:
+        stop=self.__stop
+        while not stop.is_set():
+            try:
+                connection=self.__connect()
+            except (RedisError,OSError) as err:
+                print(f"Redis pubsub : connection failed : {err}")
+                self.__ready.set()
+                stop.wait(self.reconnect_delay)
+                continue
+            try:
+                self.__listen(connection,stop)
+            except (RedisError,OSError) as err:
+                if not stop.is_set():
+                    print(f"Redis pubsub : connection lost, resubscribing : {err}")
+                    self.__count("reconnects")
+                    stop.wait(self.reconnect_delay)
+            finally:
+                with self.__write_lock:
+                    self.__connection=None
+                connection.disconnect()
+        self.__pending.put(None)
+
+
+    def __listen(self,connection,stop:threading.Event)->None:
+        confirmed=False
+        while not stop.is_set():
+            if not connection.can_read(timeout=0.2):
+                if not confirmed:
+                    confirmed=True
+                    self.__ready.set()
+                continue
+            reply=connection.read_response()
+            if not isinstance(reply,list) or not reply:
+                continue
+            kind=str_if_bytes(reply[0])
+            if kind=="message":
+                message=Message(str_if_bytes(reply[1]),reply[2],None)
+            elif kind=="pmessage":
+                message=Message(str_if_bytes(reply[2]),reply[3],str_if_bytes(reply[1]))
+            else:
+                if kind in ("subscribe","psubscribe"):
+                    with self.__lock:
+                        event=self.__confirmations.pop((kind=="psubscribe",str_if_bytes(reply[1])),None)
+                    if event is not None:
+                        event.set()
+                self.__ready.set()
+                confirmed=True
+                continue
+            self.__count("received")
+            if self.overflow=="drop":
+                try:
+                    self.__pending.put_nowait(message)
+                except queue.Full:
+                    self.__count("dropped")
+            else:
+                while not stop.is_set():
+                    try:
+                        self.__pending.put(message,timeout=0.2)
+                        break
+                    except queue.Full:
+                        continue
+
+
+    def __dispatch(self)->None:
+        while True:
+            message=self.__pending.get()
+            if message is None:
+                return
+            batch=[message]
+            while len(batch)<self.batch_size:
+                try:
+                    message=self.__pending.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    self.__deliver(batch)
+                    return
+                batch.append(message)
+            self.__deliver(batch)
+
+
+    def __deliver(self,batch:list)->None:
+        """Runs every handler on its messages of the batch, the handlers
+        in parallel and each one in order
+        """
+        with self.__lock:
+            subscriptions=list(self.__subscriptions.values())
+        work={}
+        for message in batch:
+            for subscription in subscriptions:
+                if subscription.pattern:
+                    if subscription.target!=message.pattern:
+                        continue
+                elif message.pattern is not None or subscription.target!=message.channel:
+                    continue
+                work.setdefault(subscription.id,(subscription,[]))[1].append(message)
+        futures=[self.__executor.submit(self.__call,subscription,messages) for subscription,messages in work.values()]
+        wait(futures)
+        with self.__lock:
+            self.counters["batches"]+=1
+            self.counters["dispatched"]+=len(batch)
+
+
+    def __call(self,subscription:Subscription,messages:list)->None:
+        if subscription.batch:
+            self.__handle(subscription,messages)
+            return
+        for message in messages:
+            self.__handle(subscription,message)
+
+
+    def __handle(self,subscription:Subscription,argument)->None:
+        """Runs the handler, an error only loses the message (or batch) it was given
+        """
+        try:
+            subscription.handler(argument)
+        except Exception as err:
+            self.__count("handler_errors")
+            print(f"Redis pubsub : handler of {subscription.target} failed : {err}")
+
+
+    def __count(self,name:str)->None:
+        with self.__lock:
+            self.counters[name]+=1
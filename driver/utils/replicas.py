@@ -0,0 +1,256 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from redis import Redis
+from redis.commands.cluster import READ_COMMANDS
+from redis.exceptions import ConnectionError,TimeoutError
+
+
+READS=frozenset(READ_COMMANDS)|{"SCAN","HSCAN","SSCAN","ZSCAN","TYPE","MEMORY USAGE","XLEN","XRANGE","XREVRANGE","ZRANGEBYSCORE","ZREVRANGE","ZRANK"}
+# reads of READS that write their result with a STORE or STOREDIST option
+STORING={"GEORADIUS","GEORADIUSBYMEMBER"}
+
+
+def is_read(name:str,args:tuple)->bool:
+    """Tells if the command (args) only reads, so it can run on a replica.
+    GEORADIUS and GEORADIUSBYMEMBER write when they carry STORE or STOREDIST.
+
+    Args:
+        name (str): command name in upper case
+        args (tuple): command and its arguments
+
+    Returns:
+        bool: True if the command does not write
+    """
+    if name not in READS:
+        return False
+    if name not in STORING:
+        return True
+    # GEORADIUS key longitude latitude radius unit [options] ; GEORADIUSBYMEMBER key member radius unit [options]
+    for option in args[4:]:
+        option=(option.decode("utf-8","replace") if isinstance(option,bytes) else str(option)).upper()
+        if option in ("STORE","STOREDIST"):
+            return False
+    return True
+
+
+class Replica:
+    """State of one replica in a ReplicaRouter
+    """
+
+    def __init__(self,address:tuple,client:Redis) -> None:
+        self.address=address
+        self.client=client
+        self.latency=None
+        self.lag=None
+        self.link_up=True
+        self.down_until=0.0
+        self.reads=0
+        self.failures=0
+
+
+    @property
+    def name(self)->str:
+        return f"{self.address[0]}:{self.address[1]}"
+
+
+    def available(self,now:float,max_lag:int)->bool:
+        if now<self.down_until or not self.link_up:
+            return False
+        return max_lag is None or self.lag is None or self.lag<=max_lag
+
+
+class ReplicaRouter:
+    """Picks the replica that serves each read of a ReplicaRedis.
+
+    Replicas are chosen in turn (strategy "round_robin") or by the lowest
+    moving average of their latency ("least_latency"). Every
+    (lag_check_interval) seconds the replication offsets of the primary
+    and the replicas are compared with INFO replication : a replica more
+    than (max_lag) bytes behind, or whose link to the primary is down,
+    gets no reads until it catches up. A replica that fails a read is
+    skipped for (cooldown) seconds and the read is sent to the primary.
+
+    Reads stay on the primary inside pinned(), and for (sticky_writes)
+    seconds after a write of the same thread, so a thread reads its own writes.
+
+    Args:
+        primary (Redis): client of the primary, used for the lag checks
+        replicas (list): (host,port) of the replicas
+        factory (callable): factory(host,port) -> Redis client of a replica
+        strategy (str, optional): "round_robin" or "least_latency". Defaults to "round_robin".
+        max_lag (int, optional): replication offset lag in bytes, None disables the guard. Defaults to None.
+        lag_check_interval (float, optional): seconds between lag checks. Defaults to 1.0.
+        cooldown (float, optional): seconds a failed replica is skipped. Defaults to 5.0.
+        sticky_writes (float, optional): seconds reads stay on the primary after a write. Defaults to 0.
+        discover (callable, optional): discover() -> list of (host,port), called at every lag check. Defaults to None.
+    """
+
+    strategies=("round_robin","least_latency")
+
+    def __init__(self,primary:Redis,replicas:list,factory,strategy:str="round_robin",max_lag:int=None,
+    lag_check_interval:float=1.0,cooldown:float=5.0,sticky_writes:float=0.0,discover=None) -> None:
+        if strategy not in self.strategies:
+            raise ValueError(f"Redis replicas : strategy must be one of {self.strategies}")
+        self.primary=primary
+        self.factory=factory
+        self.strategy=strategy
+        self.max_lag=max_lag
+        self.lag_check_interval=lag_check_interval
+        self.cooldown=cooldown
+        self.sticky_writes=sticky_writes
+        self.discover=discover
+        self.primary_reads=0
+        self.fallbacks=0
+        self.replicas=[Replica(tuple(address),factory(*address)) for address in replicas]
+        self.__turn=itertools.count()
+        self.__local=threading.local()
+        self.__lock=threading.Lock()
+        self.__checked=0.0
+
+
+    def close(self)->None:
+        for replica in self.replicas:
+            replica.client.connection_pool.disconnect()
+        self.replicas=[]
+
+
+    @contextmanager
+    def pinned(self):
+        """Sends every read of the current thread to the primary
+        inside the block (read your writes session).
+        """
+        depth=getattr(self.__local,"pinned",0)
+        self.__local.pinned=depth+1
+        try:
+            yield
+        finally:
+            self.__local.pinned=depth
+
+
+    def is_pinned(self)->bool:
+        if getattr(self.__local,"pinned",0):
+            return True
+        return bool(self.sticky_writes) and time.monotonic()-getattr(self.__local,"written",-1e9)<self.sticky_writes
+
+
+    def note_write(self)->None:
+        if self.sticky_writes:
+            self.__local.written=time.monotonic()
+
+
+    def select(self)->Replica:
+        """Returns the replica for the next read, None to use the primary
+        """
+        now=time.monotonic()
+        if (self.max_lag is not None or self.discover is not None) and now-self.__checked>=self.lag_check_interval:
+            self.check()
+        candidates=[replica for replica in self.replicas if replica.available(now,self.max_lag)]
+        if not candidates:
+            return None
+        if self.strategy=="least_latency":
+            untried=[replica for replica in candidates if replica.latency is None]
+            return untried[0] if untried else min(candidates,key=lambda replica:replica.latency)
+        return candidates[next(self.__turn)%len(candidates)]
+
+
+    def observe(self,replica:Replica,seconds:float)->None:
+        replica.reads+=1
+        replica.latency=seconds if replica.latency is None else replica.latency*0.8+seconds*0.2
+
+
+    def failed(self,replica:Replica,err:Exception)->None:
+        replica.failures+=1
+        replica.down_until=time.monotonic()+self.cooldown
+        self.fallbacks+=1
+        print(f"Redis replicas : read on {replica.name} failed, using the primary : {err}")
+
+
+    def check(self)->None:
+        """Refreshes the replica set (with discover) and the replication
+        lag of every replica. Only one thread checks at a time.
+        """
+        if not self.__lock.acquire(blocking=False):
+            return
+        try:
+            self.__checked=time.monotonic()
+            if self.discover is not None:
+                try:
+                    self.__refresh(self.discover())
+                except Exception as err:
+                    print(f"Redis replicas : replica discovery failed : {err}")
+            if self.max_lag is None:
+                return
+            try:
+                offset=self.primary.info("replication").get("master_repl_offset",0)
+            except (ConnectionError,TimeoutError) as err:
+                print(f"Redis replicas : lag check on the primary failed : {err}")
+                return
+            for replica in self.replicas:
+                try:
+                    info=replica.client.info("replication")
+                except (ConnectionError,TimeoutError):
+                    replica.down_until=time.monotonic()+self.cooldown
+                    continue
+                replica.link_up=info.get("master_link_status","up")=="up"
+                replica.lag=max(offset-info.get("slave_repl_offset",offset),0)
+        finally:
+            self.__lock.release()
+
+
+    def __refresh(self,addresses:list)->None:
+        addresses=[tuple(address) for address in addresses]
+        current={replica.address:replica for replica in self.replicas}
+        replicas=[current.pop(address,None) or Replica(address,self.factory(*address)) for address in addresses]
+        self.replicas=replicas
+        for replica in current.values():
+            replica.client.connection_pool.disconnect()
+
+
+    def stats(self)->dict:
+        """Returns the reads, failures, latency (seconds) and lag (bytes)
+        of every replica, and the reads served by the primary
+        """
+        return {
+            "primary_reads":self.primary_reads,
+            "fallbacks":self.fallbacks,
+            "replicas":{replica.name:{
+                "reads":replica.reads,
+                "failures":replica.failures,
+                "latency":replica.latency,
+                "lag":replica.lag,
+                "available":replica.available(time.monotonic(),self.max_lag),
+            } for replica in self.replicas},
+        }
+
+
+class ReplicaRedis(Redis):
+    """Redis client of the primary that sends read-only commands to a
+    replica picked by a ReplicaRouter. Writes, pipelines, transactions
+    and scripts always run on the primary.
+    """
+
+    def __init__(self,router:ReplicaRouter=None,**kargs) -> None:
+        super().__init__(**kargs)
+        self.router=router
+
+
+    def execute_command(self,*args,**options):
+        name=str(args[0]).upper()
+        if not is_read(name,args):
+            self.router.note_write()
+            return super().execute_command(*args,**options)
+        replica=None if self.router.is_pinned() else self.router.select()
+        if replica is None:
+            self.router.primary_reads+=1
+            return super().execute_command(*args,**options)
+        start=time.perf_counter()
+        try:
+            result=replica.client.execute_command(*args,**options)
+        except (ConnectionError,TimeoutError) as err:
+            self.router.failed(replica,err)
+            self.router.primary_reads+=1
+            return super().execute_command(*args,**options)
+        self.router.observe(replica,time.perf_counter()-start)
+        return result
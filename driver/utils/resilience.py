@@ -0,0 +1,333 @@
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED,ThreadPoolExecutor,wait
+from redis.exceptions import ConnectionError,RedisError,TimeoutError
+from driver.utils.metrics import Histogram
+from driver.utils.replicas import READS,ReplicaRouter,is_read
+
+
+# commands that can be sent again without changing the result
+IDEMPOTENT=READS|{"SET","MSET","DEL","UNLINK","EXPIRE","PEXPIRE","EXPIREAT","PEXPIREAT","PERSIST","HSET","HDEL",
+    "SADD","SREM","ZADD","ZREM","PING","ECHO","SELECT","CLIENT SETNAME","CLIENT ID","INFO","DBSIZE"}
+# options making a SET or ZADD depend on the state left by a first attempt
+CONDITIONAL={"SET":{"NX","XX","GET"},"ZADD":{"NX","XX","GT","LT","INCR"}}
+TRANSIENT=(ConnectionError,TimeoutError)
+
+
+class DriverError(RedisError):
+    """Base error of the driver. Carries the command or operation that
+    failed, the endpoint, the number of attempts and the seconds spent.
+    """
+
+    def __init__(self,message:str,command:str=None,endpoint:str=None,attempts:int=1,elapsed:float=0.0) -> None:
+        super().__init__(message)
+        self.command=command
+        self.endpoint=endpoint
+        self.attempts=attempts
+        self.elapsed=elapsed
+
+
+class CircuitOpenError(DriverError):
+    """The circuit breaker of the endpoint is open : the command was not sent
+    """
+
+
+class RetriesExhaustedError(DriverError):
+    """Every attempt of an idempotent command failed with a transient error
+    """
+
+
+class OperationError(DriverError):
+    """A Commands operation failed; the original error is its __cause__
+    """
+
+
+class CircuitBreaker:
+    """Opens after (failure_threshold) consecutive transient failures
+    of an endpoint, so calls fail at once instead of waiting for the
+    socket timeout. After (reset_timeout) seconds one call is let
+    through (half open) : its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self,failure_threshold:int=5,reset_timeout:float=5.0) -> None:
+        self.failure_threshold=failure_threshold
+        self.reset_timeout=reset_timeout
+        self.failures=0
+        self.opened=0
+        self.state="closed"
+        self.__opened_at=0.0
+        self.__lock=threading.Lock()
+
+
+    def allow(self)->bool:
+        with self.__lock:
+            if self.state=="closed":
+                return True
+            if self.state=="open" and time.monotonic()-self.__opened_at>=self.reset_timeout:
+                self.state="half_open"
+                return True
+            return False
+
+
+    def success(self)->None:
+        with self.__lock:
+            self.failures=0
+            self.state="closed"
+
+
+    def failure(self)->None:
+        with self.__lock:
+            self.failures+=1
+            if self.state=="half_open" or self.failures>=self.failure_threshold:
+                if self.state!="open":
+                    self.opened+=1
+                self.state="open"
+                self.__opened_at=time.monotonic()
+
+
+class Resilience:
+    """Resilience layer installed on the redis client of a Commands
+    helper (Commands.enable_resilience) :
+        - retries : idempotent commands failing with a connection or timeout
+          error are sent again up to (retries) times, waiting a random time
+          between 0 and backoff * 2^attempt (capped at max_backoff) in between
+        - circuit breaker : one CircuitBreaker per endpoint, commands fail
+          with CircuitOpenError while it is open
+        - hedged reads : when (hedge) is given, a read still running after
+          the (hedge_percentile) latency of the previous reads is also sent
+          to the replica and the first reply wins
+        - typed errors : failed operations of Commands are counted by type
+          instead of printed, and raised as DriverError when raise_errors is set
+
+    Args:
+        retries (int, optional): extra attempts of idempotent commands. Defaults to 2.
+        backoff (float, optional): base wait in seconds between attempts. Defaults to 0.05.
+        max_backoff (float, optional): maximum wait in seconds. Defaults to 1.0.
+        failure_threshold (int, optional): consecutive failures that open a circuit. Defaults to 5.
+        reset_timeout (float, optional): seconds before an open circuit is tried again. Defaults to 5.0.
+        hedge (Redis or ReplicaRouter, optional): replica client, or router picking it, for hedged reads. Defaults to None.
+        hedge_percentile (float, optional): latency percentile after which reads are hedged. Defaults to 95.
+        hedge_min_samples (int, optional): reads measured before hedging starts. Defaults to 20.
+        raise_errors (bool, optional): raise typed errors from Commands instead of returning None or False. Defaults to False.
+    """
+
+    def __init__(self,retries:int=2,backoff:float=0.05,max_backoff:float=1.0,failure_threshold:int=5,
+    reset_timeout:float=5.0,hedge=None,hedge_percentile:float=95,hedge_min_samples:int=20,raise_errors:bool=False) -> None:
+        if not isinstance(retries,int) or retries<0:
+            raise ValueError("Redis resilience : retries must be a positive int or 0")
+        self.retries=retries
+        self.backoff=backoff
+        self.max_backoff=max_backoff
+        self.failure_threshold=failure_threshold
+        self.reset_timeout=reset_timeout
+        self.hedge=hedge
+        self.hedge_percentile=hedge_percentile
+        self.hedge_min_samples=hedge_min_samples
+        self.raise_errors=raise_errors
+        self.breakers={}
+        self.latency=Histogram()
+        self.last_error=None
+        self.counters={"retries":0,"recovered":0,"short_circuited":0,"hedges":0,"hedge_wins":0}
+        self.errors={}
+        self.__lock=threading.Lock()
+        self.__executor=None
+        self.__pid=None
+
+
+    def close(self)->None:
+        """Waits for the reads still running after a hedge and stops the threads
+        """
+        if self.__executor is not None:
+            if self.__pid==os.getpid():
+                self.__executor.shutdown(wait=True)
+            self.__executor=None
+
+
+    def install(self,r)->None:
+        """Wraps execute_command of a redis client. Pipelines are not retried.
+        """
+        if getattr(r.execute_command,"__wrapped_by_resilience__",False):
+            return
+        execute_command=r.execute_command
+        endpoint=_endpoint(r)
+        @functools.wraps(execute_command)
+        def wrapper(*args,**options):
+            return self.execute(execute_command,endpoint,args,options)
+        wrapper.__wrapped_by_resilience__=True
+        r.execute_command=wrapper
+
+
+    def uninstall(self,r)->bool:
+        """Restores execute_command of a redis client wrapped by install
+
+        Returns:
+            bool: False if another wrapper was installed on top of it since
+        """
+        if not getattr(r.execute_command,"__wrapped_by_resilience__",False):
+            return False
+        r.execute_command=r.execute_command.__wrapped__
+        return True
+
+
+    def breaker(self,endpoint:str)->CircuitBreaker:
+        breaker=self.breakers.get(endpoint)
+        if breaker is None:
+            with self.__lock:
+                breaker=self.breakers.setdefault(endpoint,CircuitBreaker(self.failure_threshold,self.reset_timeout))
+        return breaker
+
+
+    def execute(self,execute_command,endpoint:str,args:tuple,options:dict):
+        """Sends one command with the circuit breaker, retries and hedging
+        """
+        name=str(args[0]).upper() if args else "?"
+        breaker=self.breaker(endpoint)
+        attempts=self.retries+1 if idempotent(name,args) else 1
+        start=time.monotonic()
+        error=None
+        for attempt in range(attempts):
+            if not breaker.allow():
+                self.__count("short_circuited")
+                raise CircuitOpenError(f"Redis resilience : circuit open for {endpoint}",name,endpoint,attempt,time.monotonic()-start) from error
+            if attempt:
+                self.__count("retries")
+                time.sleep(random.uniform(0,min(self.max_backoff,self.backoff*2**(attempt-1))))
+            try:
+                if self.hedge is not None and is_read(name,args):
+                    result=self.__hedged(execute_command,args,options)
+                else:
+                    result=execute_command(*args,**options)
+            except TRANSIENT as err:
+                breaker.failure()
+                error=err
+                continue
+            breaker.success()
+            if attempt:
+                self.__count("recovered")
+            return result
+        if attempts==1:
+            raise error
+        raise RetriesExhaustedError(f"Redis resilience : {name} failed {attempts} times : {error}",name,endpoint,
+            attempts,time.monotonic()-start) from error
+
+
+    def __hedged(self,execute_command,args:tuple,options:dict):
+        with self.__lock:
+            threshold=self.latency.percentile(self.hedge_percentile) if self.latency.count>=self.hedge_min_samples else None
+        if threshold is None:
+            return self.__timed(execute_command,args,options)
+        if self.__executor is None or self.__pid!=os.getpid():
+            with self.__lock:
+                if self.__executor is None or self.__pid!=os.getpid():
+                    # the threads of an executor created before a fork do not exist in the child
+                    self.__executor=ThreadPoolExecutor(max_workers=16,thread_name_prefix="redis-hedge")
+                    self.__pid=os.getpid()
+        primary=self.__executor.submit(self.__timed,execute_command,args,options)
+        done,_=wait([primary],timeout=threshold/1000000)
+        if done:
+            return primary.result()
+        replica=self.__hedge_client()
+        if replica is None:
+            return primary.result()
+        self.__count("hedges")
+        hedged=self.__executor.submit(replica.execute_command,*args,**options)
+        done,_=wait([primary,hedged],return_when=FIRST_COMPLETED)
+        first=primary if primary in done else hedged
+        if first.exception() is not None:
+            other=hedged if first is primary else primary
+            return other.result()
+        if first is hedged:
+            self.__count("hedge_wins")
+        return first.result()
+
+
+    def __hedge_client(self):
+        if not isinstance(self.hedge,ReplicaRouter):
+            return self.hedge
+        replica=self.hedge.select()
+        return replica.client if replica is not None else None
+
+
+    def __timed(self,execute_command,args:tuple,options:dict):
+        start=time.perf_counter()
+        result=execute_command(*args,**options)
+        elapsed=(time.perf_counter()-start)*1000000
+        with self.__lock:
+            self.latency.record(elapsed)
+        return result
+
+
+    def __count(self,name:str)->None:
+        with self.__lock:
+            self.counters[name]+=1
+
+
+    def failed(self,operation:str,err:Exception)->None:
+        """Records the failure of a Commands operation. Raises it as a
+        DriverError when raise_errors is set.
+        """
+        kind=type(err).__name__
+        if not isinstance(err,DriverError):
+            wrapped=OperationError(f"Redis {operation} operation failed : {err}",operation)
+            wrapped.__cause__=err
+            err=wrapped
+        with self.__lock:
+            self.errors[kind]=self.errors.get(kind,0)+1
+            self.last_error=err
+        if self.raise_errors:
+            raise err
+
+
+    def stats(self)->dict:
+        """Returns the counters (retries, recovered, short_circuited,
+        hedges, hedge_wins), the errors by type, the state of every
+        circuit breaker and the read latency percentiles in microseconds
+        """
+        with self.__lock:
+            return {
+                **self.counters,
+                "errors":dict(self.errors),
+                "breakers":{endpoint:{"state":breaker.state,"opened":breaker.opened} for endpoint,breaker in self.breakers.items()},
+                "p50_us":self.latency.percentile(50),
+                "p99_us":self.latency.percentile(99),
+            }
+
+
+def idempotent(name:str,args:tuple)->bool:
+    """Tells if the command (args) can be sent again after a lost reply.
+    SET with NX, XX or GET and ZADD with NX, XX, GT, LT or INCR are not :
+    a retry would see the state left by the first attempt.
+
+    Args:
+        name (str): command name in upper case
+        args (tuple): command and its arguments
+
+    Returns:
+        bool: True if the command can be retried
+    """
+    if name not in IDEMPOTENT:
+        return False
+    conditional=CONDITIONAL.get(name)
+    if conditional is None:
+        return True
+    # SET key value [options] ; ZADD key [options] score member ...
+    options=args[3:] if name=="SET" else args[2:]
+    for option in options:
+        option=(option.decode("utf-8","replace") if isinstance(option,bytes) else str(option)).upper()
+        if option in conditional:
+            return False
+        if name=="ZADD" and option!="CH":
+            break
+    return True
+
+
+def _endpoint(r)->str:
+    pool=getattr(r,"connection_pool",None)
+    kwargs=getattr(pool,"connection_kwargs",None) or {}
+    if "path" in kwargs:
+        return kwargs["path"]
+    return f"{kwargs.get('host','cluster')}:{kwargs.get('port','')}"
@@ -0,0 +1,144 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from redis import Redis
+
+
+ScanEntry=namedtuple("ScanEntry",["key","value","type","ttl"])
+
+
+class Scanner:
+    """Walks the keyspace, or the content of one hash, set or sorted set,
+    with the SCAN family of commands instead of KEYS, so the server is
+    never blocked and memory stays constant : only the current page and
+    the next one are held at a time.
+
+    While the caller processes a page, the next page is fetched in a
+    background thread (prefetch). For SCAN, the values, types and ttls of
+    the keys of each page can be fetched in the same round trip with a
+    pipeline (fetch_values, fetch_types, fetch_ttls) and are returned as
+    ScanEntry(key,value,type,ttl) tuples.
+
+    A scan can be resumed from the cursor it reached : cursor holds the
+    cursor of the page after the last one yielded, 0 once it is complete.
+
+    Items produced by each command :
+        - SCAN : key (str) or ScanEntry
+        - HSCAN : (field (str), value (bytes))
+        - SSCAN : member (str)
+        - ZSCAN : (member (str), score (float))
+
+    With decode=False keys, fields and members are kept as bytes, so
+    binary names that are not UTF-8 can be scanned.
+    """
+
+    commands=("SCAN","HSCAN","SSCAN","ZSCAN")
+
+    def __init__(self,r:Redis,command:str="SCAN",key:str=None,match:str=None,count:int=1000,
+    type:str=None,prefetch:bool=True,fetch_values:bool=False,fetch_types:bool=False,fetch_ttls:bool=False,cursor:int=0,
+    decode:bool=True) -> None:
+        if command not in self.commands:
+            raise ValueError(f"Redis scan : command must be one of {self.commands}")
+        if command!="SCAN" and not isinstance(key,str):
+            raise ValueError(f"Redis scan : {command} requires a key (str)")
+        if not isinstance(count,int) or count<1:
+            raise ValueError("Redis scan : count must be a positive int")
+        if command!="SCAN" and (type or fetch_values or fetch_types or fetch_ttls):
+            raise ValueError("Redis scan : type and fetch options are only available for SCAN")
+        self.__r=r
+        self.command=command
+        self.key=key
+        self.match=match
+        self.count=count
+        self.type=type
+        self.prefetch=prefetch
+        self.fetch_values=fetch_values
+        self.fetch_types=fetch_types
+        self.fetch_ttls=fetch_ttls
+        self.decode=decode
+        self.pages_read=0
+        self.items_read=0
+        self.start=cursor
+        self.cursor=cursor
+
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+
+    def pages(self):
+        """Yields the items of the scan one page at a time
+
+        Yields:
+            list: items of one page (can be empty)
+        """
+        if not self.prefetch:
+            cursor=self.start
+            while True:
+                cursor,page=self.__fetch(cursor)
+                self.cursor=cursor
+                yield page
+                if cursor==0:
+                    return
+        with ThreadPoolExecutor(max_workers=1,thread_name_prefix="redis-scan") as executor:
+            future=executor.submit(self.__fetch,self.start)
+            while True:
+                cursor,page=future.result()
+                self.cursor=cursor
+                if cursor==0:
+                    yield page
+                    return
+                future=executor.submit(self.__fetch,cursor)
+                try:
+                    yield page
+                except GeneratorExit:
+                    future.cancel()
+                    raise
+
+
+    def __fetch(self,cursor:int)->tuple:
+        text=(lambda name:name.decode("utf-8")) if self.decode else (lambda name:name)
+        if self.command=="SCAN":
+            cursor,keys=self.__r.scan(cursor=cursor,match=self.match,count=self.count,_type=self.type)
+            page=self.__details([text(key) for key in keys])
+        elif self.command=="HSCAN":
+            cursor,fields=self.__r.hscan(self.key,cursor=cursor,match=self.match,count=self.count)
+            page=[(text(field),value) for field,value in fields.items()]
+        elif self.command=="SSCAN":
+            cursor,members=self.__r.sscan(self.key,cursor=cursor,match=self.match,count=self.count)
+            page=[text(member) for member in members]
+        else:
+            cursor,members=self.__r.zscan(self.key,cursor=cursor,match=self.match,count=self.count)
+            page=[(text(member),score) for member,score in members]
+        self.pages_read+=1
+        self.items_read+=len(page)
+        return cursor,page
+
+
+    def __details(self,keys:list)->list:
+        if not keys or not (self.fetch_values or self.fetch_types or self.fetch_ttls):
+            return keys
+        pipe=self.__r.pipeline(transaction=False)
+        if self.fetch_values:
+            pipe.mget(keys)
+        if self.fetch_types:
+            for key in keys:
+                pipe.type(key)
+        if self.fetch_ttls:
+            for key in keys:
+                pipe.pttl(key)
+        replies=pipe.execute(raise_on_error=False)
+        values=[None]*len(keys)
+        types=[None]*len(keys)
+        ttls=[None]*len(keys)
+        position=0
+        if self.fetch_values:
+            if not isinstance(replies[0],Exception):
+                values=replies[0]
+            position=1
+        if self.fetch_types:
+            types=[reply.decode("utf-8") for reply in replies[position:position+len(keys)]]
+            position+=len(keys)
+        if self.fetch_ttls:
+            ttls=replies[position:position+len(keys)]
+        return [ScanEntry(*entry) for entry in zip(keys,values,types,ttls)]
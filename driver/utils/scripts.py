@@ -0,0 +1,268 @@
+import hashlib
+import threading
+from redis import Redis
+from redis.exceptions import NoScriptError
+
+
+GET_OR_SET="""
+local value=redis.call("GET",KEYS[1])
+if value then
+    return value
+end
+if ARGV[2]~="" then
+    redis.call("SET",KEYS[1],ARGV[1],"PX",ARGV[2])
+else
+    redis.call("SET",KEYS[1],ARGV[1])
+end
+return ARGV[1]
+"""
+
+COMPARE_AND_DELETE="""
+if redis.call("GET",KEYS[1])==ARGV[1] then
+    return redis.call("DEL",KEYS[1])
+end
+return 0
+"""
+
+COMPARE_AND_SET="""
+if redis.call("GET",KEYS[1])~=ARGV[1] then
+    return 0
+end
+if ARGV[3]~="" then
+    redis.call("SET",KEYS[1],ARGV[2],"PX",ARGV[3])
+else
+    redis.call("SET",KEYS[1],ARGV[2],"KEEPTTL")
+end
+return 1
+"""
+
+INCR_CAPPED="""
+local exists=redis.call("EXISTS",KEYS[1])
+local current=tonumber(redis.call("GET",KEYS[1]) or "0")
+local amount=tonumber(ARGV[1])
+if current+amount>tonumber(ARGV[2]) then
+    return false
+end
+local value=redis.call("INCRBY",KEYS[1],amount)
+if exists==0 and ARGV[3]~="" then
+    redis.call("PEXPIRE",KEYS[1],ARGV[3])
+end
+return value
+"""
+
+MGETDEL="""
+local values=redis.call("MGET",unpack(KEYS))
+redis.call("DEL",unpack(KEYS))
+return values
+"""
+
+
+class Script:
+    """Lua script registered in Scripts. The SHA1 is computed locally
+    so the script is called with EVALSHA without a first round trip.
+    """
+
+    def __init__(self,name:str,source:str) -> None:
+        self.name=name
+        self.source=source
+        self.sha=hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+class Scripts:
+    """Registry of server side Lua scripts. Scripts are registered by
+    name and called with EVALSHA; when the server answers NOSCRIPT
+    (first use, restart or SCRIPT FLUSH) the script is loaded and the
+    call retried, so each call costs a single round trip.
+
+    The registry comes with a library of atomic compound operations :
+        - get_or_set : returns the value of a key, setting it first if missing
+        - compare_and_delete : deletes a key only if it holds the expected value
+        - compare_and_set : replaces a value only if it holds the expected value
+        - incr_capped : increments a counter unless it would go over a cap
+        - mgetdel : gets and deletes several keys at once
+
+    Scripts can be queued in a pipeline or a Batch with queue().
+    """
+
+    library={
+        "get_or_set":GET_OR_SET,
+        "compare_and_delete":COMPARE_AND_DELETE,
+        "compare_and_set":COMPARE_AND_SET,
+        "incr_capped":INCR_CAPPED,
+        "mgetdel":MGETDEL,
+    }
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+        self.__scripts={}
+        self.__lock=threading.Lock()
+        for name,source in self.library.items():
+            self.register(name,source)
+
+
+    def register(self,name:str,source:str)->Script:
+        """Registers a Lua script under (name). Nothing is sent to the
+        server until the script is called.
+
+        Args:
+            name (str): name of the script
+            source (str): Lua source
+
+        Returns:
+            Script: registered script
+        """
+        if not isinstance(name,str) or not isinstance(source,str):
+            raise ValueError("Redis scripts : name and source must be strings")
+        script=Script(name,source)
+        with self.__lock:
+            self.__scripts[name]=script
+        return script
+
+
+    def get(self,name:str)->Script:
+        script=self.__scripts.get(name)
+        if script is None:
+            raise KeyError(f"Redis scripts : no script registered as {name}")
+        return script
+
+
+    def names(self)->list:
+        return sorted(self.__scripts)
+
+
+    def load(self,name:str,client=None)->str:
+        """Loads the script in the server script cache
+
+        Returns:
+            str: SHA1 of the script
+        """
+        script=self.get(name)
+        (client or self.__r).script_load(script.source)
+        return script.sha
+
+
+    def call(self,name:str,keys:list=(),args:list=(),client=None):
+        """Runs the script (name) with EVALSHA, loading it on NOSCRIPT.
+
+        Args:
+            name (str): name of the script
+            keys (list, optional): KEYS of the script. Defaults to ().
+            args (list, optional): ARGV of the script. Defaults to ().
+            client (Redis, optional): client to use instead of the one of the registry. Defaults to None.
+
+        Returns:
+            any: reply of the script
+        """
+        script=self.get(name)
+        client=client or self.__r
+        try:
+            return client.evalsha(script.sha,len(keys),*keys,*args)
+        except NoScriptError:
+            self.load(name,client)
+            return client.evalsha(script.sha,len(keys),*keys,*args)
+
+
+    def queue(self,pipe,name:str,keys:list=(),args:list=(),sent:set=None)->None:
+        """Queues the script (name) in a pipeline. A pipeline cannot retry
+        a single command on NOSCRIPT, so the first call of each script in
+        the pipeline is queued with EVAL : the server caches the script in
+        pipeline order, even after a restart or a SCRIPT FLUSH, and the
+        following calls recorded in (sent) use EVALSHA. Without (sent)
+        every call is queued with EVAL.
+
+        Args:
+            pipe (Pipeline): pipeline
+            name (str): name of the script
+            keys (list, optional): KEYS of the script. Defaults to ().
+            args (list, optional): ARGV of the script. Defaults to ().
+            sent (set, optional): SHA1 of the scripts already queued in this pipeline. Defaults to None.
+        """
+        script=self.get(name)
+        if sent is None or script.sha not in sent:
+            if sent is not None:
+                sent.add(script.sha)
+            pipe.eval(script.source,len(keys),*keys,*args)
+            return
+        pipe.evalsha(script.sha,len(keys),*keys,*args)
+
+
+    # ---- library ----------------------------------------------------------
+
+    def get_or_set(self,key:str,value:str,px:int=None)->str:
+        """Returns the value of key. If the key does not exist it is set
+        to (value), with an expiration of (px) milliseconds if given, and
+        (value) is returned. Runs in one round trip.
+
+        Returns:
+            str: current value of the key
+            None: if the operation failed
+        """
+        try:
+            result=self.call("get_or_set",[key],[value,px or ""])
+            return result.decode("utf-8") if isinstance(result,bytes) else result
+        except Exception as err:
+            print(f"Redis get_or_set operation failed : {err}")
+            return None
+
+
+    def compare_and_delete(self,key:str,expected:str)->bool:
+        """Deletes key only if it holds (expected).
+
+        Returns:
+            bool: True if the key was deleted
+        """
+        try:
+            return self.call("compare_and_delete",[key],[expected])==1
+        except Exception as err:
+            print(f"Redis compare_and_delete operation failed : {err}")
+            return False
+
+
+    def compare_and_set(self,key:str,expected:str,value:str,px:int=None)->bool:
+        """Sets key to (value) only if it holds (expected). The ttl of the
+        key is kept unless (px) milliseconds are given.
+
+        Returns:
+            bool: True if the value was replaced
+        """
+        try:
+            return self.call("compare_and_set",[key],[expected,value,px or ""])==1
+        except Exception as err:
+            print(f"Redis compare_and_set operation failed : {err}")
+            return False
+
+
+    def incr_capped(self,key:str,amount:int=1,cap:int=None,px:int=None):
+        """Increments the counter at key by (amount) unless the result
+        would be greater than (cap). A new counter expires after (px)
+        milliseconds if given.
+
+        Returns:
+            int: new value of the counter
+            bool: False if the cap was reached or the operation failed
+        """
+        if cap is None:
+            raise ValueError("Redis incr_capped : cap is required")
+        try:
+            result=self.call("incr_capped",[key],[amount,cap,px or ""])
+            return False if result is None else result
+        except Exception as err:
+            print(f"Redis incr_capped operation failed : {err}")
+            return False
+
+
+    def mgetdel(self,keys:list)->list:
+        """Gets the values of (keys) and deletes them atomically.
+
+        Returns:
+            list: value of each key, None for missing keys
+            None: if the operation failed
+        """
+        if not isinstance(keys,list) or not keys:
+            print("Redis mgetdel operation : keys must be a non empty list")
+            return None
+        try:
+            return self.call("mgetdel",keys)
+        except Exception as err:
+            print(f"Redis mgetdel operation failed : {err}")
+            return None
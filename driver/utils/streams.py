@@ -0,0 +1,333 @@
+import threading
+import time
+from redis import Redis
+from redis.exceptions import ResponseError
+
+
+class StreamProducer:
+    """Buffers messages and adds them to a stream with pipelined XADD
+    commands, one round trip per (batch_size) messages. When (maxlen) is
+    given the stream is trimmed with MAXLEN ~ (approximate trimming,
+    much cheaper for the server than exact trimming).
+
+    Backpressure : when (max_length) is given, flush() waits until
+    the consumers have brought the length of the stream below it.
+
+    Example:
+        with driver.streams.producer("events",maxlen=100000) as producer:
+            for event in events:
+                producer.add({"type":"click","user":"1"})
+    """
+
+    def __init__(self,r:Redis,stream:str,maxlen:int=None,approximate:bool=True,batch_size:int=100,
+    max_length:int=None,backoff:float=0.05) -> None:
+        if not isinstance(stream,str):
+            raise ValueError("Redis stream producer : stream must be a string")
+        if not isinstance(batch_size,int) or batch_size<1:
+            raise ValueError("Redis stream producer : batch_size must be a positive int")
+        self.__r=r
+        self.stream=stream
+        self.maxlen=maxlen
+        self.approximate=approximate
+        self.batch_size=batch_size
+        self.max_length=max_length
+        self.backoff=backoff
+        self.sent=0
+        self.round_trips=0
+        self.throttled=0.0
+        self.__buffer=[]
+        self.__lock=threading.Lock()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self,exc_type,exc,traceback)->None:
+        self.flush()
+
+
+    def __len__(self)->int:
+        return len(self.__buffer)
+
+
+    def add(self,fields:dict)->list:
+        """Buffers a message. The buffer is flushed when it holds
+        (batch_size) messages.
+
+        Args:
+            fields (dict): fields and values of the message
+
+        Returns:
+            list: ids of the flushed messages, empty if nothing was flushed
+        """
+        if not isinstance(fields,dict) or not fields:
+            raise ValueError("Redis stream producer : fields must be a non empty dict")
+        with self.__lock:
+            self.__buffer.append(fields)
+            if len(self.__buffer)<self.batch_size:
+                return []
+            return self.__flush()
+
+
+    def flush(self)->list:
+        """Sends every buffered message in one round trip.
+
+        Returns:
+            list: ids of the added messages, in order
+        """
+        with self.__lock:
+            return self.__flush()
+
+
+    def __flush(self)->list:
+        if not self.__buffer:
+            return []
+        if self.max_length is not None:
+            self.__wait_for_room()
+        pipe=self.__r.pipeline(transaction=False)
+        for fields in self.__buffer:
+            pipe.xadd(self.stream,fields,maxlen=self.maxlen,approximate=self.approximate)
+        ids=pipe.execute()
+        self.round_trips+=1
+        self.sent+=len(self.__buffer)
+        self.__buffer=[]
+        return ids
+
+
+    def __wait_for_room(self)->None:
+        start=time.perf_counter()
+        delay=self.backoff
+        while self.__r.xlen(self.stream)+len(self.__buffer)>self.max_length:
+            time.sleep(delay)
+            delay=min(delay*2,1.0)
+        self.throttled+=time.perf_counter()-start
+
+
+class StreamConsumer:
+    """Member of a consumer group that reads messages in blocks of
+    (count), acknowledges them in bulk and reclaims the messages other
+    consumers left pending for more than (claim_idle) milliseconds with
+    XAUTOCLAIM. Reads wait up to (block) milliseconds for new messages;
+    None makes them return right away.
+
+    Acknowledgements are buffered and sent in the same pipeline as the
+    next read, so a steady consumer needs a single round trip per block
+    of messages. Backpressure : no more than (max_in_flight) messages are
+    held read but not acknowledged; reads are reduced or skipped until
+    the handler catches up.
+
+    Example:
+        consumer=driver.streams.consumer("events","workers","worker-1")
+        consumer.run(lambda id,fields:process(fields),max_messages=1000)
+    """
+
+    def __init__(self,r:Redis,stream:str,group:str,consumer:str,count:int=100,block:int=1000,
+    ack_batch:int=1000,claim_idle:int=60000,max_in_flight:int=1000,start_id:str="0") -> None:
+        if not all(isinstance(name,str) for name in (stream,group,consumer)):
+            raise ValueError("Redis stream consumer : stream, group and consumer must be strings")
+        if not isinstance(count,int) or count<1:
+            raise ValueError("Redis stream consumer : count must be a positive int")
+        self.__r=r
+        self.stream=stream
+        self.group=group
+        self.consumer=consumer
+        self.count=count
+        self.block=block
+        self.ack_batch=ack_batch
+        self.claim_idle=claim_idle
+        self.max_in_flight=max_in_flight
+        self.start_id=start_id
+        self.read_count=0
+        self.acked=0
+        self.reclaimed=0
+        self.round_trips=0
+        self.in_flight=0
+        self.__acks=[]
+        self.__claim_cursor="0-0"
+        self.__group_ready=False
+
+
+    def create_group(self)->bool:
+        """Creates the consumer group, and the stream if missing.
+
+        Returns:
+            bool: True if the group was created, False if it already existed
+        """
+        try:
+            self.__r.xgroup_create(self.stream,self.group,id=self.start_id,mkstream=True)
+            created=True
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+            created=False
+        self.__group_ready=True
+        return created
+
+
+    def read(self,limit:int=None)->list:
+        """Sends the buffered acknowledgements and reads the next block
+        of new messages in the same round trip.
+
+        Args:
+            limit (int, optional): maximum number of messages, below count. Defaults to None.
+
+        Returns:
+            list: (id,fields) tuples
+        """
+        if not self.__group_ready:
+            self.create_group()
+        count=self.__count(limit)
+        if count<=0:
+            self.flush_acks()
+            return []
+        pipe=self.__r.pipeline(transaction=False)
+        acks=self.__take_acks()
+        if acks:
+            pipe.xack(self.stream,self.group,*acks)
+        pipe.xreadgroup(self.group,self.consumer,{self.stream:">"},count=count,block=self.block)
+        replies=pipe.execute()
+        self.round_trips+=1
+        self.acked+=replies[0] if acks else 0
+        messages=replies[-1][0][1] if replies[-1] else []
+        self.read_count+=len(messages)
+        self.in_flight+=len(messages)
+        return messages
+
+
+    def reclaim(self,limit:int=None)->list:
+        """Claims the messages idle for more than claim_idle milliseconds
+        in the pending list of the group with XAUTOCLAIM. Each call
+        continues where the previous one stopped.
+
+        Args:
+            limit (int, optional): maximum number of messages, below count. Defaults to None.
+
+        Returns:
+            list: (id,fields) tuples of the claimed messages
+        """
+        if not self.__group_ready:
+            self.create_group()
+        count=self.__count(limit)
+        if count<=0:
+            return []
+        reply=self.__r.xautoclaim(self.stream,self.group,self.consumer,self.claim_idle,
+            start_id=self.__claim_cursor,count=count)
+        self.round_trips+=1
+        cursor=reply[0]
+        self.__claim_cursor=cursor.decode("utf-8") if isinstance(cursor,bytes) else cursor
+        messages=[message for message in reply[1] if message[0] is not None]
+        self.reclaimed+=len(messages)
+        self.in_flight+=len(messages)
+        return messages
+
+
+    def __count(self,limit:int=None)->int:
+        count=min(self.count,self.max_in_flight-self.in_flight)
+        return count if limit is None else min(count,limit)
+
+
+    def ack(self,*ids)->None:
+        """Buffers acknowledgements. They are sent with the next read,
+        or right away once (ack_batch) are buffered.
+        """
+        self.__acks.extend(ids)
+        self.in_flight=max(self.in_flight-len(ids),0)
+        if len(self.__acks)>=self.ack_batch:
+            self.flush_acks()
+
+
+    def flush_acks(self)->int:
+        """Sends the buffered acknowledgements
+
+        Returns:
+            int: number of messages acknowledged
+        """
+        acks=self.__take_acks()
+        if not acks:
+            return 0
+        acked=self.__r.xack(self.stream,self.group,*acks)
+        self.round_trips+=1
+        self.acked+=acked
+        return acked
+
+
+    def __take_acks(self)->list:
+        acks=self.__acks
+        self.__acks=[]
+        return acks
+
+
+    def run(self,handler,stop:threading.Event=None,max_messages:int=None,reclaim_every:int=10,idle:float=0.1)->int:
+        """Reads and handles messages until (stop) is set or (max_messages)
+        were handled. A message is acknowledged when handler returns
+        without raising; failed messages stay pending and are reclaimed
+        later by a consumer of the group.
+
+        Args:
+            handler (callable): handler(id,fields)
+            stop (threading.Event, optional): event that stops the loop. Defaults to None.
+            Without it a non blocking consumer (block=None) stops when the stream is drained.
+            max_messages (int, optional): number of messages after which the loop stops. Defaults to None.
+            reclaim_every (int, optional): reads between reclaim passes. Defaults to 10.
+            idle (float, optional): seconds a non blocking consumer waits for (stop) after an empty read. Defaults to 0.1.
+
+        Returns:
+            int: number of messages handled
+        """
+        handled=0
+        reads=0
+        try:
+            while (stop is None or not stop.is_set()) and (max_messages is None or handled<max_messages):
+                limit=None if max_messages is None else max_messages-handled
+                messages=self.reclaim(limit) if reclaim_every and reads%reclaim_every==0 else []
+                if not messages:
+                    messages=self.read(limit)
+                reads+=1
+                if not messages and self.block is None:
+                    if stop is None:
+                        break
+                    stop.wait(idle)
+                    continue
+                for message_id,fields in messages:
+                    try:
+                        handler(message_id,fields)
+                    except Exception as err:
+                        print(f"Redis stream consumer : handler failed for {message_id} : {err}")
+                        self.in_flight=max(self.in_flight-1,0)
+                        continue
+                    self.ack(message_id)
+                    handled+=1
+        finally:
+            self.flush_acks()
+        return handled
+
+
+class Streams:
+    """Factory of producers and consumers bound to the connection of the Driver
+    """
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        self.__r=None
+
+
+    def producer(self,stream:str,**kargs)->StreamProducer:
+        """Returns a StreamProducer for (stream). See StreamProducer for the options.
+        """
+        return StreamProducer(self.__r,stream,**kargs)
+
+
+    def consumer(self,stream:str,group:str,consumer:str,**kargs)->StreamConsumer:
+        """Returns a StreamConsumer of (group) for (stream). See StreamConsumer for the options.
+        """
+        return StreamConsumer(self.__r,stream,group,consumer,**kargs)
+
+
+    def length(self,stream:str)->int:
+        """Returns the number of messages in the stream
+        """
+        return self.__r.xlen(stream)
@@ -0,0 +1,588 @@
+import array
+import sys
+from redis import Redis
+from driver.utils.chunks import chunked
+from driver.utils.scan import Scanner
+
+
+# array typecodes of the integer widths read with GETRANGE instead of BITFIELD
+_TYPECODES={8:("B","b"),16:("H","h"),32:("I","i"),64:("Q","q")}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Redis collections : install the numpy package to use numpy=True")
+    return numpy
+
+
+def _plain(values):
+    """Converts a numpy array or an array.array to a list of python values
+    in one call; other iterables are returned as they are
+    """
+    return values.tolist() if hasattr(values,"tolist") else values
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value,bytes) else value
+
+
+class _Collection:
+    """Base of the typed collections : a Redis key and the commands
+    every type shares. Bulk operations send (batch_size) elements per
+    command and every command of one call in one pipeline.
+    """
+
+    def __init__(self,r:Redis,key:str,batch_size:int=1000) -> None:
+        if not isinstance(key,str):
+            raise ValueError(f"Redis {type(self).__name__} : key must be a string")
+        if not isinstance(batch_size,int) or batch_size<1:
+            raise ValueError(f"Redis {type(self).__name__} : batch_size must be a positive int")
+        self._r=r
+        self.key=key
+        self.batch_size=batch_size
+
+
+    def __repr__(self)->str:
+        return f"{type(self).__name__}({self.key!r})"
+
+
+    def exists(self)->bool:
+        return bool(self._r.exists(self.key))
+
+
+    def delete(self)->bool:
+        return bool(self._r.delete(self.key))
+
+
+    def expire(self,seconds:float)->bool:
+        return bool(self._r.pexpire(self.key,max(int(seconds*1000),1)))
+
+
+    def ttl(self)->float:
+        """Returns the seconds to live of the key, None without expiry or key
+        """
+        pttl=self._r.pttl(self.key)
+        return pttl/1000 if pttl>=0 else None
+
+
+    def _batched(self,command:str,items,flatten=None)->list:
+        """Sends command once per batch of items, all in one pipeline
+
+        Returns:
+            list: reply of each batch
+        """
+        pipe=self._r.pipeline(transaction=False)
+        for batch in chunked(items,self.batch_size):
+            pipe.execute_command(command,self.key,*(flatten(batch) if flatten else batch))
+        return pipe.execute() if len(pipe) else []
+
+
+class RedisHash(_Collection):
+    """Hash with a dict-like interface. Fields are str, values are
+    str when decode is True (the default) and bytes otherwise. Iteration
+    is lazy, with HSCAN pages of (count) fields.
+
+    Example:
+        profile=driver.structures.hash("user:1")
+        profile.update({"name":"Ada","visits":"0"})
+        profile.increment("visits")
+        for field,value in profile.items():
+            ...
+    """
+
+    def __init__(self,r:Redis,key:str,decode:bool=True,batch_size:int=1000) -> None:
+        super().__init__(r,key,batch_size)
+        self.decode=decode
+
+
+    def __value(self,value):
+        return _decode(value) if self.decode else value
+
+
+    def __getitem__(self,field:str):
+        value=self._r.hget(self.key,field)
+        if value is None:
+            raise KeyError(field)
+        return self.__value(value)
+
+
+    def __setitem__(self,field:str,value)->None:
+        self._r.hset(self.key,field,value)
+
+
+    def __delitem__(self,field:str)->None:
+        if not self._r.hdel(self.key,field):
+            raise KeyError(field)
+
+
+    def __contains__(self,field:str)->bool:
+        return bool(self._r.hexists(self.key,field))
+
+
+    def __len__(self)->int:
+        return self._r.hlen(self.key)
+
+
+    def __iter__(self):
+        return (field for field,_ in self.items())
+
+
+    def get(self,field:str,default=None):
+        value=self._r.hget(self.key,field)
+        return default if value is None else self.__value(value)
+
+
+    def items(self,match:str=None,count:int=1000):
+        """Iterates over (field,value) pairs with HSCAN, one page at a time
+        """
+        for field,value in Scanner(self._r,"HSCAN",key=self.key,match=match,count=count):
+            yield field,self.__value(value)
+
+
+    def update(self,items)->int:
+        """Sets the fields of a dict or an iterable of (field,value) pairs,
+        (batch_size) fields per HSET
+
+        Returns:
+            int: number of new fields
+        """
+        pairs=items.items() if hasattr(items,"items") else items
+        return sum(self._batched("HSET",pairs,lambda batch:[item for pair in batch for item in pair]))
+
+
+    def get_many(self,fields)->list:
+        """Returns the values of fields in order, None for missing fields,
+        with one HMGET per (batch_size) fields in one round trip
+        """
+        return [self.__value(value) if value is not None else None
+            for reply in self._batched("HMGET",_plain(fields)) for value in reply]
+
+
+    def increment(self,field:str,amount=1):
+        """Adds amount to the number stored in field (HINCRBY, or
+        HINCRBYFLOAT for a float amount)
+
+        Returns:
+            int: new value, float for a float amount
+        """
+        if isinstance(amount,float):
+            return float(self._r.hincrbyfloat(self.key,field,amount))
+        return self._r.hincrby(self.key,field,amount)
+
+
+    def to_dict(self)->dict:
+        return dict(self.items())
+
+
+class RedisSet(_Collection):
+    """Set of str members. Membership tests of many members use one
+    SMISMEMBER per (batch_size) members, iteration is lazy with SSCAN.
+    """
+
+    def __contains__(self,member:str)->bool:
+        return bool(self._r.sismember(self.key,member))
+
+
+    def __len__(self)->int:
+        return self._r.scard(self.key)
+
+
+    def __iter__(self):
+        return iter(Scanner(self._r,"SSCAN",key=self.key))
+
+
+    def add(self,*members)->int:
+        return self._r.sadd(self.key,*members) if members else 0
+
+
+    def discard(self,*members)->int:
+        return self._r.srem(self.key,*members) if members else 0
+
+
+    def add_many(self,members)->int:
+        """Adds the members of any iterable or array, (batch_size) per SADD
+
+        Returns:
+            int: number of new members
+        """
+        return sum(self._batched("SADD",_plain(members)))
+
+
+    def contains_many(self,members)->list:
+        """Returns, for each member, whether it belongs to the set
+        """
+        return [bool(found) for reply in self._batched("SMISMEMBER",_plain(members)) for found in reply]
+
+
+    def members(self,match:str=None,count:int=1000)->Scanner:
+        return Scanner(self._r,"SSCAN",key=self.key,match=match,count=count)
+
+
+class RedisSortedSet(_Collection):
+    """Sorted set of str members and float scores. Bulk adds take
+    parallel arrays of members and scores; range reads are lazy and
+    fetch (page_size) members per ZRANGE.
+
+    Example:
+        ranking=driver.structures.sorted_set("ranking")
+        ranking.add_many(players,numpy_scores)
+        top=list(ranking.range(0,9,desc=True))
+        for member,score in ranking.range_by_score(100,"+inf"):
+            ...
+    """
+
+    def __contains__(self,member:str)->bool:
+        return self._r.zscore(self.key,member) is not None
+
+
+    def __len__(self)->int:
+        return self._r.zcard(self.key)
+
+
+    def __iter__(self):
+        return iter(Scanner(self._r,"ZSCAN",key=self.key))
+
+
+    def add(self,member:str,score:float)->bool:
+        return bool(self._r.zadd(self.key,{member:score}))
+
+
+    def add_many(self,members,scores=None)->int:
+        """Adds members with their scores, (batch_size) pairs per ZADD.
+        members can be a dict of member:score, or an iterable paired with
+        the iterable or array (scores).
+
+        Returns:
+            int: number of new members
+        """
+        if scores is None:
+            members,scores=list(members.keys()),list(members.values())
+        members,scores=list(_plain(members)),list(_plain(scores))
+        if len(members)!=len(scores):
+            raise ValueError("Redis RedisSortedSet : members and scores must have the same length")
+        def flatten(batch):
+            arguments=[None]*(2*len(batch))
+            arguments[0::2]=[score for score,_ in batch]
+            arguments[1::2]=[member for _,member in batch]
+            return arguments
+        return sum(self._batched("ZADD",zip(scores,members),flatten))
+
+
+    def remove(self,*members)->int:
+        return self._r.zrem(self.key,*members) if members else 0
+
+
+    def score(self,member:str)->float:
+        return self._r.zscore(self.key,member)
+
+
+    def scores(self,members,numpy:bool=False):
+        """Returns the scores of members in order, with one ZMSCORE per
+        (batch_size) members in one round trip
+
+        Returns:
+            list: scores, None for missing members
+            numpy.ndarray: float64 scores, nan for missing members, with numpy=True
+        """
+        values=[None if score is None else float(score)
+            for reply in self._batched("ZMSCORE",_plain(members)) for score in reply]
+        if numpy:
+            return _numpy().array([float("nan") if value is None else value for value in values],dtype="float64")
+        return values
+
+
+    def increment(self,member:str,amount:float=1.0)->float:
+        return self._r.zincrby(self.key,amount,member)
+
+
+    def range(self,start:int=0,stop:int=-1,desc:bool=False,page_size:int=1000):
+        """Iterates over (member,score) pairs by rank, from start to stop
+        included (negative ranks count from the end)
+
+        Yields:
+            tuple: (member,score)
+        """
+        if start<0 or stop<0:
+            size=len(self)
+            start=max(size+start,0) if start<0 else start
+            stop=size+stop if stop<0 else stop
+        while start<=stop:
+            last=min(start+page_size-1,stop)
+            page=self.__zrange(start,last,*(("REV",) if desc else ()))
+            yield from page
+            if len(page)<last-start+1:
+                return
+            start=last+1
+
+
+    def range_by_score(self,min="-inf",max="+inf",desc:bool=False,page_size:int=1000):
+        """Iterates over (member,score) pairs with min <= score <= max
+        (bounds can be "-inf", "+inf" or "(value" for exclusive ones).
+        Pages continue from the last score read rather than from an
+        offset, so the server does not walk the members already read.
+
+        Yields:
+            tuple: (member,score)
+        """
+        bound=max if desc else min
+        skip=0
+        while True:
+            pairs=self.__zrange(bound,min if desc else max,"BYSCORE",*(("REV",) if desc else ()),"LIMIT",skip,page_size)
+            yield from pairs
+            if len(pairs)<page_size:
+                return
+            last=pairs[-1][1]
+            same=0
+            for _,score in reversed(pairs):
+                if score!=last:
+                    break
+                same+=1
+            skip=skip+same if same==len(pairs) and bound==repr(last) else same
+            bound=repr(last)
+
+
+    def __zrange(self,start,stop,*options)->list:
+        """ZRANGE of Redis 6.2 (BYSCORE, REV and LIMIT in one command)
+
+        Returns:
+            list: (member,score) pairs
+        """
+        reply=self._r.execute_command("ZRANGE",self.key,start,stop,*options,"WITHSCORES")
+        return [(_decode(reply[index]),float(reply[index+1])) for index in range(0,len(reply),2)]
+
+
+    def pages(self,page_size:int=1000,numpy:bool=False):
+        """Iterates over the whole set by rank, one page at a time
+
+        Yields:
+            tuple: (members list, scores list or float64 numpy array)
+        """
+        start=0
+        while True:
+            page=self.__zrange(start,start+page_size-1)
+            if not page:
+                return
+            members=[member for member,_ in page]
+            scores=[score for _,score in page]
+            yield members,(_numpy().array(scores,dtype="float64") if numpy else scores)
+            if len(page)<page_size:
+                return
+            start+=page_size
+
+
+class RedisBitmap(_Collection):
+    """Bitmap stored in a string. Bits of many offsets are read and set
+    with one BITFIELD per (batch_size) offsets, and packed integers of
+    any width are read in bulk into arrays : widths of 8, 16, 32 or 64
+    bits at aligned positions are read as raw bytes with GETRANGE, the
+    others with BITFIELD GET.
+
+    Example:
+        seen=driver.structures.bitmap("seen:2024-01-01")
+        seen.set_many(user_ids)
+        flags=seen.get_many(user_ids)
+        counters=driver.structures.bitmap("counters")
+        counters.write_ints([1,2,3],width=16)
+        counters.read_ints(3,width=16)
+    """
+
+    def __len__(self)->int:
+        """Returns the number of bits set
+        """
+        return self._r.bitcount(self.key)
+
+
+    def get(self,offset:int)->int:
+        return self._r.getbit(self.key,offset)
+
+
+    def set(self,offset:int,value:int=1)->int:
+        """Returns the previous bit
+        """
+        return self._r.setbit(self.key,offset,value)
+
+
+    def count(self,start:int=None,end:int=None)->int:
+        """Bits set between the bytes start and end, included
+        """
+        if start is None:
+            return self._r.bitcount(self.key)
+        return self._r.bitcount(self.key,start,-1 if end is None else end)
+
+
+    def get_many(self,offsets)->list:
+        """Returns the bits at offsets, in order
+        """
+        return [bit for reply in self._batched("BITFIELD_RO",_plain(offsets),
+            lambda batch:[item for offset in batch for item in ("GET","u1",offset)]) for bit in reply]
+
+
+    def set_many(self,offsets,value:int=1)->list:
+        """Sets the bits at offsets to value
+
+        Returns:
+            list: previous bits, in order
+        """
+        return [bit for reply in self._batched("BITFIELD",_plain(offsets),
+            lambda batch:[item for offset in batch for item in ("SET","u1",offset,value)]) for bit in reply]
+
+
+    def read_ints(self,count:int,width:int=8,signed:bool=False,start:int=0,numpy:bool=False):
+        """Reads (count) consecutive integers of (width) bits from the
+        integer number (start), as packed by write_ints or BITFIELD #index
+
+        Returns:
+            array.array: integers (list for widths without an array type)
+            numpy.ndarray: with numpy=True
+        """
+        if not 1<=width<=64:
+            raise ValueError("Redis RedisBitmap : width must be between 1 and 64")
+        if width in _TYPECODES:
+            data=self._r.getrange(self.key,start*width//8,(start+count)*width//8-1) if count else b""
+            data=data.ljust(count*width//8,b"\0")
+            typecode=_TYPECODES[width][signed]
+            if numpy:
+                return _numpy().frombuffer(data,dtype=f">{'i' if signed else 'u'}{width//8}").astype(f"{'i' if signed else 'u'}{width//8}")
+            values=array.array(typecode)
+            values.frombytes(data)
+            if sys.byteorder=="little" and width>8:
+                values.byteswap()
+            return values
+        encoding=f"{'i' if signed else 'u'}{width}"
+        values=[value for reply in self._batched("BITFIELD_RO",range(start,start+count),
+            lambda batch:[item for index in batch for item in ("GET",encoding,f"#{index}")]) for value in reply]
+        if numpy:
+            return _numpy().array(values,dtype="int64" if signed or width<64 else "uint64")
+        typecode="q" if signed else "Q"
+        return array.array(typecode,values)
+
+
+    def write_ints(self,values,width:int=8,signed:bool=False,start:int=0)->int:
+        """Writes integers of (width) bits from the integer number (start)
+
+        Returns:
+            int: number of integers written
+        """
+        values=_plain(values)
+        if width in _TYPECODES:
+            packed=array.array(_TYPECODES[width][signed],values)
+            if sys.byteorder=="little" and width>8:
+                packed.byteswap()
+            self._r.setrange(self.key,start*width//8,packed.tobytes())
+            return len(packed)
+        encoding=f"{'i' if signed else 'u'}{width}"
+        written=0
+        def flatten(batch):
+            nonlocal written
+            arguments=[item for offset,value in batch for item in ("SET",encoding,f"#{offset}",value)]
+            written+=len(batch)
+            return arguments
+        self._batched("BITFIELD",enumerate(values,start),flatten)
+        return written
+
+
+    def ones(self,page_bytes:int=65536):
+        """Iterates over the offsets of the bits set, reading (page_bytes)
+        bytes per GETRANGE
+        """
+        position=0
+        while True:
+            data=self._r.getrange(self.key,position,position+page_bytes-1)
+            for index,byte in enumerate(data):
+                if byte:
+                    base=(position+index)*8
+                    for bit in range(8):
+                        if byte&(0x80>>bit):
+                            yield base+bit
+            if len(data)<page_bytes:
+                return
+            position+=page_bytes
+
+
+class RedisHLL(_Collection):
+    """HyperLogLog : approximate count of distinct elements in 12 kB
+    (standard error 0.81%). Large streams of elements are added with
+    one PFADD per (batch_size) elements and (pipeline_depth) PFADD per
+    round trip, holding one round trip of elements in memory.
+
+    Example:
+        visitors=driver.structures.hll("visitors:2024-01-01")
+        visitors.add_many(line.split()[0] for line in open("access.log"))
+        len(visitors)
+    """
+
+    def __init__(self,r:Redis,key:str,batch_size:int=1000,pipeline_depth:int=10) -> None:
+        super().__init__(r,key,batch_size)
+        self.pipeline_depth=pipeline_depth
+
+
+    def __len__(self)->int:
+        return self._r.pfcount(self.key)
+
+
+    def add(self,*elements)->bool:
+        """Returns True if the estimated cardinality changed
+        """
+        return bool(self._r.pfadd(self.key,*elements))
+
+
+    def add_many(self,elements)->bool:
+        """Adds the elements of any iterable, array or generator
+
+        Returns:
+            bool: True if the estimated cardinality changed
+        """
+        changed=False
+        for group in chunked(chunked(_plain(elements),self.batch_size),self.pipeline_depth):
+            pipe=self._r.pipeline(transaction=False)
+            for batch in group:
+                pipe.pfadd(self.key,*batch)
+            changed=any(pipe.execute()) or changed
+        return changed
+
+
+    def count(self,*others)->int:
+        """Estimated number of distinct elements of this HyperLogLog and
+        the (others), RedisHLL or keys
+        """
+        return self._r.pfcount(self.key,*(getattr(other,"key",other) for other in others))
+
+
+    def merge(self,*others)->None:
+        """Merges the (others), RedisHLL or keys, into this one
+        """
+        self._r.pfmerge(self.key,*(getattr(other,"key",other) for other in others))
+
+
+class Structures:
+    """Factory of typed collections bound to the connection of the Driver
+    """
+
+    def __init__(self,r:Redis) -> None:
+        self.__r=r
+
+
+    def close(self):
+        self.__r=None
+
+
+    def hash(self,key:str,**kargs)->RedisHash:
+        return RedisHash(self.__r,key,**kargs)
+
+
+    def set(self,key:str,**kargs)->RedisSet:
+        return RedisSet(self.__r,key,**kargs)
+
+
+    def sorted_set(self,key:str,**kargs)->RedisSortedSet:
+        return RedisSortedSet(self.__r,key,**kargs)
+
+
+    def bitmap(self,key:str,**kargs)->RedisBitmap:
+        return RedisBitmap(self.__r,key,**kargs)
+
+
+    def hll(self,key:str,**kargs)->RedisHLL:
+        return RedisHLL(self.__r,key,**kargs)
@@ -1,4 +1,9 @@
+import random
+import time
 from redis import Redis 
+from driver.utils.metrics import Histogram
+from driver.utils.monitor import MonitorConsumer
+from driver.utils.scan import Scanner
 
 class Test:
 
@@ -6,10 +11,12 @@ class Test:
         self.__r=r
 
 
-    def close(self):
-        """Close connection and kills the client object
+    def close(self,quit:bool=True):
+        """Close connection and kills the client object. With quit=False
+        the connection is left to its owner.
         """
-        self.__r.quit()
+        if quit:
+            self.__r.quit()
         self.__r=None
 
     
@@ -84,4 +91,305 @@ class Test:
         Returns:
             list: List of actons perfomed in the server.
         """
-        return self.__r.monitor()
\ No newline at end of file
+        return self.__r.monitor()
+
+
+    def monitor(self,**options)->MonitorConsumer:
+        """Returns a MonitorConsumer reading the MONITOR stream on its own
+        connection, with filters, rolling aggregates and hot keys.
+        Unlike get_actions_registry its cost is bounded by max_seconds
+        and max_events. See MonitorConsumer for the options.
+
+        Example:
+            monitor=driver.test.monitor(commands=["GET","SET"],max_seconds=5).start()
+            monitor.wait()
+            monitor.stats()["hot_keys"]
+
+        Returns:
+            MonitorConsumer: consumer, started with start(), run() or run_async()
+        """
+        return MonitorConsumer(self.__r.connection_pool,**options)
+
+
+    def memory_profiler(self,**options)->"MemoryProfiler":
+        """Returns a MemoryProfiler of the current database. Iterating 
+        over it streams the partial report after every page of keys.
+        See MemoryProfiler for the options.
+
+        Example:
+            for report in driver.test.memory_profiler(sample=0.1,max_keys_per_second=5000):
+                print(report.keys_profiled,report.estimated_bytes)
+        """
+        return MemoryProfiler(self.__r,**options)
+
+
+    def profile_memory(self,progress=None,**options)->"MemoryReport":
+        """Profiles the memory of the keyspace grouped by key prefix.
+        See MemoryProfiler for the options.
+
+        Example:
+            report=driver.test.profile_memory(depth=2,sample=0.05)
+            report.top(10)
+
+        Args:
+            progress (callable, optional): progress(report) called after every page. Defaults to None.
+
+        Returns:
+            MemoryReport: memory used by each group of keys
+        """
+        return MemoryProfiler(self.__r,**options).run(progress)
+
+
+class GroupStats:
+    """Memory used by the keys of one prefix
+    """
+
+    def __init__(self) -> None:
+        self.keys=0
+        self.bytes=0
+        self.max_bytes=0
+        self.max_key=None
+        self.volatile=0
+        self.types={}
+        self.sizes=Histogram()
+
+
+    def add(self,key:str,size:int,type:str,ttl:int)->None:
+        self.keys+=1
+        self.bytes+=size
+        self.sizes.record(size)
+        self.types[type]=self.types.get(type,0)+1
+        self.volatile+=ttl>=0
+        if size>self.max_bytes:
+            self.max_bytes=size
+            self.max_key=key
+
+
+class MemoryReport:
+    """Result of a MemoryProfiler pass. With sampling, estimated_bytes 
+    and estimated_keys extrapolate the profiled keys to the whole keyspace.
+    """
+
+    def __init__(self,sample:float) -> None:
+        self.sample=sample
+        self.keys_scanned=0
+        self.keys_profiled=0
+        self.bytes=0
+        self.pages=0
+        self.elapsed=0.0
+        self.done=False
+        self.groups={}
+        self.total=GroupStats()
+
+
+    @property
+    def estimated_bytes(self)->int:
+        return round(self.bytes/self.sample)
+
+
+    @property
+    def estimated_keys(self)->int:
+        return round(self.keys_profiled/self.sample)
+
+
+    def add(self,group:str,key:str,size:int,type:str,ttl:int)->None:
+        stats=self.groups.get(group)
+        if stats is None:
+            stats=self.groups[group]=GroupStats()
+        stats.add(key,size,type,ttl)
+        self.total.add(key,size,type,ttl)
+        self.keys_profiled+=1
+        self.bytes+=size
+
+
+    def top(self,n:int=20,by:str="bytes")->list:
+        """Returns the (n) largest groups
+
+        Args:
+            n (int, optional): number of groups. Defaults to 20.
+            by (str, optional): "bytes", "keys" or "max_bytes". Defaults to "bytes".
+
+        Returns:
+            list: dicts with prefix, keys, bytes, estimated_bytes, share, mean_bytes,
+            p50_bytes, p99_bytes, max_bytes, max_key, volatile and types
+        """
+        if by not in ("bytes","keys","max_bytes"):
+            raise ValueError("Redis memory report : by must be bytes, keys or max_bytes")
+        groups=sorted(self.groups.items(),key=lambda item:getattr(item[1],by),reverse=True)[:n]
+        return [{
+            "prefix":prefix,
+            "keys":stats.keys,
+            "bytes":stats.bytes,
+            "estimated_bytes":round(stats.bytes/self.sample),
+            "share":stats.bytes/self.bytes if self.bytes else 0.0,
+            "mean_bytes":round(stats.sizes.mean()),
+            "p50_bytes":stats.sizes.percentile(50),
+            "p99_bytes":stats.sizes.percentile(99),
+            "max_bytes":stats.max_bytes,
+            "max_key":stats.max_key,
+            "volatile":stats.volatile,
+            "types":dict(stats.types),
+        } for prefix,stats in groups]
+
+
+    def size_histogram(self,prefix:str=None)->list:
+        """Returns the number of keys per power of two size range
+
+        Args:
+            prefix (str, optional): group of keys, every key if None. Defaults to None.
+
+        Returns:
+            list: (low,high,keys) tuples, sizes in bytes, low inclusive and high exclusive
+        """
+        stats=self.total if prefix is None else self.groups.get(prefix)
+        if stats is None:
+            return []
+        bins={}
+        for index,count in stats.sizes.buckets.items():
+            bits=stats.sizes.lower_bound(index).bit_length()
+            bins[bits]=bins.get(bits,0)+count
+        return [((1<<bits)>>1,1<<bits,bins[bits]) for bits in sorted(bins)]
+
+
+    def to_dict(self,n:int=20)->dict:
+        return {
+            "keys_scanned":self.keys_scanned,
+            "keys_profiled":self.keys_profiled,
+            "bytes":self.bytes,
+            "estimated_keys":self.estimated_keys,
+            "estimated_bytes":self.estimated_bytes,
+            "pages":self.pages,
+            "elapsed":self.elapsed,
+            "done":self.done,
+            "top":self.top(n),
+            "sizes":self.size_histogram(),
+        }
+
+
+class MemoryProfiler:
+    """Profiles the memory of the keyspace without blocking the server.
+    Keys are walked with SCAN and their MEMORY USAGE, TYPE and PTTL are
+    fetched with one pipeline per (batch_size) keys. Each key is counted
+    in a group : the longest of (prefixes) it starts with, or the first 
+    (depth) parts of the key split by (delimiter).
+
+    With (sample) below 1 only that fraction of the scanned keys is 
+    profiled and the totals are extrapolated. (max_keys_per_second)
+    caps the rate of scanned keys, and so of profiled keys, so the
+    profiler can run against a production server without hurting its
+    latency.
+
+    Args:
+        r (Redis): connection
+        match (str, optional): only profile the keys matching this pattern. Defaults to None.
+        delimiter (str, optional): separator of the parts of the keys. Defaults to ":".
+        depth (int, optional): number of parts in a prefix. Defaults to 1.
+        prefixes (list, optional): explicit prefixes, used instead of delimiter and depth. Defaults to None.
+        sample (float, optional): fraction of keys profiled, between 0 and 1. Defaults to 1.0.
+        count (int, optional): SCAN COUNT hint. Defaults to 1000.
+        batch_size (int, optional): keys per pipeline. Defaults to 500.
+        max_keys_per_second (int, optional): rate limit of the scanned keys. Defaults to None.
+        samples (int, optional): SAMPLES of MEMORY USAGE for collections, server default if None. Defaults to None.
+        seed (int, optional): seed of the sampling. Defaults to None.
+    """
+
+    other="(other)"
+
+    def __init__(self,r:Redis,match:str=None,delimiter:str=":",depth:int=1,prefixes:list=None,
+    sample:float=1.0,count:int=1000,batch_size:int=500,max_keys_per_second:int=None,samples:int=None,seed:int=None) -> None:
+        if not isinstance(sample,(int,float)) or not 0<sample<=1:
+            raise ValueError("Redis memory profiler : sample must be in (0,1]")
+        if not isinstance(depth,int) or depth<1:
+            raise ValueError("Redis memory profiler : depth must be a positive int")
+        if not isinstance(batch_size,int) or batch_size<1:
+            raise ValueError("Redis memory profiler : batch_size must be a positive int")
+        if max_keys_per_second is not None and max_keys_per_second<=0:
+            raise ValueError("Redis memory profiler : max_keys_per_second must be positive")
+        self.__r=r
+        self.match=match
+        self.delimiter=delimiter
+        self.depth=depth
+        self.prefixes=sorted(prefixes,key=len,reverse=True) if prefixes else None
+        self.sample=sample
+        self.count=count
+        self.batch_size=batch_size
+        self.max_keys_per_second=max_keys_per_second
+        self.samples=samples
+        self.__random=random.Random(seed)
+
+
+    def __iter__(self):
+        report=MemoryReport(self.sample)
+        start=time.perf_counter()
+        scanner=Scanner(self.__r,"SCAN",match=self.match,count=self.count,prefetch=False,decode=False)
+        for page in scanner.pages():
+            report.keys_scanned+=len(page)
+            keys=page if self.sample>=1 else [key for key in page if self.__random.random()<self.sample]
+            for offset in range(0,len(keys),self.batch_size):
+                self.__profile(report,keys[offset:offset+self.batch_size])
+                self.__throttle(report.keys_profiled,start)
+            # pages where few or no keys are sampled still send SCAN
+            self.__throttle(report.keys_scanned,start)
+            report.pages+=1
+            report.elapsed=time.perf_counter()-start
+            yield report
+        report.done=True
+        yield report
+
+
+    def run(self,progress=None)->MemoryReport:
+        """Profiles the whole keyspace
+
+        Args:
+            progress (callable, optional): progress(report) called after every page. Defaults to None.
+
+        Returns:
+            MemoryReport: final report
+        """
+        report=None
+        for report in self:
+            if progress is not None and not report.done:
+                progress(report)
+        return report
+
+
+    def group(self,key:str)->str:
+        """Returns the group of (key)
+        """
+        if self.prefixes is not None:
+            for prefix in self.prefixes:
+                if key.startswith(prefix):
+                    return prefix
+            return self.other
+        parts=key.split(self.delimiter,self.depth)
+        if len(parts)==1:
+            return self.other
+        # the last part of a key is its name, never part of its prefix
+        return self.delimiter.join(parts[:self.depth] if len(parts)>self.depth else parts[:-1])+self.delimiter
+
+
+    def __profile(self,report:MemoryReport,keys:list)->None:
+        pipe=self.__r.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key,samples=self.samples)
+            pipe.type(key)
+            pipe.pttl(key)
+        replies=pipe.execute(raise_on_error=False)
+        for index,key in enumerate(keys):
+            size,type,ttl=replies[index*3:index*3+3]
+            if not isinstance(size,int) or isinstance(type,Exception):
+                continue
+            type=type.decode("utf-8") if isinstance(type,bytes) else type
+            if type=="none":
+                continue
+            # keys are scanned as bytes : a key that is not UTF-8 is grouped under its escaped name
+            name=key.decode("utf-8","backslashreplace") if isinstance(key,bytes) else key
+            report.add(self.group(name),name,size,type,ttl if isinstance(ttl,int) else -1)
+
+
+    def __throttle(self,keys:int,start:float)->None:
+        if self.max_keys_per_second is None:
+            return
+        delay=keys/self.max_keys_per_second-(time.perf_counter()-start)
+        if delay>0:
+            time.sleep(delay)
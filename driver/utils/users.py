@@ -1,5 +1,8 @@
 from redis import Redis
+from redis.exceptions import RedisError
 from typing import List,NewType
+from driver.utils.chunks import chunked
+from driver.utils.acl import AclCache,AclSnapshot,ProvisionReport,UserSpec
 
 class Users:
     """Contains commands related with the management of users 
@@ -7,16 +10,22 @@ class Users:
         - users_list : Returns a list with the current users
         - add_user : Adds a new user to the database and grants permissions
         - categories_list : Diplay commands categories.
+        - provision : applies a desired set of users, sending only the changes
+        - acl_snapshot : parsed and indexed copy of the ACL, refreshed cheaply
+        - can : checks a command against the ACL snapshot without a round trip
     """
     stringlist=NewType("list[str]",List[str])
     def __init__(self,r:Redis) -> None:
         self.__r=r 
+        self.__acl=AclCache()
 
         
-    def close(self):
-        """Close connection and kills the client object
+    def close(self,quit:bool=True):
+        """Close connection and kills the client object. With quit=False
+        the connection is left to its owner.
         """
-        self.__r.quit()
+        if quit:
+            self.__r.quit()
         self.__r=None
 
 
@@ -100,6 +109,7 @@ class Users:
             commands=commands,
             keys=keys
             )
+        self.__acl.invalidate()
 
 
     def categories_list(self,category:str=None)->stringlist:
@@ -142,7 +152,8 @@ class Users:
         if not isinstance(users,list):
             print("Redis users delete_users : Argument users must be a list ")
             return 0
-        return self.__r.acl_deluser(users)
+        self.__acl.invalidate()
+        return self.__r.acl_deluser(*users)
     
 
     def get_basic_commands(self)->stringlist:
@@ -155,4 +166,104 @@ class Users:
             list[str]: list of commands
         """
         return ["+set","+get","+mset","+mget","+getdel"]
-        
\ No newline at end of file
+        
+
+
+    def provision(self,users:list,delete_missing:bool=False,protected:tuple=("default",),batch_size:int=100,
+    dry_run:bool=False)->ProvisionReport:
+        """Makes the users of the server match (users) : the desired state
+        is compared with the current ACL and only new or different users
+        are sent, with ACL SETUSER reset ..., (batch_size) commands per
+        pipeline. With delete_missing the users absent from (users) are
+        deleted, except the (protected) ones.
+
+        Example:
+            report=driver.users.provision([
+                UserSpec("tenant:1",password=secret,categories=["+read"],keys=["tenant:1:*"]),
+                {"username":"tenant:2","password":other,"commands":["+get"],"keys":["tenant:2:*"]},
+            ],delete_missing=True)
+            report.summary()
+
+        Args:
+            users (list): UserSpec or dicts of UserSpec arguments
+            delete_missing (bool, optional): delete the other users. Defaults to False.
+            protected (tuple, optional): users never deleted. Defaults to ("default",).
+            batch_size (int, optional): commands per round trip. Defaults to 100.
+            dry_run (bool, optional): only compute the report. Defaults to False.
+
+        Returns:
+            ProvisionReport: users created, updated, unchanged, deleted and errors
+            None: if the current ACL could not be read
+        """
+        try:
+            specs=[user if isinstance(user,UserSpec) else UserSpec(**user) for user in users]
+        except (TypeError,ValueError) as err:
+            print(f"Redis users provision : invalid user : {err}")
+            return None
+        snapshot=self.acl_snapshot(max_age=0)
+        if snapshot is None:
+            return None
+        report=ProvisionReport()
+        commands=[]
+        for spec in specs:
+            current=snapshot.users.get(spec.username)
+            if current is not None and spec.matches(current):
+                report.unchanged.append(spec.username)
+                continue
+            (report.created if current is None else report.updated).append(spec.username)
+            commands.append((spec.username,("ACL","SETUSER",spec.username,*spec.rules())))
+        if delete_missing:
+            desired={spec.username for spec in specs}
+            for name in sorted(set(snapshot.users)-desired-set(protected)):
+                report.deleted.append(name)
+                commands.append((name,("ACL","DELUSER",name)))
+        if dry_run or not commands:
+            return report
+        for batch in chunked(commands,batch_size):
+            pipe=self.__r.pipeline(transaction=False)
+            for _,command in batch:
+                pipe.execute_command(*command)
+            try:
+                replies=pipe.execute(raise_on_error=False)
+            except RedisError as err:
+                replies=[err]*len(batch)
+            report.round_trips+=1
+            for (name,_),reply in zip(batch,replies):
+                if isinstance(reply,Exception):
+                    report.errors[name]=str(reply)
+        for names in (report.created,report.updated,report.deleted):
+            names[:]=[name for name in names if name not in report.errors]
+        self.__acl.invalidate()
+        return report
+
+
+    def acl_snapshot(self,max_age:float=60.0)->AclSnapshot:
+        """Returns the parsed ACL of the server (users, their categories,
+        commands and key patterns, with indexes by category and command).
+        The snapshot is refreshed when it is older than (max_age) seconds,
+        with one ACL LIST; ACL CAT is only sent for new categories.
+
+        Returns:
+            AclSnapshot: snapshot, also used by can
+            None: if the ACL could not be read
+        """
+        try:
+            return self.__acl.get(self.__r,max_age)
+        except RedisError as err:
+            print(f"Redis users acl_snapshot operation failed : {err}")
+            return None
+
+
+    def can(self,username:str,command:str,key:str=None,channel:str=None,access:str=None,max_age:float=60.0)->bool:
+        """Returns True if (username) may run (command) on (key) or
+        (channel), evaluated in process on the ACL snapshot : no round
+        trip unless the snapshot is older than (max_age) seconds.
+        See AclSnapshot.can.
+
+        Example:
+            driver.users.can("tenant:1","set","tenant:1:profile")
+        """
+        snapshot=self.acl_snapshot(max_age)
+        if snapshot is None:
+            return False
+        return snapshot.can(username,command,key,channel,access)
@@ -1,9 +1,26 @@
 from driver import Driver
+from benchmarks.standin import StandinServer
 import os
 import pytest
+import redis
 
 redis_driver = Driver()
 
 @pytest.fixture
 def driver_instance():
-    return redis_driver.get_instance()
\ No newline at end of file
+    return redis_driver.get_instance()
+
+
+@pytest.fixture(scope="session")
+def standin_server():
+    with StandinServer() as server:
+        yield server
+
+
+@pytest.fixture
+def standin_redis(standin_server:StandinServer):
+    r=redis.Redis(port=standin_server.port)
+    r.flushall()
+    standin_server.reset_counters()
+    yield r
+    r.connection_pool.disconnect()
@@ -0,0 +1,78 @@
+import asyncio
+import redis.asyncio as redis
+from driver.aio import AsyncDriver
+from driver.aio.client import Client
+from driver.aio.test import Test as AsyncTest
+from driver.aio.users import Users
+
+
+def test_async_driver_concurrent_lookups(standin_server,standin_redis):
+    """Thousands of concurrent commands share a small connection pool
+    """
+    async def scenario():
+        driver=AsyncDriver.get_instance()
+        assert await driver.connect(port=standin_server.port,max_connections=20) is True
+        assert await driver.commands.mset({f"key:{index}":str(index) for index in range(2000)}) is True
+        values=await asyncio.gather(*[driver.commands.get(f"key:{index}") for index in range(2000)])
+        assert values==[str(index) for index in range(2000)]
+        assert await driver.commands.set("key",1) is False
+        assert await driver.commands.getdel("missing") is False
+        assert await driver.close() is True
+    asyncio.run(scenario())
+
+
+def test_async_client_helper(standin_server,standin_redis):
+    """The async Client names, describes, lists and kills connections
+    """
+    async def scenario():
+        r=redis.Redis(port=standin_server.port)
+        client=Client(r)
+        await client.set_client_name("async-worker")
+        info=await client.get_client_info()
+        assert set(info)=={"id","addr","laddr","fd","name","db"} and info["name"]=="async-worker"
+        assert await client.get_client_id()==int(info["id"])
+        assert "async-worker" in [entry["name"] for entry in await client.get_client_list()]
+        assert await client.kill(1) is False
+        standin_redis.ping()
+        other=[entry for entry in await client.get_client_list() if entry["name"]!="async-worker"][0]
+        assert await client.kill(other["addr"]) is True
+        assert await client.kill(other["addr"]) is False
+        await client.echo("hello")
+        client.close()
+        await r.close(close_connection_pool=True)
+    asyncio.run(scenario())
+
+
+def test_async_users_helper(standin_server,standin_redis):
+    """The async Users adds, lists and deletes ACL users
+    """
+    async def scenario():
+        r=redis.Redis(port=standin_server.port)
+        users=Users(r)
+        assert len(await users.generate_password())==64
+        await users.add_user("reader",True,"+secret",categories=["+@read"],commands=users.get_basic_commands(),keys=["cache:*"])
+        assert sorted(await users.users())==["default","reader"]
+        assert any(line.startswith("user reader on") for line in await users.users_list())
+        assert "get" in await users.categories_list("read")
+        assert await users.delete_users("reader")==0
+        assert await users.delete_users(["reader"])==1
+        assert await users.users()==["default"]
+        users.close()
+        await r.close(close_connection_pool=True)
+    asyncio.run(scenario())
+
+
+def test_async_test_helper(standin_server,standin_redis):
+    """The async Test reports memory usage and database size
+    """
+    standin_redis.set("key","value")
+    async def scenario():
+        r=redis.Redis(port=standin_server.port)
+        test=AsyncTest(r)
+        assert await test.memory_usage("key")>len("value")
+        assert await test.memory_usage("missing") is None
+        assert await test.memory_usage(1)==0
+        assert await test.database_size()==1
+        test.close()
+        await r.close(close_connection_pool=True)
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+from driver.utils.commands import Commands
+
+
+def test_batch_results_in_order(standin_redis):
+    """Batch results follow call order and the single call return conventions
+    """
+    commands=Commands(standin_redis)
+    with commands.batch() as batch:
+        batch.set("name","Jhon")
+        batch.append("name","ny")
+        batch.get("name")
+        batch.get("missing")
+        batch.set("name",1)
+        batch.getdel("name")
+        batch.getdel("name")
+    assert batch.results==[True,6,"Jhonny",None,False,b"Jhonny",False]
+
+
+def test_batch_flushes_on_command_count(standin_redis,standin_server):
+    """Batch flushes automatically once max_commands are queued
+    """
+    commands=Commands(standin_redis)
+    batch=commands.batch(max_commands=10)
+    for index in range(25):
+        batch.set(f"key:{index}","value")
+    assert len(batch.results)==20
+    assert len(batch)==5
+    batch.flush()
+    assert batch.results==[True]*25
+    assert batch.round_trips==3
+
+
+def test_batch_flushes_on_byte_size(standin_redis):
+    """Batch flushes automatically once max_bytes are queued
+    """
+    commands=Commands(standin_redis)
+    batch=commands.batch(max_bytes=100)
+    batch.set("big","x"*200)
+    assert batch.results==[True]
+    assert commands.get("big")=="x"*200
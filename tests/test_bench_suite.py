@@ -0,0 +1,36 @@
+import json
+from benchmarks import suite
+
+
+def test_quick_run_reports_every_metric(tmp_path):
+    """A quick run writes throughput, latency and allocation metrics for each benchmark
+    """
+    output=tmp_path/"results.json"
+    assert suite.main(["--quick","--only","commands.get","commands.mset","--output",str(output)])==0
+    document=json.loads(output.read_text())
+    assert document["environment"]["target"]=="standin"
+    assert {"commands.get","commands.getdel","commands.mset[10]","commands.mset[100]"}==set(document["results"])
+    for result in document["results"].values():
+        assert result["ops"]>0 and result["ops_per_second"]>0
+        assert 0<result["p50_us"]<=result["p99_us"]
+        assert {"alloc_bytes_per_op","alloc_peak_kb"}<=set(result)
+
+
+def test_compare_fails_beyond_threshold(tmp_path):
+    """Results slower than the baseline beyond the threshold are reported as regressions
+    """
+    baseline={"results":{
+        "commands.get":{"ops_per_second":1000.0,"p99_us":100.0},
+        "commands.set":{"ops_per_second":1000.0,"p99_us":100.0},
+        "removed":{"ops_per_second":1000.0,"p99_us":100.0},
+    }}
+    results={"results":{
+        "commands.get":{"ops_per_second":800.0,"p99_us":120.0},
+        "commands.set":{"ops_per_second":700.0,"p99_us":140.0},
+    }}
+    regressions=suite.compare(results,baseline,threshold=0.25)
+    assert len(regressions)==2 and all(line.startswith("commands.set") for line in regressions)
+    assert suite.compare(results,baseline,threshold=0.5)==[]
+    path=tmp_path/"baseline.json"
+    path.write_text(json.dumps({"results":{"commands.get":{"ops_per_second":1e12,"p99_us":1e-3}}}))
+    assert suite.main(["--quick","--only","commands.get","--output",str(tmp_path/"out.json"),"--baseline",str(path)])==1
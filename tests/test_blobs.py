@@ -0,0 +1,119 @@
+import io
+import time
+import tracemalloc
+import pytest
+from driver.utils.blobs import BLOB_COMMIT,BlobError
+from driver.utils.commands import Commands
+from benchmarks.standin import Hash
+
+
+def blob_commit(connection,keys,args):
+    keyspace=connection.keyspace
+    current=keyspace.lookup(keys[0])
+    old=[current.get(b"version"),current.get(b"chunks")] if isinstance(current,Hash) else None
+    if args[1]==b"string":
+        value=keyspace.lookup(keys[1])
+        keyspace.delete(keys[1])
+        keyspace.store(keys[0],value)
+        committed=keys[:1]
+    else:
+        keyspace.store(keys[0],Hash({b"size":args[2],b"chunk_size":args[3],b"chunks":b"%d"%(len(keys)-1),b"version":args[4]}))
+        committed=keys
+    for key in committed:
+        keyspace.expires.pop(key,None)
+        if int(args[0]):
+            keyspace.expires[key]=time.time()+int(args[0])/1000
+    return old
+
+
+@pytest.fixture
+def commands(standin_redis,standin_server):
+    standin_server.register_script(BLOB_COMMIT,blob_commit)
+    return Commands(standin_redis)
+
+
+def test_string_layout_round_trip(commands,standin_redis):
+    """Blobs stored as one string are read back whole, by range and as a stream
+    """
+    blobs=commands.blobs(chunk_size=65536)
+    data=bytes(range(256))*4096+b"tail"
+    assert blobs.write("blob",io.BytesIO(data),ttl=60)==len(data)
+    assert standin_redis.get("blob")==data
+    assert standin_redis.dbsize()==1 and 59000<standin_redis.pttl("blob")<=60000
+    assert blobs.size("blob")==len(data)
+    assert blobs.read("blob")==data
+    assert blobs.read("blob",1000,70000)==data[1000:71000]
+    assert b"".join(blobs.stream("blob",len(data)-10))==data[-10:]
+    buffer=bytearray(100000)
+    assert blobs.read_into("blob",buffer,5)==100000 and buffer==data[5:100005]
+    target=io.BytesIO()
+    assert blobs.read_to("blob",target)==len(data) and target.getvalue()==data
+    assert blobs.read("missing") is None and blobs.stream("missing") is None
+
+
+def test_text_is_decoded_across_chunks(commands):
+    """Multibyte characters split between chunks are decoded
+    """
+    blobs=commands.blobs(chunk_size=7)
+    text="añ€😀"*50
+    assert blobs.write("text",text)==len(text.encode())
+    pieces=list(blobs.stream("text",encoding="utf-8"))
+    assert "".join(pieces)==text and len(pieces)>1
+
+
+def test_chunked_layout_replaces_versions(commands,standin_redis):
+    """Writing a chunked blob again replaces the chunks of the previous version
+    """
+    blobs=commands.blobs(chunk_size=1000,layout="chunked")
+    first=bytearray(b"a"*2500)
+    assert blobs.write("video",memoryview(first))==2500
+    assert standin_redis.dbsize()==4
+    assert blobs.read("video",900,1200)==b"a"*1200
+    second=[b"b"*1500,b"c"*100]
+    assert blobs.write("video",iter(second),ttl=30)==1600
+    assert standin_redis.dbsize()==3
+    assert blobs.read("video")==b"b"*1500+b"c"*100
+    assert all(0<standin_redis.pttl(key)<=30000 for key in standin_redis.scan_iter())
+    chunks=blobs.stream("video",chunk_size=1000)
+    assert next(chunks)==b"b"*1000
+    blobs.write("video",b"d"*1600)
+    with pytest.raises(BlobError):
+        next(chunks)
+    assert blobs.delete("video") is True and standin_redis.dbsize()==0
+    assert blobs.delete("video") is False
+
+
+def test_streaming_holds_about_one_chunk(commands):
+    """Streaming a large blob allocates about one chunk at a time
+    """
+    chunk_size=65536
+    blobs=commands.blobs(chunk_size=chunk_size)
+    size=8*1048576
+    data=bytearray(size)
+    assert blobs.write("large",data)==size
+    del data
+
+    class Sink:
+        written=0
+        def write(self,chunk):
+            self.written+=len(chunk)
+
+    sink=Sink()
+    tracemalloc.start()
+    assert blobs.read_to("large",sink)==size
+    _,peak=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert sink.written==size
+    assert peak<8*chunk_size
+
+
+def test_invalid_uses(commands,standin_redis):
+    """Wrong key types and arguments are rejected
+    """
+    blobs=commands.blobs()
+    standin_redis.hset("profile","name","x")
+    assert blobs.read("profile") is None
+    assert blobs.write(1,b"x") is None
+    assert blobs.read_into("profile",b"read-only") is None
+    with pytest.raises(ValueError):
+        commands.blobs(layout="files")
@@ -0,0 +1,121 @@
+import json
+import os
+import pytest
+from driver.utils.bulk import Bulk,BulkExporter,BulkImporter,chunks_of,encode_command
+
+
+def test_import_jsonl_csv_and_resp(standin_redis,tmp_path):
+    """Records are imported from jsonl, csv and RESP files
+    """
+    bulk=Bulk(standin_redis)
+    jsonl=tmp_path/"seed.jsonl"
+    jsonl.write_text("\n".join(json.dumps(record) for record in [
+        {"key":"user:1","value":"Jhon"},
+        {"key":"user:2","value":{"age":30},"ttl":60},
+        {"command":["HSET","profile:1","name","Jhon"]},
+        {"command":["HSET","profile:1"]},
+    ])+"\n")
+    report=bulk.import_file(str(jsonl),batch_size=2,window=2)
+    assert report.summary()["records"]==4 and report.errors==1 and report.chunks==2
+    assert standin_redis.get("user:2")==b'{"age":30}' and 0<standin_redis.pttl("user:2")<=60000
+    assert standin_redis.hget("profile:1","name")==b"Jhon"
+    table=tmp_path/"seed.csv"
+    table.write_text("id,name,ttl\nuser:3,Ana,\nuser:4,Bob,1\n")
+    bulk.import_file(str(table),csv_options={"key":"id","value":"name","ttl":"ttl"})
+    assert standin_redis.get("user:3")==b"Ana" and standin_redis.pttl("user:3")==-1
+    assert 0<standin_redis.pttl("user:4")<=1000
+    raw=tmp_path/"seed.resp"
+    raw.write_bytes(b"".join(encode_command("SET",f"raw:{index}","a\r\nb") for index in range(100)))
+    assert bulk.import_file(str(raw)).records==100
+    assert standin_redis.get("raw:99")==b"a\r\nb"
+
+
+def test_import_resumes_from_checkpoint(standin_redis,tmp_path):
+    """An interrupted import resumes after the last checkpoint
+    """
+    checkpoint=str(tmp_path/"import.checkpoint")
+    def commands(fail_at=None):
+        for index in range(50):
+            if index==fail_at:
+                raise RuntimeError("crash")
+            yield ("SET",f"key:{index}",str(index))
+    importer=BulkImporter(standin_redis,batch_size=10,window=10,checkpoint=checkpoint,checkpoint_every=10)
+    with pytest.raises(RuntimeError):
+        importer.run(commands(fail_at=35),source="numbers")
+    assert json.load(open(checkpoint))["records"]==30
+    standin_redis.set("key:0","changed")
+    report=importer.run(commands(),source="numbers")
+    assert report.resumed==30 and report.records==20
+    assert standin_redis.get("key:0")==b"changed" and standin_redis.get("key:49")==b"49"
+    assert not os.path.exists(checkpoint)
+
+
+def test_export_and_parallel_restore(standin_redis,tmp_path):
+    """Exported keys are restored with their values and ttl by several workers
+    """
+    for index in range(250):
+        standin_redis.set(f"item:{index}",str(index))
+    standin_redis.hset("item:hash","field","value")
+    standin_redis.set("item:ttl","1",px=60000)
+    standin_redis.set("other","1")
+    path=str(tmp_path/"items.dump")
+    bulk=Bulk(standin_redis)
+    report=bulk.export(path,match="item:*",count=100,chunk_size=100)
+    assert report.records==252
+    with open(path,"rb") as source:
+        assert sum(records for _,records,_ in chunks_of(source.read()))==252
+    standin_redis.flushdb()
+    report=bulk.restore(path,workers=3)
+    assert report.records==252 and report.errors==0
+    assert standin_redis.get("item:249")==b"249"
+    assert standin_redis.hget("item:hash","field")==b"value"
+    assert 50000<standin_redis.pttl("item:ttl")<=60000
+    assert standin_redis.exists("other")==0
+    report=bulk.restore(path,replace=False)
+    assert report.errors==252 and "BUSYKEY" in report.error_samples[0]
+
+
+def test_export_keeps_binary_keys(standin_redis,tmp_path):
+    """Keys that are not UTF-8 are exported and restored as bytes
+    """
+    standin_redis.set(b"bin:\xff\xfe",b"\x00\x01")
+    standin_redis.set("bin:text","value")
+    path=str(tmp_path/"binary.dump")
+    bulk=Bulk(standin_redis)
+    assert bulk.export(path,match="bin:*").records==2
+    standin_redis.flushdb()
+    assert bulk.restore(path).records==2
+    assert standin_redis.get(b"bin:\xff\xfe")==b"\x00\x01" and standin_redis.get("bin:text")==b"value"
+
+
+def test_import_rejects_cluster_clients():
+    """A client without a single connection pool cannot import
+    """
+    class ClusterLike:
+        pass
+    with pytest.raises(ValueError,match="cluster mode"):
+        Bulk(ClusterLike()).import_commands([("SET","key","value")])
+
+
+def test_export_resumes_after_crash(standin_redis,tmp_path):
+    """An interrupted export resumes after the last complete chunk
+    """
+    for index in range(300):
+        standin_redis.set(f"key:{index}",str(index))
+    path=str(tmp_path/"keys.dump")
+    checkpoint=str(tmp_path/"export.checkpoint")
+    pages=[]
+    def crash(report):
+        pages.append(report.records)
+        if len(pages)==2:
+            raise RuntimeError("crash")
+    exporter=BulkExporter(standin_redis,count=50,chunk_size=50,checkpoint=checkpoint)
+    with pytest.raises(RuntimeError):
+        exporter.run(path,progress=crash)
+    with open(path,"ab") as target:
+        target.write(b"partial chunk")
+    report=exporter.run(path)
+    assert report.resumed==100 and report.records==200
+    with open(path,"rb") as source:
+        assert sum(records for _,records,_ in chunks_of(source.read()))==300
+    assert not os.path.exists(checkpoint)
@@ -0,0 +1,46 @@
+import threading
+from driver.utils.chunks import ChunkReport
+from driver.utils.commands import Commands
+
+
+def test_mset_and_mget_chunked(standin_redis,standin_server):
+    """Chunks run concurrently and values stream back in input order
+    """
+    commands=Commands(standin_redis)
+    report=ChunkReport()
+    items={f"key:{index}":str(index) for index in range(2500)}
+    assert commands.mset_chunked(items,chunk_size=100,workers=4,report=report) is True
+    assert report.summary()["chunks"]==25
+    keys=list(items)+["missing"]
+    values=commands.mget_chunked(iter(keys),chunk_size=300,workers=3)
+    assert list(values)==[value.encode() for value in items.values()]+[None]
+
+
+def test_chunk_report_summary():
+    """The report exposes per chunk latency percentiles
+    """
+    report=ChunkReport()
+    for latency in range(1,101):
+        report.record(10,latency/1000)
+    summary=report.summary()
+    assert summary["keys"]==1000
+    assert summary["p50"]==0.05
+    assert summary["p99"]==0.099
+    assert summary["max"]==0.1
+
+
+def test_chunk_report_concurrent_records():
+    """Records from concurrent threads are all counted
+    """
+    report=ChunkReport()
+    def record():
+        for _ in range(10000):
+            report.record(2,0.001,failed=True)
+    threads=[threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary=report.summary()
+    assert (summary["chunks"],summary["keys"],summary["failed"])==(80000,160000,80000)
+    assert len(report.latencies)==80000
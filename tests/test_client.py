@@ -0,0 +1,42 @@
+import redis
+from driver.utils.client import Client,ClientTable
+
+
+def test_client_info_single_round_trip(standin_redis,standin_server):
+    """get_client_info sends CLIENT INFO once
+    """
+    client=Client(standin_redis)
+    standin_redis.ping()
+    standin_server.reset_counters()
+    info=client.get_client_info()
+    assert standin_server.commands_processed==1
+    assert set(info)=={"id","addr","laddr","fd","name","db"}
+
+
+def test_client_table_filter_and_kill(standin_redis,standin_server):
+    """Clients are parsed in columns, filtered and killed in one pipeline
+    """
+    workers=[redis.Redis(port=standin_server.port,client_name="worker") for _ in range(3)]
+    for worker in workers:
+        worker.ping()
+    client=Client(standin_redis)
+    table=client.get_client_table()
+    assert len(table)>=4
+    assert sorted(table.filter(name="worker").column("name"))==["worker"]*3
+    assert len(table.filter(name="worker",min_idle=3600))==0
+    standin_server.reset_counters()
+    assert client.kill_clients(name="worker")==3
+    assert standin_server.round_trips==2
+    assert len(client.get_client_table().filter(name="worker"))==0
+    for worker in workers:
+        worker.connection_pool.disconnect()
+
+
+def test_client_table_parse():
+    """Missing fields are padded and numeric fields stored as ints
+    """
+    table=ClientTable.parse(b"id=1 addr=10.0.0.1:1 idle=5 name=a\nid=2 addr=10.0.0.2:2 idle=50 name= omem=10\n")
+    assert table.column("id")==[1,2]
+    assert table.column("omem")==[0,10]
+    assert table.filter(addr_prefix="10.0.0.2").column("id")==[2]
+    assert [row["name"] for row in table.rows()]==["a",""]
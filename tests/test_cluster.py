@@ -0,0 +1,80 @@
+import pytest
+from redis.crc import key_slot
+from driver import Driver
+from driver.utils.cluster import ClusterClient
+from driver.utils.commands import Commands
+from benchmarks.standin import StandinCluster
+
+
+@pytest.fixture(scope="module")
+def standin_cluster():
+    with StandinCluster(nodes=3) as cluster:
+        yield cluster
+
+
+@pytest.fixture
+def cluster_client(standin_cluster):
+    client=ClusterClient(host=standin_cluster.host,port=standin_cluster.port)
+    for node in client.get_primaries():
+        client.get_redis_connection(node).flushall()
+    standin_cluster.reset_counters()
+    yield client
+    client.close()
+
+
+def test_multi_key_split_by_slot(cluster_client,standin_cluster):
+    """mset and mget span every node with one round trip per node, in input order
+    """
+    keys=[f"key:{index}" for index in range(100)]
+    assert len({key_slot(key.encode()) for key in keys})>3
+    assert cluster_client.mset({key:key.upper() for key in keys}) is True
+    assert standin_cluster.counters()[0]==3
+    shuffled=keys[::-1]+["missing"]
+    assert cluster_client.mget(shuffled)==[key.upper().encode() for key in keys[::-1]]+[None]
+    commands=Commands(cluster_client)
+    assert commands.getdel_many(keys[:10])==[key.upper().encode() for key in keys[:10]]
+    assert commands.mget(keys[:10])==[None]*10
+
+
+def test_slot_map_refreshed_on_moved(cluster_client,standin_cluster):
+    """A MOVED reply refreshes the slot map once
+    """
+    cluster_client.mset({"a":"1","b":"2","c":"3"})
+    slot=key_slot(b"a")
+    owner=standin_cluster.owners[slot]
+    target=next(index for index,port in enumerate(standin_cluster.ports) if not owner.endswith(f":{port}"))
+    standin_cluster.move_slot(slot,target)
+    assert cluster_client.mget(["a","b","c"])==[b"1",b"2",b"3"]
+    assert cluster_client.redirects==1
+    assert cluster_client.mget(["a"])==[b"1"]
+    assert cluster_client.redirects==1
+
+
+def test_ask_redirection(cluster_client,standin_cluster):
+    """Keys of a migrating slot are read from the target node after ASK
+    """
+    cluster_client.mset({"moving":"value"})
+    slot=key_slot(b"moving")
+    source=standin_cluster.ports.index(int(standin_cluster.owners[slot].rsplit(":",1)[1]))
+    target=(source+1)%3
+    data=standin_cluster.call(source,"export_slot",slot)
+    standin_cluster.call(target,"import_slot",data)
+    standin_cluster.call(source,"set_slot_state",slot,f"{standin_cluster.host}:{standin_cluster.ports[target]}")
+    standin_cluster.call(target,"set_slot_state",slot,None,True)
+    try:
+        assert cluster_client.mget(["moving"])==[b"value"]
+        assert cluster_client.redirects==1
+    finally:
+        standin_cluster.call(source,"set_slot_state",slot)
+        standin_cluster.call(target,"set_slot_state",slot)
+        standin_cluster.call(source,"import_slot",standin_cluster.call(target,"export_slot",slot))
+
+
+def test_driver_cluster_mode(driver_instance:Driver,standin_cluster):
+    """The driver connects in cluster mode and rejects handles on other databases
+    """
+    assert driver_instance.connect(host=standin_cluster.host,port=standin_cluster.port,cluster=True) is True
+    assert driver_instance.commands.mset({f"user:{index}":str(index) for index in range(20)}) is True
+    assert driver_instance.commands.mget([f"user:{index}" for index in range(20)])==[str(index).encode() for index in range(20)]
+    with pytest.raises(Exception):
+        driver_instance.handle("sessions",db=1)
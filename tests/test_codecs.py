@@ -0,0 +1,52 @@
+import pytest
+from driver.utils.codecs import Serializer
+from driver.utils.commands import Commands
+
+
+@pytest.mark.parametrize("codec",["json","pickle"])
+def test_serializer_round_trip(codec):
+    """Values round trip and large values are compressed
+    """
+    serializer=Serializer(codec,threshold=100)
+    value={"name":"Jhon","items":list(range(200))}
+    data=serializer.dumps(value)
+    assert data[2]==1
+    assert serializer.loads(data)==value
+    assert Serializer("raw").loads(data)==value
+
+
+def test_serializer_keeps_values_without_header():
+    """Values written by Commands.set are returned as bytes
+    """
+    assert Serializer().loads(b"plain")==b"plain"
+    assert Serializer().loads(None) is None
+
+
+def test_serializer_keeps_non_ascii_text():
+    """Plain UTF-8 text and unknown headers are returned as bytes
+    """
+    for text in ("שלום","ÿes","日本語","😀"):
+        assert Serializer().loads(text.encode("utf-8"))==text.encode("utf-8")
+    assert Serializer("str").loads(Serializer("str").dumps("שלום"))=="שלום"
+    unknown=Serializer().dumps("value")[:1]+bytes((200,0))+b"data"
+    assert Serializer().loads(unknown)==unknown
+    compressed=Serializer().dumps("value")[:2]+bytes((200,))+b"data"
+    assert Serializer().loads(compressed)==compressed
+
+
+def test_lz4_falls_back_to_zlib():
+    """Compression falls back to zlib when lz4 is not installed
+    """
+    serializer=Serializer("json",compression="lz4")
+    assert serializer.compression.name in ("lz4","zlib")
+
+
+def test_commands_objects(standin_redis):
+    """Commands stores and reads native python values
+    """
+    commands=Commands(standin_redis)
+    commands.set_serializer(Serializer("pickle"))
+    assert commands.set_object("user",{"id":1,"tags":("a","b")}) is True
+    assert commands.get_object("user")=={"id":1,"tags":("a","b")}
+    assert commands.mset_objects({"a":[1],"b":b"bytes"}) is True
+    assert commands.mget_objects(["a","b","missing"])==[[1],b"bytes",None]
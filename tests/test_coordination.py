@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+import pytest
+from redis.crc import key_slot
+from driver.utils.commands import Commands
+from driver.utils.coordination import Coordination,LOCK_ACQUIRE,LOCK_EXTEND,SLIDING_WINDOW,TOKEN_BUCKET
+from driver.utils.scripts import COMPARE_AND_DELETE
+from benchmarks.standin import Hash,ZSet
+
+
+def compare_and_delete(connection,keys,args):
+    if connection.keyspace.lookup(keys[0])==args[0]:
+        return int(connection.keyspace.delete(keys[0]))
+    return 0
+
+
+def lock_acquire(connection,keys,args):
+    keyspace=connection.keyspace
+    if keyspace.lookup(keys[0]) is not None:
+        return None
+    keyspace.store(keys[0],args[0])
+    keyspace.expires[keys[0]]=time.time()+int(args[1])/1000
+    fence=int(keyspace.lookup(keys[1]) or 0)+1
+    keyspace.store(keys[1],str(fence).encode())
+    return fence
+
+
+def lock_extend(connection,keys,args):
+    if connection.keyspace.lookup(keys[0])!=args[0]:
+        return 0
+    connection.keyspace.expires[keys[0]]=time.time()+int(args[1])/1000
+    return 1
+
+
+def sliding_window(connection,keys,args):
+    now,window,limit,cost=(int(arg) for arg in args[:4])
+    keyspace=connection.keyspace
+    log=keyspace.lookup(keys[0]) or ZSet()
+    for member in [member for member,score in log.items() if score<=now-window]:
+        del log[member]
+    if len(log)+cost>limit:
+        retry=min(log.values())+window-now if log else window
+        return [0,limit-len(log),int(retry)]
+    for index in range(cost):
+        log[args[4]+b":%d"%(index+1)]=float(now)
+    keyspace.store(keys[0],log)
+    keyspace.expires[keys[0]]=time.time()+window/1000
+    return [1,limit-len(log),0]
+
+
+def token_bucket(connection,keys,args):
+    now=int(args[0])
+    rate,capacity,cost=float(args[1]),int(args[2]),int(args[3])
+    keyspace=connection.keyspace
+    state=keyspace.lookup(keys[0]) or Hash()
+    tokens=float(state.get(b"tokens",capacity))
+    tokens=min(capacity,tokens+max(now-int(state.get(b"ts",now)),0)*rate/1000)
+    allowed,retry=0,0
+    if tokens>=cost:
+        tokens-=cost
+        allowed=1
+    else:
+        retry=math.ceil((cost-tokens)*1000/rate)
+    state[b"tokens"]=repr(tokens).encode()
+    state[b"ts"]=str(now).encode()
+    keyspace.store(keys[0],state)
+    return [allowed,math.floor(tokens),retry]
+
+
+@pytest.fixture
+def coordination(standin_redis,standin_server):
+    for source,function in ((COMPARE_AND_DELETE,compare_and_delete),(LOCK_ACQUIRE,lock_acquire),(LOCK_EXTEND,lock_extend),
+        (SLIDING_WINDOW,sliding_window),(TOKEN_BUCKET,token_bucket)):
+        standin_server.register_script(source,function)
+    return Coordination(standin_redis,Commands(standin_redis).scripts)
+
+
+def test_lock_fencing_tokens(coordination,standin_redis):
+    """Each acquisition of a lock returns a higher fencing token
+    """
+    first=coordination.lock("report",ttl=0.1)
+    second=coordination.lock("report",ttl=5,blocking=False)
+    assert first.acquire()==1
+    assert second.acquire() is None
+    assert first.extend(5) is True
+    assert 4000<standin_redis.pttl("lock:{report}")<=5000
+    assert key_slot(first.key.encode())==key_slot(first.fence_key.encode())
+    assert first.release() is True
+    assert second.acquire()==2
+    assert first.release() is False
+    assert second.release() is True
+    expired=coordination.lock("report",ttl=0.05)
+    assert expired.acquire()==3
+    time.sleep(0.06)
+    with coordination.lock("report",timeout=1) as token:
+        assert token==4
+    assert expired.release() is False
+    assert coordination.lock("report").locked() is False
+
+
+def test_lock_blocks_until_released(coordination):
+    """A blocking acquire waits until the holder releases the lock
+    """
+    holder=coordination.lock("job")
+    holder.acquire()
+    threading.Timer(0.05,holder.release).start()
+    waiter=coordination.lock("job",retry_interval=0.01)
+    assert waiter.acquire(timeout=1)==2
+    assert coordination.lock("job").acquire(timeout=0.02) is None
+    waiter.release()
+
+
+def test_reentrant_lock(coordination,standin_server):
+    """A reentrant lock is acquired again by its thread without a round trip
+    """
+    lock=coordination.reentrant_lock("tree")
+    with lock as token:
+        standin_server.reset_counters()
+        with lock as inner:
+            assert inner==token
+        assert standin_server.round_trips==0
+        assert lock.lock.locked()
+        other=[]
+        thread=threading.Thread(target=lambda:other.append(lock.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+        assert other==[None]
+    assert not lock.lock.locked()
+
+
+def test_sliding_window_limiter(coordination,standin_server):
+    """Requests over the window limit are denied locally until retry_after
+    """
+    limiter=coordination.sliding_window(3,window=0.2)
+    assert [limiter.hit("user:1").allowed for _ in range(3)]==[True,True,True]
+    denied=limiter.hit("user:1")
+    assert denied.allowed is False and 0<denied.retry_after<=0.2
+    standin_server.reset_counters()
+    assert limiter.hit("user:1").allowed is False
+    assert standin_server.round_trips==0 and limiter.local_denials==1
+    time.sleep(denied.retry_after+0.01)
+    assert limiter.hit("user:1")==(True,2,0.0)
+
+
+def test_token_bucket_batch(coordination,standin_server,standin_redis):
+    """Several keys are checked against the token bucket in one pipeline
+    """
+    limiter=coordination.token_bucket(rate=1,capacity=2)
+    standin_server.reset_counters()
+    results=limiter.hit_many(["a","b","a","a"])
+    assert standin_server.round_trips==1
+    assert [result.allowed for result in results]==[True,True,True,False]
+    assert results[3].retry_after>0.9
+    assert limiter.hit_many(["a","b"])[0].allowed is False
+    assert limiter.stats()["local_denials"]==1
+    standin_redis.script_flush()
+    assert [result.allowed for result in limiter.hit_many(["c","d"])]==[True,True]
+
+
+def test_limiter_bounds_blocked_keys(coordination):
+    """The local pre-check remembers at most max_blocked keys
+    """
+    limiter=coordination.sliding_window(1,window=5,max_blocked=4)
+    for index in range(10):
+        assert limiter.hit(f"user:{index}").allowed is True
+        assert limiter.hit(f"user:{index}").allowed is False
+        assert limiter.stats()["blocked_keys"]<=4
+    assert limiter.stats()["checks"]==20
+    assert limiter.hit("user:9").allowed is False and limiter.stats()["local_denials"]==1
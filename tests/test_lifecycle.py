@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from driver import Driver
+from benchmarks import suite
+
+
+def test_import_and_connect_are_lazy(standin_server):
+    """Importing and connecting the driver loads no helper module until
+    the helper is used
+    """
+    script=f"""
+import sys
+import threading
+from driver import Driver
+assert "http.server" not in sys.modules
+assert not [name for name in sys.modules if name.startswith("driver.utils.") and name not in ("driver.utils.pool","driver.utils.handle")]
+driver=Driver()
+assert driver.connect(port={standin_server.port}) is True
+assert "driver.utils.bulk" not in sys.modules and "driver.utils.commands" not in sys.modules
+assert driver.commands.get("key") is None and "driver.utils.batch" not in sys.modules and "driver.utils.resilience" not in sys.modules
+assert driver.bulk is driver.bulk and "driver.utils.bulk" in sys.modules
+assert driver.close() is True
+"""
+    subprocess.run([sys.executable,"-c",script],cwd=suite.ROOT,check=True)
+
+
+def test_close_sends_one_quit_and_is_idempotent(driver_instance:Driver,standin_server,standin_redis):
+    """Closing sends a single QUIT and closing again does nothing
+    """
+    assert driver_instance.connect(port=standin_server.port) is True
+    driver_instance.handle("other",db=1).commands.get("key")
+    driver_instance.commands.set("key","value")
+    driver_instance.users.users()
+    standin_server.reset_counters()
+    assert driver_instance.close() is True
+    assert standin_server.commands_processed==1
+    assert driver_instance.close() is True
+    assert standin_server.commands_processed==1
+    with pytest.raises(AttributeError):
+        driver_instance.commands
+
+
+@pytest.mark.skipif(not hasattr(os,"fork"),reason="needs os.fork")
+def test_forked_child_reconnects(driver_instance:Driver,standin_server,standin_redis):
+    """A forked child opens its own connections and leaves the parent ones working
+    """
+    assert driver_instance.connect(port=standin_server.port) is True
+    handle=driver_instance.handle("sessions",db=2)
+    assert driver_instance.commands.set("owner","parent") is True
+    parent_commands=driver_instance.commands
+    parent_pool=driver_instance.pool_stats()
+    pid=os.fork()
+    if pid==0:
+        code=1
+        try:
+            assert driver_instance.commands is not parent_commands
+            assert driver_instance.pool_stats()["created"]==1
+            assert driver_instance.handle("sessions") is not handle
+            for index in range(200):
+                assert driver_instance.commands.set(f"child:{index}",str(index)) is True
+                assert driver_instance.commands.get(f"child:{index}")==str(index)
+            driver_instance.handle("sessions").commands.set("child","done")
+            code=0 if driver_instance.close() is True else 1
+        finally:
+            os._exit(code)
+    for _ in range(200):
+        assert driver_instance.commands.get("owner")=="parent"
+    _,status=os.waitpid(pid,0)
+    assert os.waitstatus_to_exitcode(status)==0
+    assert driver_instance.commands.get("child:199")=="199"
+    assert handle.commands.get("child")=="done"
+    assert driver_instance.pool_stats()["created"]==parent_pool["created"]
+    assert driver_instance.close() is True
+
+
+def test_startup_budget():
+    """Import and connect times over the startup budget are reported
+    """
+    results={"results":{"startup.import":{"p50_us":40000.0},"startup.connect":{"p50_us":5000.0}}}
+    assert suite.over_budget(results,50)==[]
+    assert suite.over_budget(results,30)==["startup : import + connect 45.0 ms, budget 30 ms"]
+    assert suite.over_budget({"results":{}},1)==[]
+
+
+def test_connect_again_releases_previous_connection(driver_instance:Driver,standin_server,standin_redis):
+    """Connecting again closes the helpers, handles and pool of the previous connection
+    """
+    assert driver_instance.connect(port=standin_server.port) is True
+    driver_instance.pubsub.subscribe("news",lambda message:None)
+    handle=driver_instance.handle("old",db=1)
+    handle.commands.get("key")
+    pool=handle.redis.connection_pool.pool
+    standin_server.reset_counters()
+    assert driver_instance.connect(port=standin_server.port) is True
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("redis-pubsub")]
+    assert handle.commands is None
+    assert [connection._sock for connection in pool._connections]==[None]
+    assert standin_server.commands_processed==1
+    assert driver_instance.close() is True
@@ -0,0 +1,89 @@
+import threading
+import time
+from driver.utils.commands import Commands
+from driver.utils.scripts import COMPARE_AND_DELETE
+
+
+def compare_and_delete(connection,keys,args):
+    if connection.keyspace.lookup(keys[0])==args[0]:
+        return int(connection.keyspace.delete(keys[0]))
+    return 0
+
+
+def test_memoize_builds_keys_from_arguments(standin_redis,standin_server):
+    """Calls with the same arguments share one cached value with the configured ttl
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    commands=Commands(standin_redis)
+    calls=[]
+    @commands.memoize(ttl=60,prefix="views")
+    def profile(user_id,fields=("name",)):
+        calls.append(user_id)
+        return {"id":user_id,"fields":list(fields)}
+    assert profile(1)=={"id":1,"fields":["name"]}
+    assert profile(user_id=1)=={"id":1,"fields":["name"]}
+    assert profile(2)["id"]==2
+    assert calls==[1,2]
+    assert profile.key(1).startswith("views:tests.test_memoize.")
+    assert 54000<=standin_redis.pttl(profile.key(1))<=66000
+    assert profile.invalidate(1) is True
+    profile(1)
+    assert calls==[1,2,1]
+    stats=profile.memoizer.stats()
+    assert stats["hits"]==1 and stats["misses"]==3 and stats["recomputes"]==3
+    assert standin_redis.exists(profile.key(1)+":lock")==0
+
+
+def test_concurrent_misses_compute_once(standin_redis,standin_server):
+    """Concurrent misses on one key compute the value once
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    memoizer=Commands(standin_redis).memoizer(ttl=60)
+    calls=[]
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "page"
+    results=[]
+    threads=[threading.Thread(target=lambda:results.append(memoizer.get_or_compute("page:home",compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results==["page"]*8
+    assert len(calls)==1
+    assert memoizer.stats()["coalesced"]==7
+
+
+def test_other_process_waits_for_lock_holder(standin_redis,standin_server):
+    """A second memoizer (another process) waits for the value instead of computing it
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    first=Commands(standin_redis).memoizer(ttl=60)
+    second=Commands(standin_redis).memoizer(ttl=60)
+    started=threading.Event()
+    def slow():
+        started.set()
+        time.sleep(0.1)
+        return 42
+    thread=threading.Thread(target=first.get_or_compute,args=("answer",slow))
+    thread.start()
+    started.wait()
+    assert second.get_or_compute("answer",lambda:0)==42
+    thread.join()
+    assert second.stats()["lock_waits"]==1
+    assert second.stats()["recomputes"]==0
+
+
+def test_early_recomputation_serves_stale_value(standin_redis,standin_server):
+    """Early recomputation serves the stale value while another process holds the lock
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    memoizer=Commands(standin_redis).memoizer(ttl=0.2,jitter=0,beta=1000000)
+    memoizer.get_or_compute("report",lambda:(time.sleep(0.01),"v1")[1])
+    standin_redis.set("report:lock","other",px=1000)
+    assert memoizer.get_or_compute("report",lambda:"v2")=="v1"
+    standin_redis.delete("report:lock")
+    assert memoizer.get_or_compute("report",lambda:"v2")=="v2"
+    stats=memoizer.stats()
+    assert stats["early_recomputes"]==2 and stats["stale_served"]==1
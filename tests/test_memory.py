@@ -0,0 +1,59 @@
+import time
+from driver.utils import test as test_helper
+from driver.utils.test import MemoryProfiler
+
+
+def fill(r):
+    r.mset({f"user:{index}:name":"x"*100 for index in range(50)})
+    r.mset({f"session:{index}":"y"*10 for index in range(30)})
+    r.set("counter","1",px=60000)
+
+
+def test_profile_groups_by_prefix(standin_redis):
+    """Keys are grouped by prefix with their size, type and ttl
+    """
+    fill(standin_redis)
+    reports=[]
+    report=test_helper.Test(standin_redis).profile_memory(progress=lambda report:reports.append(report.keys_profiled),count=20)
+    assert report.done and report.keys_scanned==report.keys_profiled==81
+    top=report.top(3)
+    assert [group["prefix"] for group in top]==["user:","session:","(other)"]
+    assert top[0]["keys"]==50 and top[0]["types"]=={"string":50}
+    assert top[2]["volatile"]==1
+    assert reports==sorted(reports) and len(reports)==5
+    assert sum(keys for _,_,keys in report.size_histogram())==81
+
+
+def test_profile_binary_keys(standin_redis):
+    """Keys that are not UTF-8 are profiled under their escaped name
+    """
+    standin_redis.set(b"bin:\xff\xfe","x")
+    standin_redis.set("bin:text","y")
+    report=MemoryProfiler(standin_redis).run()
+    assert report.keys_profiled==2
+    assert report.top(1)[0]["prefix"]=="bin:"
+
+
+def test_profile_sampled_and_throttled(standin_redis,standin_server):
+    """Sampling profiles a fraction of the keys, pipelined and rate limited
+    """
+    fill(standin_redis)
+    standin_server.reset_counters()
+    start=time.perf_counter()
+    report=MemoryProfiler(standin_redis,sample=0.5,seed=1,batch_size=100,max_keys_per_second=200).run()
+    assert time.perf_counter()-start>=report.keys_profiled/200*0.9
+    assert 20<report.keys_profiled<60
+    assert report.estimated_keys==round(report.keys_profiled/0.5)
+    assert standin_server.round_trips<=20
+    start=time.perf_counter()
+    report=MemoryProfiler(standin_redis,sample=0.01,seed=1,count=10,max_keys_per_second=200).run()
+    assert time.perf_counter()-start>=report.keys_scanned/200*0.9
+
+
+def test_profile_explicit_prefixes(standin_redis):
+    fill(standin_redis)
+    profiler=MemoryProfiler(standin_redis,prefixes=["user:1","user:"])
+    assert profiler.group("user:12:name")=="user:1"
+    assert profiler.group("counter")=="(other)"
+    assert MemoryProfiler(standin_redis,depth=2).group("user:12:name")=="user:12:"
+    assert MemoryProfiler(standin_redis,depth=2).group("user:12")=="user:"
@@ -0,0 +1,56 @@
+from driver import Driver
+from driver.utils.metrics import Histogram,Metrics
+
+
+def test_histogram_percentiles_within_error():
+    """Percentiles stay within the relative error of the buckets
+    """
+    histogram=Histogram()
+    for value in range(1,100001):
+        histogram.record(value)
+    for percent in (50,90,99,99.9):
+        expected=percent/100*100000
+        assert abs(histogram.percentile(percent)-expected)/expected<1/16
+    assert histogram.min==1 and histogram.max==100000
+    assert len(histogram.buckets)<300
+
+
+def test_driver_metrics_and_hooks(driver_instance:Driver,standin_server,standin_redis):
+    """Helper calls and server commands are recorded and exported
+    """
+    metrics=Metrics()
+    seen=[]
+    metrics.add_hook(pre=lambda name,args,kargs:name,post=lambda name,seconds,result,error,context:seen.append(context))
+    assert driver_instance.connect(port=standin_server.port) is True
+    driver_instance.enable_metrics(metrics)
+    driver_instance.commands.set("key","value")
+    driver_instance.commands.get("key")
+    driver_instance.commands.get(1)
+    driver_instance.handle("other",db=1).commands.get("key")
+    snapshot=metrics.snapshot()
+    assert snapshot["calls"]["commands.get"]["calls"]==2
+    assert snapshot["calls"]["commands.set"]["bytes_out"]==8
+    assert snapshot["calls"]["server.GET"]["calls"]==2
+    assert snapshot["calls"]["other.commands.get"]["calls"]==1
+    assert snapshot["pool"]["created"]>=1
+    assert seen==["commands.set","commands.get","commands.get","other.commands.get"]
+    text=metrics.prometheus()
+    assert 'redis_driver_call_duration_seconds_count{call="commands.get"} 2' in text
+    assert "redis_driver_pool_wait_time" in text
+
+
+def test_pipelined_commands_are_recorded(driver_instance:Driver,standin_server,standin_redis):
+    """Commands sent through batches and pipelines are recorded with their round trip
+    """
+    assert driver_instance.connect(port=standin_server.port) is True
+    metrics=driver_instance.enable_metrics()
+    metrics.reset()
+    with driver_instance.batch() as batch:
+        batch.set("key","value")
+        batch.get("key")
+        batch.get("other")
+    snapshot=metrics.snapshot()["calls"]
+    assert snapshot["server.PIPELINE"]["calls"]==1
+    assert snapshot["server.PIPELINE"]["bytes_in"]==5
+    assert snapshot["server.GET"]["calls"]==2
+    assert snapshot["server.SET"]["bytes_out"]==8
@@ -0,0 +1,61 @@
+import asyncio
+from driver.utils.monitor import MonitorConsumer,TopK,parse_line
+
+
+def test_parse_line():
+    """Quoted and escaped arguments are split and keys extracted
+    """
+    event=parse_line(b'1339518083.107412 [0 127.0.0.1:60866] "mset" "a" "x \\"y\\"\\n" "b" "\\x01"')
+    assert event.command=="MSET" and event.db==0 and event.client=="127.0.0.1:60866"
+    assert event.args==["a",'x "y"\n',"b","\x01"]
+    assert event.keys==["a","b"]
+    assert parse_line(b"OK") is None
+    assert parse_line('1.0 [0 lua] "evalsha" "abc" "1" "k" "v"').keys==["k"]
+
+
+def test_top_k_bounded():
+    """TopK keeps at most k keys and ranks the hot key first
+    """
+    top=TopK(k=3)
+    for index in range(1000):
+        top.add(f"key:{index%50}")
+        top.add("hot")
+    assert len(top.items)==3
+    assert top.top()[0]==("hot",1000)
+
+
+def test_monitor_filters_and_budget(standin_redis,standin_server):
+    """Matching commands are aggregated until the event budget is spent
+    """
+    monitor=MonitorConsumer(standin_redis.connection_pool,commands=["GET"],key_pattern="user:*",max_events=30,max_seconds=5)
+    monitor.start()
+    for index in range(20):
+        standin_redis.get("user:1")
+        standin_redis.get(f"other:{index}")
+    standin_redis.set("user:2","x")
+    assert monitor.wait(5)
+    stats=monitor.stats()
+    assert stats["stopped_by"]=="max_events" and stats["events"]==30
+    assert stats["matched"]==15
+    assert stats["hot_keys"]==[("user:1",15)]
+    assert list(stats["commands_per_second"])==["GET"]
+
+
+def test_monitor_key_pattern_uses_redis_glob(standin_redis):
+    """The key pattern follows the Redis glob rules, with backslash escapes and [^...]
+    """
+    monitor=MonitorConsumer(standin_redis.connection_pool,key_pattern="user:\\*[^a]",max_events=4,max_seconds=5)
+    monitor.start()
+    for key in ("user:*b","user:*a","user:1b","user:*!"):
+        standin_redis.get(key)
+    assert monitor.wait(5)
+    assert monitor.stats()["hot_keys"]==[("user:*b",1),("user:*!",1)]
+
+
+def test_monitor_async_time_budget(standin_redis):
+    """The asyncio consumer stops when the time budget is spent
+    """
+    monitor=MonitorConsumer(standin_redis.connection_pool,max_events=None,max_seconds=0.3)
+    stats=asyncio.run(monitor.run_async())
+    assert stats["stopped_by"]=="max_seconds"
+    assert 0.3<=stats["elapsed"]<1
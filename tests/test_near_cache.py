@@ -0,0 +1,96 @@
+import time
+import redis
+from driver.utils.cache import NearCache
+from driver.utils.commands import Commands
+
+
+def fill(cache:NearCache,*keys)->None:
+    for key in keys:
+        cache.begin(key)
+        cache.store(key,b"value")
+
+
+def test_near_cache_lru_eviction():
+    """The least recently used key is evicted first
+    """
+    cache=NearCache(max_entries=2)
+    fill(cache,"a","b")
+    cache.lookup("a")
+    fill(cache,"c")
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") is not None
+    assert cache.stats()["evictions"]==1
+
+
+def test_near_cache_lfu_eviction():
+    """The least frequently used key is evicted first
+    """
+    cache=NearCache(max_entries=2,policy="lfu")
+    fill(cache,"a","b")
+    cache.lookup("b")
+    cache.lookup("b")
+    cache.lookup("a")
+    fill(cache,"c")
+    assert cache.lookup("a") is None
+    assert cache.lookup("b") is not None
+
+
+def test_near_cache_bytes_and_expiry():
+    """Entries are bounded by bytes and never outlive the key expiry
+    """
+    cache=NearCache(max_bytes=12)
+    fill(cache,"a","b")
+    assert len(cache)==2
+    fill(cache,"c")
+    assert len(cache)==2
+    cache.begin("d")
+    cache.store("d",b"value",pttl=1)
+    time.sleep(0.005)
+    assert cache.lookup("d") is None
+    assert cache.stats()["expirations"]==1
+
+
+def test_near_cache_drops_value_invalidated_while_fetching():
+    """An invalidation that arrives during the fetch discards the value
+    """
+    cache=NearCache()
+    cache.begin("a")
+    cache.invalidate([b"a"])
+    cache.store("a",b"stale")
+    assert cache.lookup("a") is None
+
+
+def test_near_cache_invalidated_by_other_client(standin_server,standin_redis):
+    """Writes from another connection evict the local copy
+    """
+    commands=Commands(redis.Redis(port=standin_server.port))
+    writer=Commands(standin_redis)
+    writer.set("hot","1")
+    cache=commands.enable_near_cache()
+    assert commands.get("hot")=="1"
+    standin_server.reset_counters()
+    assert commands.get("hot")=="1"
+    assert commands.mget(["hot"])==[b"1"]
+    assert standin_server.round_trips==0
+    writer.set("hot","2")
+    deadline=time.time()+2
+    while len(cache) and time.time()<deadline:
+        time.sleep(0.01)
+    assert commands.get("hot")=="2"
+    assert cache.stats()["invalidations"]==1
+    commands.disable_near_cache()
+
+
+def test_near_cache_missing_key(standin_server,standin_redis):
+    """A missing key read through the near cache returns None without error
+    """
+    commands=Commands(redis.Redis(port=standin_server.port))
+    commands.enable_near_cache()
+    resilience=commands.enable_resilience(raise_errors=True)
+    assert commands.get("missing") is None
+    assert commands.get("missing") is None
+    commands.set("missing","now")
+    assert commands.get("missing")=="now"
+    commands.disable_resilience()
+    resilience.close()
+    commands.disable_near_cache()
@@ -0,0 +1,45 @@
+import threading
+import time
+import redis
+from driver import Driver
+from driver.utils.pool import Pool
+
+
+def test_handles_share_pool_per_database(driver_instance:Driver,standin_server,standin_redis):
+    """Named handles see their own database and share one pool
+    """
+    assert driver_instance.connect(port=standin_server.port,max_connections=2) is True
+    cache=driver_instance.handle("cache",db=0)
+    sessions=driver_instance.handle("sessions",db=3)
+    assert driver_instance.handle("sessions") is sessions
+    assert cache.commands.set("key","cache") is True
+    assert sessions.commands.set("key","sessions") is True
+    assert cache.commands.get("key")=="cache"
+    assert sessions.commands.get("key")=="sessions"
+    assert driver_instance.pool_stats()["created"]<=2
+
+
+def test_pool_counts_waits(standin_server,standin_redis):
+    """Checkouts that find no idle connection are counted as waits
+    """
+    pool=Pool(port=standin_server.port,max_connections=1,timeout=5)
+    connection=pool.get_connection("GET")
+    releaser=threading.Timer(0.05,pool.release,args=(connection,))
+    releaser.start()
+    redis.Redis(connection_pool=pool).ping()
+    stats=pool.stats()
+    assert stats["waits"]==1
+    assert stats["wait_time"]>=0.04
+    assert stats["in_use"]==0 and stats["idle"]==1
+
+
+def test_pool_reaps_idle_connections(standin_server,standin_redis):
+    """Sockets idle for longer than idle_timeout are closed
+    """
+    pool=Pool(port=standin_server.port,idle_timeout=0.01)
+    r=redis.Redis(connection_pool=pool)
+    r.ping()
+    time.sleep(0.02)
+    assert pool.reap()==1
+    assert r.ping() is True
+    assert pool.stats()["reaped"]==1
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+import redis
+from driver.utils.pubsub import PubSub
+
+
+def wait_for(condition,timeout:float=2.0)->bool:
+    deadline=time.monotonic()+timeout
+    while time.monotonic()<deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+
+def test_one_reader_connection_for_all_subscriptions(standin_redis,standin_server):
+    """Every channel and pattern is served by a single reader connection
+    """
+    bus=PubSub(standin_redis)
+    orders,users,batches=[],[],[]
+    try:
+        bus.subscribe("orders",orders.append)
+        bus.subscribe("orders",lambda message:None)
+        bus.psubscribe("user:*",batches.append,batch=True)
+        bus.psubscribe("user:*",users.append)
+        subscribers=[client for client in standin_redis.client_list() if client["sub"]!="0" or client["psub"]!="0"]
+        assert len(subscribers)==1 and subscribers[0]["sub"]=="1" and subscribers[0]["psub"]=="1"
+        assert bus.publish_many([("orders","1"),("user:1","a"),("orders","2"),("user:2","b")])==[1,1,1,1]
+        assert wait_for(lambda:len(orders)==2 and len(users)==2)
+        assert [message.data for message in orders]==[b"1",b"2"]
+        assert users[1]==("user:2",b"b","user:*")
+        assert sum(len(batch) for batch in batches)==2
+        stats=bus.stats()
+        assert stats["received"]==4 and stats["published"]==4 and stats["channels"]==1 and stats["patterns"]==1
+    finally:
+        bus.close()
+
+
+def test_unsubscribe_and_handler_errors(standin_redis):
+    """A failing handler does not stop the others and unsubscribing the last one drops the channel
+    """
+    bus=PubSub(standin_redis)
+    received=[]
+    try:
+        failing=bus.subscribe("events",lambda message:1/0)
+        kept=bus.subscribe("events",received.append)
+        bus.publish("events","1")
+        assert wait_for(lambda:received)
+        bus.unsubscribe(failing)
+        bus.unsubscribe(kept)
+        assert wait_for(lambda:bus.publish("events","2")==0)
+        assert bus.stats()["handler_errors"]==1
+    finally:
+        bus.close()
+
+
+def test_handler_error_keeps_later_messages(standin_redis):
+    """A failing message does not drop the next ones of the same batch
+    """
+    bus=PubSub(standin_redis)
+    seen=[]
+    def handler(message):
+        seen.append(message.data)
+        if message.data==b"1":
+            raise ValueError("bad message")
+    try:
+        bus.subscribe("jobs",handler)
+        bus.publish_many([("jobs","1"),("jobs","2"),("jobs","3")])
+        assert wait_for(lambda:len(seen)==3)
+        assert seen==[b"1",b"2",b"3"] and bus.stats()["handler_errors"]==1
+    finally:
+        bus.close()
+
+
+def test_concurrent_first_subscriptions_start_one_reader(standin_redis):
+    """Threads subscribing at the same time share one reader and dispatcher
+    """
+    bus=PubSub(standin_redis)
+    received=[]
+    barrier=threading.Barrier(8)
+    def subscribe(index):
+        barrier.wait()
+        bus.subscribe(f"channel:{index}",received.append)
+    try:
+        threads=[threading.Thread(target=subscribe,args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len([thread for thread in threading.enumerate() if thread.name=="redis-pubsub"])==1
+        assert len([thread for thread in threading.enumerate() if thread.name=="redis-pubsub-dispatch"])==1
+        assert bus.publish_many([(f"channel:{index}","x") for index in range(8)])==[1]*8
+        assert wait_for(lambda:len(received)==8)
+    finally:
+        bus.close()
+
+
+def test_resubscribes_after_reconnection(standin_redis):
+    """Channels and patterns are subscribed again after the connection is killed
+    """
+    bus=PubSub(standin_redis,reconnect_delay=0.01)
+    received=[]
+    try:
+        bus.subscribe("alerts",received.append)
+        bus.psubscribe("metrics.*",received.append)
+        killed=redis.Redis(connection_pool=standin_redis.connection_pool).client_kill_filter(skipme=True)
+        assert killed>=1
+        assert wait_for(lambda:bus.stats()["reconnects"]==1)
+        assert wait_for(lambda:standin_redis.publish("alerts","up")==1)
+        assert wait_for(lambda:standin_redis.publish("metrics.cpu","90")==1)
+        assert wait_for(lambda:len(received)>=2)
+    finally:
+        bus.close()
+
+
+def test_drop_overflow(standin_redis):
+    """Messages over max_pending are dropped with the drop overflow policy
+    """
+    bus=PubSub(standin_redis,max_pending=1,batch_size=1,overflow="drop")
+    release=threading.Event()
+    try:
+        bus.subscribe("burst",lambda message:release.wait(2))
+        bus.publish_many([("burst",str(index)) for index in range(20)])
+        assert wait_for(lambda:bus.stats()["received"]==20)
+        release.set()
+        assert wait_for(lambda:bus.stats()["dispatched"]+bus.stats()["dropped"]==20)
+        assert bus.stats()["dropped"]>0
+    finally:
+        release.set()
+        bus.close()
+
+
+def test_asyncio_queue(standin_redis):
+    """Messages are delivered to an asyncio queue
+    """
+    bus=PubSub(standin_redis)
+    async def consume():
+        messages=bus.queue("jobs",maxsize=10)
+        bus.publish_many([("jobs","a"),("jobs","b")])
+        return [await asyncio.wait_for(messages.get(),2) for _ in range(2)]
+    try:
+        assert [message.data for message in asyncio.run(consume())]==[b"a",b"b"]
+    finally:
+        bus.close()
@@ -0,0 +1,103 @@
+import socket
+import pytest
+import redis
+from driver import Driver
+from driver.utils.commands import Commands
+from driver.utils.replicas import ReplicaRedis,ReplicaRouter,is_read
+from benchmarks.standin import StandinServer
+
+
+@pytest.fixture(scope="module")
+def replica_servers():
+    with StandinServer() as first,StandinServer(latency=0.005) as second:
+        yield first,second
+
+
+@pytest.fixture
+def replicas(replica_servers):
+    for server in replica_servers:
+        redis.Redis(port=server.port).flushall()
+        server.replication={"role":"slave","slave_repl_offset":0,"master_link_status":"up"}
+        server.reset_counters()
+    return replica_servers
+
+
+def routed(primary,ports,**options):
+    router=ReplicaRouter(redis.Redis(port=primary.port),[("127.0.0.1",port) for port in ports],
+        lambda host,port:redis.Redis(host=host,port=port),**options)
+    return ReplicaRedis(router=router,port=primary.port)
+
+
+def free_port()->int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1",0))
+        return sock.getsockname()[1]
+
+
+def test_reads_round_robin_writes_on_primary(standin_redis,standin_server,replicas):
+    """Reads alternate between replicas while writes and pinned reads go to the primary
+    """
+    r=routed(standin_server,[server.port for server in replicas])
+    commands=Commands(r)
+    assert commands.set("key","value") is True
+    for server in replicas:
+        redis.Redis(port=server.port).set("key","value")
+        server.reset_counters()
+    assert [commands.get("key") for _ in range(4)]==["value"]*4
+    assert [server.commands_processed for server in replicas]==[2,2]
+    assert standin_redis.get("key")==b"value"
+    with r.router.pinned():
+        commands.get("key")
+    assert r.router.stats()["primary_reads"]==1
+
+
+def test_georadius_store_is_a_write():
+    """GEORADIUS with STORE or STOREDIST is sent to the primary
+    """
+    assert is_read("GEORADIUS",("GEORADIUS","places",13.4,52.5,10,"km","WITHDIST")) is True
+    assert is_read("GEORADIUS",("GEORADIUS","places",13.4,52.5,10,"km","STORE","near")) is False
+    assert is_read("GEORADIUSBYMEMBER",("GEORADIUSBYMEMBER","places","home",10,"km",b"STOREDIST","near")) is False
+    assert is_read("GET",("GET","key")) is True and is_read("SET",("SET","key","value")) is False
+
+
+def test_lag_guard_and_least_latency(standin_server,replicas,standin_redis):
+    """Lagging replicas are skipped and reads go to the least latency replica
+    """
+    standin_server.replication={"role":"master","master_repl_offset":1000}
+    try:
+        r=routed(standin_server,[server.port for server in replicas],max_lag=100,strategy="least_latency")
+        replicas[1].replication["slave_repl_offset"]=950
+        for _ in range(5):
+            r.get("key")
+        stats=r.router.stats()["replicas"]
+        assert [replica["reads"] for replica in stats.values()]==[0,5]
+        assert [replica["lag"] for replica in stats.values()]==[1000,50]
+        replicas[0].replication["slave_repl_offset"]=1000
+        r.router.check()
+        for _ in range(5):
+            r.get("key")
+        assert [replica["reads"] for replica in r.router.stats()["replicas"].values()][0]>=4
+    finally:
+        standin_server.replication={"role":"master","master_repl_offset":0}
+
+
+def test_failed_replica_falls_back_to_primary(standin_server,standin_redis,replicas):
+    """A read on an unreachable replica falls back to the primary
+    """
+    standin_redis.set("key","primary")
+    r=routed(standin_server,[free_port(),replicas[0].port])
+    redis.Redis(port=replicas[0].port).set("key","replica")
+    values=[r.get("key") for _ in range(4)]
+    assert values[0]==b"primary" and values[1:]==[b"replica"]*3
+    assert r.router.stats()["fallbacks"]==1
+
+
+def test_driver_sticky_writes(driver_instance:Driver,standin_server,replicas):
+    """Reads following a write are sent to the primary
+    """
+    assert driver_instance.connect(port=standin_server.port,replicas=[("127.0.0.1",replicas[0].port)],sticky_writes=60) is True
+    driver_instance.commands.set("fresh","value")
+    assert driver_instance.commands.get("fresh")=="value"
+    assert driver_instance.replica_stats()["primary_reads"]==1
+    with driver_instance.read_your_writes():
+        assert driver_instance.commands.get("fresh")=="value"
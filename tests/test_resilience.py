@@ -0,0 +1,115 @@
+import socket
+import time
+import pytest
+import redis
+from driver.utils.commands import Commands
+from driver.utils.resilience import CircuitOpenError,DriverError,OperationError,idempotent
+from benchmarks.standin import StandinServer
+
+
+def free_port()->int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1",0))
+        return sock.getsockname()[1]
+
+
+def test_only_idempotent_commands_retried(standin_redis):
+    """Connection errors are retried for reads but not for non idempotent writes
+    """
+    execute_command=standin_redis.execute_command
+    failures=[]
+    def flaky(*args,**options):
+        if failures:
+            raise failures.pop()
+        return execute_command(*args,**options)
+    standin_redis.execute_command=flaky
+    commands=Commands(standin_redis)
+    resilience=commands.enable_resilience(backoff=0.001)
+    commands.set("key","value")
+    failures.append(redis.ConnectionError("Connection reset by peer"))
+    assert commands.get("key")=="value"
+    failures.append(redis.ConnectionError("Connection reset by peer"))
+    assert commands.append("key","!") is False
+    assert commands.get("key")=="value"
+    stats=resilience.stats()
+    assert stats["retries"]==1 and stats["recovered"]==1
+    assert stats["errors"]=={"ConnectionError":1}
+    resilience.raise_errors=True
+    failures.append(redis.ConnectionError("Connection reset by peer"))
+    with pytest.raises(OperationError) as info:
+        commands.append("key","!")
+    assert isinstance(info.value.__cause__,redis.ConnectionError)
+
+
+def test_conditional_writes_not_retried():
+    """SET and ZADD are retried only without options depending on the current value
+    """
+    assert idempotent("SET",("SET","key","value","PX",100)) is True
+    assert idempotent("SET",("SET","key","NX")) is True
+    assert idempotent("SET",("SET","lock","token","NX","PX",100)) is False
+    assert idempotent("SET",("SET","key","value",b"GET")) is False
+    assert idempotent("ZADD",("ZADD","ranking",1,"NX")) is True
+    assert idempotent("ZADD",("ZADD","ranking","CH",1,"a")) is True
+    assert idempotent("ZADD",("ZADD","ranking","CH","INCR",1,"a")) is False
+    assert idempotent("ZADD",("ZADD","ranking","GT",1,"a")) is False
+    assert idempotent("INCR",("INCR","counter")) is False
+
+
+def test_circuit_breaker_fails_fast(capsys):
+    """An open circuit breaker fails calls without waiting for the server
+    """
+    commands=Commands(redis.Redis(port=free_port(),socket_connect_timeout=0.2))
+    resilience=commands.enable_resilience(retries=0,failure_threshold=2,reset_timeout=60)
+    assert commands.get("key") is None
+    assert commands.get("key") is None
+    start=time.perf_counter()
+    assert commands.get("key") is None
+    assert time.perf_counter()-start<0.01
+    stats=resilience.stats()
+    assert stats["short_circuited"]==1
+    assert stats["errors"]=={"ConnectionError":2,"CircuitOpenError":1}
+    assert list(stats["breakers"].values())[0]=={"state":"open","opened":1}
+    assert capsys.readouterr().out==""
+    resilience.raise_errors=True
+    with pytest.raises(CircuitOpenError):
+        commands.get("key")
+    with pytest.raises(DriverError):
+        commands.mset({"a":"1"})
+
+
+def test_slow_read_hedged_to_replica(standin_redis,standin_server):
+    """A read slower than the usual latency is answered by the hedge replica
+    """
+    with StandinServer() as replica:
+        redis.Redis(port=replica.port).set("key","replica")
+        standin_redis.set("key","primary")
+        commands=Commands(standin_redis)
+        resilience=commands.enable_resilience(hedge=redis.Redis(port=replica.port),hedge_min_samples=10)
+        for _ in range(10):
+            assert commands.get("key")=="primary"
+        standin_server.latency=0.2
+        try:
+            start=time.perf_counter()
+            assert commands.get("key")=="replica"
+            assert time.perf_counter()-start<0.15
+            resilience.close()
+        finally:
+            standin_server.latency=0.0
+        assert resilience.stats()["hedge_wins"]==1
+
+
+def test_driver_resilience_covers_handles(driver_instance,standin_server):
+    """Resilience enabled on the driver applies to its handles and can be disabled
+    """
+    resilience=driver_instance.enable_resilience(retries=1)
+    try:
+        assert driver_instance.connect(port=standin_server.port)
+        assert driver_instance.commands.resilience is resilience
+        assert driver_instance.handle("resilience",db=2).commands.resilience is resilience
+        assert resilience.hedge is None
+        driver_instance.commands.set("key","value")
+        assert [breaker["state"] for breaker in driver_instance.resilience_stats()["breakers"].values()]==["closed"]
+    finally:
+        driver_instance.disable_resilience()
+    assert driver_instance.commands.resilience is None
+    assert driver_instance.resilience_stats()=={}
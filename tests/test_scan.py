@@ -0,0 +1,41 @@
+from driver.utils.commands import Commands
+
+
+def test_scan_iter_streams_every_key(standin_redis):
+    """scan_iter walks the keyspace page by page with match and type filters
+    """
+    commands=Commands(standin_redis)
+    commands.mset({f"user:{index}":str(index) for index in range(250)})
+    commands.mset({f"order:{index}":str(index) for index in range(50)})
+    standin_redis.sadd("user:set","a")
+    scanner=commands.scan_iter(match="user:*",count=40,type="string")
+    keys=list(scanner)
+    assert sorted(keys)==sorted(f"user:{index}" for index in range(250))
+    assert scanner.pages_read==8
+
+
+def test_scan_iter_fetches_page_details(standin_redis):
+    """values, types and ttls are fetched with one pipeline per page
+    """
+    commands=Commands(standin_redis)
+    commands.set("a","1",ex=100)
+    standin_redis.sadd("b","x")
+    entries={entry.key:entry for entry in commands.scan_iter(values=True,types=True,ttls=True,prefetch=False)}
+    assert entries["a"].value==b"1"
+    assert entries["a"].type=="string"
+    assert 0<entries["a"].ttl<=100000
+    assert entries["b"].value is None
+    assert entries["b"].type=="set"
+    assert entries["b"].ttl==-1
+
+
+def test_collection_scans(standin_redis):
+    """hscan_iter, sscan_iter and zscan_iter stream the members of one key
+    """
+    commands=Commands(standin_redis)
+    standin_redis.hset("hash",mapping={f"field:{index}":index for index in range(30)})
+    standin_redis.sadd("set",*[f"member:{index}" for index in range(30)])
+    standin_redis.zadd("zset",{f"member:{index}":index for index in range(30)})
+    assert dict(commands.hscan_iter("hash",count=7))=={f"field:{index}":str(index).encode() for index in range(30)}
+    assert set(commands.sscan_iter("set",match="member:1*",count=7))=={"member:1"}|{f"member:{index}" for index in range(10,20)}
+    assert dict(commands.zscan_iter("zset",count=7))=={f"member:{index}":float(index) for index in range(30)}
@@ -0,0 +1,80 @@
+from driver.utils.commands import Commands
+from driver.utils.scripts import COMPARE_AND_DELETE
+
+
+def compare_and_delete(connection,keys,args):
+    if connection.keyspace.lookup(keys[0])==args[0]:
+        return int(connection.keyspace.delete(keys[0]))
+    return 0
+
+
+def test_script_loaded_on_noscript(standin_redis,standin_server):
+    """EVALSHA is retried after loading the script when the server answers NOSCRIPT
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    standin_redis.script_flush()
+    commands=Commands(standin_redis)
+    commands.set("lock","token")
+    standin_server.reset_counters()
+    assert commands.scripts.compare_and_delete("lock","other") is False
+    assert standin_server.round_trips==3
+    assert commands.scripts.compare_and_delete("lock","token") is True
+    assert standin_server.round_trips==4
+    assert commands.get("lock") is None
+
+
+def test_script_in_batch(standin_redis,standin_server):
+    """Scripts can be queued in a batch and survive a SCRIPT FLUSH
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    commands=Commands(standin_redis)
+    commands.mset({"a":"1","b":"2"})
+    with commands.batch() as batch:
+        batch.script("compare_and_delete",["a"],["1"])
+        batch.get("b")
+    standin_redis.script_flush()
+    with commands.batch() as second:
+        second.script("compare_and_delete",["b"],["2"])
+    assert batch.results==[1,"2"]
+    assert second.results==[1]
+    assert commands.mget(["a","b"])==[None,None]
+
+
+def test_script_in_batch_keeps_call_order(standin_redis,standin_server):
+    """A script missing from the server cache runs before the commands queued after it
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    commands=Commands(standin_redis)
+    commands.set("a","1")
+    assert commands.scripts.compare_and_delete("a","other") is False
+    standin_redis.script_flush()
+    standin_server.reset_counters()
+    with commands.batch() as batch:
+        batch.script("compare_and_delete",["a"],["1"])
+        batch.set("a","2")
+        batch.script("compare_and_delete",["a"],["2"])
+    assert batch.results==[1,True,1]
+    assert standin_server.round_trips==1
+    assert commands.get("a") is None
+
+
+def test_scripts_registry():
+    """Scripts are registered by name with a locally computed SHA1
+    """
+    commands=Commands(None)
+    script=commands.scripts.register("custom","return 1")
+    assert script.sha=="e0e1f9fabfc9d4800c877a703b823ac0578ff8db"
+    assert "compare_and_delete" in commands.scripts.names()
+
+
+def test_script_in_pipeline_after_flush(standin_redis,standin_server):
+    """Scripts queued in a plain pipeline still run after a SCRIPT FLUSH
+    """
+    standin_server.register_script(COMPARE_AND_DELETE,compare_and_delete)
+    commands=Commands(standin_redis)
+    commands.mset({"a":"1","b":"2"})
+    for key,value in (("a","1"),("b","2")):
+        standin_redis.script_flush()
+        pipe=standin_redis.pipeline(transaction=False)
+        commands.scripts.queue(pipe,"compare_and_delete",[key],[value])
+        assert pipe.execute()==[1]
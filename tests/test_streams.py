@@ -0,0 +1,68 @@
+import threading
+import time
+from driver.utils.streams import Streams
+
+
+def test_producer_batches_xadd(standin_redis,standin_server):
+    """Messages are added with one round trip per batch and trimmed with MAXLEN
+    """
+    streams=Streams(standin_redis)
+    with streams.producer("events",batch_size=50,maxlen=120) as producer:
+        for index in range(130):
+            producer.add({"index":str(index)})
+    assert producer.sent==130
+    assert producer.round_trips==3
+    assert streams.length("events")==120
+
+
+def test_consumer_group_reads_and_acks_in_bulk(standin_redis):
+    """A consumer reads in blocks and piggybacks its acks on the next read
+    """
+    streams=Streams(standin_redis)
+    with streams.producer("jobs",batch_size=100) as producer:
+        for index in range(250):
+            producer.add({"index":str(index)})
+    consumer=streams.consumer("jobs","workers","worker-1",count=100,block=None)
+    seen=[]
+    handled=consumer.run(lambda message_id,fields:seen.append(int(fields[b"index"])),reclaim_every=0)
+    assert handled==250
+    assert seen==list(range(250))
+    assert consumer.acked==250
+    assert standin_redis.xpending("jobs","workers")["pending"]==0
+    assert consumer.round_trips==4
+
+
+def test_consumer_reclaims_and_respects_in_flight_limit(standin_redis):
+    """Pending messages of a dead consumer are reclaimed with XAUTOCLAIM
+    """
+    streams=Streams(standin_redis)
+    with streams.producer("tasks") as producer:
+        for index in range(10):
+            producer.add({"index":str(index)})
+    dead=streams.consumer("tasks","workers","dead",count=10,block=None)
+    assert len(dead.read())==10
+    worker=streams.consumer("tasks","workers","alive",count=4,block=None,claim_idle=1,max_in_flight=4)
+    time.sleep(0.01)
+    claimed=worker.reclaim()
+    assert len(claimed)==4
+    assert worker.reclaim()==[]
+    worker.ack(*[message_id for message_id,_ in claimed])
+    assert worker.flush_acks()==4
+    handled=worker.run(lambda message_id,fields:None,reclaim_every=1)
+    assert handled==6
+
+
+def test_consumer_run_limits(standin_redis):
+    """max_messages is never overshot and an empty non blocking read waits for stop
+    """
+    streams=Streams(standin_redis)
+    with streams.producer("orders") as producer:
+        for index in range(10):
+            producer.add({"index":str(index)})
+    consumer=streams.consumer("orders","workers","worker-1",count=4,block=None)
+    assert consumer.run(lambda message_id,fields:None,max_messages=5,reclaim_every=0)==5
+    assert consumer.read_count==5
+    stop=threading.Event()
+    threading.Timer(0.3,stop.set).start()
+    assert consumer.run(lambda message_id,fields:None,stop=stop,reclaim_every=0)==5
+    assert consumer.round_trips<10
@@ -0,0 +1,118 @@
+import array
+import pytest
+from driver.utils.structures import Structures
+
+
+@pytest.fixture
+def structures(standin_redis):
+    return Structures(standin_redis)
+
+
+def test_hash(structures,standin_server):
+    """Hash fields are written in batches and read like a dict
+    """
+    profile=structures.hash("user:1",batch_size=3)
+    standin_server.reset_counters()
+    assert profile.update({f"field:{index}":str(index) for index in range(10)})==10
+    assert standin_server.round_trips==1
+    profile["name"]="Ada"
+    assert profile["name"]=="Ada" and "name" in profile and len(profile)==11
+    assert profile.get_many(["name","missing","field:9"])==["Ada",None,"9"]
+    assert profile.increment("visits")==1 and profile.increment("visits",2)==3
+    assert profile.increment("ratio",0.5)==0.5
+    del profile["ratio"]
+    with pytest.raises(KeyError):
+        profile["ratio"]
+    assert profile.get("ratio","none")=="none"
+    assert profile.to_dict()["field:3"]=="3"
+    assert sorted(profile)[0]=="field:0"
+    assert structures.hash("user:1",decode=False)["name"]==b"Ada"
+
+
+def test_set(structures,standin_server):
+    """Set members are added and checked in batches
+    """
+    tags=structures.set("tags",batch_size=100)
+    standin_server.reset_counters()
+    assert tags.add_many(f"tag:{index}" for index in range(1000))==1000
+    assert standin_server.commands_processed==10
+    assert tags.contains_many(["tag:1","tag:5000"])==[True,False]
+    assert "tag:7" in tags and len(tags)==1000
+    assert tags.discard("tag:7")==1 and len(set(tags))==999
+    assert sorted(tags.members(match="tag:99*"))==["tag:99","tag:990","tag:991","tag:992","tag:993",
+        "tag:994","tag:995","tag:996","tag:997","tag:998","tag:999"]
+
+
+def test_sorted_set_bulk_and_ranges(structures,standin_server):
+    """Sorted set members are added in batches and read by pages of rank and score
+    """
+    ranking=structures.sorted_set("ranking",batch_size=250)
+    members=[f"player:{index}" for index in range(1000)]
+    scores=array.array("d",(index//10 for index in range(1000)))
+    standin_server.reset_counters()
+    assert ranking.add_many(members,scores)==1000
+    assert standin_server.commands_processed==4
+    assert len(ranking)==1000 and ranking.score("player:15")==1.0
+    assert ranking.scores(["player:15","missing"])==[1.0,None]
+    top=list(ranking.range(0,4,desc=True,page_size=2))
+    assert [score for _,score in top]==[99.0]*5
+    assert len(list(ranking.range(page_size=64)))==1000
+    assert list(ranking.range(-2))==[("player:998",99.0),("player:999",99.0)]
+    band=list(ranking.range_by_score(10,"(20",page_size=7))
+    assert [member for member,_ in band]==[f"player:{index}" for index in range(100,200)]
+    descending=list(ranking.range_by_score(5,8,desc=True,page_size=4))
+    assert [score for _,score in descending]==sorted([float(index//10) for index in range(50,90)],reverse=True)
+    assert len({member for member,_ in descending})==40
+    pages=list(ranking.pages(page_size=400))
+    assert [len(members) for members,_ in pages]==[400,400,200]
+    assert ranking.increment("player:0",5)==5.0
+    assert ranking.add_many({"a":1,"b":2})==2 and ranking.remove("a","b")==2
+    with pytest.raises(ValueError):
+        ranking.add_many(["x"],[1,2])
+
+
+def test_bitmap(structures,standin_redis):
+    """Bitmap bits and packed integers are read and written in batches
+    """
+    seen=structures.bitmap("seen",batch_size=2)
+    assert seen.set_many([1,5,9,40])==[0,0,0,0]
+    assert seen.get_many(range(10))==[0,1,0,0,0,1,0,0,0,1]
+    assert seen.set(5,0)==1 and seen.get(5)==0
+    assert len(seen)==3 and seen.count(0,0)==1
+    assert list(seen.ones(page_bytes=2))==[1,9,40]
+    counters=structures.bitmap("counters",batch_size=4)
+    assert counters.write_ints([1,300,65535],width=16,start=1)==3
+    assert standin_redis.getrange("counters",0,-1)==bytes([0,0,0,1,1,44,255,255])
+    assert counters.read_ints(4,width=16).tolist()==[0,1,300,65535]
+    assert counters.read_ints(2,width=16,signed=True,start=3).tolist()==[-1,0]
+    packed=structures.bitmap("packed")
+    assert packed.write_ints([5,-3,7],width=4,signed=True)==3
+    assert packed.read_ints(3,width=4,signed=True).tolist()==[5,-3,7]
+    assert packed.read_ints(2,width=4,start=1).tolist()==[13,7]
+
+
+def test_hll(structures,standin_server):
+    """HyperLogLog elements are added through a pipeline and counted
+    """
+    visitors=structures.hll("visitors",batch_size=100,pipeline_depth=5)
+    standin_server.reset_counters()
+    assert visitors.add_many(f"ip:{index%1500}" for index in range(3000)) is True
+    assert standin_server.round_trips==6
+    assert len(visitors)==1500
+    other=structures.hll("visitors:other")
+    assert other.add("ip:1","ip:new") is True
+    assert visitors.count(other)==1501
+    visitors.merge(other)
+    assert len(visitors)==1501
+
+
+def test_numpy_arrays(structures):
+    """Sorted sets and bitmaps accept and return numpy arrays
+    """
+    numpy=pytest.importorskip("numpy")
+    ranking=structures.sorted_set("numpy")
+    assert ranking.add_many(numpy.array(["a","b","c"]),numpy.arange(3,dtype="float64"))==3
+    assert numpy.isnan(ranking.scores(["a","missing"],numpy=True)).tolist()==[False,True]
+    counters=structures.bitmap("numpy:counters")
+    counters.write_ints(numpy.array([1,2,3],dtype="uint32"),width=32)
+    assert counters.read_ints(3,width=32,numpy=True).tolist()==[1,2,3]
@@ -0,0 +1,135 @@
+import pytest
+from driver.utils.acl import AclUser,UserSpec,_glob
+from driver.utils.users import Users
+
+
+@pytest.fixture
+def users(standin_redis,standin_server):
+    yield Users(standin_redis)
+    standin_server.acl_users={name:user for name,user in standin_server.acl_users.items() if name==b"default"}
+
+
+def tenants(count:int,password:str="secret")->list:
+    return [UserSpec(f"tenant:{index}",password=password,categories=["read"],commands=["+set"],keys=[f"tenant:{index}:*"])
+        for index in range(count)]
+
+
+def test_provision_sends_only_changes(users,standin_server):
+    """Provisioning sends only the users that changed
+    """
+    report=users.provision(tenants(250),batch_size=100)
+    assert report.summary()=={"created":250,"updated":0,"unchanged":0,"deleted":0,"failed":0,"round_trips":3}
+    assert len(users.users())==251
+    standin_server.reset_counters()
+    report=users.provision(tenants(250))
+    assert report.summary()["unchanged"]==250 and report.round_trips==0
+    assert standin_server.round_trips==2
+    standin_server.reset_counters()
+    users.provision(tenants(250))
+    assert standin_server.round_trips==1
+    desired=tenants(10)
+    desired[3]=UserSpec("tenant:3",password="rotated",categories=["read"],commands=["+set"],keys=["tenant:3:*"])
+    desired.append({"username":"auditor","nopass":True,"categories":["+@read"],"keys":["*"]})
+    assert users.provision(desired,delete_missing=True,dry_run=True).summary()["deleted"]==240
+    assert len(users.users())==251
+    report=users.provision(desired,delete_missing=True)
+    assert report.created==["auditor"] and report.updated==["tenant:3"] and len(report.deleted)==240
+    assert sorted(users.users())==sorted(["default","auditor"]+[f"tenant:{index}" for index in range(10)])
+
+
+def test_provision_keeps_unspecified_channels(users,standin_redis):
+    """A spec without channels leaves the channels of the user unchanged
+    """
+    standin_redis.execute_command("ACL","SETUSER","feed","on",">old","~feed:*","&events:*","+@read")
+    report=users.provision([UserSpec("feed",password="new",categories=["read"],keys=["feed:*"])])
+    assert report.updated==["feed"]
+    snapshot=users.acl_snapshot(max_age=0)
+    assert snapshot.users["feed"].channels==["&events:*"]
+    assert users.provision([UserSpec("feed",password="new",categories=["read"],keys=["feed:*"])]).unchanged==["feed"]
+    users.provision([UserSpec("feed",password="new",categories=["read"],keys=["feed:*"],channels=[])])
+    assert users.acl_snapshot(max_age=0).users["feed"].channels==[]
+
+
+def test_provision_reports_failures(users):
+    """Users rejected by the server are reported as errors
+    """
+    report=users.provision([UserSpec("good",nopass=True),UserSpec("bad",categories=["+@nosuchcategory"])])
+    assert report.created==["good"] and list(report.errors)==["bad"]
+    assert users.provision([{"username":"with space"}]) is None
+
+
+def test_snapshot_refresh_and_indexes(users,standin_redis,standin_server):
+    """The ACL snapshot is indexed by category and command and refreshed when stale
+    """
+    users.provision(tenants(5))
+    snapshot=users.acl_snapshot()
+    assert snapshot.by_category["read"]=={f"tenant:{index}" for index in range(5)}
+    assert snapshot.by_command["set"]=={f"tenant:{index}" for index in range(5)}
+    assert "get" in snapshot.categories["read"]
+    refreshes=snapshot.refreshes
+    assert users.acl_snapshot() is snapshot and snapshot.refreshes==refreshes
+    parsed=snapshot.parsed
+    standin_redis.acl_setuser("tenant:0",enabled=False)
+    standin_server.reset_counters()
+    users.acl_snapshot(max_age=0)
+    assert snapshot.parsed==parsed+1 and standin_server.round_trips==1
+    assert snapshot.users["tenant:0"].enabled is False
+
+
+def test_can_evaluates_in_process(users,standin_redis,standin_server):
+    """Permissions are evaluated from the snapshot without a round trip
+    """
+    standin_redis.execute_command("ACL","SETUSER","writer","on","nopass","~orders:*","%R~catalog:*","&events:*",
+        "+@read","-get","+config|get","+@write")
+    standin_redis.execute_command("ACL","SETUSER","blocked","off","nopass","~*","+@all")
+    users.acl_snapshot()
+    standin_server.reset_counters()
+    assert users.can("writer","set","orders:1") is True
+    assert users.can("writer","get","orders:1") is False
+    assert users.can("writer","hget","orders:1") is True
+    assert users.can("writer","set","users:1") is False
+    assert users.can("writer","hget","catalog:1") is False
+    assert users.can("writer","hget","catalog:1",access="read") is True
+    assert users.can("writer","set","catalog:1",access="write") is False
+    assert users.can("writer","config get") is True and users.can("writer","config|set") is False
+    assert users.can("writer","publish",channel="events:new") is False
+    assert users.can("default","publish",channel="events:new") is True
+    assert users.can("blocked","get","x") is False and users.can("nobody","get") is False
+    assert standin_server.round_trips==0
+    assert users.acl_snapshot().who_can("config|set")==["default"]
+
+
+def test_parse_acl_line():
+    """ACL LIST lines are parsed into users matching their spec
+    """
+    user=AclUser("user app on #"+"a"*64+" ~app:* %W~log:* resetchannels -@all +@read -@dangerous +set (~other:* +get)")
+    assert user.enabled and user.password_hashes=={"a"*64}
+    assert user.keys==[("app:*","RW"),("log:*","W")]
+    assert user.categories=={"read"} and user.commands=={"set"}
+    assert user.selectors==["(~other:* +get)"]
+    spec=UserSpec("app",password_hashes=["A"*64],categories=["read","-dangerous"],commands=["set"],keys=["app:*","%W~log:*"])
+    assert spec.matches(user)
+
+
+@pytest.mark.parametrize("pattern,string,expected",[
+    ("user:*","user:1",True),("*","",True),("a*","a",True),("a*b*c","axxbyyc",True),("a*b","ab",True),("a*b","ac",False),
+    ("h?llo","hello",True),("h?llo","hllo",False),
+    ("h[ae]llo","hallo",True),("h[ae]llo","hillo",False),
+    ("h[^e]llo","hallo",True),("h[^e]llo","hello",False),("h[!e]llo","h!llo",True),("h[!e]llo","hallo",False),
+    ("h[a-c]llo","hbllo",True),("h[c-a]llo","hbllo",True),("h[a-c]llo","hdllo",False),
+    ("h\\*llo","h*llo",True),("h\\*llo","hello",False),("h[\\]]llo","h]llo",True),("[ab","b",True),
+])
+def test_redis_glob(pattern,string,expected):
+    """Patterns follow the Redis glob rules, not fnmatch
+    """
+    assert _glob(pattern,string) is expected
+
+
+def test_can_uses_redis_glob(users,standin_redis):
+    """Key and channel patterns with negated classes and escapes are evaluated like the server
+    """
+    standin_redis.execute_command("ACL","SETUSER","scoped","on","nopass","~[^t]*","~t\\*","&news[!x]","+@all")
+    snapshot=users.acl_snapshot()
+    assert snapshot.can("scoped","get","orders") is True and snapshot.can("scoped","get","tenant") is False
+    assert snapshot.can("scoped","get","t*") is True and snapshot.can("scoped","get","tx") is False
+    assert snapshot.can("scoped","publish",channel="news!") is True and snapshot.can("scoped","publish",channel="newsy") is False